@@ -0,0 +1,269 @@
+"""Client for querying the Sia API."""
+
+import collections
+import decimal
+import hashlib
+import threading
+
+import monotonic
+import pysia
+import requests
+from requests import adapters
+from urllib3 import connectionpool
+
+from sia_metrics_collector import stdlib_api
+
+_USER_AGENT = {'User-agent': 'Sia-Agent'}
+
+# Size of each chunk to read from a streamed response.
+_STREAM_CHUNK_SIZE = 64 * 1024
+
+# Settings for the client's pool of HTTP connections to Sia, defined with the
+# standard library client so that they can be read without importing pysia.
+ConnectionOptions = stdlib_api.ConnectionOptions
+DEFAULT_CONNECTION_OPTIONS = stdlib_api.DEFAULT_CONNECTION_OPTIONS
+"""Counts of the client's HTTP connection usage.
+
+Fields:
+    request_count: Number of requests the client has sent.
+    new_connection_count: Number of connections the client has opened.
+    reused_connection_count: Number of requests that were sent on an already
+        open, kept-alive connection.
+"""
+ConnectionStats = collections.namedtuple(
+    'ConnectionStats',
+    ['request_count', 'new_connection_count', 'reused_connection_count'])
+
+
+class Error(Exception):
+    pass
+
+
+class ResponseError(Error):
+    pass
+
+
+class _CountingAdapter(adapters.HTTPAdapter):
+    """An HTTPAdapter that counts requests sent and connections opened.
+
+    Attributes:
+        request_count: Number of requests the adapter has sent.
+        new_connection_count: Number of connections the adapter has opened.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.request_count = 0
+        self.new_connection_count = 0
+        self._count_lock = threading.Lock()
+        super(_CountingAdapter, self).__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(_CountingAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http':
+            self._make_counting_pool_class(connectionpool.HTTPConnectionPool),
+            'https':
+            self._make_counting_pool_class(connectionpool.HTTPSConnectionPool),
+        }
+
+    def send(self, request, *args, **kwargs):
+        with self._count_lock:
+            self.request_count += 1
+        return super(_CountingAdapter, self).send(request, *args, **kwargs)
+
+    def _make_counting_pool_class(self, pool_class):
+        adapter = self
+
+        class CountingConnectionPool(pool_class):
+
+            def _new_conn(self):
+                with adapter._count_lock:
+                    adapter.new_connection_count += 1
+                return super(CountingConnectionPool, self)._new_conn()
+
+        return CountingConnectionPool
+
+
+class Client(pysia.Sia):
+    """A pysia client that also records the size of each response body.
+
+    When a GET request's response body is byte-for-byte identical to the
+    previous response from the same path, the client skips parsing it and
+    returns the very same object it returned last time. Callers must
+    therefore treat parsed responses as read-only, and may use an identity
+    check to detect unchanged responses.
+
+    Attributes:
+        response_sizes: A dict mapping each API path (e.g. '/renter/files') to
+            the size (in bytes) of the body of the most recent response
+            received for that path. A path has no entry if its most recent
+            request failed before the full response arrived.
+        decode_seconds: A dict mapping each API path to the time (in seconds)
+            spent decoding the body of the most recent response received for
+            that path: fingerprinting it, and parsing it unless it was
+            unchanged. Like response_sizes, a path has no entry if its most
+            recent request failed.
+    """
+
+    def __init__(self,
+                 host,
+                 port,
+                 connection_options=DEFAULT_CONNECTION_OPTIONS):
+        """Creates a new Client.
+
+        All requests share a single pool of keep-alive connections, rather
+        than opening a new connection for each request.
+
+        Args:
+            host: Hostname of the Sia node, including URL scheme.
+            port: Siad API port of the Sia node.
+            connection_options: ConnectionOptions for the connection pool.
+        """
+        super(Client, self).__init__(host, port)
+        self.response_sizes = {}
+        self.decode_seconds = {}
+        # Maps each API path to a (fingerprint, parsed response) pair for its
+        # most recent GET response.
+        self._parsed_responses = {}
+        self._timeout = (connection_options.connect_timeout,
+                         connection_options.read_timeout)
+        self._adapter = _CountingAdapter(
+            pool_connections=1, pool_maxsize=connection_options.pool_size)
+        self._session = requests.Session()
+        self._session.headers.update(_USER_AGENT)
+        self._session.mount('http://', self._adapter)
+        self._session.mount('https://', self._adapter)
+
+    def close(self):
+        """Closes all connections to Sia."""
+        self._session.close()
+
+    def connection_stats(self):
+        """Returns a ConnectionStats counting connection usage so far."""
+        request_count = self._adapter.request_count
+        new_connection_count = self._adapter.new_connection_count
+        return ConnectionStats(
+            request_count=request_count,
+            new_connection_count=new_connection_count,
+            reused_connection_count=max(0,
+                                        request_count - new_connection_count))
+
+    def __call__(self, verb, url, data=None):
+        self.response_sizes.pop(url, None)
+        self.decode_seconds.pop(url, None)
+        full_url = self._url_base + url
+        if verb == pysia.client.GET:
+            response = self._session.get(
+                full_url, params=data, timeout=self._timeout)
+        else:
+            response = self._session.post(
+                full_url, data=data, timeout=self._timeout)
+        self.response_sizes[url] = len(response.content)
+        decode_start_time = monotonic.monotonic()
+        try:
+            return self._parse_response(verb, url, data, response)
+        finally:
+            self.decode_seconds[url] = (
+                monotonic.monotonic() - decode_start_time)
+
+    def _parse_response(self, verb, url, data, response):
+        is_cacheable = verb == pysia.client.GET and not data
+        if is_cacheable:
+            fingerprint = fingerprint_body(response.content)
+            cached = self._parsed_responses.get(url)
+            if cached and cached[0] == fingerprint:
+                return cached[1]
+        try:
+            parsed = response.json()
+        except ValueError:
+            return response.ok
+        if is_cacheable:
+            self._parsed_responses[url] = (fingerprint, parsed)
+        return parsed
+
+    def iter_renter_files(self):
+        """Yields each file from /renter/files as its JSON is parsed.
+
+        Unlike get_renter_files(), this reads the response body incrementally
+        and never holds more than one file's entry in memory, no matter how
+        many files the renter has.
+
+        Yields:
+            A dict for each file in the response, in the same format as the
+            entries of get_renter_files()['files'].
+
+        Raises:
+            ResponseError: The response did not contain a list of files.
+        """
+        # Imported only when used, as only --stream_files needs it, and it
+        # is slow to import.
+        import ijson
+        url = '/renter/files'
+        self.response_sizes.pop(url, None)
+        response = self._session.get(
+            self._url_base + url, stream=True, timeout=self._timeout)
+        try:
+            response.raw.decode_content = True
+            body = _CountingReader(response.raw)
+            events = _KeyWatcher(ijson.parse(body), u'files')
+            for f in ijson.common.items(events, 'files.item'):
+                yield _decimals_to_floats(f)
+            if not events.key_seen:
+                raise ResponseError('Response from %s has no files (HTTP %d)' %
+                                    (url, response.status_code))
+            # Read to the end of the body so that the connection goes back to
+            # the pool instead of being closed.
+            while body.read():
+                pass
+            self.response_sizes[url] = body.bytes_read
+        finally:
+            response.close()
+
+
+class _CountingReader(object):
+    """Wraps a file-like object to count the bytes read from it."""
+
+    def __init__(self, raw):
+        self._raw = raw
+        self.bytes_read = 0
+
+    def read(self, size=_STREAM_CHUNK_SIZE):
+        chunk = self._raw.read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+class _KeyWatcher(object):
+    """Passes through ijson parse events, noting if a top-level key appears."""
+
+    def __init__(self, events, key):
+        self._events = events
+        self._key = key
+        self.key_seen = False
+
+    def __iter__(self):
+        for prefix, event, value in self._events:
+            if prefix == '' and event == 'map_key' and value == self._key:
+                self.key_seen = True
+            yield prefix, event, value
+
+
+def fingerprint_body(body):
+    """Returns a value that is equal for two bodies only if they're identical.
+
+    Hashing is much cheaper than parsing JSON, and including the length makes
+    a collision between bodies of different sizes impossible.
+
+    Args:
+        body: Bytes of a response body.
+    """
+    return len(body), hashlib.sha1(body).digest()
+
+
+def _decimals_to_floats(item):
+    # ijson parses non-integer numbers as Decimal, but json parses them as
+    # float, so convert them to match get_renter_files().
+    for key, value in item.items():
+        if isinstance(value, decimal.Decimal):
+            item[key] = float(value)
+    return item
@@ -0,0 +1,1022 @@
+"""Polls Sia nodes from a single asyncio event loop, on Python 3.
+
+This is an alternative to main.py's thread-based polling. One event loop sends
+every query to every node over non-blocking HTTP connections, so polling many
+nodes at once needs no thread per query or per node. Polls are scheduled with
+the loop's timers, and their results go to AsyncSinks.
+
+The module uses callbacks and asyncio.Protocol rather than async/await, so
+that it stays valid Python 2 syntax for the build's Python 2 tools, but only
+Python 3 can import it.
+"""
+
+import asyncio
+import collections
+import datetime
+import functools
+import json
+import logging
+import ssl
+import time
+from concurrent import futures
+from urllib import parse
+
+from sia_metrics_collector import api
+from sia_metrics_collector import scheduler
+from sia_metrics_collector import sink
+from sia_metrics_collector import state
+
+logger = logging.getLogger(__name__)
+
+# Path of the Sia API endpoint that each query group's metrics come from.
+_QUERY_PATHS = {
+    'contract': '/renter/contracts',
+    'file': '/renter/files',
+    'wallet': '/wallet',
+    'renter': '/renter',
+}
+
+_USER_AGENT = 'Sia-Agent'
+
+# Seconds to wait for a query group's response, if it has no deadline.
+DEFAULT_QUERY_TIMEOUT = 60.0
+
+# HTTP statuses whose responses never have a body.
+_BODILESS_STATUSES = (204, 304)
+"""A complete HTTP response.
+
+Fields:
+    status: HTTP status code.
+    body: Bytes of the response body.
+"""
+_Response = collections.namedtuple('_Response', ['status', 'body'])
+"""The outcome of fetching one endpoint's response during a poll.
+
+Fields:
+    timing: state.QueryTiming of the fetch.
+    response: The parsed response, or None if the fetch failed.
+    error: The exception the fetch failed with, or None if it succeeded.
+"""
+_Fetch = collections.namedtuple('_Fetch', ['timing', 'response', 'error'])
+
+
+class Error(Exception):
+    pass
+
+
+class ConnectTimeoutError(Error):
+    pass
+
+
+class ReadTimeoutError(Error):
+    pass
+
+
+class ConnectionClosedError(Error):
+    pass
+
+
+class ProtocolError(Error):
+    pass
+
+
+class CancelledQueryError(Error):
+    pass
+
+
+class QueryTimeoutError(Error):
+    pass
+
+
+class AsyncClient(object):
+    """Queries the Sia API of one node over non-blocking HTTP connections.
+
+    Requests share a pool of keep-alive HTTP/1.1 connections, opening a new
+    one only when every open connection is busy, up to the pool size. Further
+    requests wait for a connection to free up.
+
+    Like api.Client, when a response body is byte-for-byte identical to the
+    previous response from the same path, the client skips parsing it and
+    returns the very same object it returned last time. Other bodies are
+    parsed on the loop's default executor, so that a large response doesn't
+    hold up the loop.
+
+    Attributes:
+        response_sizes: Like api.Client.response_sizes.
+        decode_seconds: Like api.Client.decode_seconds.
+    """
+
+    def __init__(self,
+                 loop,
+                 host,
+                 port,
+                 connection_options=api.DEFAULT_CONNECTION_OPTIONS):
+        """Creates a new AsyncClient.
+
+        Args:
+            loop: asyncio event loop to run requests on.
+            host: Hostname of the Sia node, including URL scheme.
+            port: Siad API port of the Sia node.
+            connection_options: api.ConnectionOptions for the connection pool.
+        """
+        url = parse.urlsplit(host)
+        self._loop = loop
+        self._hostname = url.hostname
+        self._port = port
+        self._ssl = None
+        if url.scheme == 'https':
+            self._ssl = ssl.create_default_context()
+        # The URL's host, unlike its hostname, keeps the brackets of an IPv6
+        # address.
+        self._host_header = '%s:%d' % (url.netloc, port)
+        self._pool_size = connection_options.pool_size
+        self._connect_timeout = connection_options.connect_timeout
+        self._read_timeout = connection_options.read_timeout
+        self.response_sizes = {}
+        self.decode_seconds = {}
+        # Maps each API path to a (fingerprint, parsed response) pair for its
+        # most recent response.
+        self._parsed_responses = {}
+        # Every open connection, and those that no request is using, most
+        # recently used last.
+        self._connections = set()
+        self._idle_connections = []
+        # Tasks opening new connections.
+        self._openings = set()
+        # Futures of requests waiting for a connection, in order of arrival.
+        self._waiters = collections.deque()
+        self._open_count = 0
+        self._request_count = 0
+        self._new_connection_count = 0
+
+    def get(self, path):
+        """Starts a GET request for an API path.
+
+        Cancelling the returned future cancels the request, and closes its
+        connection if the request was already sent.
+
+        Args:
+            path: Path of the Sia API endpoint (e.g. '/wallet').
+
+        Returns:
+            An asyncio.Future of the parsed JSON response or, if the body is
+            not JSON, whether the HTTP status was a success (as pysia
+            returns). Its exception is an Error or OSError if the request
+            failed.
+        """
+        self.response_sizes.pop(path, None)
+        self.decode_seconds.pop(path, None)
+        result = self._loop.create_future()
+        connection = self._acquire_connection()
+        result.add_done_callback(lambda _: connection.cancel())
+        connection.add_done_callback(
+            functools.partial(self._on_connection, path, result))
+        return result
+
+    def close(self):
+        """Closes all connections to Sia, failing requests in flight.
+
+        The connections finish closing on the loop's next iteration.
+        """
+        while self._waiters:
+            self._waiters.popleft().cancel()
+        for opening in list(self._openings):
+            opening.cancel()
+        for protocol in list(self._connections):
+            protocol.close()
+
+    def connection_stats(self):
+        """Returns an api.ConnectionStats counting connection usage so far."""
+        return api.ConnectionStats(
+            request_count=self._request_count,
+            new_connection_count=self._new_connection_count,
+            reused_connection_count=max(
+                0, self._request_count - self._new_connection_count))
+
+    def _acquire_connection(self):
+        """Returns a future of a connection for a single request to use."""
+        connection = self._loop.create_future()
+        while self._idle_connections:
+            protocol = self._idle_connections.pop()
+            if protocol.reusable:
+                connection.set_result(protocol)
+                return connection
+            # Sia closed it while it was idle.
+            self._connections.discard(protocol)
+            self._open_count -= 1
+        if self._open_count < self._pool_size:
+            self._open_connection(connection)
+        else:
+            self._waiters.append(connection)
+        return connection
+
+    def _open_connection(self, connection):
+        self._open_count += 1
+        opening = self._loop.create_task(
+            asyncio.wait_for(
+                self._loop.create_connection(
+                    functools.partial(_HttpProtocol, self._loop,
+                                      self._read_timeout),
+                    self._hostname,
+                    self._port,
+                    ssl=self._ssl), self._connect_timeout))
+        self._openings.add(opening)
+        connection.add_done_callback(lambda _: opening.cancel())
+        opening.add_done_callback(
+            functools.partial(self._on_connection_opened, connection))
+
+    def _on_connection_opened(self, connection, opening):
+        self._openings.discard(opening)
+        if opening.cancelled() or opening.exception():
+            self._open_count -= 1
+            self._open_next_waiter()
+            if connection.done():
+                return
+            if opening.cancelled():
+                connection.cancel()
+                return
+            error = opening.exception()
+            if isinstance(error, asyncio.TimeoutError):
+                error = ConnectTimeoutError(
+                    'Timed out connecting to %s' % self._host_header)
+            connection.set_exception(error)
+            return
+        self._new_connection_count += 1
+        _, protocol = opening.result()
+        self._connections.add(protocol)
+        if connection.done():
+            self._release_connection(protocol)
+        else:
+            connection.set_result(protocol)
+
+    def _on_connection(self, path, result, connection):
+        if connection.cancelled():
+            result.cancel()
+            return
+        if connection.exception():
+            if not result.done():
+                result.set_exception(connection.exception())
+            return
+        protocol = connection.result()
+        if result.done():
+            self._release_connection(protocol)
+            return
+        self._request_count += 1
+        response = protocol.request(self._host_header, path)
+        result.add_done_callback(lambda _: response.cancel())
+        response.add_done_callback(
+            functools.partial(self._on_response, path, result, protocol))
+
+    def _on_response(self, path, result, protocol, response):
+        if response.cancelled() or response.exception():
+            # The connection may be partway through a response, so it can't
+            # carry another request.
+            self._discard_connection(protocol)
+            if result.done():
+                return
+            if response.cancelled():
+                result.cancel()
+            else:
+                result.set_exception(response.exception())
+            return
+        if protocol.reusable:
+            self._release_connection(protocol)
+        else:
+            self._discard_connection(protocol)
+        if result.done():
+            return
+        status, body = response.result()
+        self.response_sizes[path] = len(body)
+        parsing = self._loop.run_in_executor(None, self._parse_body, path,
+                                             status, body)
+        parsing.add_done_callback(functools.partial(_copy_outcome, result))
+
+    def _parse_body(self, path, status, body):
+        """Parses a response body, on an executor thread."""
+        decode_start_time = time.monotonic()
+        fingerprint = api.fingerprint_body(body)
+        cached = self._parsed_responses.get(path)
+        if cached and cached[0] == fingerprint:
+            parsed = cached[1]
+        else:
+            try:
+                parsed = json.loads(body.decode('utf-8'))
+                self._parsed_responses[path] = (fingerprint, parsed)
+            except ValueError:
+                parsed = status < 400
+        self.decode_seconds[path] = time.monotonic() - decode_start_time
+        return parsed
+
+    def _release_connection(self, protocol):
+        """Hands a connection to the next waiting request, or the pool."""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(protocol)
+                return
+        self._idle_connections.append(protocol)
+
+    def _discard_connection(self, protocol):
+        protocol.close()
+        self._connections.discard(protocol)
+        self._open_count -= 1
+        self._open_next_waiter()
+
+    def _open_next_waiter(self):
+        # A connection slot freed up, so the next waiting request may open one.
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._open_connection(waiter)
+                return
+
+
+class _HttpProtocol(asyncio.Protocol):
+    """A keep-alive HTTP/1.1 connection carrying one request at a time.
+
+    Attributes:
+        reusable: Whether the connection may carry another request once the
+            current one's response is complete.
+    """
+
+    def __init__(self, loop, read_timeout):
+        """Creates a new _HttpProtocol.
+
+        Args:
+            loop: asyncio event loop the connection runs on.
+            read_timeout: Seconds to wait between bytes of a response, or None
+                to wait forever.
+        """
+        self._loop = loop
+        self._read_timeout = read_timeout
+        self._read_timer = None
+        self._transport = None
+        self._response = None
+        self._parser = None
+        self.reusable = True
+
+    def connection_made(self, transport):
+        self._transport = transport
+
+    def connection_lost(self, exc):
+        self.reusable = False
+        self._cancel_read_timer()
+        if self._response and not self._response.done():
+            self._response.set_exception(
+                ConnectionClosedError(
+                    'Connection closed before the full response arrived'))
+
+    def data_received(self, data):
+        if not self._response or self._response.done():
+            # Sia sent bytes nobody asked for, so the connection can't be
+            # trusted to line up responses with requests.
+            self.close()
+            return
+        self._start_read_timer()
+        try:
+            response = self._parser.feed(data)
+        except ProtocolError as e:
+            self.close()
+            self._response.set_exception(e)
+            return
+        if response:
+            self._cancel_read_timer()
+            if not self._parser.keep_alive:
+                self.reusable = False
+            self._response.set_result(response)
+
+    def request(self, host_header, path):
+        """Sends a GET request.
+
+        Args:
+            host_header: Value of the request's Host header.
+            path: Path to request.
+
+        Returns:
+            An asyncio.Future of the _Response.
+        """
+        self._response = self._loop.create_future()
+        self._parser = _ResponseParser()
+        self._transport.write(('GET %s HTTP/1.1\r\n'
+                               'Host: %s\r\n'
+                               'User-Agent: %s\r\n'
+                               'Accept-Encoding: identity\r\n'
+                               '\r\n' % (path, host_header,
+                                         _USER_AGENT)).encode('latin-1'))
+        self._start_read_timer()
+        return self._response
+
+    def close(self):
+        self.reusable = False
+        self._cancel_read_timer()
+        if self._transport:
+            self._transport.close()
+
+    def _start_read_timer(self):
+        self._cancel_read_timer()
+        if self._read_timeout is not None:
+            self._read_timer = self._loop.call_later(self._read_timeout,
+                                                     self._on_read_timeout)
+
+    def _cancel_read_timer(self):
+        if self._read_timer:
+            self._read_timer.cancel()
+            self._read_timer = None
+
+    def _on_read_timeout(self):
+        self._read_timer = None
+        self.close()
+        if self._response and not self._response.done():
+            self._response.set_exception(
+                ReadTimeoutError('Timed out waiting for response bytes'))
+
+
+class _ResponseParser(object):
+    """Parses an HTTP/1.1 response from the bytes of a connection.
+
+    Handles only what siad sends in reply to the client's GET requests. siad
+    serves its API with Go's net/http, which delimits every HTTP/1.1 response
+    body with either a Content-Length or chunked transfer encoding (without
+    trailers), and honors the request's Accept-Encoding: identity. Anything
+    else is a ProtocolError, rather than an edge of HTTP to get subtly wrong.
+
+    Attributes:
+        keep_alive: Whether the connection stays open after the response.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._status = None
+        self._content_length = None
+        self._chunked = False
+        # Size of the chunk being read, or None before its size line.
+        self._chunk_size = None
+        self._body = bytearray()
+        self.keep_alive = True
+
+    def feed(self, data):
+        """Adds bytes of the response.
+
+        Args:
+            data: Bytes that arrived on the connection.
+
+        Returns:
+            The _Response once it's complete, or None if more bytes are
+            needed.
+
+        Raises:
+            ProtocolError: The bytes are not a valid HTTP response.
+        """
+        self._buffer.extend(data)
+        if self._status is None and not self._parse_head():
+            return None
+        if self._chunked:
+            return self._parse_chunks()
+        if len(self._buffer) < self._content_length:
+            return None
+        return _Response(self._status,
+                         bytes(self._buffer[:self._content_length]))
+
+    def _parse_head(self):
+        head_end = self._buffer.find(b'\r\n\r\n')
+        if head_end < 0:
+            return False
+        lines = bytes(self._buffer[:head_end]).decode('latin-1').split('\r\n')
+        del self._buffer[:head_end + 4]
+        try:
+            version, status = lines[0].split(' ', 2)[:2]
+            self._status = int(status)
+        except ValueError:
+            raise ProtocolError('Invalid HTTP status line: %r' % lines[0])
+        if version != 'HTTP/1.1' or self._status < 200:
+            raise ProtocolError('Unexpected HTTP status line: %r' % lines[0])
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip().lower()
+        self.keep_alive = headers.get('connection') != 'close'
+        if self._status in _BODILESS_STATUSES:
+            self._content_length = 0
+        elif 'transfer-encoding' in headers:
+            if headers['transfer-encoding'] != 'chunked':
+                raise ProtocolError('Unsupported Transfer-Encoding: %s' %
+                                    headers['transfer-encoding'])
+            self._chunked = True
+        elif 'content-length' in headers:
+            try:
+                self._content_length = int(headers['content-length'])
+            except ValueError:
+                raise ProtocolError(
+                    'Invalid Content-Length: %s' % headers['content-length'])
+        else:
+            raise ProtocolError(
+                'Response has neither a Content-Length nor chunked encoding')
+        return True
+
+    def _parse_chunks(self):
+        while True:
+            if self._chunk_size is None:
+                line_end = self._buffer.find(b'\r\n')
+                if line_end < 0:
+                    return None
+                size_text = bytes(self._buffer[:line_end]).split(b';', 1)[0]
+                try:
+                    self._chunk_size = int(size_text, 16)
+                except ValueError:
+                    raise ProtocolError('Invalid chunk size: %r' % size_text)
+                del self._buffer[:line_end + 2]
+            if self._chunk_size == 0:
+                # The last chunk is followed by an empty line.
+                if len(self._buffer) < 2:
+                    return None
+                if not self._buffer.startswith(b'\r\n'):
+                    raise ProtocolError('Unexpected trailers after last chunk')
+                return _Response(self._status, bytes(self._body))
+            if len(self._buffer) < self._chunk_size + 2:
+                return None
+            if not self._buffer.startswith(b'\r\n', self._chunk_size):
+                raise ProtocolError('Chunk is longer than its size')
+            self._body.extend(self._buffer[:self._chunk_size])
+            del self._buffer[:self._chunk_size + 2]
+            self._chunk_size = None
+
+
+class _FetchedApi(object):
+    """Stands in for a Sia API client, returning responses fetched earlier.
+
+    state.Builder queries its Sia API synchronously, so for each poll, the
+    engine fetches the due endpoints' responses first, then builds a SiaState
+    from them through this object.
+
+    Attributes:
+        response_sizes: The underlying AsyncClient's response sizes.
+        decode_seconds: The underlying AsyncClient's decode times.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self.response_sizes = client.response_sizes
+        self.decode_seconds = client.decode_seconds
+        self._fetches = {}
+
+    def set_fetches(self, fetches):
+        """Sets the fetched responses to return.
+
+        Args:
+            fetches: A dict mapping API paths to their _Fetch.
+        """
+        self._fetches = fetches
+
+    def connection_stats(self):
+        return self._client.connection_stats()
+
+    def get_renter_contracts(self):
+        return self._get('/renter/contracts')
+
+    def get_renter_files(self):
+        return self._get('/renter/files')
+
+    def get_wallet(self):
+        return self._get('/wallet')
+
+    def get_renter(self):
+        return self._get('/renter')
+
+    def _get(self, path):
+        fetch = self._fetches[path]
+        if fetch.error:
+            raise fetch.error
+        return fetch.response
+
+
+class Engine(object):
+    """Polls Sia nodes, querying all their endpoints at once from one loop.
+
+    Each query group's request is cancelled if it runs past its deadline, or
+    past the query timeout if the group has none, so that one hung node can't
+    stall every node's poll. The group is then marked late, as with the
+    thread-based engine's deadlines. Polls build their SiaStates on the loop's
+    default executor.
+
+    Attributes:
+        builders: A state.Builder for each node, in the order of the nodes.
+    """
+
+    def __init__(self,
+                 loop,
+                 nodes_to_poll,
+                 connection_options=api.DEFAULT_CONNECTION_OPTIONS,
+                 time_fn=datetime.datetime.utcnow,
+                 deadlines=None,
+                 query_timeout=DEFAULT_QUERY_TIMEOUT,
+                 telemetry=None):
+        """Creates a new Engine.
+
+        Args:
+            loop: asyncio event loop to poll on.
+            nodes_to_poll: A list of nodes.Node to poll.
+            connection_options: api.ConnectionOptions for each node's pool of
+                HTTP connections.
+            time_fn: A function that returns the current time.
+            deadlines: Optional state.DeadlineOptions. Unlike the
+                thread-based engine, a query that misses its deadline is
+                cancelled rather than left to finish in the background.
+            query_timeout: Seconds to wait for the response of a query group
+                that has no deadline.
+            telemetry: Optional telemetry.Recorder. See state.Builder.
+        """
+        self._loop = loop
+        self._time_fn = time_fn
+        self._deadlines = deadlines or state.DeadlineOptions(
+            query_deadlines={},
+            sample_deadline=None,
+            late_policy=state.LATE_EMPTY)
+        self._query_timeout = query_timeout
+        self._clients = [
+            AsyncClient(loop, node.hostname, node.port, connection_options)
+            for node in nodes_to_poll
+        ]
+        self._fetched_apis = [_FetchedApi(client) for client in self._clients]
+        self.builders = [
+            state.Builder(
+                fetched_api, time_fn, node_id=node.node_id, telemetry=telemetry)
+            for node, fetched_api in zip(nodes_to_poll, self._fetched_apis)
+        ]
+        # Requests that are still in flight, to cancel on close().
+        self._requests = set()
+
+    def poll(self, query_groups=None):
+        """Starts a poll of every node.
+
+        Args:
+            query_groups: Optional collection of names from state.QUERY_GROUPS
+                to query, as for state.Builder.build().
+
+        Returns:
+            An asyncio.Future of a list of SiaState, one for each node, in the
+            order of the nodes. Cancelling it cancels the poll's requests.
+        """
+        groups = [
+            group for group in state.QUERY_GROUPS
+            if query_groups is None or group in query_groups
+        ]
+        fetches_by_client = [{
+            group: self._fetch(client, _QUERY_PATHS[group],
+                               self._query_seconds(group))
+            for group in groups
+        }
+                             for client in self._clients]
+        all_fetches = [
+            fetch for fetches in fetches_by_client
+            for fetch in fetches.values()
+        ]
+        polled = self._loop.create_future()
+        gathered = asyncio.gather(*all_fetches)
+        polled.add_done_callback(lambda _: gathered.cancel())
+        gathered.add_done_callback(
+            functools.partial(self._on_fetched, polled, query_groups,
+                              fetches_by_client))
+        return polled
+
+    def close(self):
+        """Cancels requests in flight and closes every node's connections.
+
+        Runs the loop until the connections have closed, so it must not be
+        called while the loop is running.
+        """
+        for request in list(self._requests):
+            request.cancel()
+        for client in self._clients:
+            client.close()
+        self._loop.run_until_complete(asyncio.sleep(0))
+
+    def _query_seconds(self, group):
+        """Returns how long to wait for a query group's response."""
+        deadlines = [
+            deadline
+            for deadline in (self._deadlines.query_deadlines.get(group),
+                             self._deadlines.sample_deadline)
+            if deadline is not None
+        ]
+        return min(deadlines) if deadlines else self._query_timeout
+
+    def _fetch(self, client, path, timeout):
+        """Fetches one endpoint's response.
+
+        Args:
+            client: AsyncClient to fetch with.
+            path: Path of the Sia API endpoint.
+            timeout: Seconds to wait for the response before cancelling the
+                request.
+
+        Returns:
+            An asyncio.Future of the _Fetch, which never fails; a failed
+            request's error is recorded in the _Fetch instead.
+        """
+        start_time = self._time_fn()
+        fetch = self._loop.create_future()
+        request = self._loop.create_task(
+            asyncio.wait_for(client.get(path), timeout))
+        self._requests.add(request)
+        fetch.add_done_callback(lambda _: request.cancel())
+        request.add_done_callback(
+            functools.partial(self._on_request_done, fetch, path, start_time))
+        return fetch
+
+    def _on_request_done(self, fetch, path, start_time, request):
+        self._requests.discard(request)
+        if fetch.done():
+            return
+        timing = state.QueryTiming(
+            start_time=start_time, end_time=self._time_fn())
+        if request.cancelled():
+            fetch.set_result(
+                _Fetch(timing, None,
+                       CancelledQueryError('Query to %s was cancelled' % path)))
+        elif isinstance(request.exception(), asyncio.TimeoutError):
+            fetch.set_result(
+                _Fetch(timing, None,
+                       QueryTimeoutError('Query to %s timed out' % path)))
+        elif request.exception():
+            fetch.set_result(_Fetch(timing, None, request.exception()))
+        else:
+            fetch.set_result(_Fetch(timing, request.result(), None))
+
+    def _on_fetched(self, polled, query_groups, fetches_by_client, gathered):
+        if polled.done() or gathered.cancelled():
+            return
+        results_by_client = [{
+            group: fetch.result()
+            for group, fetch in fetches.items()
+        }
+                             for fetches in fetches_by_client]
+        building = self._loop.run_in_executor(None, self._build_states,
+                                              query_groups, results_by_client)
+        building.add_done_callback(functools.partial(_copy_outcome, polled))
+
+    def _build_states(self, query_groups, results_by_client):
+        """Builds each node's SiaState from its fetches, on an executor thread.
+
+        Args:
+            query_groups: The query groups that were fetched, as for poll().
+            results_by_client: A list with a dict for each node, mapping each
+                fetched group to its _Fetch.
+
+        Returns:
+            A list of SiaState, one for each node.
+        """
+        states = []
+        for builder, fetched_api, results in zip(
+                self.builders, self._fetched_apis, results_by_client):
+            fetched_api.set_fetches({
+                _QUERY_PATHS[group]: result
+                for group, result in results.items()
+            })
+            states.append(
+                builder.build(
+                    query_groups,
+                    query_timings={
+                        group: result.timing
+                        for group, result in results.items()
+                    },
+                    late_groups=[
+                        group for group, result in results.items()
+                        if isinstance(result.error, QueryTimeoutError)
+                    ],
+                    late_policy=self._deadlines.late_policy))
+        return states
+
+
+class AsyncSink(object):
+    """Passes items to a function on a thread of its own, one at a time.
+
+    A drop-in for sink.Sink whose put() never blocks the event loop. Under the
+    BLOCK policy, put() queues the item even if the queue is full, and the
+    caller waits on room() before putting more.
+    """
+
+    def __init__(self,
+                 loop,
+                 name,
+                 handle_fn,
+                 capacity,
+                 backpressure_policy=sink.BLOCK):
+        """Creates a new AsyncSink.
+
+        Args:
+            loop: asyncio event loop to run on.
+            name: Name of the sink, for logs and stats.
+            handle_fn: Function to call with each item, in the order the items
+                were put, on the sink's own thread. Exceptions it raises are
+                logged and otherwise ignored.
+            capacity: Maximum number of items waiting on the queue.
+            backpressure_policy: One of sink.BACKPRESSURE_POLICIES.
+        """
+        if capacity <= 0:
+            raise ValueError('Capacity must be positive: %s' % capacity)
+        if backpressure_policy not in sink.BACKPRESSURE_POLICIES:
+            raise ValueError(
+                'Unknown backpressure policy: %s' % backpressure_policy)
+        self.name = name
+        self._loop = loop
+        self._handle_fn = handle_fn
+        self._capacity = capacity
+        self._backpressure_policy = backpressure_policy
+        self._items = collections.deque()
+        # Runs handle_fn, so that a slow sink only holds up its own items, not
+        # other sinks' or the loop's other executor work. Created on first use,
+        # as close() shuts it down.
+        self._executor = None
+        # Future of the item being handled, or None if the sink is idle.
+        self._handling = None
+        # Futures waiting for room on the queue, or for it to drain.
+        self._room_waiters = []
+        self._drain_waiters = []
+        self._max_depth = 0
+        self._put_count = 0
+        self._dropped_count = 0
+
+    def put(self, item):
+        """Queues an item, applying the backpressure policy if it's full."""
+        self._put_count += 1
+        if len(self._items) >= self._capacity:
+            if self._backpressure_policy == sink.DROP_NEWEST:
+                self._dropped_count += 1
+                return
+            if self._backpressure_policy == sink.DROP_OLDEST:
+                self._items.popleft()
+                self._dropped_count += 1
+        self._items.append(item)
+        self._max_depth = max(self._max_depth, len(self._items))
+        self._handle_next()
+
+    def room(self):
+        """Returns an asyncio.Future that's done once there's room to put.
+
+        Only the BLOCK policy waits for the queue to have room. The others
+        make room by dropping items.
+        """
+        waiter = self._loop.create_future()
+        if (self._backpressure_policy != sink.BLOCK or
+                len(self._items) < self._capacity):
+            waiter.set_result(None)
+        else:
+            self._room_waiters.append(waiter)
+        return waiter
+
+    def close(self):
+        """Runs the loop until every queued item has been handled.
+
+        Then stops the sink's thread, until the next item is put. Must not be
+        called while the loop is running.
+        """
+        if self._items or self._handling:
+            drained = self._loop.create_future()
+            self._drain_waiters.append(drained)
+            self._loop.run_until_complete(drained)
+        if self._executor:
+            self._executor.shutdown()
+            self._executor = None
+
+    def stats(self):
+        """Returns sink.QueueStats counting queue usage so far."""
+        return sink.QueueStats(
+            depth=len(self._items),
+            max_depth=self._max_depth,
+            capacity=self._capacity,
+            put_count=self._put_count,
+            dropped_count=self._dropped_count)
+
+    def _handle_next(self):
+        if self._handling or not self._items:
+            return
+        item = self._items.popleft()
+        if not self._executor:
+            self._executor = futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='sink-' + self.name)
+        self._handling = self._loop.run_in_executor(self._executor,
+                                                    self._handle_fn, item)
+        self._handling.add_done_callback(self._on_handled)
+        if len(self._items) < self._capacity:
+            _resolve_all(self._room_waiters)
+
+    def _on_handled(self, handling):
+        self._handling = None
+        if not handling.cancelled() and handling.exception():
+            logger.error(
+                'Sink %s failed to handle item',
+                self.name,
+                exc_info=handling.exception())
+        self._handle_next()
+        if not self._handling:
+            _resolve_all(self._drain_waiters)
+
+
+def poll_forever(loop, engine, poll_scheduler, cadences, handle_poll_fn, sinks):
+    """Polls on schedule, using the loop's timers, until cancelled.
+
+    Each poll starts at its scheduled time once the previous poll is done and
+    every sink has room, so a full sink under the BLOCK policy holds back
+    polling, as it does with threads.
+
+    Args:
+        loop: asyncio event loop to poll on.
+        engine: Engine to poll with.
+        poll_scheduler: scheduler.Scheduler whose clock is the loop's time().
+        cadences: cadence.Cadences of the query groups.
+        handle_poll_fn: Function called on the loop with the poll's index
+            (counting from 0), its scheduler.Tick, and its list of SiaState.
+        sinks: A list of AsyncSink that handle_poll_fn puts items on.
+
+    Returns:
+        An asyncio.Future that fails if a poll fails, and otherwise never
+        completes until cancelled.
+    """
+    return _PollLoop(loop, engine, poll_scheduler, cadences, handle_poll_fn,
+                     sinks).start()
+
+
+class _PollLoop(object):
+    """Runs poll_forever() by chaining callbacks from one poll to the next."""
+
+    def __init__(self, loop, engine, poll_scheduler, cadences, handle_poll_fn,
+                 sinks):
+        self._loop = loop
+        self._engine = engine
+        self._scheduler = poll_scheduler
+        self._cadences = cadences
+        self._handle_poll_fn = handle_poll_fn
+        self._sinks = sinks
+        self._done = loop.create_future()
+        self._done.add_done_callback(self._on_done)
+        self._start_time = None
+        self._next_index = 0
+        self._poll_count = 0
+        # The pending timer, poll, or wait for sinks, to cancel when done.
+        self._pending = None
+
+    def start(self):
+        self._start_time = self._loop.time()
+        self._schedule_next_poll()
+        return self._done
+
+    def _schedule_next_poll(self):
+        index, scheduled_time, missed_count = self._scheduler.next_slot(
+            self._start_time, self._next_index)
+        self._pending = self._loop.call_at(scheduled_time, self._poll, index,
+                                           scheduled_time, missed_count)
+
+    def _poll(self, index, scheduled_time, missed_count):
+        tick = scheduler.Tick(
+            index=index,
+            lateness=self._loop.time() - scheduled_time,
+            missed_count=missed_count)
+        self._next_index = index + 1
+        self._pending = self._engine.poll(self._cadences.due_groups(index))
+        self._pending.add_done_callback(
+            functools.partial(self._on_polled, tick))
+
+    def _on_polled(self, tick, polled):
+        if self._done.done() or polled.cancelled():
+            return
+        try:
+            self._handle_poll_fn(self._poll_count, tick, polled.result())
+        except Exception as e:
+            self._done.set_exception(e)
+            return
+        self._poll_count += 1
+        self._pending = asyncio.gather(*[s.room() for s in self._sinks])
+        self._pending.add_done_callback(self._on_room)
+
+    def _on_room(self, room):
+        if not self._done.done() and not room.cancelled():
+            self._schedule_next_poll()
+
+    def _on_done(self, _):
+        if self._pending:
+            self._pending.cancel()
+
+
+def _copy_outcome(result, source):
+    """Completes a future the way another finished, unless it's done already.
+
+    Args:
+        result: asyncio.Future to complete.
+        source: Finished future whose result, exception, or cancellation to
+            copy.
+    """
+    if result.done():
+        return
+    if source.cancelled():
+        result.cancel()
+    elif source.exception():
+        result.set_exception(source.exception())
+    else:
+        result.set_result(source.result())
+
+
+def _resolve_all(waiters):
+    for waiter in waiters:
+        if not waiter.done():
+            waiter.set_result(None)
+    del waiters[:]
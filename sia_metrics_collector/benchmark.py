@@ -0,0 +1,560 @@
+#!/usr/bin/python2
+"""Benchmarks the collector's hot paths on synthetic Sia API responses.
+
+Each case times one operation, and measures how much the process's peak
+memory grows while running it:
+
+    populate_contract_metrics: Builder aggregating a /renter/contracts
+        response with the given number of contracts.
+    populate_file_metrics: Builder aggregating a /renter/files response with
+        the given number of files.
+    contract_sum_batched: Like populate_contract_metrics, but always summing
+        the contracts' hastings in NumPy batches, at the contract counts in
+        BATCH_SUM_SIZES. Skipped if NumPy is not installed.
+    contract_sum_loop: Like contract_sum_batched, but always summing them one
+        contract at a time. The sizes at which it's slower than
+        contract_sum_batched show whether state's batch sum threshold still
+        holds.
+    csv_write_state: CsvSerializer writing one fully populated SiaState.
+    console_string: Formatting one SiaState for the console.
+    once_run: The collector polling a siad_simulator node with --once, from
+        starting the interpreter until it exits. As the collector runs in its
+        own process, the case's peak memory is always near zero.
+
+Aggregation cases run once per payload size; the others don't depend on the
+size, so run once. The contract sum cases run at their own sizes, around the
+threshold they test. Every case runs in a fresh child process, so that one
+case's memory use doesn't hide another's. Peak memory is how far the child's
+resident set size rises above what it held after building the payload, so it
+has page granularity and small allocations show up as zero. On Linux, the
+child resets its peak resident set size before running the operation; on
+other platforms, memory used while building the payload can hide the
+operation's.
+
+Results are written as JSON:
+
+    {
+      "python": "2.7.18",
+      "results": {
+        "populate_contract_metrics/1000": {
+          "seconds": 0.0021,
+          "peak_memory_bytes": 0,
+          "operations_per_second": 476.2
+        },
+        ...
+      }
+    }
+
+Given a baseline from an earlier run, the benchmark compares the two and
+exits with status 1 if any case got slower or used more memory beyond the
+allowed tolerance. It also exits with status 1 if once_run takes longer than
+its budget, as cron jobs pay its time on every run.
+"""
+
+from __future__ import print_function
+
+import argparse
+import datetime
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+
+from sia_metrics_collector import cli
+from sia_metrics_collector import process_stats
+from sia_metrics_collector import serialize
+from sia_metrics_collector import siad_simulator
+from sia_metrics_collector import state
+
+DEFAULT_SIZES = (10, 1000, 100000, 1000000)
+
+# Contract counts to compare batched and one at a time contract sums at,
+# around state._BATCH_SUM_MIN_CONTRACTS.
+BATCH_SUM_SIZES = (1024, 2048, 4096, 8192, 16384, 32768)
+
+# Default fraction by which a case may exceed its baseline before it counts as
+# a regression. Timings on a shared machine vary by several percent from run
+# to run.
+DEFAULT_TIME_TOLERANCE = 0.25
+DEFAULT_MEMORY_TOLERANCE = 0.25
+
+# Default seconds that once_run may take, however fast its baseline was.
+DEFAULT_ONCE_BUDGET = 1.0
+
+# Memory growth below this is never a regression, as it is within the noise of
+# RSS page granularity and the allocator reusing freed memory.
+_MIN_MEMORY_REGRESSION_BYTES = 1024 * 1024
+
+# Each timing runs the operation enough times to take at least this long.
+_MIN_TIMING_SECONDS = 0.2
+# Number of timings to take the fastest of.
+_TIMING_REPEATS = 3
+
+# Number of distinct values each synthetic field draws from. Sharing values
+# across entries keeps million-entry payloads from taking gigabytes.
+_VALUE_POOL_SIZE = 1000
+_RANDOM_SEED = 0
+
+_CONTRACT_HASTINGS_FIELDS = (u'totalcost', u'fees', u'StorageSpending',
+                             u'uploadspending', u'downloadspending',
+                             u'renterfunds')
+
+_SIZED_CASES = ('populate_contract_metrics', 'populate_file_metrics')
+_BATCH_SUM_CASES = ('contract_sum_batched', 'contract_sum_loop')
+_UNSIZED_CASES = ('csv_write_state', 'console_string', 'once_run')
+CASES = _SIZED_CASES + _BATCH_SUM_CASES + _UNSIZED_CASES
+
+
+class Error(Exception):
+    pass
+
+
+class InvalidBaselineError(Error):
+    pass
+
+
+def make_contracts_response(contract_count):
+    """Creates a synthetic /renter/contracts response.
+
+    Args:
+        contract_count: Total number of contracts. A quarter of them are
+            inactive.
+
+    Returns:
+        A parsed response, like api.SiaApi.get_renter_contracts() returns.
+    """
+    rng = random.Random(_RANDOM_SEED)
+    pools = {
+        field:
+        [u'%d' % rng.randint(10**20, 10**27) for _ in range(_VALUE_POOL_SIZE)]
+        for field in _CONTRACT_HASTINGS_FIELDS
+    }
+    sizes = [rng.randint(0, 2**40) for _ in range(_VALUE_POOL_SIZE)]
+    contracts = []
+    for i in range(contract_count):
+        contract = {
+            field: pool[(i * 7 + j) % _VALUE_POOL_SIZE]
+            for j, (field, pool) in enumerate(pools.items())
+        }
+        contract[u'size'] = sizes[i % _VALUE_POOL_SIZE]
+        contracts.append(contract)
+    inactive_count = contract_count // 4
+    return {
+        u'activecontracts': contracts[inactive_count:],
+        u'inactivecontracts': contracts[:inactive_count],
+    }
+
+
+def make_files_response(file_count):
+    """Creates a synthetic /renter/files response.
+
+    Args:
+        file_count: Number of files. About one in ten is still uploading.
+
+    Returns:
+        A parsed response, like api.SiaApi.get_renter_files() returns.
+    """
+    rng = random.Random(_RANDOM_SEED)
+    sizes = [rng.randint(1, 2**34) for _ in range(_VALUE_POOL_SIZE)]
+    progresses = [
+        100 if rng.random() < 0.9 else rng.uniform(0, 100)
+        for _ in range(_VALUE_POOL_SIZE)
+    ]
+    files = []
+    for i in range(file_count):
+        size = sizes[i % _VALUE_POOL_SIZE]
+        progress = progresses[(i * 7) % _VALUE_POOL_SIZE]
+        files.append({
+            u'filesize': size,
+            u'uploadprogress': progress,
+            u'uploadedbytes': int(size * progress / 100),
+        })
+    return {u'files': files}
+
+
+def make_full_state():
+    """Creates a SiaState with every field set, as after a successful poll."""
+    sia_state = state.SiaState()
+    for i, field in enumerate(state.SiaState._fields):
+        kind = state.FIELD_KINDS[field]
+        if kind == state.TIMESTAMP:
+            value = datetime.datetime(2018, 2, 11, 16, 5, 2, 1000 * i)
+        elif kind == state.HASTINGS:
+            value = 123456789012345678901234567 * (i + 1)
+        elif kind == state.FLOAT:
+            value = 1234.5 + i
+        elif kind == state.INTEGER:
+            value = 1000 + i
+        else:
+            value = u'renter-1'
+        setattr(sia_state, field, value)
+    return sia_state
+
+
+class _FakeSiaApi(object):
+    """Serves fixed responses, as new objects so that none are memoized."""
+
+    def __init__(self, contracts_response=None, files_response=None):
+        self._contracts_response = contracts_response
+        self._files_response = files_response
+        self.response_sizes = {}
+
+    def get_renter_contracts(self):
+        return dict(self._contracts_response)
+
+    def get_renter_files(self):
+        return dict(self._files_response)
+
+
+def run_case(case, size):
+    """Runs a benchmark case in the current process.
+
+    Args:
+        case: Name of the case, one of CASES.
+        size: Number of entries in the case's payload. Ignored by cases that
+            have no payload.
+
+    Returns:
+        A dict of the case's results.
+    """
+    cleanup = lambda: None
+    if case == 'populate_contract_metrics':
+        builder = state.Builder(
+            _FakeSiaApi(contracts_response=make_contracts_response(size)),
+            time_fn=datetime.datetime.utcnow)
+        operation = lambda: builder._populate_contract_metrics(state.SiaState())
+    elif case in _BATCH_SUM_CASES:
+        builder = state.Builder(
+            _FakeSiaApi(contracts_response=make_contracts_response(size)),
+            time_fn=datetime.datetime.utcnow)
+        operation = lambda: builder._populate_contract_metrics(state.SiaState())
+        # Forces the Builder's choice between summing in batches or one
+        # contract at a time, whatever the number of contracts.
+        original_min_contracts = state._BATCH_SUM_MIN_CONTRACTS
+        state._BATCH_SUM_MIN_CONTRACTS = (0 if case == 'contract_sum_batched'
+                                          else sys.maxsize)
+
+        def cleanup():
+            state._BATCH_SUM_MIN_CONTRACTS = original_min_contracts
+    elif case == 'populate_file_metrics':
+        builder = state.Builder(
+            _FakeSiaApi(files_response=make_files_response(size)),
+            time_fn=datetime.datetime.utcnow)
+        operation = lambda: builder._populate_file_metrics(state.SiaState())
+    elif case == 'csv_write_state':
+        output_dir = tempfile.mkdtemp()
+        csv_file = open(os.path.join(output_dir, 'metrics.csv'), 'w')
+
+        def cleanup():
+            csv_file.close()
+            shutil.rmtree(output_dir)
+
+        serializer = serialize.CsvSerializer(csv_file)
+        sia_state = make_full_state()
+        operation = lambda: serializer.write_state(sia_state)
+    elif case == 'console_string':
+        sia_state = make_full_state()
+        operation = lambda: cli._make_console_string(sia_state)
+    elif case == 'once_run':
+        simulator = siad_simulator.Simulator()
+        output_dir = tempfile.mkdtemp()
+        devnull = open(os.devnull, 'w')
+
+        def cleanup():
+            devnull.close()
+            simulator.close()
+            shutil.rmtree(output_dir)
+
+        command = [
+            sys.executable, '-m', 'sia_metrics_collector.main', '--once',
+            '--node',
+            siad_simulator.make_node_specs([simulator])[0], '--output_file',
+            os.path.join(output_dir, 'metrics.csv')
+        ]
+        # Runs the collector from the directory holding this package, so that
+        # it's the one benchmarked.
+        package_parent = os.path.dirname(
+            os.path.dirname(os.path.abspath(__file__)))
+        operation = lambda: subprocess.check_call(
+            command, cwd=package_parent, stdout=devnull, stderr=devnull)
+    else:
+        raise ValueError('Unknown benchmark case: %s' % case)
+    try:
+        # The first call pays one-time costs, like importing modules, that
+        # aren't part of the steady-state cost of each poll.
+        operation()
+        gc.collect()
+        process_stats.reset_peak_rss()
+        peak_rss_before = process_stats.peak_rss_bytes()
+        seconds = _time_operation(operation)
+        peak_memory_bytes = max(
+            0,
+            process_stats.peak_rss_bytes() - peak_rss_before)
+    finally:
+        cleanup()
+    return {
+        'seconds': seconds,
+        'peak_memory_bytes': peak_memory_bytes,
+        'operations_per_second': 1.0 / seconds if seconds else None,
+    }
+
+
+def run_benchmarks(cases=CASES, sizes=DEFAULT_SIZES):
+    """Runs benchmark cases, each in a new child process.
+
+    Args:
+        cases: Names of the cases to run.
+        sizes: Payload sizes to run each sized case with.
+
+    Returns:
+        A dict of results, keyed by result_key().
+    """
+    results = {}
+    for case in cases:
+        if case == 'contract_sum_batched' and not _can_batch_sum():
+            continue
+        if case in _SIZED_CASES:
+            case_sizes = sizes
+        elif case in _BATCH_SUM_CASES:
+            case_sizes = BATCH_SUM_SIZES
+        else:
+            case_sizes = (None,)
+        for size in case_sizes:
+            pool = multiprocessing.Pool(processes=1)
+            try:
+                results[result_key(case, size)] = pool.apply(
+                    run_case, (case, size))
+            finally:
+                pool.terminate()
+                pool.join()
+    return results
+
+
+def result_key(case, size):
+    """Returns the key of a case's results, e.g. 'populate_file_metrics/10'."""
+    if size is None:
+        return case
+    return '%s/%d' % (case, size)
+
+
+def find_regressions(results,
+                     baseline,
+                     time_tolerance=DEFAULT_TIME_TOLERANCE,
+                     memory_tolerance=DEFAULT_MEMORY_TOLERANCE):
+    """Compares results to a baseline.
+
+    Cases missing from either the results or the baseline are skipped.
+
+    Args:
+        results: A dict of results, as run_benchmarks() returns.
+        baseline: A dict of results from an earlier run.
+        time_tolerance: Fraction by which a case may be slower than its
+            baseline.
+        memory_tolerance: Fraction by which a case's peak memory may exceed
+            its baseline.
+
+    Returns:
+        A list of strings describing each regression, sorted by case.
+    """
+    regressions = []
+    for key in sorted(set(results) & set(baseline)):
+        result = results[key]
+        expected = baseline[key]
+        if result['seconds'] > expected['seconds'] * (1 + time_tolerance):
+            regressions.append('%s: %s per operation, baseline %s' %
+                               (key, _format_seconds(result['seconds']),
+                                _format_seconds(expected['seconds'])))
+        memory_limit = max(expected['peak_memory_bytes'] *
+                           (1 + memory_tolerance), _MIN_MEMORY_REGRESSION_BYTES)
+        if result['peak_memory_bytes'] > memory_limit:
+            regressions.append('%s: %d bytes peak memory, baseline %d' %
+                               (key, result['peak_memory_bytes'],
+                                expected['peak_memory_bytes']))
+    return regressions
+
+
+def find_over_budget(results, once_budget=DEFAULT_ONCE_BUDGET):
+    """Checks that once_run took no longer than its budget.
+
+    Args:
+        results: A dict of results, as run_benchmarks() returns.
+        once_budget: Seconds that once_run may take.
+
+    Returns:
+        A list of strings describing each case over its budget.
+    """
+    result = results.get('once_run')
+    if result and result['seconds'] > once_budget:
+        return [
+            'once_run: %s per operation, budget %s' %
+            (_format_seconds(result['seconds']), _format_seconds(once_budget))
+        ]
+    return []
+
+
+def find_batch_sum_crossover(results):
+    """Finds the contract count from which batched contract sums are faster.
+
+    Args:
+        results: A dict of results, as run_benchmarks() returns.
+
+    Returns:
+        The smallest size in BATCH_SUM_SIZES from which contract_sum_batched
+        is faster than contract_sum_loop at every larger size, or None if it
+        isn't faster at the largest size, or either case didn't run.
+    """
+    crossover = None
+    for size in reversed(BATCH_SUM_SIZES):
+        batched = results.get(result_key('contract_sum_batched', size))
+        loop = results.get(result_key('contract_sum_loop', size))
+        if not batched or not loop or batched['seconds'] >= loop['seconds']:
+            break
+        crossover = size
+    return crossover
+
+
+def load_baseline(baseline_path):
+    """Reads the results of an earlier run from a JSON file.
+
+    Raises:
+        InvalidBaselineError: The file is not a benchmark results file.
+    """
+    with open(baseline_path) as baseline_file:
+        try:
+            baseline = json.load(baseline_file)
+        except ValueError as e:
+            raise InvalidBaselineError('Baseline is not valid JSON: %s' % e)
+    if not isinstance(baseline, dict) or not isinstance(
+            baseline.get('results'), dict):
+        raise InvalidBaselineError(
+            'Baseline has no results: %s' % baseline_path)
+    return baseline['results']
+
+
+def _can_batch_sum():
+    """Returns whether state can sum contracts in batches, i.e. has NumPy."""
+    return state._sum_contract_fields([]) is not None
+
+
+def _time_operation(operation):
+    """Returns the fastest time of an operation, in seconds per call."""
+    timer = timeit.Timer(operation)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= _MIN_TIMING_SECONDS:
+            break
+        number *= 10
+    timings = [elapsed] + timer.repeat(_TIMING_REPEATS - 1, number)
+    return min(timings) / number
+
+
+def _format_seconds(seconds):
+    if seconds < 1e-3:
+        return '%.1fus' % (seconds * 1e6)
+    if seconds < 1:
+        return '%.2fms' % (seconds * 1e3)
+    return '%.3fs' % seconds
+
+
+def _print_results(results):
+    print('case                                   per op    ops/s   peak MB')
+    for key in sorted(results):
+        result = results[key]
+        print('{key:<36} {seconds:>9} {ops:>8.0f} {memory:>9.1f}'.format(
+            key=key,
+            seconds=_format_seconds(result['seconds']),
+            ops=result['operations_per_second'],
+            memory=result['peak_memory_bytes'] / (1024.0 * 1024.0)))
+
+
+def main(args):
+    baseline = load_baseline(args.baseline) if args.baseline else None
+    cases = args.cases.split(',') if args.cases else CASES
+    for case in cases:
+        if case not in CASES:
+            sys.exit('Unknown benchmark case: %s' % case)
+    sizes = ([int(size) for size in args.sizes.split(',')]
+             if args.sizes else DEFAULT_SIZES)
+    results = run_benchmarks(cases, sizes)
+    _print_results(results)
+    if set(_BATCH_SUM_CASES) <= set(cases) and _can_batch_sum():
+        crossover = find_batch_sum_crossover(results)
+        if crossover:
+            print('Batched contract sums are faster from %d contracts '
+                  '(threshold: %d)' % (crossover,
+                                       state._BATCH_SUM_MIN_CONTRACTS))
+        else:
+            print('Batched contract sums are slower at %d contracts '
+                  '(threshold: %d)' % (BATCH_SUM_SIZES[-1],
+                                       state._BATCH_SUM_MIN_CONTRACTS))
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(
+                {
+                    'python': platform.python_version(),
+                    'results': results,
+                },
+                output_file,
+                indent=2,
+                sort_keys=True)
+    over_budget = find_over_budget(results, args.once_budget)
+    for case in over_budget:
+        print('Over budget: %s' % case)
+    regressions = []
+    if baseline is not None:
+        regressions = find_regressions(results, baseline, args.time_tolerance,
+                                       args.memory_tolerance)
+        for regression in regressions:
+            print('Regression: %s' % regression)
+    if over_budget or regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='Sia Metrics Collector Benchmark',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        '-o', '--output', help='Path to write results to, as JSON')
+    parser.add_argument(
+        '--baseline',
+        help=('Path to results of an earlier run. If any case regressed '
+              'compared to it, exits with status 1'))
+    parser.add_argument(
+        '--cases',
+        help=('Comma-separated names of cases to run (%s). Runs all cases if '
+              'unset' % ', '.join(CASES)))
+    parser.add_argument(
+        '--sizes',
+        help=('Comma-separated numbers of contracts or files to aggregate. '
+              'Defaults to %s. The contract sum cases always run at %s' %
+              (','.join(str(s) for s in DEFAULT_SIZES), ','.join(
+                  str(s) for s in BATCH_SUM_SIZES))))
+    parser.add_argument(
+        '--time_tolerance',
+        type=float,
+        default=DEFAULT_TIME_TOLERANCE,
+        help=('Fraction by which a case may be slower than its baseline '
+              'before it counts as a regression'))
+    parser.add_argument(
+        '--memory_tolerance',
+        type=float,
+        default=DEFAULT_MEMORY_TOLERANCE,
+        help=('Fraction by which a case\'s peak memory may exceed its '
+              'baseline before it counts as a regression (growth under 1 MiB '
+              'never does)'))
+    parser.add_argument(
+        '--once_budget',
+        type=float,
+        default=DEFAULT_ONCE_BUDGET,
+        help=('Seconds that once_run may take, from starting the collector '
+              'until it exits. If it takes longer, exits with status 1'))
+    main(parser.parse_args())
@@ -0,0 +1,408 @@
+"""Serializes SiaState to an append-only file of fixed-width binary records.
+
+A file consists of a header followed by one record per SiaState. Because every
+record is the same size, record i begins at header_size + i * record_size, so
+readers can jump straight to any record, or memory-map the whole file as a
+NumPy structured array without parsing it.
+
+Header (all integers little-endian):
+    magic: 8 bytes, always 'SIAMETRC'.
+    version: uint16 format version.
+    field_count: uint16 number of fields in each record.
+    header_size: uint32 size of the header (including padding) in bytes.
+    record_size: uint32 size of each record in bytes.
+    field_count field descriptors, each:
+        kind: uint8 code for the kind of value (see _KIND_CODES).
+        width: uint8 size of the field's value in bytes.
+        name_length: uint8 length of the field's name.
+        name: name_length bytes of the field's name.
+    Zero padding up to header_size, which is a multiple of 64.
+
+Record:
+    null_mask: ceil(field_count / 64) uint64 words. Bit i (counting from the
+        least significant bit of the first word) is set if field i is None.
+    One value per field, in header order, encoded according to its kind:
+        timestamp: int64 microseconds since the Unix epoch.
+        float: float64.
+        integer: int64.
+        hastings: unsigned 128-bit integer, as a uint64 of the low 64 bits
+            followed by a uint64 of the high 64 bits.
+        string: UTF-8 bytes, NUL-padded to the field's width. Longer strings
+            are truncated.
+    Fields that are None are written as zero (NaN for floats, the minimum
+    int64 for timestamps, so NumPy reads them as NaT).
+"""
+
+import calendar
+import collections
+import datetime
+import os
+import struct
+
+from sia_metrics_collector import buffered_writer
+from sia_metrics_collector import state
+
+_MAGIC = b'SIAMETRC'
+_VERSION = 1
+_HEADER_PREFIX_FORMAT = '<8sHHII'
+_FIELD_DESCRIPTOR_FORMAT = '<BBB'
+_HEADER_ALIGNMENT = 64
+_STRING_WIDTH = 32
+_UINT64_MASK = (1 << 64) - 1
+_EPOCH = datetime.datetime(1970, 1, 1)
+# NumPy reads the minimum int64 as NaT ("not a time").
+_NULL_TIMESTAMP = -(1 << 63)
+
+_KIND_CODES = {
+    state.TIMESTAMP: 1,
+    state.FLOAT: 2,
+    state.INTEGER: 3,
+    state.HASTINGS: 4,
+    state.STRING: 5,
+}
+_KINDS_BY_CODE = {code: kind for kind, code in _KIND_CODES.items()}
+
+# Width (in bytes) of each kind of value, and its struct format.
+_KIND_WIDTHS = {
+    state.TIMESTAMP: 8,
+    state.FLOAT: 8,
+    state.INTEGER: 8,
+    state.HASTINGS: 16,
+    state.STRING: _STRING_WIDTH,
+}
+_KIND_FORMATS = {
+    state.TIMESTAMP: 'q',
+    state.FLOAT: 'd',
+    state.INTEGER: 'q',
+    state.HASTINGS: 'QQ',
+    state.STRING: '%ds' % _STRING_WIDTH,
+}
+
+# Constant for Python's file seek() function.
+_FROM_FILE_END = 2
+"""Describes a single field of a record.
+
+Fields:
+    name: Name of the SiaState field.
+    kind: Kind of value the field holds (e.g. state.HASTINGS).
+    width: Size of the field's value in bytes.
+"""
+FieldDescriptor = collections.namedtuple('FieldDescriptor',
+                                         ['name', 'kind', 'width'])
+
+
+class Error(Exception):
+    pass
+
+
+class InvalidFileError(Error):
+    pass
+
+
+class SchemaMismatchError(Error):
+    pass
+
+
+class Schema(object):
+    """Layout of the records in a binary metrics file."""
+
+    def __init__(self, fields):
+        """Creates a new Schema.
+
+        Args:
+            fields: A list of FieldDescriptor, in record order.
+        """
+        self.fields = tuple(fields)
+        self.null_mask_words = (len(self.fields) + 63) // 64
+        self._struct = struct.Struct('<' + 'Q' * self.null_mask_words + ''.join(
+            _KIND_FORMATS[f.kind] for f in self.fields))
+        self.record_size = self._struct.size
+        self.header_size = _round_up(
+            struct.calcsize(_HEADER_PREFIX_FORMAT) + sum(
+                struct.calcsize(_FIELD_DESCRIPTOR_FORMAT) + len(f.name)
+                for f in self.fields), _HEADER_ALIGNMENT)
+
+    def __eq__(self, other):
+        return isinstance(other, Schema) and self.fields == other.fields
+
+    def __ne__(self, other):
+        return not self == other
+
+    def encode_header(self):
+        header = struct.pack(_HEADER_PREFIX_FORMAT, _MAGIC, _VERSION,
+                             len(self.fields), self.header_size,
+                             self.record_size)
+        for field in self.fields:
+            header += struct.pack(_FIELD_DESCRIPTOR_FORMAT,
+                                  _KIND_CODES[field.kind], field.width,
+                                  len(field.name)) + field.name.encode('ascii')
+        return header.ljust(self.header_size, b'\0')
+
+    def encode_record(self, sia_state):
+        null_mask = 0
+        values = []
+        for i, field in enumerate(self.fields):
+            value = getattr(sia_state, field.name)
+            if value is None:
+                null_mask |= 1 << i
+            values.extend(_encode_value(field.kind, value))
+        mask_words = [(null_mask >> (64 * i)) & _UINT64_MASK
+                      for i in range(self.null_mask_words)]
+        return self._struct.pack(*(mask_words + values))
+
+    def decode_record(self, record):
+        values = self._struct.unpack(record)
+        null_mask = 0
+        for i in range(self.null_mask_words):
+            null_mask |= values[i] << (64 * i)
+        position = self.null_mask_words
+        decoded = {}
+        for i, field in enumerate(self.fields):
+            value_count = len(_KIND_FORMATS[field.kind])
+            if field.kind == state.STRING:
+                value_count = 1
+            raw_values = values[position:position + value_count]
+            position += value_count
+            if null_mask & (1 << i):
+                decoded[field.name] = None
+            else:
+                decoded[field.name] = _decode_value(field.kind, raw_values)
+        return decoded
+
+
+def current_schema():
+    """Returns the Schema for records of the current SiaState fields."""
+    return Schema([
+        FieldDescriptor(
+            name=name,
+            kind=state.FIELD_KINDS[name],
+            width=_KIND_WIDTHS[state.FIELD_KINDS[name]])
+        for name in state.SiaState._fields
+    ])
+
+
+def read_schema(binary_file):
+    """Reads the schema from the header of a binary metrics file.
+
+    Args:
+        binary_file: File object open for reading in binary mode. Reading
+            starts from the beginning of the file.
+
+    Returns:
+        The file's Schema.
+
+    Raises:
+        InvalidFileError: The file does not begin with a valid header.
+    """
+    binary_file.seek(0)
+    prefix_size = struct.calcsize(_HEADER_PREFIX_FORMAT)
+    prefix = binary_file.read(prefix_size)
+    if len(prefix) < prefix_size:
+        raise InvalidFileError('File is too short to contain a header')
+    magic, version, field_count, header_size, record_size = struct.unpack(
+        _HEADER_PREFIX_FORMAT, prefix)
+    if magic != _MAGIC:
+        raise InvalidFileError('File is not a binary metrics file')
+    if version != _VERSION:
+        raise InvalidFileError('Unsupported format version: %d' % version)
+    descriptor_size = struct.calcsize(_FIELD_DESCRIPTOR_FORMAT)
+    fields = []
+    for _ in range(field_count):
+        kind_code, width, name_length = struct.unpack(
+            _FIELD_DESCRIPTOR_FORMAT, binary_file.read(descriptor_size))
+        if kind_code not in _KINDS_BY_CODE:
+            raise InvalidFileError('Unknown field kind: %d' % kind_code)
+        fields.append(
+            FieldDescriptor(
+                # Names are ASCII, so they convert to str on Python 2 too.
+                name=str(binary_file.read(name_length).decode('ascii')),
+                kind=_KINDS_BY_CODE[kind_code],
+                width=width))
+    schema = Schema(fields)
+    if (schema.header_size, schema.record_size) != (header_size, record_size):
+        raise InvalidFileError('Header sizes do not match field descriptors')
+    return schema
+
+
+def read_states(binary_file):
+    """Reads every record from a binary metrics file.
+
+    This decodes records in pure Python. For fast, zero-copy access to large
+    files, use load_records instead.
+
+    Args:
+        binary_file: File object open for reading in binary mode.
+
+    Yields:
+        A SiaState for each complete record in the file. Fields in the
+        file that SiaState lacks are ignored.
+    """
+    schema = read_schema(binary_file)
+    binary_file.seek(schema.header_size)
+    while True:
+        record = binary_file.read(schema.record_size)
+        if len(record) < schema.record_size:
+            return
+        decoded = schema.decode_record(record)
+        sia_state = state.SiaState()
+        for name, value in decoded.items():
+            if name in state.FIELD_KINDS:
+                setattr(sia_state, name, value)
+        yield sia_state
+
+
+def load_records(path):
+    """Memory-maps a binary metrics file as a NumPy structured array.
+
+    No data is copied or parsed up front, so this takes the same time no
+    matter how large the file is, and record i is simply records[i].
+
+    Timestamp fields are datetime64[us] (NaT if None), floats are float64
+    (NaN if None), and hastings fields are sub-arrays with 'lo' and 'hi'
+    uint64 fields (see hastings_to_long). The 'null_mask' field holds the
+    bitmask of None fields.
+
+    Requires NumPy.
+
+    Args:
+        path: Path to the binary metrics file.
+
+    Returns:
+        A read-only numpy.memmap of the file's complete records.
+    """
+    import numpy
+
+    with open(path, 'rb') as binary_file:
+        schema = read_schema(binary_file)
+    record_count = (
+        os.path.getsize(path) - schema.header_size) // schema.record_size
+    dtype = numpy.dtype([('null_mask', '<u8', (schema.null_mask_words,)
+                         )] + [(f.name, _numpy_type(f)) for f in schema.fields])
+    if record_count == 0:
+        return numpy.zeros(0, dtype=dtype)
+    return numpy.memmap(
+        path,
+        dtype=dtype,
+        mode='r',
+        offset=schema.header_size,
+        shape=(record_count,))
+
+
+def hastings_to_long(value):
+    """Converts a hastings value from load_records to a Python long.
+
+    Args:
+        value: A record's hastings field, with 'lo' and 'hi' uint64 fields.
+
+    Returns:
+        The amount of hastings as a long.
+    """
+    return (int(value['hi']) << 64) | int(value['lo'])
+
+
+class BinarySerializer(object):
+    """Serializes SiaState to a binary metrics file."""
+
+    def __init__(self,
+                 binary_file,
+                 flush_policy=buffered_writer.DEFAULT_FLUSH_POLICY):
+        """Creates a serializer, writing to the given file.
+
+        Args:
+            binary_file: Output file to write records to, opened in either 'w+b'
+                or 'r+b' mode. If the file is empty, BinarySerializer writes a
+                header. Otherwise, the file's schema must match the current
+                SiaState fields, and any incomplete record at its end (e.g.
+                from a crash mid-write) is truncated.
+            flush_policy: buffered_writer.FlushPolicy for when to flush
+                records to the file.
+
+        Raises:
+            SchemaMismatchError: The existing file's schema doesn't match the
+                current SiaState fields.
+        """
+        self._writer = buffered_writer.GroupCommitWriter(
+            binary_file, flush_policy)
+        self._schema = current_schema()
+        binary_file.seek(0, _FROM_FILE_END)
+        file_size = binary_file.tell()
+        if file_size == 0:
+            binary_file.write(self._schema.encode_header())
+            binary_file.flush()
+            return
+        existing_schema = read_schema(binary_file)
+        if existing_schema != self._schema:
+            raise SchemaMismatchError(
+                'Existing file has different fields than the current SiaState')
+        complete_size = file_size - (
+            file_size - self._schema.header_size) % self._schema.record_size
+        if complete_size != file_size:
+            binary_file.truncate(complete_size)
+        binary_file.seek(complete_size)
+
+    def write_state(self, sia_state):
+        self._writer.write(self._schema.encode_record(sia_state))
+        self._writer.end_row()
+
+    def flush(self):
+        """Writes any buffered records to the file."""
+        self._writer.flush()
+
+    def flush_if_due(self):
+        """Writes buffered records to the file if the flush policy says to."""
+        self._writer.flush_if_due()
+
+    def writer_stats(self):
+        """Returns buffered_writer.WriterStats for the output file."""
+        return self._writer.stats()
+
+
+def _encode_value(kind, value):
+    if kind == state.HASTINGS:
+        if value is None:
+            return 0, 0
+        value = int(value)
+        if value < 0 or value >> 128:
+            raise ValueError('Hastings out of range: %d' % value)
+        return value & _UINT64_MASK, value >> 64
+    if kind == state.TIMESTAMP:
+        if value is None:
+            return _NULL_TIMESTAMP,
+        return _to_microseconds(value),
+    if kind == state.FLOAT:
+        return float('nan') if value is None else float(value),
+    if kind == state.INTEGER:
+        return 0 if value is None else int(value),
+    return b'' if value is None else value.encode('utf-8'),
+
+
+def _decode_value(kind, raw_values):
+    if kind == state.HASTINGS:
+        low, high = raw_values
+        return (high << 64) | low
+    value = raw_values[0]
+    if kind == state.TIMESTAMP:
+        return _EPOCH + datetime.timedelta(microseconds=value)
+    if kind == state.STRING:
+        return value.rstrip(b'\0').decode('utf-8')
+    return value
+
+
+def _to_microseconds(timestamp):
+    return (calendar.timegm(timestamp.timetuple()) * 1000000 +
+            timestamp.microsecond)
+
+
+def _numpy_type(field):
+    if field.kind == state.HASTINGS:
+        return [('lo', '<u8'), ('hi', '<u8')]
+    return {
+        state.TIMESTAMP: '<M8[us]',
+        state.FLOAT: '<f8',
+        state.INTEGER: '<i8',
+        state.STRING: 'S%d' % field.width,
+    }[field.kind]
+
+
+def _round_up(value, multiple):
+    return (value + multiple - 1) // multiple * multiple
@@ -0,0 +1,207 @@
+"""Buffers rows of output and writes them to a file in groups."""
+
+import collections
+import logging
+import os
+import threading
+
+import monotonic
+
+logger = logging.getLogger(__name__)
+"""Settings for when a GroupCommitWriter flushes and fsyncs its file.
+
+Fields:
+    flush_rows: Flush once this many rows are buffered, or None to not flush
+        based on the number of rows. 1 flushes every row.
+    flush_seconds: Flush once the oldest buffered row is this many seconds
+        old, or None to not flush based on time. Checked when a row ends,
+        and by flush_if_due() (see FlushTimer).
+    fsync_seconds: When flushing, also fsync the file if it has not been
+        fsynced in the last fsync_seconds seconds, or None to never fsync.
+        0 fsyncs on every flush.
+"""
+FlushPolicy = collections.namedtuple(
+    'FlushPolicy', ['flush_rows', 'flush_seconds', 'fsync_seconds'])
+
+# Maximum time (in seconds) to block at once while waiting for a FlushTimer's
+# thread to stop, so that Python 2 can still deliver signals meanwhile.
+_JOIN_SLICE_SECONDS = 0.5
+
+# Flushes every row, but leaves it to the OS to decide when to write to disk.
+DEFAULT_FLUSH_POLICY = FlushPolicy(
+    flush_rows=1, flush_seconds=None, fsync_seconds=None)
+"""Counts of a GroupCommitWriter's buffering and flushing.
+
+Fields:
+    bytes_buffered: Number of bytes currently buffered and not yet flushed.
+    rows_buffered: Number of rows currently buffered and not yet flushed.
+    flush_count: Number of flushes so far.
+    fsync_count: Number of fsyncs so far.
+    total_flush_latency: Total time (in seconds) spent flushing, including
+        fsyncs.
+    max_flush_latency: Longest time (in seconds) a single flush took.
+"""
+WriterStats = collections.namedtuple('WriterStats', [
+    'bytes_buffered', 'rows_buffered', 'flush_count', 'fsync_count',
+    'total_flush_latency', 'max_flush_latency'
+])
+
+
+class GroupCommitWriter(object):
+    """Buffers writes to a file, and flushes them according to a FlushPolicy.
+
+    Buffered rows are lost if the process dies without calling flush(), so
+    callers must flush on shutdown.
+    """
+
+    def __init__(self,
+                 output_file,
+                 flush_policy=DEFAULT_FLUSH_POLICY,
+                 clock=monotonic.monotonic):
+        """Creates a new GroupCommitWriter.
+
+        Args:
+            output_file: File to write to.
+            flush_policy: FlushPolicy for when to flush and fsync the file.
+            clock: Function that returns the current time in seconds.
+        """
+        self._output_file = output_file
+        self._flush_policy = flush_policy
+        self._clock = clock
+        self._chunks = []
+        self._bytes_buffered = 0
+        self._rows_buffered = 0
+        self._oldest_row_time = None
+        self._last_fsync_time = None
+        self._flush_count = 0
+        self._fsync_count = 0
+        self._total_flush_latency = 0.0
+        self._max_flush_latency = 0.0
+
+    def write(self, data):
+        """Buffers data, which is part of the current row."""
+        self._chunks.append(data)
+        self._bytes_buffered += len(data)
+
+    def end_row(self):
+        """Ends the current row, and flushes if the flush policy says to."""
+        if self._rows_buffered == 0:
+            self._oldest_row_time = self._clock()
+        self._rows_buffered += 1
+        if self._is_flush_due():
+            self.flush()
+
+    def flush_if_due(self):
+        """Flushes if any rows are buffered and the flush policy says to."""
+        if self._rows_buffered and self._is_flush_due():
+            self.flush()
+
+    def flush(self):
+        """Writes all buffered data to the file, and fsyncs if due."""
+        start_time = self._clock()
+        if self._chunks:
+            # Chunks are text for CSV and bytes for binary records, so they're
+            # joined with an empty chunk of the same type.
+            self._output_file.write(self._chunks[0][:0].join(self._chunks))
+        self._output_file.flush()
+        if self._is_fsync_due(start_time):
+            os.fsync(self._output_file.fileno())
+            self._last_fsync_time = start_time
+            self._fsync_count += 1
+        latency = self._clock() - start_time
+        self._chunks = []
+        self._bytes_buffered = 0
+        self._rows_buffered = 0
+        self._oldest_row_time = None
+        self._flush_count += 1
+        self._total_flush_latency += latency
+        self._max_flush_latency = max(self._max_flush_latency, latency)
+
+    def stats(self):
+        """Returns WriterStats counting buffering and flushing so far."""
+        return WriterStats(
+            bytes_buffered=self._bytes_buffered,
+            rows_buffered=self._rows_buffered,
+            flush_count=self._flush_count,
+            fsync_count=self._fsync_count,
+            total_flush_latency=self._total_flush_latency,
+            max_flush_latency=self._max_flush_latency)
+
+    def _is_flush_due(self):
+        policy = self._flush_policy
+        if policy.flush_rows is not None and (self._rows_buffered >=
+                                              policy.flush_rows):
+            return True
+        return policy.flush_seconds is not None and (
+            self._clock() - self._oldest_row_time >= policy.flush_seconds)
+
+    def _is_fsync_due(self, now):
+        fsync_seconds = self._flush_policy.fsync_seconds
+        if fsync_seconds is None:
+            return False
+        if self._last_fsync_time is None:
+            return True
+        return now - self._last_fsync_time >= fsync_seconds
+
+
+class FlushTimer(object):
+    """Calls flush_if_due() on outputs from a thread of its own, periodically.
+
+    Outputs only check whether their buffered rows are due to be written when
+    they write another row, so when rows are written less often than they're
+    due, a FlushTimer writes them in between.
+
+    Outputs are not thread-safe, so while the timer runs, every other use of
+    an output must go through a function wrapped with locked().
+    """
+
+    def __init__(self, outputs, interval):
+        """Creates a new FlushTimer, and starts its thread.
+
+        Args:
+            outputs: A list of outputs (e.g. serialize.CsvSerializer) with a
+                flush_if_due() method.
+            interval: Time (in seconds) between checks. A row due to be
+                written is written at most this long after it's due.
+        """
+        self._outputs = outputs
+        self._interval = interval
+        self._locks = {id(output): threading.Lock() for output in outputs}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='flush-timer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def locked(self, output, fn):
+        """Wraps a function that uses an output, so that it holds its lock.
+
+        Args:
+            output: One of the timer's outputs.
+            fn: Function that uses the output.
+
+        Returns:
+            A function that takes the same arguments and returns the same
+            value as fn.
+        """
+        lock = self._locks[id(output)]
+
+        def locked_fn(*args, **kwargs):
+            with lock:
+                return fn(*args, **kwargs)
+
+        return locked_fn
+
+    def close(self):
+        """Stops the timer's thread, once any check in progress is done."""
+        self._stopped.set()
+        while self._thread.is_alive():
+            self._thread.join(_JOIN_SLICE_SECONDS)
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            for output in self._outputs:
+                try:
+                    with self._locks[id(output)]:
+                        output.flush_if_due()
+                except Exception:
+                    logger.exception('Failed to flush buffered rows')
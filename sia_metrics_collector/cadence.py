@@ -0,0 +1,55 @@
+"""Schedules how often each group of Sia metrics is refreshed."""
+
+from sia_metrics_collector import state
+
+
+class Cadences(object):
+    """Decides which groups of metrics to refresh on each poll."""
+
+    def __init__(self, cadences, poll_frequency):
+        """Creates a new Cadences instance.
+
+        Args:
+            cadences: A dict mapping names from state.QUERY_GROUPS to how
+                often (in seconds) to refresh the group. Groups that are
+                absent are refreshed on every poll.
+            poll_frequency: Time (in seconds) between polls. Each cadence is
+                rounded to the nearest whole number of polls.
+        """
+        self._poll_intervals = {
+            group: max(1, int(round(seconds / float(poll_frequency))))
+            for group, seconds in cadences.items()
+        }
+        # Maps each group to the index of the poll it was last refreshed on.
+        # Groups are due once their interval has passed since then, rather
+        # than on multiples of it, so that a group whose slot was missed
+        # (e.g. because polling fell behind) is refreshed on the next poll
+        # instead of waiting for another slot that could be missed too.
+        self._last_refresh_indexes = {}
+
+    def due_groups(self, poll_index):
+        """Returns the groups to refresh on a given poll, and records them.
+
+        Must be called once for each poll, in order of poll index.
+
+        Args:
+            poll_index: Zero-based index of the poll. Every group is due on the
+                first poll.
+
+        Returns:
+            A list of names from state.QUERY_GROUPS.
+        """
+        due = [
+            group for group in state.QUERY_GROUPS
+            if self._is_due(group, poll_index)
+        ]
+        for group in due:
+            self._last_refresh_indexes[group] = poll_index
+        return due
+
+    def _is_due(self, group, poll_index):
+        last_refresh_index = self._last_refresh_indexes.get(group)
+        if last_refresh_index is None:
+            return True
+        interval = self._poll_intervals.get(group, 1)
+        return poll_index - last_refresh_index >= interval
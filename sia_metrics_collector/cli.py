@@ -1,43 +1,141 @@
 """Functions to support printing messages to the console."""
 
+from __future__ import print_function
+
 import datetime
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-def print_header():
-    print """
+def print_header(show_node_id=False):
+    header = """
 time     latency uploaded  #c a/i  tot $     fees $    store $   u/l $     d/l $
 -------- ------- --------- ------- --------- --------- --------- --------- ---------
 """.strip()
+    if show_node_id:
+        title, underline = header.split('\n')
+        header = '%s node\n%s ----' % (title, underline)
+    print(header)
 
 
-def print_state(state):
+def print_state(state, show_node_id=False):
     try:
-        print _make_console_string(state)
+        console_string = _make_console_string(state)
+        if show_node_id:
+            console_string += ' %s' % state.node_id
+        print(console_string)
     except Exception as e:
-        logger.error('Failed to print to console: %s', e.message)
+        logger.error('Failed to print to console: %s', e)
         return ''
 
 
+def print_latency_summary(summaries):
+    """Prints a table of recent Sia API latency percentiles.
+
+    Args:
+        summaries: A list of latency_stats.LatencySummary to print.
+    """
+    print('endpoint          samples   p50 ms   p95 ms   p99 ms')
+    for summary in summaries:
+        print(_make_latency_summary_string(summary))
+
+
+def print_connection_stats(node_connection_stats):
+    """Prints a table of HTTP connection usage for each Sia node.
+
+    Args:
+        node_connection_stats: A list of (node ID, api.ConnectionStats) pairs
+            to print. Pairs with no stats are skipped.
+    """
+    print('node              requests      new   reused')
+    for node_id, stats in node_connection_stats:
+        if stats is None:
+            continue
+        print('{node_id:<17} {requests:8d} {new:8d} {reused:8d}'.format(
+            node_id=node_id,
+            requests=stats.request_count,
+            new=stats.new_connection_count,
+            reused=stats.reused_connection_count))
+
+
+def print_writer_stats(output_writer_stats):
+    """Prints a table of buffering and flush latency for each output file.
+
+    Args:
+        output_writer_stats: A list of (output path,
+            buffered_writer.WriterStats) pairs to print. Pairs with no stats
+            are skipped.
+    """
+    print('output            buf rows buf bytes  flushes   fsyncs  mean ms  '
+          ' max ms')
+    for path, stats in output_writer_stats:
+        if stats is None:
+            continue
+        mean_flush_latency = (stats.total_flush_latency / stats.flush_count
+                              if stats.flush_count else 0.0)
+        print('{path:<17} {rows:8d} {bytes:9d} {flushes:8d} {fsyncs:8d} '
+              '{mean:8.1f} {max:8.1f}'.format(
+                  path=path,
+                  rows=stats.rows_buffered,
+                  bytes=stats.bytes_buffered,
+                  flushes=stats.flush_count,
+                  fsyncs=stats.fsync_count,
+                  mean=mean_flush_latency * 1000.0,
+                  max=stats.max_flush_latency * 1000.0))
+
+
+def print_queue_stats(sink_queue_stats):
+    """Prints a table of queue usage for each sink.
+
+    Args:
+        sink_queue_stats: A list of (sink name, sink.QueueStats) pairs to
+            print.
+    """
+    print('sink                 depth  max depth capacity     puts  dropped')
+    for name, stats in sink_queue_stats:
+        print('{name:<17} {depth:8d} {max_depth:10d} {capacity:8d} '
+              '{puts:8d} {dropped:8d}'.format(
+                  name=name,
+                  depth=stats.depth,
+                  max_depth=stats.max_depth,
+                  capacity=stats.capacity,
+                  puts=stats.put_count,
+                  dropped=stats.dropped_count))
+
+
+def _make_latency_summary_string(summary):
+    return ('{name:<17} {sample_count:7d} '
+            '{p50:8.1f} {p95:8.1f} {p99:8.1f}').format(
+                name=summary.name,
+                sample_count=summary.sample_count,
+                p50=summary.p50,
+                p95=summary.p95,
+                p99=summary.p99)
+
+
 def _make_console_string(state):
-    return ('{timestamp} {api_latency:5d}ms {file_uploaded_bytes}'
-            ' {contract_count_active}'
-            ' {contract_count_inactive}'
-            ' {contract_total_spending}'
-            ' {renter_contract_fees}'
-            ' {renter_storage_spending} {renter_upload_spending} {renter_download_spending}').format(
-                timestamp=_format_timestamp(state),
-                api_latency=int(state.api_latency),
-                file_uploaded_bytes=_format_bytes(state.file_uploaded_bytes),
-                contract_count_active=_format_contract_count(state.contract_count_active),
-                contract_count_inactive=_format_contract_count(state.contract_count_inactive),
-                contract_total_spending=_format_hastings(state.contract_total_spending),
-                renter_contract_fees=_format_hastings(state.renter_contract_fees),
-                renter_storage_spending=_format_hastings(state.renter_storage_spending),
-                renter_upload_spending=_format_hastings(state.renter_upload_spending),
-                renter_download_spending=_format_hastings(state.renter_download_spending))
+    return (
+        '{timestamp} {api_latency:5d}ms {file_uploaded_bytes}'
+        ' {contract_count_active}'
+        ' {contract_count_inactive}'
+        ' {contract_total_spending}'
+        ' {renter_contract_fees}'
+        ' {renter_storage_spending} {renter_upload_spending} {renter_download_spending}'
+    ).format(
+        timestamp=_format_timestamp(state),
+        api_latency=int(state.api_latency),
+        file_uploaded_bytes=_format_bytes(state.file_uploaded_bytes),
+        contract_count_active=_format_contract_count(
+            state.contract_count_active),
+        contract_count_inactive=_format_contract_count(
+            state.contract_count_inactive),
+        contract_total_spending=_format_hastings(state.contract_total_spending),
+        renter_contract_fees=_format_hastings(state.renter_contract_fees),
+        renter_storage_spending=_format_hastings(state.renter_storage_spending),
+        renter_upload_spending=_format_hastings(state.renter_upload_spending),
+        renter_download_spending=_format_hastings(
+            state.renter_download_spending))
 
 
 def _format_timestamp(state):
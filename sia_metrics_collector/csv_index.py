@@ -0,0 +1,279 @@
+"""Indexes CSV output by timestamp, for fast reads of a time range.
+
+The index is a sidecar file next to the CSV file (e.g. 'sia-metrics.csv.idx')
+that holds the timestamp and byte offset of every Nth row:
+
+    sia-metrics-csv-index 1 1000
+    timestamp,api_latency,file_count,...
+    2018-02-11T16:05:02 1094
+    2018-02-12T09:12:40 402317
+
+The first line holds the index format version and the row interval N, and
+the second holds the CSV file's header row, so that an index left over from a
+different file is detected and rebuilt. The collector writes rows in
+timestamp order, so reading a time range is a binary search of the entries
+for the last one before the range, followed by a scan of at most N rows
+before the range begins.
+
+Updating the index appends entries only for the rows added since the last
+update.
+"""
+
+import bisect
+import csv
+import os
+
+_MAGIC = 'sia-metrics-csv-index'
+_VERSION = 1
+
+DEFAULT_INTERVAL = 1000
+
+
+class Error(Exception):
+    pass
+
+
+class InvalidFileError(Error):
+    pass
+
+
+class UnknownFieldError(Error):
+    pass
+
+
+class CsvIndex(object):
+    """Sparse index of the rows in a CSV file written by CsvSerializer."""
+
+    def __init__(self, csv_path, index_path=None, interval=DEFAULT_INTERVAL):
+        """Creates a new CsvIndex, loading the index file if it exists.
+
+        Args:
+            csv_path: Path to the CSV file to index.
+            index_path: Path to the index file. Defaults to csv_path with an
+                '.idx' suffix.
+            interval: Number of rows between index entries. An existing index
+                with a different interval is rebuilt on update.
+        """
+        self._csv_path = csv_path
+        self._index_path = index_path or csv_path + '.idx'
+        self._interval = interval
+        # Header row of the CSV file that the index entries refer to.
+        self._header = None
+        # Timestamp and byte offset of every interval-th row, in file order.
+        self._timestamps = []
+        self._offsets = []
+        self._load()
+
+    def update(self):
+        """Adds index entries for rows written since the last update.
+
+        Rebuilds the index if the CSV file no longer matches it (e.g. because
+        the file was replaced). A partially written final row is left for a
+        later update.
+
+        Raises:
+            InvalidFileError: The CSV file's first column is not timestamp.
+        """
+        with open(self._csv_path, 'rb') as csv_file:
+            header = _read_header(csv_file)
+            if header is None:
+                return
+            rewrite = (header != self._header or
+                       not self._entries_match(csv_file))
+            if rewrite:
+                self._header = header
+                self._timestamps = []
+                self._offsets = []
+            if self._offsets:
+                # Resume counting from the row of the last entry.
+                position = self._offsets[-1]
+                rows_since_entry = 0
+            else:
+                position = len(header) + 1
+                rows_since_entry = self._interval
+            csv_file.seek(position)
+            new_entries = []
+            for line in iter(csv_file.readline, b''):
+                if not line.endswith(b'\n'):
+                    break
+                if rows_since_entry == self._interval:
+                    new_entries.append((_row_timestamp(line), position))
+                    rows_since_entry = 0
+                rows_since_entry += 1
+                position += len(line)
+        for timestamp, offset in new_entries:
+            self._timestamps.append(timestamp)
+            self._offsets.append(offset)
+        if rewrite:
+            self._write_index()
+        elif new_entries:
+            with open(self._index_path, 'a') as index_file:
+                for entry in new_entries:
+                    index_file.write('%s %d\n' % entry)
+
+    def read_rows(self, fields=None, start=None, end=None, node_id=None):
+        """Reads rows of the CSV file, in file order.
+
+        Rows written since the last update are read too, but the index only
+        skips ahead over rows it has entries for.
+
+        Args:
+            fields: A list of names of columns to read, or None for all
+                columns.
+            start: If specified, only rows with this timestamp or later are
+                read. An ISO 8601 timestamp, or prefix of one (e.g.
+                '2018-02-11' or '2018-02-11T16:05').
+            end: If specified, only rows with a timestamp before this are
+                read. In the same format as start.
+            node_id: If specified, only rows for the node with this ID are
+                read.
+
+        Returns:
+            A tuple of (fieldnames, rows), where fieldnames is the list of
+            names of the columns read and rows is an iterator of rows, each a
+            list of the column values as strings.
+
+        Raises:
+            InvalidFileError: The CSV file's first column is not timestamp.
+            UnknownFieldError: One of the fields is not a column of the CSV
+                file.
+        """
+        csv_file = open(self._csv_path, 'rb')
+        try:
+            header = _read_header(csv_file)
+            if header is None:
+                csv_file.close()
+                return fields or [], iter([])
+            header_fields = next(csv.reader([header]))
+            fields = fields or header_fields
+            columns = [_column_index(header_fields, f) for f in fields]
+            node_id_column = None
+            if node_id is not None:
+                node_id_column = _column_index(header_fields, 'node_id')
+            csv_file.seek(self._find_offset(header, start))
+        except Exception:
+            csv_file.close()
+            raise
+        return fields, _iter_rows(csv_file, columns, start, end, node_id,
+                                  node_id_column)
+
+    def _load(self):
+        if not os.path.exists(self._index_path):
+            return
+        with open(self._index_path) as index_file:
+            lines = index_file.read().split('\n')
+        # Any damage (e.g. an entry cut short by a crash) leaves the index
+        # empty, so that the next update rebuilds it.
+        if (len(lines) < 3 or lines[-1] or
+                lines[0] != _index_header(self._interval)):
+            return
+        timestamps = []
+        offsets = []
+        for line in lines[2:-1]:
+            parts = line.split(' ')
+            if len(parts) != 2 or not parts[1].isdigit():
+                return
+            timestamps.append(parts[0])
+            offsets.append(int(parts[1]))
+        self._header = lines[1]
+        self._timestamps = timestamps
+        self._offsets = offsets
+
+    def _entries_match(self, csv_file):
+        for i in set([0, len(self._offsets) - 1]):
+            if i < 0:
+                continue
+            csv_file.seek(self._offsets[i])
+            line = csv_file.readline()
+            if (not line.endswith(b'\n') or
+                    _row_timestamp(line) != self._timestamps[i]):
+                return False
+        return True
+
+    def _find_offset(self, header, start):
+        data_offset = len(header) + 1
+        if start is None or header != self._header:
+            return data_offset
+        # Rows before the last entry earlier than start are all earlier than
+        # start, so reading can begin at that entry.
+        i = bisect.bisect_left(self._timestamps, start)
+        if i == 0:
+            return data_offset
+        return self._offsets[i - 1]
+
+    def _write_index(self):
+        # Write to a temporary file and rename it over the index, so that a
+        # crash never leaves a partially rebuilt index.
+        temp_path = self._index_path + '.tmp'
+        with open(temp_path, 'w') as index_file:
+            index_file.write(_index_header(self._interval) + '\n')
+            index_file.write(self._header + '\n')
+            for entry in zip(self._timestamps, self._offsets):
+                index_file.write('%s %d\n' % entry)
+        os.rename(temp_path, self._index_path)
+
+
+def _index_header(interval):
+    return '%s %d %d' % (_MAGIC, _VERSION, interval)
+
+
+def _read_header(csv_file):
+    header = csv_file.readline()
+    if not header.endswith(b'\n'):
+        return None
+    header = _native_string(header[:-1])
+    if not header.startswith('timestamp,'):
+        raise InvalidFileError(
+            'Expected timestamp as first column of CSV file, got header: %s' %
+            header)
+    return header
+
+
+def _column_index(header_fields, field):
+    try:
+        return header_fields.index(field)
+    except ValueError:
+        raise UnknownFieldError('Unknown field: %s' % field)
+
+
+def _row_timestamp(line):
+    return _native_string(line.split(b',', 1)[0])
+
+
+def _native_string(data):
+    # The CSV file is read as bytes, so that offsets count bytes, but its
+    # contents are handled as str, which Python 3 must decode.
+    if isinstance(data, str):
+        return data
+    return data.decode('utf-8')
+
+
+def _iter_rows(csv_file, columns, start, end, node_id, node_id_column):
+    last_column = max(columns)
+    if node_id_column is not None:
+        last_column = max(last_column, node_id_column)
+    try:
+        for line in iter(csv_file.readline, b''):
+            if not line.endswith(b'\n'):
+                break
+            timestamp = _row_timestamp(line)
+            if start is not None and timestamp < start:
+                continue
+            if end is not None and timestamp >= end:
+                break
+            values = _split_row(_native_string(line[:-1]), last_column)
+            if (node_id_column is not None and
+                    values[node_id_column] != node_id):
+                continue
+            yield [values[column] for column in columns]
+    finally:
+        csv_file.close()
+
+
+def _split_row(line, last_column):
+    # CsvSerializer only quotes values that contain commas or quotes, which
+    # metrics never do, so most rows can be split without the csv module,
+    # stopping after the last column needed.
+    if '"' in line:
+        return next(csv.reader([line]))
+    return line.split(',', last_column + 1)
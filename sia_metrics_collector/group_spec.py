@@ -0,0 +1,39 @@
+"""Parses settings that take a number of seconds for a group of Sia metrics."""
+
+from sia_metrics_collector import state
+
+
+class Error(Exception):
+    pass
+
+
+class InvalidGroupSpecError(Error):
+    pass
+
+
+def parse_group_spec(spec):
+    """Parses a group specification string, such as a cadence or deadline.
+
+    Args:
+        spec: A string of the form 'group=seconds', where group is one of
+            state.QUERY_GROUPS (e.g. 'file=300').
+
+    Returns:
+        A (group, seconds) pair.
+
+    Raises:
+        InvalidGroupSpecError: The spec is not a valid group specification.
+    """
+    if '=' not in spec:
+        raise InvalidGroupSpecError('Must be group=seconds: %s' % spec)
+    group, seconds = [part.strip() for part in spec.split('=', 1)]
+    if group not in state.QUERY_GROUPS:
+        raise InvalidGroupSpecError('Unknown group %s, expected one of: %s' %
+                                    (group, ', '.join(state.QUERY_GROUPS)))
+    try:
+        seconds = float(seconds)
+    except ValueError:
+        raise InvalidGroupSpecError('Invalid number of seconds: %s' % spec)
+    if seconds <= 0:
+        raise InvalidGroupSpecError('Seconds must be positive: %s' % spec)
+    return group, seconds
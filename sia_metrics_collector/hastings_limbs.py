@@ -0,0 +1,370 @@
+"""Exact arithmetic on arrays of hastings values with NumPy.
+
+Hastings amounts routinely exceed 2^64 (1 SC is 10^24 hastings), so they don't
+fit NumPy's integer types, and float64 loses the low-order digits that
+distinguish nearby balances. Instead, an array of n amounts is held as an
+(n, LIMB_COUNT) int64 array of limbs: base 2^32 digits, least significant
+first, so that amount i is sum(limbs[i, k] << (32 * k)).
+
+Each limb holds 32 bits in a 64-bit integer, which leaves room to add or
+subtract limbs of up to 2^31 amounts at once without overflow. normalize()
+then carries the excess into the next limb. After normalizing, every limb but
+the last is in [0, 2^32), and the last limb carries the sign, so differences
+of amounts can be negative.
+
+Requires NumPy.
+"""
+
+import numpy
+
+# Four 32-bit limbs hold the 128 bits that binary output stores per amount.
+LIMB_COUNT = 4
+LIMB_BITS = 32
+
+_LIMB_MASK = (1 << LIMB_BITS) - 1
+_LIMB_SCALES = 2.0**(LIMB_BITS * numpy.arange(LIMB_COUNT))
+
+# Decimal strings are parsed in chunks of _CHUNK_DIGITS digits, each small
+# enough that multiplying a limb by 10^_CHUNK_DIGITS fits in an int64.
+_CHUNK_DIGITS = 8
+_MAX_DIGITS = 40
+_CHUNK_POWERS = 10**numpy.arange(_CHUNK_DIGITS - 1, -1, -1, dtype=numpy.int64)
+_ZERO_CODE = ord('0')
+_NINE_CODE = ord('9')
+
+# Number of strings sum_decimal_strings() works on at once.
+_SUM_BLOCK_SIZE = 1 << 16
+
+
+def zeros(count):
+    """Returns limbs for count amounts of zero hastings."""
+    return numpy.zeros((count, LIMB_COUNT), dtype=numpy.int64)
+
+
+def from_decimal_strings(strings):
+    """Parses decimal strings of hastings into limbs.
+
+    Args:
+        strings: A sequence or array of strings of non-negative decimal
+            integers below 2^128, e.g. '1000000000000000000000000'.
+
+    Returns:
+        Limbs of the amounts, one row per string.
+
+    Raises:
+        ValueError: A string is empty, is not a decimal integer, or is out of
+            range.
+    """
+    strings = _as_string_array(strings)
+    chunks = _decimal_chunks(strings)
+    limbs = zeros(len(strings))
+    for i in range(chunks.shape[1]):
+        limbs *= 10**_CHUNK_DIGITS
+        limbs[:, 0] += chunks[:, i]
+        limbs = normalize(limbs)
+    if (limbs[:, -1] >> LIMB_BITS).any():
+        raise ValueError('Hastings out of range: %s' %
+                         strings[(limbs[:, -1] >> LIMB_BITS) != 0][0])
+    return limbs
+
+
+def sum_decimal_strings(strings):
+    """Sums decimal strings of hastings exactly.
+
+    This is faster than adding up int() of each string for more than a few
+    hundred strings, as it never converts a string to a number. Instead, the
+    digits are lined up in columns by place value, each column is summed as
+    int64, and only the totals for each place value are combined into a long.
+
+    Args:
+        strings: A sequence or array of strings of non-negative decimal
+            integers, e.g. '1000000000000000000000000'. Unlike
+            from_decimal_strings(), there is no limit on their size.
+
+    Returns:
+        The total, as an integer.
+
+    Raises:
+        ValueError: A string is empty or is not a decimal integer.
+    """
+    total = 0
+    # Working through the strings in blocks bounds the memory the arrays
+    # take, and keeps each place value's total far below the int64 limit.
+    for start in range(0, len(strings), _SUM_BLOCK_SIZE):
+        block = strings[start:start + _SUM_BLOCK_SIZE]
+        if isinstance(block, numpy.ndarray):
+            place_totals = _sum_place_values(_as_string_array(block))
+        else:
+            try:
+                place_totals = _sum_padded_place_values(block)
+            except (AttributeError, TypeError):
+                # Not all strings, so left to NumPy to convert.
+                place_totals = _sum_place_values(_as_string_array(block))
+        block_total = 0
+        for place_total in place_totals[::-1]:
+            block_total = block_total * 10 + int(place_total)
+        total += block_total
+    return total
+
+
+def _sum_padded_place_values(strings):
+    """Sums the digits of a sequence of decimal strings by place value.
+
+    Zero-padding every string to the longest one's length puts digits with the
+    same place value in the same column, so the joined strings can be viewed
+    as a 2D array of digits directly. This skips building an array of strings,
+    which takes longer than summing them.
+
+    Args:
+        strings: A sequence of unicode or bytes strings of decimal integers.
+
+    Returns:
+        An int64 array whose element k is the total of the strings' digits
+        with place value 10^k.
+
+    Raises:
+        ValueError: A string is empty or is not a decimal integer.
+        AttributeError, TypeError: An element is not a string, or the strings
+            mix unicode and bytes.
+    """
+    if len(strings) == 0:
+        return numpy.zeros(0, dtype=numpy.int64)
+    lengths = list(map(len, strings))
+    if min(lengths) == 0:
+        raise ValueError('Empty hastings value')
+    width = max(lengths)
+    # The empty string of the strings' own type joins them.
+    padded = strings[0][:0].join([s.zfill(width) for s in strings])
+    if not isinstance(padded, bytes):
+        # Fails for non-ASCII strings, which aren't decimal integers anyway.
+        padded = padded.encode('ascii')
+    # Codes are unsigned, so codes below '0' wrap around to large digits. A
+    # sign stays in front of zfill()'s padding, so it's rejected too.
+    digits = numpy.frombuffer(
+        padded, dtype=numpy.uint8).reshape(len(strings), width) - _ZERO_CODE
+    is_invalid = digits > 9
+    if is_invalid.any():
+        raise ValueError('Invalid hastings value: %s' % strings[int(
+            numpy.flatnonzero(is_invalid.any(axis=1))[0])])
+    return numpy.einsum('ij->j', digits, dtype=numpy.int64)[::-1]
+
+
+def _sum_place_values(strings):
+    """Sums the digits of decimal strings by place value.
+
+    Args:
+        strings: A bytes or unicode array of decimal strings.
+
+    Returns:
+        An int64 array whose element k is the total of the strings' digits
+        with place value 10^k.
+
+    Raises:
+        ValueError: A string is empty or is not a decimal integer.
+    """
+    if len(strings) == 0:
+        return numpy.zeros(0, dtype=numpy.int64)
+    codes = _character_codes(strings)
+    lengths = _string_lengths(codes)
+    counts = numpy.bincount(lengths)
+    if counts[0]:
+        raise ValueError('Empty hastings value')
+    place_totals = numpy.zeros(codes.shape[1], dtype=numpy.int64)
+    for length in numpy.flatnonzero(counts):
+        if counts[length] == len(strings):
+            group = codes[:, :length]
+        else:
+            group = codes[lengths == length, :length]
+        # Codes are unsigned, so codes below '0' wrap around to large digits.
+        digits = group - _ZERO_CODE
+        is_invalid = digits > 9
+        if is_invalid.any():
+            raise ValueError(
+                'Invalid hastings value: %s' %
+                strings[lengths == length][is_invalid.any(axis=1)][0])
+        place_totals[:length] += numpy.einsum(
+            'ij->j', digits, dtype=numpy.int64)[::-1]
+    return place_totals
+
+
+def _as_string_array(strings):
+    if isinstance(strings, numpy.ndarray):
+        if strings.dtype.kind in ('S', 'U'):
+            return strings
+        return strings.astype(numpy.bytes_)
+    # Converting to bytes is faster than to unicode. It fails for non-ASCII
+    # strings, but those aren't decimal integers anyway.
+    return numpy.array(strings, dtype=numpy.bytes_)
+
+
+def _character_codes(strings):
+    """Returns a 2D array of the codes of each string's characters.
+
+    The array is a view of the strings, so creating it copies nothing.
+    Strings shorter than the array's width are padded with codes of zero.
+    """
+    strings = numpy.ascontiguousarray(strings)
+    code_type = numpy.uint32 if strings.dtype.kind == 'U' else numpy.uint8
+    return strings.view(code_type).reshape(len(strings), -1)
+
+
+def _string_lengths(codes):
+    """Returns the length of each string in an array of character codes.
+
+    Working from the last column, each column's padding shortens its strings,
+    until a column without padding. For strings with NULs of their own, the
+    lengths are too short, so that their first length characters include a
+    NUL, which callers reject as not a digit.
+    """
+    width = codes.shape[1]
+    lengths = numpy.full(len(codes), width, dtype=numpy.intp)
+    for column in range(width - 1, -1, -1):
+        is_padding = codes[:, column] == 0
+        if not is_padding.any():
+            break
+        lengths -= is_padding
+    return lengths
+
+
+def _decimal_chunks(strings):
+    """Splits decimal strings into chunks of digits.
+
+    Args:
+        strings: A bytes or unicode array of decimal strings.
+
+    Returns:
+        An int64 array with a row for each string, of the values of its
+        _CHUNK_DIGITS-digit chunks, most significant first, as if the string
+        were zero-padded to _MAX_DIGITS digits.
+
+    Raises:
+        ValueError: A string is empty, is not a decimal integer, or is too
+            long.
+    """
+    if len(strings) == 0:
+        return numpy.zeros((0, _MAX_DIGITS // _CHUNK_DIGITS), dtype=numpy.int64)
+    codes = _character_codes(strings)
+    lengths = _string_lengths(codes)
+    if (lengths == 0).any():
+        raise ValueError('Empty hastings value')
+    in_string = numpy.arange(codes.shape[1]) < lengths[:, numpy.newaxis]
+    is_digit = (codes >= _ZERO_CODE) & (codes <= _NINE_CODE)
+    invalid_rows = (in_string & ~is_digit).any(axis=1)
+    if invalid_rows.any():
+        raise ValueError(
+            'Invalid hastings value: %s' % strings[invalid_rows][0])
+    if lengths.max() > _MAX_DIGITS:
+        raise ValueError(
+            'Hastings out of range: %s' % strings[lengths > _MAX_DIGITS][0])
+    # Right-align each string's digits in a row of _MAX_DIGITS digits. Boolean
+    # indexing takes and puts elements in row-major order, so each string's
+    # digits land in the same order.
+    digits = numpy.zeros((len(strings), _MAX_DIGITS), dtype=numpy.uint8)
+    is_aligned_digit = numpy.arange(_MAX_DIGITS) >= (
+        _MAX_DIGITS - lengths[:, numpy.newaxis])
+    digits[is_aligned_digit] = codes[in_string] - _ZERO_CODE
+    return digits.reshape(len(strings), -1,
+                          _CHUNK_DIGITS).astype(numpy.int64).dot(_CHUNK_POWERS)
+
+
+def from_lo_hi(lo, hi):
+    """Converts hastings stored as low and high uint64 halves into limbs.
+
+    Args:
+        lo: uint64 array of the low 64 bits of each amount.
+        hi: uint64 array of the high 64 bits of each amount, e.g. from
+            binary_serialize.load_records.
+
+    Returns:
+        Limbs of the amounts.
+    """
+    lo = numpy.asarray(lo, dtype=numpy.uint64)
+    hi = numpy.asarray(hi, dtype=numpy.uint64)
+    mask = numpy.uint64(_LIMB_MASK)
+    shift = numpy.uint64(LIMB_BITS)
+    return numpy.column_stack([lo & mask, lo >> shift, hi & mask,
+                               hi >> shift]).astype(numpy.int64)
+
+
+def from_longs(values):
+    """Converts a sequence of Python integers into limbs.
+
+    Args:
+        values: A sequence of ints or longs in the range [0, 2^128).
+
+    Returns:
+        Limbs of the amounts.
+    """
+    return numpy.array(
+        [[(value >> (LIMB_BITS * k)) & _LIMB_MASK
+          for k in range(LIMB_COUNT)]
+         for value in values],
+        dtype=numpy.int64).reshape(-1, LIMB_COUNT)
+
+
+def normalize(limbs):
+    """Carries each limb's overflow into the next limb.
+
+    Args:
+        limbs: Limbs whose values may be outside [0, 2^32), e.g. after adding
+            or subtracting limbs.
+
+    Returns:
+        New limbs of the same amounts, with every limb but the last in
+        [0, 2^32).
+    """
+    limbs = limbs.copy()
+    for k in range(LIMB_COUNT - 1):
+        # Right shift on int64 rounds down, so negative limbs borrow.
+        carry = limbs[:, k] >> LIMB_BITS
+        limbs[:, k] &= _LIMB_MASK
+        limbs[:, k + 1] += carry
+    return limbs
+
+
+def subtract(a, b):
+    """Returns limbs of a - b, which may be negative."""
+    return normalize(a - b)
+
+
+def is_negative(limbs):
+    """Returns a bool array, True where the normalized amount is negative."""
+    return limbs[:, -1] < 0
+
+
+def sum_groups(limbs, group_starts):
+    """Sums runs of consecutive amounts exactly.
+
+    Args:
+        limbs: Normalized limbs of the amounts to sum.
+        group_starts: Increasing int array of the index of the first amount in
+            each group. Each group runs until the next group's start.
+
+    Returns:
+        Normalized limbs with one row per group, holding its sum.
+    """
+    if len(group_starts) == 0:
+        return zeros(0)
+    return normalize(numpy.add.reduceat(limbs, group_starts, axis=0))
+
+
+def to_float(limbs):
+    """Converts limbs to float64 amounts, rounded to the nearest float."""
+    negative = is_negative(limbs)
+    magnitudes = numpy.where(negative[:, numpy.newaxis], normalize(-limbs),
+                             limbs)
+    values = (magnitudes * _LIMB_SCALES).sum(axis=1)
+    return numpy.where(negative, -values, values)
+
+
+def to_longs(limbs):
+    """Converts limbs to a list of exact Python longs.
+
+    This works one amount at a time in Python, so is meant only for
+    presenting results.
+    """
+    return [
+        sum(int(limb) << (LIMB_BITS * k)
+            for k, limb in enumerate(row))
+        for row in limbs
+    ]
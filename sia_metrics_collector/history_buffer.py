@@ -0,0 +1,242 @@
+"""Keeps a node's recent SiaState history in compact, preallocated arrays.
+
+A SiaState holds each value as a separate Python object (a float, long, or
+datetime of 24 to 48 bytes, plus the record's slot), so a sample of every
+field costs about 1.7 KB. A HistoryBuffer instead stores one NumPy array per
+field, with values in fixed-width machine types:
+
+    timestamp: datetime64[us] (NaT if None), 8 bytes.
+    float: float64 (NaN if None), 8 bytes.
+    integer: int64, 8 bytes.
+    hastings: 'lo' and 'hi' uint64 halves, as in binary_serialize, 16 bytes.
+
+plus a bitmask of which fields are None (8 bytes per 64 fields). Every field
+but node_id, which is the same for all of a buffer's samples, takes 488 bytes
+per sample. bytes_per_sample() gives the size for a subset of fields.
+
+The buffer holds the latest capacity samples. Rather than wrapping around, it
+writes into spare rows past the end of the arrays, and when those run out,
+moves the latest samples back to the start. So the samples it holds are
+always contiguous, and last() and between() return views of the arrays
+without copying. A view reflects the buffer's arrays, so it changes once later
+appends move or overwrite its rows; copy it to keep it longer.
+
+Requires NumPy.
+"""
+
+import numpy
+
+from sia_metrics_collector import hastings_limbs
+from sia_metrics_collector import rates
+from sia_metrics_collector import state
+
+_NUMERIC_KINDS = (state.TIMESTAMP, state.FLOAT, state.INTEGER, state.HASTINGS)
+
+# Fields a buffer can store: every field but node_id.
+BUFFERED_FIELDS = tuple(
+    f for f in state.SiaState._fields if state.FIELD_KINDS[f] in _NUMERIC_KINDS)
+
+_NUMPY_TYPES = {
+    state.TIMESTAMP: numpy.dtype('datetime64[us]'),
+    state.FLOAT: numpy.dtype(numpy.float64),
+    state.INTEGER: numpy.dtype(numpy.int64),
+    state.HASTINGS: numpy.dtype([('lo', '<u8'), ('hi', '<u8')]),
+}
+_NULL_VALUES = {
+    state.TIMESTAMP: numpy.datetime64('NaT'),
+    state.FLOAT: numpy.nan,
+    state.INTEGER: 0,
+    state.HASTINGS: (0, 0),
+}
+_UINT64_MASK = (1 << 64) - 1
+
+# Default number of spare rows, as a fraction of the capacity. Each time the
+# spare rows run out, the buffer moves capacity rows, so spare rows trade
+# memory for fewer moves.
+DEFAULT_SLACK = 0.25
+
+
+def bytes_per_sample(fields=BUFFERED_FIELDS):
+    """Returns the bytes of buffer each sample takes, excluding spare rows.
+
+    Args:
+        fields: A list of names of fields the buffer stores.
+    """
+    return (_null_mask_words(fields) * 8 +
+            sum(_NUMPY_TYPES[state.FIELD_KINDS[f]].itemsize for f in fields))
+
+
+class HistoryBuffer(object):
+    """Holds a node's latest samples, one preallocated array per field."""
+
+    def __init__(self, capacity, fields=BUFFERED_FIELDS, slack=DEFAULT_SLACK):
+        """Creates a new HistoryBuffer, allocating all its memory up front.
+
+        Args:
+            capacity: Maximum number of samples to hold. Appending to a full
+                buffer discards its oldest sample.
+            fields: A list of names of the fields to store. Must include
+                'timestamp'. Other fields of appended samples are ignored.
+            slack: Number of spare rows to allocate, as a fraction of the
+                capacity. At least one spare row is always allocated.
+        """
+        if capacity <= 0:
+            raise ValueError('Capacity must be positive: %s' % capacity)
+        if 'timestamp' not in fields:
+            raise ValueError('Fields must include timestamp')
+        for field in fields:
+            if field not in BUFFERED_FIELDS:
+                raise ValueError('Field cannot be buffered: %s' % field)
+        self.fields = tuple(fields)
+        self._capacity = capacity
+        row_count = capacity + max(1, int(capacity * slack))
+        self._columns = {
+            f: numpy.zeros(row_count, dtype=_NUMPY_TYPES[state.FIELD_KINDS[f]])
+            for f in self.fields
+        }
+        self._null_mask = numpy.zeros(
+            (row_count, _null_mask_words(self.fields)), dtype=numpy.uint64)
+        # Samples occupy rows [_start, _end) of every array.
+        self._start = 0
+        self._end = 0
+
+    def __len__(self):
+        return self._end - self._start
+
+    def nbytes(self):
+        """Returns the bytes allocated for the buffer's arrays."""
+        return self._null_mask.nbytes + sum(
+            column.nbytes for column in self._columns.values())
+
+    def append(self, sia_state):
+        """Adds a sample, discarding the oldest if the buffer is full.
+
+        Args:
+            sia_state: SiaState to add. Its timestamp must be set, and no
+                earlier than the timestamp of the latest sample.
+
+        Raises:
+            ValueError: The sample has no timestamp, or is out of order.
+        """
+        if sia_state.timestamp is None:
+            raise ValueError('Sample has no timestamp')
+        if len(self) and numpy.datetime64(
+                sia_state.timestamp) < self._columns['timestamp'][self._end -
+                                                                  1]:
+            raise ValueError('Sample is earlier than the latest sample: %s' %
+                             sia_state.timestamp)
+        if self._end == len(self._null_mask):
+            self._compact()
+        row = self._end
+        null_mask = 0
+        for i, field in enumerate(self.fields):
+            value = getattr(sia_state, field)
+            kind = state.FIELD_KINDS[field]
+            if value is None:
+                null_mask |= 1 << i
+                value = _NULL_VALUES[kind]
+            elif kind == state.HASTINGS:
+                value = int(value)
+                value = (value & _UINT64_MASK, value >> 64)
+            self._columns[field][row] = value
+        for word in range(self._null_mask.shape[1]):
+            self._null_mask[row, word] = (null_mask >>
+                                          (64 * word)) & _UINT64_MASK
+        self._end += 1
+        if len(self) > self._capacity:
+            self._start += 1
+
+    def last(self, count):
+        """Returns a Window of the latest count samples, or all if fewer."""
+        return self._window(max(self._start, self._end - count), self._end)
+
+    def between(self, start, end):
+        """Returns a Window of samples in a time range.
+
+        Args:
+            start: datetime of the earliest samples to include.
+            end: datetime to include samples until (exclusive).
+        """
+        timestamps = self._columns['timestamp'][self._start:self._end]
+        first, last = numpy.searchsorted(
+            timestamps, [numpy.datetime64(start),
+                         numpy.datetime64(end)])
+        return self._window(self._start + first, self._start + last)
+
+    def _window(self, first_row, end_row):
+        return Window(self.fields, {
+            f: column[first_row:end_row]
+            for f, column in self._columns.items()
+        }, self._null_mask[first_row:end_row])
+
+    def _compact(self):
+        # Keep all but one of the latest samples, leaving room for the sample
+        # being appended. NumPy copies overlapping ranges correctly.
+        keep = min(len(self), self._capacity - 1)
+        for column in self._columns.values():
+            column[:keep] = column[self._end - keep:self._end]
+        self._null_mask[:keep] = self._null_mask[self._end - keep:self._end]
+        self._start = 0
+        self._end = keep
+
+
+class Window(object):
+    """Views of consecutive samples in a HistoryBuffer, oldest first."""
+
+    def __init__(self, fields, columns, null_mask):
+        self._fields = fields
+        self._columns = columns
+        self._null_mask = null_mask
+
+    def __len__(self):
+        return len(self._null_mask)
+
+    @property
+    def timestamps(self):
+        """A datetime64[us] array of the samples' timestamps."""
+        return self._columns['timestamp']
+
+    def values(self, field):
+        """Returns the array of a field's values, a view of the buffer.
+
+        Values where the field is None are NaN for floats, NaT for
+        timestamps, and zero otherwise. Hastings values have 'lo' and 'hi'
+        uint64 fields (see binary_serialize.hastings_to_long).
+        """
+        return self._columns[field]
+
+    def present(self, field):
+        """Returns a bool array, False for samples where the field is None."""
+        i = self._fields.index(field)
+        return (self._null_mask[:, i // 64] >> numpy.uint64(i % 64) &
+                numpy.uint64(1)) == 0
+
+    def to_history(self, fields):
+        """Copies fields of the samples into a rates.History.
+
+        Args:
+            fields: A list of names of float, integer, or hastings fields to
+                include.
+
+        Returns:
+            A rates.History of the samples.
+
+        Raises:
+            rates.UnsupportedFieldError: One of the fields is a timestamp.
+        """
+        columns = {}
+        for field in fields:
+            if state.FIELD_KINDS[field] == state.TIMESTAMP:
+                raise rates.UnsupportedFieldError(
+                    'Not a numeric field: %s' % field)
+            values = self._columns[field]
+            if state.FIELD_KINDS[field] == state.HASTINGS:
+                values = hastings_limbs.from_lo_hi(values['lo'], values['hi'])
+            else:
+                values = values.astype(numpy.float64)
+            columns[field] = rates.Column(values, self.present(field))
+        return rates.History(self.timestamps.copy(), columns)
+
+
+def _null_mask_words(fields):
+    return (len(fields) + 63) // 64
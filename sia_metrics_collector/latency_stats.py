@@ -0,0 +1,91 @@
+"""Tracks rolling percentiles of Sia API query latencies."""
+
+import collections
+import math
+"""Summary of recent latencies for a single query.
+
+Fields:
+    name: Name of the query (e.g. '/renter/files').
+    sample_count: Number of latency samples the summary covers.
+    p50: Median latency (in milliseconds).
+    p95: 95th percentile latency (in milliseconds).
+    p99: 99th percentile latency (in milliseconds).
+"""
+LatencySummary = collections.namedtuple(
+    'LatencySummary', ['name', 'sample_count', 'p50', 'p95', 'p99'])
+
+# Pairs of (query name, SiaState latency field) to track.
+_TRACKED_LATENCIES = (
+    ('all', 'api_latency'),
+    ('/renter/contracts', 'contract_query_latency'),
+    ('/renter/files', 'file_query_latency'),
+    ('/wallet', 'wallet_query_latency'),
+    ('/renter', 'renter_query_latency'),
+)
+
+
+class LatencyTracker(object):
+    """Keeps a rolling window of recent latencies for each Sia API query."""
+
+    def __init__(self, window_size=1000):
+        """Creates a new LatencyTracker.
+
+        Args:
+            window_size: Number of most recent samples to keep for each query,
+                or None to keep every sample.
+        """
+        self._windows = collections.OrderedDict(
+            (name, collections.deque(maxlen=window_size))
+            for name, _ in _TRACKED_LATENCIES)
+
+    def record(self, state):
+        """Adds the latencies from a SiaState to the rolling windows.
+
+        Args:
+            state: SiaState whose latency fields to record. Latencies that are
+                None are ignored.
+        """
+        for name, field in _TRACKED_LATENCIES:
+            latency = getattr(state, field)
+            if latency is not None:
+                self._windows[name].append(latency)
+
+    def summarize(self):
+        """Summarizes the latencies currently in the rolling windows.
+
+        Returns:
+            A list of LatencySummary, one for each query that has at least one
+            latency sample.
+        """
+        summaries = []
+        for name, window in self._windows.items():
+            if not window:
+                continue
+            summaries.append(summarize_latencies(name, window))
+        return summaries
+
+
+def summarize_latencies(name, latencies):
+    """Summarizes a collection of latencies.
+
+    Args:
+        name: Name of the query (or other operation) the latencies are of.
+        latencies: A non-empty iterable of latencies, in milliseconds.
+
+    Returns:
+        A LatencySummary of the latencies.
+    """
+    latencies = sorted(latencies)
+    return LatencySummary(
+        name=name,
+        sample_count=len(latencies),
+        p50=_percentile(latencies, 50),
+        p95=_percentile(latencies, 95),
+        p99=_percentile(latencies, 99))
+
+
+def _percentile(sorted_values, percentile):
+    # Use the nearest-rank method so that every percentile is a latency that
+    # was actually observed.
+    rank = int(math.ceil(percentile / 100.0 * len(sorted_values)))
+    return sorted_values[max(rank, 1) - 1]
@@ -0,0 +1,355 @@
+#!/usr/bin/python2
+"""Measures the collector under load from a fleet of simulated Sia nodes.
+
+Starts siad_simulator nodes in a child process, so that serving them doesn't
+take CPU time from the collector, then runs the collector's real polling
+pipeline (main._poll_forever) against them for a fixed duration, writing CSV
+to a temporary file. It then reports:
+
+    Sample latency: percentiles of each sample's api_latency, and of each
+        endpoint's query latency.
+    Jitter: percentiles of each sample's poll lateness, and of how far the
+        time between consecutive samples of a node strays from the poll
+        frequency.
+    Collector CPU time and RSS, measured in the collector's process only.
+
+For example, to poll 100 nodes with 1000 contracts each, every 5 seconds:
+
+    python -m sia_metrics_collector.load_test --nodes 100 --contracts 1000 \\
+        --latency lognormal:30,0.5 --poll_frequency 5 --duration 120
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import logging
+import math
+import multiprocessing
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import timeit
+
+from sia_metrics_collector import api
+from sia_metrics_collector import cadence
+from sia_metrics_collector import cli
+from sia_metrics_collector import latency_stats
+from sia_metrics_collector import main
+from sia_metrics_collector import nodes
+from sia_metrics_collector import process_stats
+from sia_metrics_collector import scheduler
+from sia_metrics_collector import serialize
+from sia_metrics_collector import sink
+from sia_metrics_collector import siad_simulator
+
+logger = logging.getLogger(__name__)
+
+_OUTPUT_PATH = 'metrics.csv'
+
+# A field of each query group, which is None if the group's query failed.
+_GROUP_CHECK_FIELDS = ('contract_count_active', 'file_count',
+                       'wallet_siacoin_balance', 'renter_allowance')
+"""How the collector polls the simulated nodes.
+
+Fields:
+    poll_frequency: Seconds between polls.
+    max_parallel_nodes: Maximum number of nodes to poll at the same time.
+    concurrent_queries: Whether to query each node's endpoints at the same
+        time.
+    stream_files: Whether to parse /renter/files as it arrives.
+    connection_options: api.ConnectionOptions for each node's client.
+    engine: How to run polls: 'threads', or 'asyncio' (Python 3 only).
+"""
+CollectorOptions = collections.namedtuple('CollectorOptions', [
+    'poll_frequency', 'max_parallel_nodes', 'concurrent_queries',
+    'stream_files', 'connection_options', 'engine'
+])
+"""Results of a load test.
+
+Fields:
+    duration: Seconds the collector ran for.
+    sample_count: Number of samples the collector wrote.
+    expected_sample_count: Number of samples the collector would have written
+        if it never fell behind.
+    incomplete_sample_count: Number of samples missing the metrics of at least
+        one query, because the query failed.
+    latency_summaries: A list of latency_stats.LatencySummary of the samples'
+        API latencies, overall and for each endpoint.
+    lateness_summary: latency_stats.LatencySummary of how late (in
+        milliseconds) each poll started, or None if there were no samples.
+    interval_error_summary: latency_stats.LatencySummary of how far (in
+        milliseconds) the time between consecutive samples of a node strays
+        from the poll frequency, or None if no node had two samples.
+    cpu_seconds: CPU time the collector's process used while polling.
+    peak_rss_bytes: Largest resident set size of the collector's process
+        while polling.
+    final_rss_bytes: Resident set size of the collector's process once it
+        stopped polling, or None if unknown.
+"""
+LoadTestReport = collections.namedtuple('LoadTestReport', [
+    'duration', 'sample_count', 'expected_sample_count',
+    'incomplete_sample_count', 'latency_summaries', 'lateness_summary',
+    'interval_error_summary', 'cpu_seconds', 'peak_rss_bytes', 'final_rss_bytes'
+])
+
+
+class _DurationElapsed(BaseException):
+    """Raised in the polling thread to stop the collector.
+
+    Like KeyboardInterrupt, it isn't an Exception, so the collector's handlers
+    that log and ignore errors don't swallow it.
+    """
+
+
+class _RecordingSerializer(object):
+    """Records each state's timings before passing it to a serializer."""
+
+    def __init__(self, serializer):
+        self._serializer = serializer
+        self._latency_tracker = latency_stats.LatencyTracker(window_size=None)
+        self.lateness = []
+        # Maps each node ID to the timestamps of its samples.
+        self.timestamps = collections.defaultdict(list)
+        self.sample_count = 0
+        self.incomplete_sample_count = 0
+
+    def write_state(self, state):
+        self._serializer.write_state(state)
+        self.sample_count += 1
+        self._latency_tracker.record(state)
+        if state.poll_lateness is not None:
+            self.lateness.append(state.poll_lateness)
+        if state.timestamp:
+            self.timestamps[state.node_id].append(state.timestamp)
+        if any(getattr(state, f) is None for f in _GROUP_CHECK_FIELDS):
+            self.incomplete_sample_count += 1
+
+    def flush(self):
+        self._serializer.flush()
+
+    def writer_stats(self):
+        return self._serializer.writer_stats()
+
+    def latency_summaries(self):
+        return self._latency_tracker.summarize()
+
+
+def run_load_test(node_count, simulator_options, collector_options, duration):
+    """Runs the collector against a fleet of simulated nodes.
+
+    Must be called from the main thread, as it stops the collector with a
+    SIGALRM.
+
+    Args:
+        node_count: Number of simulated nodes to poll.
+        simulator_options: siad_simulator.SimulatorOptions for every node.
+        collector_options: CollectorOptions for how to poll the nodes.
+        duration: Seconds to poll the nodes for.
+
+    Returns:
+        A LoadTestReport of the collector's performance.
+    """
+    fleet_connection, child_connection = multiprocessing.Pipe()
+    fleet = multiprocessing.Process(
+        target=_serve_fleet,
+        args=(node_count, simulator_options, child_connection),
+        name='siad-simulator-fleet')
+    fleet.start()
+    output_dir = tempfile.mkdtemp()
+    try:
+        node_specs = fleet_connection.recv()
+        nodes_to_poll = [nodes.parse_node_spec(spec) for spec in node_specs]
+        return _poll_fleet(nodes_to_poll, collector_options, duration,
+                           os.path.join(output_dir, _OUTPUT_PATH))
+    finally:
+        if fleet.is_alive():
+            fleet_connection.send(None)
+        fleet.join()
+        shutil.rmtree(output_dir)
+
+
+def _serve_fleet(node_count, simulator_options, connection):
+    """Serves simulated nodes until told to stop through the connection."""
+    # The parent's alarm stops its polling, not the fleet.
+    signal.signal(signal.SIGALRM, signal.SIG_IGN)
+    simulators = siad_simulator.start_fleet(node_count, simulator_options)
+    try:
+        connection.send(siad_simulator.make_node_specs(simulators))
+        connection.recv()
+    finally:
+        for simulator in simulators:
+            simulator.close()
+
+
+def _poll_fleet(nodes_to_poll, collector_options, duration, output_path):
+    with open(output_path, 'w') as output:
+        recorder = _RecordingSerializer(serialize.CsvSerializer(output))
+        previous_handler = signal.signal(signal.SIGALRM,
+                                         _raise_duration_elapsed)
+        # The collector prints each poll, which would flood the terminal, so
+        # its console output is discarded, though still formatted.
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        process_stats.reset_peak_rss()
+        cpu_start = process_stats.cpu_seconds()
+        start = timeit.default_timer()
+        try:
+            signal.setitimer(signal.ITIMER_REAL, duration)
+            main._poll_forever(
+                nodes_to_poll,
+                {node.node_id: [output_path]
+                 for node in nodes_to_poll}, {output_path: recorder},
+                exporter=None,
+                frequency=collector_options.poll_frequency,
+                missed_poll_policy=scheduler.SKIP,
+                cadences=cadence.Cadences({}, collector_options.poll_frequency),
+                connection_options=collector_options.connection_options,
+                concurrent_queries=collector_options.concurrent_queries,
+                stream_files=collector_options.stream_files,
+                max_parallel_nodes=collector_options.max_parallel_nodes,
+                latency_summary_interval=0,
+                sink_queue_size=1000,
+                backpressure_policy=sink.BLOCK,
+                engine=collector_options.engine)
+        except _DurationElapsed:
+            pass
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+            sys.stdout.close()
+            sys.stdout = stdout
+        elapsed = timeit.default_timer() - start
+        cpu_seconds = process_stats.cpu_seconds() - cpu_start
+        peak_rss_bytes = process_stats.peak_rss_bytes()
+    return LoadTestReport(
+        duration=elapsed,
+        sample_count=recorder.sample_count,
+        expected_sample_count=len(nodes_to_poll) * int(
+            math.ceil(duration / collector_options.poll_frequency)),
+        incomplete_sample_count=recorder.incomplete_sample_count,
+        latency_summaries=recorder.latency_summaries(),
+        lateness_summary=_summarize('poll lateness', recorder.lateness),
+        interval_error_summary=_summarize(
+            'interval error',
+            _interval_errors(recorder.timestamps,
+                             collector_options.poll_frequency)),
+        cpu_seconds=cpu_seconds,
+        peak_rss_bytes=peak_rss_bytes,
+        final_rss_bytes=process_stats.rss_bytes())
+
+
+def _raise_duration_elapsed(signum, frame):
+    raise _DurationElapsed()
+
+
+def _interval_errors(timestamps_by_node, poll_frequency):
+    """Returns how far the intervals between samples stray from the frequency.
+
+    Args:
+        timestamps_by_node: A dict mapping each node ID to a list of the
+            timestamps of its samples, in order.
+        poll_frequency: Seconds between polls.
+
+    Returns:
+        A list of the absolute difference (in milliseconds) between each
+        interval and the poll frequency.
+    """
+    errors = []
+    for timestamps in timestamps_by_node.values():
+        for previous, current in zip(timestamps, timestamps[1:]):
+            interval = (current - previous).total_seconds()
+            errors.append(abs(interval - poll_frequency) * 1000.0)
+    return errors
+
+
+def _summarize(name, values):
+    if not values:
+        return None
+    return latency_stats.summarize_latencies(name, values)
+
+
+def print_report(report):
+    """Prints a LoadTestReport."""
+    print('Ran for %.1fs: %d of %d expected samples, %d incomplete' %
+          (report.duration, report.sample_count, report.expected_sample_count,
+           report.incomplete_sample_count))
+    print()
+    cli.print_latency_summary(
+        list(report.latency_summaries) + [
+            s for s in (report.lateness_summary, report.interval_error_summary)
+            if s
+        ])
+    print()
+    print('Collector CPU: %.2fs (%.1f%% of one core)' %
+          (report.cpu_seconds, 100.0 * report.cpu_seconds / report.duration))
+    print('Collector RSS: %.1f MB peak, %s final' %
+          (report.peak_rss_bytes / (1024.0 * 1024.0),
+           ('%.1f MB' % (report.final_rss_bytes / (1024.0 * 1024.0))
+            if report.final_rss_bytes is not None else 'unknown')))
+
+
+def _main(args):
+    logging.basicConfig(level=logging.WARNING)
+    report = run_load_test(
+        args.nodes,
+        siad_simulator.SimulatorOptions(
+            contract_count=args.contracts,
+            file_count=args.files,
+            latency_fn=siad_simulator.parse_latency_spec(args.latency),
+            error_rate=args.error_rate,
+            change_interval=args.change_interval,
+            seed=args.seed),
+        CollectorOptions(
+            poll_frequency=args.poll_frequency,
+            max_parallel_nodes=args.max_parallel_nodes,
+            concurrent_queries=args.concurrent_queries,
+            stream_files=args.stream_files,
+            connection_options=api.DEFAULT_CONNECTION_OPTIONS._replace(
+                pool_size=args.http_pool_size),
+            engine=args.engine), args.duration)
+    print_report(report)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='Sia Metrics Collector Load Test',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    siad_simulator.add_simulator_arguments(parser)
+    parser.add_argument(
+        '--duration',
+        type=float,
+        default=60,
+        help='Seconds to run the collector for')
+    parser.add_argument(
+        '-f',
+        '--poll_frequency',
+        type=float,
+        default=5,
+        help='Frequency (in seconds) to poll the simulated nodes')
+    parser.add_argument(
+        '--max_parallel_nodes',
+        type=int,
+        default=16,
+        help='Maximum number of nodes to poll at the same time')
+    parser.add_argument(
+        '--concurrent_queries',
+        action='store_true',
+        help='Query all of a node\'s endpoints at the same time')
+    parser.add_argument(
+        '--stream_files',
+        action='store_true',
+        help='Parse the /renter/files response as it arrives')
+    parser.add_argument(
+        '--http_pool_size',
+        type=int,
+        default=api.DEFAULT_CONNECTION_OPTIONS.pool_size,
+        help='Maximum number of keep-alive HTTP connections to each node')
+    parser.add_argument(
+        '--engine',
+        choices=main._ENGINES,
+        default=main._THREADS_ENGINE,
+        help='How the collector runs polls (asyncio requires Python 3)')
+    _main(parser.parse_args())
@@ -1,17 +1,54 @@
 #!/usr/bin/python2
 
 import argparse
-import datetime
+import functools
 import logging
 import os
-import time
+import signal
+import sys
 
-import cli
-import serialize
-import state
+# Modules that only some options need (multiprocessing.pool,
+# binary_serialize, prometheus_exporter and sqlite_serialize) are imported
+# where they're used, so that a --once run from cron doesn't pay to import
+# them. For the same reason, only polling forever uses api.Client.
+from sia_metrics_collector import buffered_writer
+from sia_metrics_collector import cadence
+from sia_metrics_collector import cli
+from sia_metrics_collector import group_spec
+from sia_metrics_collector import latency_stats
+from sia_metrics_collector import nodes
+from sia_metrics_collector import partition
+from sia_metrics_collector import rollup
+from sia_metrics_collector import scheduler
+from sia_metrics_collector import serialize
+from sia_metrics_collector import sink
+from sia_metrics_collector import state
+from sia_metrics_collector import stdlib_api
+from sia_metrics_collector import telemetry
 
 logger = logging.getLogger(__name__)
 
+# Output paths containing this placeholder get a separate file for each node.
+_NODE_ID_PLACEHOLDER = '{node_id}'
+
+# Maximum number of concurrent Sia API queries that polling one node makes.
+_QUERIES_PER_NODE = 4
+
+_CSV_FORMAT = 'csv'
+_BINARY_FORMAT = 'binary'
+_SQLITE_FORMAT = 'sqlite'
+_OUTPUT_FORMATS = (_CSV_FORMAT, _BINARY_FORMAT, _SQLITE_FORMAT)
+
+# Ways of running polls: on threads that each wait for a blocking query, or on
+# a single asyncio event loop (see async_engine.py), which needs Python 3.
+_THREADS_ENGINE = 'threads'
+_ASYNCIO_ENGINE = 'asyncio'
+_ENGINES = (_THREADS_ENGINE, _ASYNCIO_ENGINE)
+
+# Only the latest poll matters to the metrics exporter, so it keeps just a
+# couple of polls waiting and drops older ones if it falls behind.
+_EXPORTER_QUEUE_SIZE = 2
+
 
 def configure_logging():
     root_logger = logging.getLogger()
@@ -27,43 +64,564 @@ def configure_logging():
 def main(args):
     configure_logging()
     logger.info('Started runnning')
-    with _open_output_file(args.output_file) as csv_file:
-        _poll_forever(args.hostname, args.port, args.poll_frequency, csv_file)
+    _exit_on_sigterm()
+    nodes_to_poll = _get_nodes(args)
+    output_paths = _get_output_paths(args.output_file, nodes_to_poll)
+    # Outputs to close on exit.
+    outputs = []
+    serializers = {}
+    make_serializer = _get_serializer_factory(args)
+    open_output = functools.partial(
+        _open_output, output_format=args.output_format)
+    for path in set(output_paths.values()):
+        if args.partition_period:
+            output = partition.PartitionedSerializer(
+                path, args.partition_period, args.compression, open_output,
+                make_serializer)
+            serializers[path] = output
+        else:
+            output = open_output(path)
+            serializers[path] = make_serializer(output)
+        outputs.append(output)
+    rollup_paths = []
+    for resolution in args.rollups:
+        path = _get_rollup_path(args.output_file, resolution)
+        rollup_serializer = rollup.RollupSerializer(
+            _open_output(path, _CSV_FORMAT),
+            rollup.RESOLUTION_SECONDS[resolution], _get_flush_policy(args))
+        serializers[path] = rollup_serializer
+        outputs.append(rollup_serializer)
+        rollup_paths.append(path)
+    # Every node's metrics also go to each rollup.
+    node_output_paths = {
+        node_id: [path] + rollup_paths
+        for node_id, path in output_paths.items()
+    }
+    exporter = None
+    if args.metrics_port is not None:
+        from sia_metrics_collector import prometheus_exporter
+        exporter = prometheus_exporter.Exporter(args.metrics_host,
+                                                args.metrics_port)
+        outputs.append(exporter)
+    telemetry_writer = None
+    if args.telemetry_file:
+        telemetry_writer = telemetry.CsvWriter(
+            _open_output(args.telemetry_file, _CSV_FORMAT),
+            _get_flush_policy(args))
+        outputs.append(telemetry_writer)
+    try:
+        if args.once:
+            _poll_once(nodes_to_poll, node_output_paths, serializers,
+                       _get_connection_options(args), args.concurrent_queries,
+                       args.stream_files, args.max_parallel_nodes,
+                       _get_deadlines(args), telemetry_writer)
+        else:
+            _poll_forever(
+                nodes_to_poll, node_output_paths, serializers,
+                exporter, args.poll_frequency, args.missed_poll_policy,
+                _get_cadences(args), _get_connection_options(args),
+                args.concurrent_queries, args.stream_files,
+                args.max_parallel_nodes, args.latency_summary_interval,
+                args.sink_queue_size, args.backpressure_policy, args.engine,
+                _get_deadlines(args), telemetry_writer,
+                _get_flush_check_seconds(args))
+    finally:
+        for output in outputs:
+            output.close()
+
+
+def _exit_on_sigterm():
+    # By default, SIGTERM kills the process without unwinding the stack.
+    # Exiting normally instead runs the cleanup that flushes buffered output.
+    signal.signal(signal.SIGTERM, _exit_once)
 
 
-def _open_output_file(output_path):
-    """Opens the output file and seeks to the end.
+def _exit_once(signum, frame):
+    # Anything that signals the whole process group (e.g. timeout, or a
+    # supervisor) may send SIGTERM again while cleanup runs, and exiting then
+    # would cut the cleanup short, so later signals are ignored.
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    sys.exit(0)
 
-    CsvWriter needs the mode to either be 'r+' or 'w'.
+
+def _get_nodes(args):
+    """Gets the list of Sia nodes to poll from the command-line arguments.
+
+    Args:
+        args: Parsed command-line arguments. If they specify no nodes with
+            --node or --nodes_file, the collector polls the single node at
+            --hostname and --port.
+
+    Returns:
+        A list of nodes.Node to poll.
+    """
+    nodes_to_poll = [nodes.parse_node_spec(spec) for spec in args.node_specs]
+    if args.nodes_file:
+        with open(args.nodes_file) as nodes_file:
+            nodes_to_poll.extend(nodes.read_nodes_file(nodes_file))
+    if not nodes_to_poll:
+        nodes_to_poll.append(nodes.make_node(args.hostname, args.port))
+    nodes.check_unique_ids(nodes_to_poll)
+    return nodes_to_poll
+
+
+def _get_cadences(args):
+    return cadence.Cadences(
+        dict(group_spec.parse_group_spec(spec) for spec in args.cadence_specs),
+        args.poll_frequency)
+
+
+def _get_deadlines(args):
+    """Gets the state.DeadlineOptions, or None if no deadline is set."""
+    if not args.query_deadline_specs and args.sample_deadline is None:
+        return None
+    return state.DeadlineOptions(
+        query_deadlines=dict(
+            group_spec.parse_group_spec(spec)
+            for spec in args.query_deadline_specs),
+        sample_deadline=args.sample_deadline,
+        late_policy=args.late_query_policy)
+
+
+def _get_connection_options(args):
+    return stdlib_api.ConnectionOptions(
+        pool_size=args.http_pool_size,
+        connect_timeout=args.connect_timeout,
+        read_timeout=args.read_timeout)
+
+
+def _get_flush_policy(args):
+    return buffered_writer.FlushPolicy(
+        flush_rows=args.flush_rows,
+        flush_seconds=args.flush_seconds,
+        fsync_seconds=args.fsync_seconds)
+
+
+def _get_flush_check_seconds(args):
+    """Gets how often to check for buffered rows that are due to be written.
+
+    Returns:
+        The shortest time limit on buffering rows, or None if there's none.
+    """
+    limits = [args.flush_seconds]
+    if args.output_format == _SQLITE_FORMAT:
+        limits.append(args.sqlite_batch_seconds)
+    limits = [limit for limit in limits if limit is not None]
+    return min(limits) if limits else None
+
+
+def _get_serializer_factory(args):
+    """Gets the function that creates a serializer for an opened output."""
+    if args.output_format == _SQLITE_FORMAT:
+        from sia_metrics_collector import sqlite_serialize
+        return lambda connection: sqlite_serialize.SqliteSerializer(
+            connection,
+            batch_size=args.sqlite_batch_size,
+            batch_seconds=args.sqlite_batch_seconds)
+    flush_policy = _get_flush_policy(args)
+    if args.output_format == _BINARY_FORMAT:
+        from sia_metrics_collector import binary_serialize
+        return lambda binary_file: binary_serialize.BinarySerializer(
+            binary_file, flush_policy)
+    return lambda csv_file: serialize.CsvSerializer(csv_file, flush_policy)
+
+
+def _get_output_paths(output_path, nodes_to_poll):
+    """Gets the path of the output file for each node.
+
+    Args:
+        output_path: Path to output file. If the path contains '{node_id}',
+            each node writes to its own file, with the placeholder replaced by
+            its node ID. Otherwise, all nodes share a single file.
+        nodes_to_poll: A list of nodes.Node to get output paths for.
+
+    Returns:
+        A dict mapping each node ID to its output path.
+    """
+    return {
+        node.node_id: output_path.replace(_NODE_ID_PLACEHOLDER, node.node_id)
+        for node in nodes_to_poll
+    }
+
+
+def _get_rollup_path(output_path, resolution):
+    """Gets the path of the CSV file for a rollup of all nodes' metrics.
+
+    Args:
+        output_path: Path to output file, from which the rollup's path is
+            derived (e.g. 'sia-metrics.csv' becomes
+            'sia-metrics.rollup-1h.csv').
+        resolution: Name of the rollup's resolution (a key of
+            rollup.RESOLUTION_SECONDS).
+    """
+    prefix, _ = os.path.splitext(
+        output_path.replace(_NODE_ID_PLACEHOLDER, 'all'))
+    return '%s.rollup-%s.csv' % (prefix, resolution)
+
+
+def _open_output(output_path, output_format):
+    """Opens the output in the way its format's serializer needs.
+
+    CsvSerializer needs a file opened in either 'r+' or 'w' mode,
+    BinarySerializer needs a file opened in either 'r+b' or 'w+b' mode, and
+    SqliteSerializer needs a database connection.
 
     Args:
         output_path: Path to output file to open or create.
+        output_format: Format of the output (one of _OUTPUT_FORMATS).
+
+    Returns:
+        An open file, or sqlite3.Connection, with a close() method.
     """
+    if output_format == _SQLITE_FORMAT:
+        from sia_metrics_collector import sqlite_serialize
+        return sqlite_serialize.connect(output_path)
+    if output_format == _BINARY_FORMAT:
+        existing_mode, new_mode = 'r+b', 'w+b'
+    else:
+        existing_mode, new_mode = 'r+', 'w'
     if os.path.exists(output_path):
-        return open(output_path, 'r+')
+        return open(output_path, existing_mode)
+    else:
+        return open(output_path, new_mode)
+
+
+def _poll_forever(nodes_to_poll,
+                  node_output_paths,
+                  serializers,
+                  exporter,
+                  frequency,
+                  missed_poll_policy,
+                  cadences,
+                  connection_options,
+                  concurrent_queries,
+                  stream_files,
+                  max_parallel_nodes,
+                  latency_summary_interval,
+                  sink_queue_size,
+                  backpressure_policy,
+                  engine=_THREADS_ENGINE,
+                  deadlines=None,
+                  telemetry_writer=None,
+                  flush_check_seconds=None):
+    recorder = telemetry.Recorder() if telemetry_writer else None
+    flush_timer = None
+    if flush_check_seconds is not None:
+        flush_outputs = list(serializers.values())
+        if telemetry_writer:
+            flush_outputs.append(telemetry_writer)
+        flush_timer = buffered_writer.FlushTimer(flush_outputs,
+                                                 flush_check_seconds)
+    if engine == _ASYNCIO_ENGINE:
+        # Imported only when used, because they need Python 3.
+        import asyncio
+        from sia_metrics_collector import async_engine
+        loop = asyncio.new_event_loop()
+        make_sink = functools.partial(async_engine.AsyncSink, loop)
+    else:
+        loop = None
+        make_sink = sink.Sink
+    # Each output, and the console, is written by its own sink, so that a
+    # stalled disk or terminal doesn't delay the next poll.
+    output_sinks = {
+        path: make_sink(path,
+                        _locked(flush_timer, serializer,
+                                _timed(recorder, 'serialize',
+                                       serializer.write_state)),
+                        sink_queue_size, backpressure_policy)
+        for path, serializer in serializers.items()
+    }
+    console_sink = make_sink('console',
+                             _timed(recorder, 'console_render',
+                                    lambda print_fn: print_fn()),
+                             sink_queue_size, backpressure_policy)
+    all_sinks = list(output_sinks.values()) + [console_sink]
+    if recorder:
+        telemetry_sink = make_sink('telemetry',
+                                   _locked(flush_timer, telemetry_writer,
+                                           telemetry_writer.write_sample),
+                                   sink_queue_size, backpressure_policy)
+        all_sinks.append(telemetry_sink)
+    else:
+        telemetry_sink = None
+    if exporter:
+        # Rendering the exporter's response happens on this sink's thread,
+        # never on the polling thread.
+        exporter_sink = make_sink('exporter', lambda update_fn: update_fn(),
+                                  _EXPORTER_QUEUE_SIZE, sink.DROP_OLDEST)
+        all_sinks.append(exporter_sink)
     else:
-        return open(output_path, 'w')
+        exporter_sink = None
+    sinks_by_node_id = {
+        node_id: [output_sinks[path] for path in paths]
+        for node_id, paths in node_output_paths.items()
+    }
+    try:
+        if loop:
+            # A query still running when the next poll is due has no use, so
+            # queries without a deadline time out after one poll period.
+            poller = async_engine.Engine(
+                loop,
+                nodes_to_poll,
+                connection_options,
+                deadlines=deadlines,
+                query_timeout=frequency,
+                telemetry=recorder)
+            builders = poller.builders
+        else:
+            builders = _make_builders(
+                nodes_to_poll,
+                connection_options,
+                concurrent_queries,
+                stream_files,
+                max_parallel_nodes,
+                deadlines=deadlines,
+                recorder=recorder)
+        handle_poll_fn = functools.partial(
+            _handle_poll,
+            nodes_to_poll=nodes_to_poll,
+            builders=builders,
+            serializers=serializers,
+            sinks_by_node_id=sinks_by_node_id,
+            all_sinks=all_sinks,
+            console_sink=console_sink,
+            exporter=exporter,
+            exporter_sink=exporter_sink,
+            latency_tracker=latency_stats.LatencyTracker(),
+            latency_summary_interval=latency_summary_interval,
+            show_node_id=len(nodes_to_poll) > 1,
+            recorder=recorder,
+            telemetry_sink=telemetry_sink)
+        if loop:
+            # The schedule runs on the loop's clock, so that its times can be
+            # handed to the loop's timers.
+            poll_scheduler = scheduler.Scheduler(
+                frequency, missed_poll_policy, clock=loop.time)
+            polling = async_engine.poll_forever(loop, poller, poll_scheduler,
+                                                cadences, handle_poll_fn,
+                                                all_sinks)
+            try:
+                loop.run_until_complete(polling)
+            finally:
+                polling.cancel()
+                poller.close()
+        else:
+            _poll_and_write(builders, frequency, missed_poll_policy, cadences,
+                            _make_node_pool(nodes_to_poll, max_parallel_nodes),
+                            handle_poll_fn)
+    finally:
+        for s in all_sinks:
+            s.close()
+        if flush_timer:
+            flush_timer.close()
+        for serializer in serializers.values():
+            serializer.flush()
+        if loop:
+            loop.close()
+        if recorder:
+            recorder.close()
 
 
-def _poll_forever(sia_hostname, sia_port, frequency, csv_file):
-    builder = state.make_builder(sia_hostname, sia_port)
-    csv_serializer = serialize.CsvSerializer(csv_file)
-    next_poll_time = datetime.datetime.utcnow()
-    for i in xrange(1000000000):
-        s = builder.build()
+def _poll_once(nodes_to_poll,
+               node_output_paths,
+               serializers,
+               connection_options,
+               concurrent_queries,
+               stream_files,
+               max_parallel_nodes,
+               deadlines,
+               telemetry_writer=None):
+    """Polls every node once, and writes the states straight to the outputs.
 
-        csv_serializer.write_state(s)
-        # Print header every 100 lines.
-        if i % 100 == 0:
-            cli.print_header()
-        cli.print_state(s)
-        next_poll_time += datetime.timedelta(seconds=frequency)
-        _wait_until(next_poll_time)
+    Without a schedule to keep, there's nothing for sinks to protect, so this
+    skips starting their threads, and queries every group regardless of
+    cadence. Unless streaming files, it queries Sia with stdlib_api.Client,
+    which is quicker to import than api.Client.
+    """
+    recorder = telemetry.Recorder() if telemetry_writer else None
+    builders = _make_builders(
+        nodes_to_poll,
+        connection_options,
+        concurrent_queries,
+        stream_files,
+        max_parallel_nodes,
+        client_class=None if stream_files else stdlib_api.Client,
+        deadlines=deadlines,
+        recorder=recorder)
+    states = _build_states(builders, None,
+                           _make_node_pool(nodes_to_poll, max_parallel_nodes))
+    try:
+        for s in states:
+            for path in node_output_paths[s.node_id]:
+                _timed(recorder, 'serialize', serializers[path].write_state)(s)
+        _timed(recorder, 'console_render', _print_states)(
+            states, 0, show_node_id=len(nodes_to_poll) > 1)
+        if recorder:
+            telemetry_writer.write_sample(recorder.sample(0))
+    finally:
+        for serializer in serializers.values():
+            serializer.flush()
+        if recorder:
+            recorder.close()
+
+
+def _make_node_pool(nodes_to_poll, max_parallel_nodes):
+    # Threads are shared across nodes and capped, so polling many nodes costs
+    # a bounded number of threads rather than several threads per node.
+    parallel_nodes = min(len(nodes_to_poll), max_parallel_nodes)
+    if parallel_nodes > 1:
+        from multiprocessing import pool
+        return pool.ThreadPool(parallel_nodes)
+    return None
+
+
+def _make_builders(nodes_to_poll,
+                   connection_options,
+                   concurrent_queries,
+                   stream_files,
+                   max_parallel_nodes,
+                   client_class=None,
+                   deadlines=None,
+                   recorder=None):
+    # Waiting for a query only until its deadline means running it on another
+    # thread, so deadlines need query pools too. A late query keeps its thread
+    # until Sia responds, so each node gets a pool of its own, and a hung node
+    # ties up only its own threads rather than starving every other node's
+    # queries. Its pool can't run out either, as a group with a late query
+    # waits on it rather than sending another.
+    if deadlines:
+        from multiprocessing import pool
+        query_pools = [
+            pool.ThreadPool(_QUERIES_PER_NODE) for _ in nodes_to_poll
+        ]
+    elif concurrent_queries:
+        from multiprocessing import pool
+        parallel_nodes = min(len(nodes_to_poll), max_parallel_nodes)
+        query_pools = [pool.ThreadPool(_QUERIES_PER_NODE * parallel_nodes)
+                      ] * len(nodes_to_poll)
+    else:
+        query_pools = [None] * len(nodes_to_poll)
+    return [
+        state.make_builder(
+            node,
+            connection_options=connection_options,
+            thread_pool=query_pool,
+            stream_files=stream_files,
+            client_class=client_class,
+            deadlines=deadlines,
+            telemetry=recorder)
+        for node, query_pool in zip(nodes_to_poll, query_pools)
+    ]
 
 
-def _wait_until(timestamp):
-    while datetime.datetime.utcnow() < timestamp:
-        time.sleep(0.5)
+def _timed(recorder, stage, fn):
+    # Without telemetry, fn is called as it is, so costs nothing extra.
+    if recorder:
+        return recorder.timed(stage, fn)
+    return fn
+
+
+def _locked(flush_timer, output, fn):
+    # Without a flush timer, only the output's sink uses it, so fn needs no
+    # lock.
+    if flush_timer:
+        return flush_timer.locked(output, fn)
+    return fn
+
+
+def _poll_and_write(builders, frequency, missed_poll_policy, cadences,
+                    node_pool, handle_poll_fn):
+    poll_scheduler = scheduler.Scheduler(frequency, missed_poll_policy)
+    for i, tick in enumerate(poll_scheduler.ticks()):
+        # Cadences are based on the tick's slot in the schedule rather than
+        # the number of polls, so they stay aligned with time when polls are
+        # missed.
+        states = _build_states(builders, cadences.due_groups(tick.index),
+                               node_pool)
+        handle_poll_fn(i, tick, states)
+
+
+def _handle_poll(poll_index,
+                 tick,
+                 states,
+                 nodes_to_poll,
+                 builders,
+                 serializers,
+                 sinks_by_node_id,
+                 all_sinks,
+                 console_sink,
+                 exporter,
+                 exporter_sink,
+                 latency_tracker,
+                 latency_summary_interval,
+                 show_node_id,
+                 recorder=None,
+                 telemetry_sink=None):
+    """Hands a poll's states to the sinks, and reports on polling."""
+    if tick.missed_count:
+        logger.warning('Missed %d poll(s) because polling fell behind',
+                       tick.missed_count)
+    for s in states:
+        s.poll_lateness = tick.lateness * 1000.0
+        for node_sink in sinks_by_node_id[s.node_id]:
+            node_sink.put(s)
+        latency_tracker.record(s)
+    console_sink.put(
+        functools.partial(_print_states, states, poll_index, show_node_id))
+    # Stats are taken now, rather than when a sink gets to handling them.
+    if exporter_sink:
+        exporter_sink.put(
+            functools.partial(exporter.update, states,
+                              _get_collector_stats(nodes_to_poll, builders,
+                                                   serializers, all_sinks)))
+    if latency_summary_interval and (
+        (poll_index + 1) % latency_summary_interval == 0):
+        collector_stats = _get_collector_stats(nodes_to_poll, builders,
+                                               serializers, all_sinks)
+        console_sink.put(
+            functools.partial(_print_stats, latency_tracker.summarize(),
+                              collector_stats.node_connection_stats,
+                              collector_stats.output_writer_stats,
+                              collector_stats.sink_queue_stats))
+    # Each sample covers the time since the previous poll's, which includes
+    # writing and printing earlier polls, on the sinks' threads.
+    if telemetry_sink:
+        telemetry_sink.put(recorder.sample(poll_index))
+
+
+def _get_collector_stats(nodes_to_poll, builders, serializers, all_sinks):
+    from sia_metrics_collector import prometheus_exporter
+    return prometheus_exporter.CollectorStats(
+        node_connection_stats=[(node.node_id, builder.connection_stats())
+                               for node, builder in zip(nodes_to_poll, builders)
+                              ],
+        output_writer_stats=[(path, serializer.writer_stats())
+                             for path, serializer in serializers.items()
+                             if hasattr(serializer, 'writer_stats')],
+        sink_queue_stats=[(s.name, s.stats()) for s in all_sinks])
+
+
+def _print_states(states, poll_index, show_node_id):
+    # Print header every 100 polls.
+    if poll_index % 100 == 0:
+        cli.print_header(show_node_id)
+    for s in states:
+        cli.print_state(s, show_node_id)
+
+
+def _print_stats(latency_summaries, node_connection_stats, output_writer_stats,
+                 sink_queue_stats):
+    cli.print_latency_summary(latency_summaries)
+    cli.print_connection_stats(node_connection_stats)
+    cli.print_writer_stats(output_writer_stats)
+    cli.print_queue_stats(sink_queue_stats)
+
+
+def _build_states(builders, query_groups, node_pool):
+    if node_pool:
+        return node_pool.map(lambda builder: builder.build(query_groups),
+                             builders)
+    return [builder.build(query_groups) for builder in builders]
 
 
 if __name__ == '__main__':
@@ -80,15 +638,240 @@ if __name__ == '__main__':
         type=int,
         default=9980,
         help='Siad API port of Sia node to poll for metrics')
+    parser.add_argument(
+        '-n',
+        '--node',
+        action='append',
+        default=[],
+        dest='node_specs',
+        help=('Sia node to poll, as [node_id=][scheme://]host[:port]. May be '
+              'repeated to poll several nodes. Overrides --hostname and '
+              '--port'))
+    parser.add_argument(
+        '--nodes_file',
+        help=('Path to file listing Sia nodes to poll, one per line, in the '
+              'same format as --node'))
+    parser.add_argument(
+        '--http_pool_size',
+        type=int,
+        default=stdlib_api.DEFAULT_CONNECTION_OPTIONS.pool_size,
+        help='Maximum number of keep-alive HTTP connections to each Sia node')
+    parser.add_argument(
+        '--connect_timeout',
+        type=float,
+        default=stdlib_api.DEFAULT_CONNECTION_OPTIONS.connect_timeout,
+        help='Seconds to wait for an HTTP connection to a Sia node to open')
+    parser.add_argument(
+        '--read_timeout',
+        type=float,
+        default=stdlib_api.DEFAULT_CONNECTION_OPTIONS.read_timeout,
+        help=('Seconds to wait between bytes of a response from a Sia node. '
+              'If unset, waits forever'))
+    parser.add_argument(
+        '--engine',
+        choices=_ENGINES,
+        default=_THREADS_ENGINE,
+        help=('How to run polls: on a pool of threads, or on a single asyncio '
+              'event loop that sends every query of every node at once over '
+              'non-blocking connections (requires Python 3, and ignores '
+              '--concurrent_queries and --max_parallel_nodes). The asyncio '
+              'engine cancels a query that misses its deadline, and gives '
+              'queries without one a deadline of one poll period'))
+    parser.add_argument(
+        '--stream_files',
+        action='store_true',
+        help=('Parse the /renter/files response as it arrives, so memory use '
+              'stays constant no matter how many files Sia has'))
+    parser.add_argument(
+        '--max_parallel_nodes',
+        type=int,
+        default=16,
+        help='Maximum number of Sia nodes to poll at the same time')
+    parser.add_argument(
+        '--once',
+        action='store_true',
+        help=('Poll every node once, append the metrics to the output, and '
+              'exit, for running from cron or a systemd timer rather than as '
+              'a daemon'))
     parser.add_argument(
         '-f',
         '--poll_frequency',
-        type=int,
+        type=float,
         default=60,
-        help='Frequency (in seconds) to poll metrics')
+        help='Frequency (in seconds) to poll metrics. May be fractional')
+    parser.add_argument(
+        '--missed_poll_policy',
+        choices=scheduler.MISSED_TICK_POLICIES,
+        default=scheduler.SKIP,
+        help=('What to do with polls whose scheduled time passed while the '
+              'previous poll was still running: skip them, catch up by '
+              'running them all back to back, or coalesce them into a single '
+              'poll that runs immediately'))
+    parser.add_argument(
+        '--cadence',
+        action='append',
+        default=[],
+        dest='cadence_specs',
+        help=('How often to refresh a group of metrics, as group=seconds '
+              '(e.g. file=300), where group is one of: %s. May be repeated. '
+              'Groups without a cadence are refreshed on every poll, and '
+              'between refreshes, a group\'s last metrics are carried '
+              'forward' % ', '.join(state.QUERY_GROUPS)))
+    parser.add_argument(
+        '--concurrent_queries',
+        action='store_true',
+        help=('Query all Sia API endpoints at the same time rather than one '
+              'after another'))
+    parser.add_argument(
+        '--query_deadline',
+        action='append',
+        default=[],
+        dest='query_deadline_specs',
+        help=('How long to wait for a group of metrics on each poll, as '
+              'group=seconds (e.g. file=20), where group is one of: %s. May '
+              'be repeated. A query that misses its deadline is left to '
+              'finish in the background, and the next poll of its group uses '
+              'its response. Queries run at the same time, as with '
+              '--concurrent_queries' % ', '.join(state.QUERY_GROUPS)))
+    parser.add_argument(
+        '--sample_deadline',
+        type=float,
+        help=('How long to wait for all of a node\'s metrics on each poll, '
+              'in seconds. Like --query_deadline, but for every group. If '
+              'unset, and a group has no --query_deadline, waits for it '
+              'forever'))
+    parser.add_argument(
+        '--late_query_policy',
+        choices=state.LATE_POLICIES,
+        default=state.LATE_EMPTY,
+        help=('Whether to leave the metrics of a group that missed its '
+              'deadline empty, or carry them forward from its last '
+              'successful query. Either way, the group\'s <group>_status '
+              'column is "late"'))
+    parser.add_argument(
+        '--latency_summary_interval',
+        type=int,
+        default=0,
+        help=('Print percentiles of recent Sia API latencies every N polls '
+              '(0 to disable)'))
     parser.add_argument(
         '-o',
         '--output_file',
         required=True,
-        help='Path to file to write metrics')
-    main(parser.parse_args())
+        help=('Path to file to write metrics. If it contains {node_id}, each '
+              'node writes to a separate file'))
+    parser.add_argument(
+        '--output_format',
+        choices=_OUTPUT_FORMATS,
+        default=_CSV_FORMAT,
+        help=('Format of the output file: CSV, fixed-width binary records '
+              'that can be memory-mapped (see binary_serialize.py), or a '
+              'SQLite database (see query_metrics.py)'))
+    parser.add_argument(
+        '--sqlite_batch_size',
+        type=int,
+        default=100,
+        help=('With --output_format sqlite, number of rows to write to the '
+              'database in each transaction'))
+    parser.add_argument(
+        '--sqlite_batch_seconds',
+        type=float,
+        default=300,
+        help=('With --output_format sqlite, maximum seconds to hold rows '
+              'before writing them to the database, even if the batch is '
+              'not full'))
+    parser.add_argument(
+        '--partition_period',
+        choices=partition.PARTITION_PERIODS,
+        help=('Split CSV or binary output into a separate file for each hour '
+              'or day of metrics (see partition.py). If unset, writes a '
+              'single file'))
+    parser.add_argument(
+        '--compression',
+        choices=partition.COMPRESSIONS,
+        default=partition.GZIP,
+        help=('With --partition_period, how to compress each file once the '
+              'collector moves on to the next. zstd requires the zstandard '
+              'package'))
+    parser.add_argument(
+        '--rollup',
+        action='append',
+        default=[],
+        choices=sorted(rollup.RESOLUTION_SECONDS),
+        dest='rollups',
+        help=('Also write the min, max, mean, and last value of each metric '
+              'over every 1m, 1h, or 1d of polls to a separate CSV file (e.g. '
+              'sia-metrics.rollup-1h.csv). May be repeated'))
+    parser.add_argument(
+        '--sink_queue_size',
+        type=int,
+        default=1000,
+        help=('Maximum number of polls to hold for each output file, and the '
+              'console, while waiting to be written'))
+    parser.add_argument(
+        '--backpressure_policy',
+        choices=sink.BACKPRESSURE_POLICIES,
+        default=sink.BLOCK,
+        help=('What to do when polls are collected faster than an output file '
+              'or the console can write them: block polling until there is '
+              'room, or drop the oldest or newest unwritten poll'))
+    parser.add_argument(
+        '--flush_rows',
+        type=int,
+        default=buffered_writer.DEFAULT_FLUSH_POLICY.flush_rows,
+        help=('With --output_format csv or binary, buffer rows and write them '
+              'to the output file once this many are buffered'))
+    parser.add_argument(
+        '--flush_seconds',
+        type=float,
+        default=buffered_writer.DEFAULT_FLUSH_POLICY.flush_seconds,
+        help=('With --output_format csv or binary, write buffered rows to the '
+              'output file once the oldest is this many seconds old, even if '
+              'fewer than --flush_rows are buffered. Also applies between '
+              'polls, checked every this many seconds'))
+    parser.add_argument(
+        '--fsync_seconds',
+        type=float,
+        default=buffered_writer.DEFAULT_FLUSH_POLICY.fsync_seconds,
+        help=('With --output_format csv or binary, when writing buffered rows, '
+              'also force them to disk if the output file has not been forced '
+              'to disk in this many seconds (0 to force every write). If '
+              'unset, leaves it to the OS'))
+    parser.add_argument(
+        '--metrics_port',
+        type=int,
+        help=('Serve the latest metrics of each node, and the collector\'s '
+              'own stats, for Prometheus to scrape at '
+              'http://<metrics_host>:<metrics_port>/metrics. If unset, '
+              'metrics are not served'))
+    parser.add_argument(
+        '--metrics_host',
+        default='127.0.0.1',
+        help=('With --metrics_port, address to serve metrics on (empty for '
+              'all interfaces)'))
+    parser.add_argument(
+        '--telemetry_file',
+        help=('Path to CSV file to write the collector\'s own CPU time, '
+              'memory use, garbage collection pauses and time spent in each '
+              'stage of polling to, once per poll (see telemetry.py). If '
+              'unset, the collector does not measure itself'))
+    args = parser.parse_args()
+    if args.partition_period and args.output_format == _SQLITE_FORMAT:
+        parser.error('--partition_period does not support sqlite output')
+    if args.engine == _ASYNCIO_ENGINE:
+        if sys.version_info[0] < 3:
+            parser.error('--engine asyncio requires Python 3')
+        if args.stream_files:
+            parser.error('--engine asyncio does not support --stream_files')
+    if args.once:
+        # The asyncio engine only pays for its setup over many polls, and
+        # the rest keep state from one poll of the process to the next.
+        if args.engine != _THREADS_ENGINE:
+            parser.error('--once does not support --engine %s' % args.engine)
+        if args.cadence_specs:
+            parser.error('--once does not support --cadence')
+        if args.rollups:
+            parser.error('--once does not support --rollup')
+        if args.metrics_port is not None:
+            parser.error('--once does not support --metrics_port')
+    main(args)
@@ -0,0 +1,128 @@
+"""Parses the list of Sia nodes to collect metrics from."""
+
+import collections
+
+try:
+    import urlparse
+except ImportError:
+    # Python 3 renamed it.
+    from urllib import parse as urlparse
+
+_DEFAULT_SCHEME = 'http'
+_DEFAULT_PORT = 9980
+"""A Sia node to poll for metrics.
+
+Fields:
+    node_id: Name that identifies the node in the collected metrics.
+    hostname: Hostname of the node, including URL scheme (e.g.
+        'http://localhost').
+    port: Siad API port of the node.
+"""
+Node = collections.namedtuple('Node', ['node_id', 'hostname', 'port'])
+
+
+class Error(Exception):
+    pass
+
+
+class InvalidNodeSpecError(Error):
+    pass
+
+
+class DuplicateNodeIdError(Error):
+    pass
+
+
+def make_node(hostname, port):
+    """Makes a Node from a hostname and port, using them to derive its ID.
+
+    Args:
+        hostname: Hostname of the node, optionally including URL scheme.
+        port: Siad API port of the node.
+
+    Returns:
+        A Node with an ID of the form 'host:port'.
+    """
+    return parse_node_spec('%s:%d' % (hostname, port))
+
+
+def parse_node_spec(spec):
+    """Parses a node specification string.
+
+    Args:
+        spec: A string of the form '[node_id=][scheme://]host[:port]', for
+            example 'renter-1=http://10.0.0.5:9980'. If the node ID is absent,
+            it defaults to 'host:port'. If the scheme is absent, it defaults to
+            http. If the port is absent, it defaults to 9980.
+
+    Returns:
+        The Node that the string specifies.
+
+    Raises:
+        InvalidNodeSpecError: The spec is not a valid node specification.
+    """
+    node_id = None
+    address = spec.strip()
+    if '=' in address:
+        node_id, address = [part.strip() for part in address.split('=', 1)]
+        if not node_id:
+            raise InvalidNodeSpecError('Empty node ID in spec: %s' % spec)
+    if '://' not in address:
+        address = '%s://%s' % (_DEFAULT_SCHEME, address)
+    parsed = urlparse.urlparse(address)
+    try:
+        port = parsed.port or _DEFAULT_PORT
+    except ValueError:
+        raise InvalidNodeSpecError('Invalid port in spec: %s' % spec)
+    if not parsed.hostname or parsed.path not in ('', '/'):
+        raise InvalidNodeSpecError('Invalid address in spec: %s' % spec)
+    host = parsed.hostname
+    # urlparse strips the brackets from an IPv6 address, which are needed to
+    # tell its colons apart from the port's.
+    if ':' in host:
+        host = '[%s]' % host
+    if not node_id:
+        node_id = '%s:%d' % (host, port)
+    return Node(
+        node_id=node_id, hostname='%s://%s' % (parsed.scheme, host), port=port)
+
+
+def read_nodes_file(nodes_file):
+    """Reads node specifications from a file, one per line.
+
+    Blank lines and lines beginning with '#' are ignored.
+
+    Args:
+        nodes_file: File object containing node specifications in the format
+            that parse_node_spec accepts.
+
+    Returns:
+        A list of Nodes in the order they appear in the file.
+
+    Raises:
+        InvalidNodeSpecError: A line in the file is not a valid node
+            specification.
+    """
+    nodes = []
+    for line in nodes_file:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        nodes.append(parse_node_spec(line))
+    return nodes
+
+
+def check_unique_ids(nodes):
+    """Checks that no two nodes share the same ID.
+
+    Args:
+        nodes: A list of Nodes.
+
+    Raises:
+        DuplicateNodeIdError: Two or more nodes have the same ID.
+    """
+    seen_ids = set()
+    for node in nodes:
+        if node.node_id in seen_ids:
+            raise DuplicateNodeIdError('Duplicate node ID: %s' % node.node_id)
+        seen_ids.add(node.node_id)
@@ -0,0 +1,324 @@
+"""Splits output into segment files by time, and compresses closed segments.
+
+For an output path like 'sia-metrics.csv' partitioned by hour, metrics from
+16:00 to 17:00 UTC on 2018-02-11 are written to the segment
+'sia-metrics.2018-02-11T16.csv'. Once the collector moves on to the next
+segment, the closed segment is compressed in the background (e.g. to
+'sia-metrics.2018-02-11T16.csv.gz') and listed in the manifest,
+'sia-metrics.manifest.json':
+
+    {
+      "segments": [
+        {
+          "path": "sia-metrics.2018-02-11T16.csv.gz",
+          "start": "2018-02-11T16:00:00",
+          "end": "2018-02-11T17:00:00"
+        }
+      ]
+    }
+
+Each segment holds metrics with timestamps from start (inclusive) to end
+(exclusive), so readers can open only the segments that overlap the time
+range they need. Segment paths are relative to the manifest's directory. The
+segment currently being written is not listed.
+"""
+
+import datetime
+import glob
+import gzip
+import json
+import logging
+import os
+import shutil
+
+from sia_metrics_collector import sink
+
+logger = logging.getLogger(__name__)
+
+HOUR = 'hour'
+DAY = 'day'
+PARTITION_PERIODS = (HOUR, DAY)
+
+NO_COMPRESSION = 'none'
+GZIP = 'gzip'
+ZSTD = 'zstd'
+COMPRESSIONS = (NO_COMPRESSION, GZIP, ZSTD)
+
+_LABEL_FORMATS = {
+    HOUR: '%Y-%m-%dT%H',
+    DAY: '%Y-%m-%d',
+}
+_PERIOD_LENGTHS = {
+    HOUR: datetime.timedelta(hours=1),
+    DAY: datetime.timedelta(days=1),
+}
+_COMPRESSED_EXTENSIONS = {
+    GZIP: '.gz',
+    ZSTD: '.zst',
+}
+_TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S'
+_COPY_CHUNK_SIZE = 1024 * 1024
+
+# Maximum number of closed segments waiting to be compressed. A segment
+# closes at most once an hour, so the queue only fills if compression is
+# badly stuck, in which case rotation waits for it.
+_COMPRESSION_QUEUE_SIZE = 100
+
+
+class Error(Exception):
+    pass
+
+
+class CompressionUnavailableError(Error):
+    pass
+
+
+class PartitionedSerializer(object):
+    """Serializes SiaState to a series of segment files, one per period.
+
+    Each segment is written by its own serializer (e.g. a CsvSerializer), so
+    segments are complete files in the same format as unpartitioned output.
+    """
+
+    def __init__(self,
+                 base_path,
+                 period,
+                 compression,
+                 open_fn,
+                 make_serializer,
+                 time_fn=datetime.datetime.utcnow):
+        """Creates a new PartitionedSerializer.
+
+        Segments of base_path that were left uncompressed and unlisted (e.g.
+        because the collector crashed) are closed and compressed now, except
+        for the segment for the current period, which is appended to.
+        Compressed segments that were never listed are listed now.
+
+        Args:
+            base_path: Path to derive segment and manifest paths from.
+            period: One of PARTITION_PERIODS.
+            compression: One of COMPRESSIONS.
+            open_fn: Function that opens a segment file, given its path.
+            make_serializer: Function that creates a serializer for an open
+                segment file.
+            time_fn: Function that returns the current UTC time.
+
+        Raises:
+            CompressionUnavailableError: The module for the compression is
+                not installed.
+        """
+        if period not in PARTITION_PERIODS:
+            raise ValueError('Unknown partition period: %s' % period)
+        if compression not in COMPRESSIONS:
+            raise ValueError('Unknown compression: %s' % compression)
+        self._compress_fn = _get_compress_fn(compression)
+        self._period = period
+        self._compression = compression
+        self._open_fn = open_fn
+        self._make_serializer = make_serializer
+        self._path_prefix, self._extension = os.path.splitext(base_path)
+        self._manifest_path = self._path_prefix + '.manifest.json'
+        self._manifest = read_manifest(self._manifest_path)
+        self._segment_start = None
+        self._segment_file = None
+        self._serializer = None
+        self._compression_sink = sink.Sink(
+            'compress-%s' % os.path.basename(base_path), self._finish_segment,
+            _COMPRESSION_QUEUE_SIZE)
+        current_segment_start = _truncate(period, time_fn())
+        for segment_start in self._recover_segments():
+            if segment_start != current_segment_start:
+                self._compression_sink.put(segment_start)
+
+    def write_state(self, state):
+        segment_start = _truncate(self._period, state.timestamp)
+        # Metrics never move back to an earlier segment, which may already be
+        # compressed, so a state from the past (e.g. after the system clock
+        # is set back) is written to the current segment.
+        if self._segment_start is None or segment_start > self._segment_start:
+            self._rotate(segment_start)
+        self._serializer.write_state(state)
+
+    def flush(self):
+        if self._serializer:
+            self._serializer.flush()
+
+    def flush_if_due(self):
+        if self._serializer:
+            self._serializer.flush_if_due()
+
+    def writer_stats(self):
+        """Returns buffered_writer.WriterStats for the current segment file."""
+        if not self._serializer:
+            return None
+        return self._serializer.writer_stats()
+
+    def close(self):
+        """Closes the current segment, and waits for compression to finish.
+
+        The current segment stays uncompressed and unlisted, so that if the
+        collector restarts within the same period, it appends to the
+        segment.
+        """
+        self._close_segment()
+        self._compression_sink.close()
+
+    def _rotate(self, segment_start):
+        if self._segment_start is not None:
+            self._close_segment()
+            self._compression_sink.put(self._segment_start)
+        self._segment_start = segment_start
+        self._segment_file = self._open_fn(self._segment_path(segment_start))
+        self._serializer = self._make_serializer(self._segment_file)
+
+    def _close_segment(self):
+        if self._segment_file:
+            self._serializer.flush()
+            self._segment_file.close()
+        self._segment_file = None
+        self._serializer = None
+
+    def _finish_segment(self, segment_start):
+        # Runs on the compression sink's thread.
+        path = self._segment_path(segment_start)
+        listed_path = path
+        if self._compress_fn:
+            listed_path = path + _COMPRESSED_EXTENSIONS[self._compression]
+            self._compress_fn(path, listed_path)
+        self._list_segment(segment_start, listed_path)
+        _write_manifest(self._manifest_path, self._manifest)
+        if listed_path != path:
+            # The source is only removed once the compressed copy is listed,
+            # so a crash before this point leaves the segment to be
+            # compressed again on restart rather than lost.
+            os.remove(path)
+        logger.info('Closed output segment %s', listed_path)
+
+    def _list_segment(self, segment_start, path):
+        self._manifest.append({
+            'path':
+            os.path.basename(path),
+            'start':
+            segment_start.strftime(_TIMESTAMP_FORMAT),
+            'end': (segment_start +
+                    _PERIOD_LENGTHS[self._period]).strftime(_TIMESTAMP_FORMAT),
+        })
+        self._manifest.sort(key=lambda segment: segment['start'])
+
+    def _segment_path(self, segment_start):
+        return '%s.%s%s' % (self._path_prefix,
+                            _make_label(self._period, segment_start),
+                            self._extension)
+
+    def _recover_segments(self):
+        """Tidies up segments left behind by a crash.
+
+        Removes uncompressed segments whose compressed copy is already
+        listed, and lists compressed segments whose source was removed
+        before they were listed.
+
+        Returns:
+            Start times of uncompressed segments that are not listed, in
+            order.
+        """
+        listed_paths = dict(
+            (segment['start'], segment['path']) for segment in self._manifest)
+        unlisted_starts = []
+        for segment_start, path in self._find_segments(self._extension):
+            listed_path = listed_paths.get(
+                segment_start.strftime(_TIMESTAMP_FORMAT))
+            if listed_path is None:
+                unlisted_starts.append(segment_start)
+            elif listed_path != os.path.basename(path) and os.path.exists(
+                    os.path.join(os.path.dirname(path), listed_path)):
+                logger.info('Removing already compressed segment %s', path)
+                os.remove(path)
+        if self._compress_fn:
+            orphan_count = 0
+            compressed_extension = (
+                self._extension + _COMPRESSED_EXTENSIONS[self._compression])
+            for segment_start, path in self._find_segments(
+                    compressed_extension):
+                if (segment_start.strftime(_TIMESTAMP_FORMAT) in listed_paths or
+                        segment_start in unlisted_starts):
+                    continue
+                logger.info('Listing orphaned segment %s', path)
+                self._list_segment(segment_start, path)
+                orphan_count += 1
+            if orphan_count:
+                _write_manifest(self._manifest_path, self._manifest)
+        return unlisted_starts
+
+    def _find_segments(self, extension):
+        pattern = '%s.*%s' % (self._path_prefix, extension)
+        segments = []
+        for path in glob.glob(pattern):
+            label = path[len(self._path_prefix) + 1:len(path) - len(extension)]
+            try:
+                segment_start = datetime.datetime.strptime(
+                    label, _LABEL_FORMATS[self._period])
+            except ValueError:
+                continue
+            segments.append((segment_start, path))
+        return sorted(segments)
+
+
+def read_manifest(manifest_path):
+    """Reads the list of closed segments from a manifest.
+
+    Args:
+        manifest_path: Path to the manifest file.
+
+    Returns:
+        A list of dicts, one per segment, with 'path', 'start', and 'end'
+        keys, in order of start time. Empty if the manifest does not exist.
+    """
+    if not os.path.exists(manifest_path):
+        return []
+    with open(manifest_path) as manifest_file:
+        return json.load(manifest_file)['segments']
+
+
+def _get_compress_fn(compression):
+    if compression == GZIP:
+        return _gzip_file
+    if compression == ZSTD:
+        try:
+            import zstandard
+        except ImportError:
+            raise CompressionUnavailableError(
+                'zstd compression requires the zstandard package')
+        return lambda source_path, destination_path: _zstd_file(
+            zstandard, source_path, destination_path)
+    return None
+
+
+def _gzip_file(source_path, destination_path):
+    with open(source_path, 'rb') as source:
+        with gzip.open(destination_path, 'wb') as destination:
+            shutil.copyfileobj(source, destination, _COPY_CHUNK_SIZE)
+
+
+def _zstd_file(zstandard, source_path, destination_path):
+    with open(source_path, 'rb') as source:
+        with open(destination_path, 'wb') as destination:
+            zstandard.ZstdCompressor().copy_stream(source, destination)
+
+
+def _make_label(period, timestamp):
+    return timestamp.strftime(_LABEL_FORMATS[period])
+
+
+def _truncate(period, timestamp):
+    if period == DAY:
+        return datetime.datetime(timestamp.year, timestamp.month, timestamp.day)
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def _write_manifest(manifest_path, segments):
+    # Write to a temporary file and rename it over the manifest, so that
+    # readers never see a partially written manifest.
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w') as manifest_file:
+        json.dump({'segments': segments}, manifest_file, indent=2)
+    os.rename(temp_path, manifest_path)
@@ -0,0 +1,66 @@
+"""Measures the current process's CPU time and memory use."""
+
+import re
+import resource
+import sys
+
+_PROC_STATUS_PATH = '/proc/self/status'
+_PROC_CLEAR_REFS_PATH = '/proc/self/clear_refs'
+# Writing this to clear_refs resets the process's peak RSS (VmHWM) to its
+# current RSS (Linux 4.0 and later).
+_RESET_PEAK_RSS = '5'
+
+
+def cpu_seconds():
+    """Returns the CPU time (user plus system) the process has used so far."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def rss_bytes():
+    """Returns the process's current resident set size, or None if unknown.
+
+    Only Linux reports the current resident set size.
+    """
+    return _read_status_bytes('VmRSS')
+
+
+def peak_rss_bytes():
+    """Returns the largest resident set size of the process so far.
+
+    On Linux, this is since the last reset_peak_rss(), if it succeeded.
+    """
+    peak_rss = _read_status_bytes('VmHWM')
+    if peak_rss is not None:
+        return peak_rss
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, other platforms kilobytes.
+    if sys.platform == 'darwin':
+        return max_rss
+    return max_rss * 1024
+
+
+def reset_peak_rss():
+    """Resets the process's peak resident set size to its current size.
+
+    Returns:
+        True if the peak was reset, or False if the platform doesn't support
+        it.
+    """
+    try:
+        with open(_PROC_CLEAR_REFS_PATH, 'w') as clear_refs:
+            clear_refs.write(_RESET_PEAK_RSS)
+    except (IOError, OSError):
+        return False
+    return True
+
+
+def _read_status_bytes(key):
+    try:
+        with open(_PROC_STATUS_PATH) as status:
+            match = re.search(r'^%s:\s+(\d+) kB' % key, status.read(), re.M)
+    except (IOError, OSError):
+        return None
+    if not match:
+        return None
+    return int(match.group(1)) * 1024
@@ -0,0 +1,282 @@
+"""Serves the latest metrics over HTTP in the Prometheus text format.
+
+GET /metrics returns each numeric SiaState field from each node's most recent
+poll, labeled with the node's ID, along with the collector's own timings:
+
+    # HELP sia_file_count file_count from the latest poll of each node.
+    # TYPE sia_file_count gauge
+    sia_file_count{node_id="renter-1"} 12
+    ...
+    # HELP sia_collector_query_latency_milliseconds Recent Sia API query ...
+    # TYPE sia_collector_query_latency_milliseconds gauge
+    sia_collector_query_latency_milliseconds{query="all",quantile="0.5"} 41.3
+
+Hastings are written as exact integers, and timestamps as seconds since the
+Unix epoch.
+
+The response text is rendered once per poll, when the collector hands the
+poll's states to update(), and every scrape is answered from that text. So
+scrapers never wait on, or add load to, Sia nodes or the polling thread, no
+matter how many there are.
+"""
+
+import calendar
+import collections
+import logging
+import math
+import threading
+
+try:
+    import BaseHTTPServer
+    import SocketServer
+except ImportError:
+    # Python 3 renamed them.
+    from http import server as BaseHTTPServer
+    import socketserver as SocketServer
+
+from sia_metrics_collector import latency_stats
+from sia_metrics_collector import state
+
+logger = logging.getLogger(__name__)
+
+_METRICS_PATH = '/metrics'
+_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_GAUGE = 'gauge'
+_COUNTER = 'counter'
+
+_NUMERIC_KINDS = (state.TIMESTAMP, state.FLOAT, state.INTEGER, state.HASTINGS)
+_UNIT_DESCRIPTIONS = {
+    state.TIMESTAMP: ', in seconds since the Unix epoch',
+    state.HASTINGS: ', in hastings',
+}
+
+# SiaState fields exported for each node, in SiaState order.
+_EXPORTED_FIELDS = tuple(
+    f for f in state.SiaState._fields if state.FIELD_KINDS[f] in _NUMERIC_KINDS)
+
+_QUANTILES = (('0.5', 'p50'), ('0.95', 'p95'), ('0.99', 'p99'))
+
+# Metrics of the collector's stats, as tuples of (metric name, type, stats
+# attribute, description).
+_CONNECTION_METRICS = (
+    ('sia_collector_requests_total', _COUNTER, 'request_count',
+     'HTTP requests to each Sia node.'),
+    ('sia_collector_new_connections_total', _COUNTER, 'new_connection_count',
+     'HTTP connections opened to each Sia node.'),
+    ('sia_collector_reused_connections_total', _COUNTER,
+     'reused_connection_count',
+     'HTTP requests to each Sia node that reused a connection.'),
+)
+_WRITER_METRICS = (
+    ('sia_collector_output_buffered_rows', _GAUGE, 'rows_buffered',
+     'Rows buffered and not yet written to each output file.'),
+    ('sia_collector_output_flushes_total', _COUNTER, 'flush_count',
+     'Writes of buffered rows to each output file.'),
+    ('sia_collector_output_fsyncs_total', _COUNTER, 'fsync_count',
+     'Forced writes of each output file to disk.'),
+    ('sia_collector_output_flush_seconds_total', _COUNTER,
+     'total_flush_latency',
+     'Time spent writing buffered rows to each output file.'),
+    ('sia_collector_output_flush_seconds_max', _GAUGE, 'max_flush_latency',
+     'Longest single write of buffered rows to each output file.'),
+)
+_QUEUE_METRICS = (
+    ('sia_collector_sink_queue_depth', _GAUGE, 'depth',
+     'Items waiting on each sink\'s queue.'),
+    ('sia_collector_sink_queue_capacity', _GAUGE, 'capacity',
+     'Maximum items on each sink\'s queue.'),
+    ('sia_collector_sink_dropped_total', _COUNTER, 'dropped_count',
+     'Items discarded because a sink\'s queue was full.'),
+)
+"""Snapshot of the collector's own stats, taken on the polling thread.
+
+Fields:
+    node_connection_stats: A list of (node ID, api.ConnectionStats) pairs.
+        Pairs with no stats are skipped.
+    output_writer_stats: A list of (output path, buffered_writer.WriterStats)
+        pairs. Pairs with no stats are skipped.
+    sink_queue_stats: A list of (sink name, sink.QueueStats) pairs.
+"""
+CollectorStats = collections.namedtuple(
+    'CollectorStats',
+    ['node_connection_stats', 'output_writer_stats', 'sink_queue_stats'])
+
+
+class Exporter(object):
+    """Serves metrics from the latest poll of each node over HTTP."""
+
+    def __init__(self, host, port):
+        """Creates a new Exporter and starts serving on a background thread.
+
+        Until the first update(), scrapes get an empty response.
+
+        Args:
+            host: Address to listen on (e.g. '127.0.0.1', or '' for all
+                interfaces).
+            port: Port to listen on, or 0 to pick a free port.
+        """
+        # Latest SiaState of each node, in the order the nodes first
+        # appeared.
+        self._latest_states = collections.OrderedDict()
+        self._latency_tracker = latency_stats.LatencyTracker()
+        self._poll_count = 0
+        # Handler threads read this while update() replaces it. Replacing an
+        # attribute is atomic, so scrapes see either the old or new text.
+        self._exposition = ''
+        self._server = _ThreadingHTTPServer((host, port), _MetricsHandler)
+        self._server.exporter = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name='prometheus-exporter')
+        self._thread.daemon = True
+        self._thread.start()
+        logger.info('Serving metrics at http://%s:%d%s', host or '0.0.0.0',
+                    self.port, _METRICS_PATH)
+
+    def update(self, states, collector_stats):
+        """Records a poll's states and re-renders the response text.
+
+        Args:
+            states: A list of SiaState from the poll, at most one per node.
+            collector_stats: CollectorStats as of the poll.
+        """
+        for sia_state in states:
+            self._latest_states[sia_state.node_id] = sia_state
+            self._latency_tracker.record(sia_state)
+        self._poll_count += 1
+        self._exposition = self._render(collector_stats)
+
+    def exposition(self):
+        """Returns the current response text."""
+        return self._exposition
+
+    def close(self):
+        """Stops serving and closes the listening socket."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _render(self, collector_stats):
+        lines = []
+        for field in _EXPORTED_FIELDS:
+            samples = []
+            for node_id, sia_state in self._latest_states.items():
+                value = getattr(sia_state, field)
+                if value is not None:
+                    samples.append(({'node_id': node_id}, value))
+            description = '%s from the latest poll of each node%s.' % (
+                field, _UNIT_DESCRIPTIONS.get(state.FIELD_KINDS[field], ''))
+            _add_metric(lines, 'sia_' + field, _GAUGE, description, samples)
+        _add_metric(lines, 'sia_collector_polls_total', _COUNTER,
+                    'Number of polls the collector has exported.',
+                    [({}, self._poll_count)])
+        latency_samples = []
+        for summary in self._latency_tracker.summarize():
+            for quantile, attribute in _QUANTILES:
+                latency_samples.append(({
+                    'query': summary.name,
+                    'quantile': quantile
+                }, getattr(summary, attribute)))
+        _add_metric(lines, 'sia_collector_query_latency_milliseconds', _GAUGE,
+                    'Recent Sia API query latencies, by quantile.',
+                    latency_samples)
+        _add_stats_metrics(lines, 'node_id',
+                           collector_stats.node_connection_stats,
+                           _CONNECTION_METRICS)
+        _add_stats_metrics(lines, 'output', collector_stats.output_writer_stats,
+                           _WRITER_METRICS)
+        _add_stats_metrics(lines, 'sink', collector_stats.sink_queue_stats,
+                           _QUEUE_METRICS)
+        return ''.join(line + '\n' for line in lines)
+
+
+class _ThreadingHTTPServer(SocketServer.ThreadingMixIn,
+                           BaseHTTPServer.HTTPServer):
+    # Don't let a scrape in progress keep the collector from exiting.
+    daemon_threads = True
+
+
+class _MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != _METRICS_PATH:
+            self.send_error(404)
+            return
+        body = self.server.exporter.exposition()
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', _CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are routine, so don't log each one to the console.
+        logger.debug(format, *args)
+
+
+def _add_metric(lines, name, metric_type, description, samples):
+    """Adds a metric's lines to the exposition, if it has samples.
+
+    Args:
+        lines: List of exposition lines to add to.
+        name: Name of the metric.
+        metric_type: _GAUGE or _COUNTER.
+        description: Text for the metric's HELP line.
+        samples: A list of (labels, value) pairs, where labels is a dict of
+            label names to values.
+    """
+    if not samples:
+        return
+    lines.append('# HELP %s %s' % (name, description))
+    lines.append('# TYPE %s %s' % (name, metric_type))
+    for labels, value in samples:
+        if labels:
+            label_text = '{%s}' % ','.join(
+                '%s="%s"' % (label, _escape_label_value(labels[label]))
+                for label in sorted(labels))
+        else:
+            label_text = ''
+        lines.append('%s%s %s' % (name, label_text, _format_value(value)))
+
+
+def _add_stats_metrics(lines, label, labeled_stats, metrics):
+    """Adds metrics of one kind of stats to the exposition.
+
+    Args:
+        lines: List of exposition lines to add to.
+        label: Name of the label that identifies each stats' source.
+        labeled_stats: A list of (label value, stats) pairs. Pairs with no
+            stats are skipped.
+        metrics: Tuple of (metric name, type, stats attribute, description)
+            tuples for the metrics to add.
+    """
+    labeled_stats = [(label_value, stats)
+                     for label_value, stats in labeled_stats
+                     if stats is not None]
+    for name, metric_type, attribute, description in metrics:
+        _add_metric(lines, name, metric_type, description, [({
+            label: label_value
+        }, getattr(stats, attribute)) for label_value, stats in labeled_stats])
+
+
+def _escape_label_value(value):
+    if not isinstance(value, str):
+        # Unicode on Python 2, where the exposition is UTF-8 bytes.
+        value = value.encode('utf-8')
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if hasattr(value, 'timetuple'):
+        return repr(
+            calendar.timegm(value.timetuple()) + value.microsecond / 1e6)
+    if isinstance(value, float):
+        if math.isnan(value):
+            return 'NaN'
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    # Integers, including hastings, are written exactly.
+    return str(value)
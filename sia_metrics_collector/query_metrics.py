@@ -0,0 +1,78 @@
+#!/usr/bin/python2
+"""Prints metrics from a SQLite database or CSV file written by the collector.
+
+Metrics are printed as CSV. CSV files are read through a sparse index of their
+timestamps (see csv_index), which is created or updated next to the file.
+"""
+
+import argparse
+import csv
+import sys
+
+from sia_metrics_collector import csv_index
+from sia_metrics_collector import sqlite_serialize
+
+
+def main(args):
+    fields = args.fields.split(',') if args.fields else None
+    writer = csv.writer(sys.stdout, lineterminator='\n')
+    if args.metrics_file.endswith('.csv'):
+        _print_csv_rows(writer, args, fields)
+    else:
+        _print_sqlite_rows(writer, args, fields)
+
+
+def _print_csv_rows(writer, args, fields):
+    index = csv_index.CsvIndex(args.metrics_file, interval=args.index_interval)
+    index.update()
+    fieldnames, rows = index.read_rows(
+        fields=fields, start=args.start, end=args.end, node_id=args.node_id)
+    writer.writerow(fieldnames)
+    writer.writerows(rows)
+
+
+def _print_sqlite_rows(writer, args, fields):
+    connection = sqlite_serialize.connect(args.metrics_file)
+    try:
+        rows = sqlite_serialize.query_rows(
+            connection,
+            fields=fields,
+            start=args.start,
+            end=args.end,
+            node_id=args.node_id)
+        writer.writerow([column[0] for column in rows.description])
+        writer.writerows(rows)
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='Sia Metrics Query',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        'metrics_file',
+        help=('Path to SQLite database or CSV file (ending in .csv) written '
+              'by the collector'))
+    parser.add_argument(
+        '--start',
+        help=('Earliest timestamp to print metrics for (inclusive), as ISO '
+              '8601 (e.g. 2018-02-11 or 2018-02-11T16:05)'))
+    parser.add_argument(
+        '--end',
+        help=('Timestamp to print metrics until (exclusive), in the same '
+              'format as --start'))
+    parser.add_argument('--node_id', help='Only print metrics for this node')
+    parser.add_argument(
+        '--fields',
+        help=('Comma-separated names of metrics to print (e.g. '
+              'timestamp,wallet_siacoin_balance). Prints all metrics if '
+              'unset'))
+    parser.add_argument(
+        '--index_interval',
+        type=int,
+        default=csv_index.DEFAULT_INTERVAL,
+        help=('Number of CSV rows between entries of the CSV file\'s index. '
+              'Smaller intervals make the index larger, but range reads '
+              'faster'))
+    main(parser.parse_args())
@@ -0,0 +1,357 @@
+"""Computes deltas and rates of metrics over collected history with NumPy.
+
+A History holds a node's samples as columns, loaded from CSV, binary, or
+SQLite output. Rates are computed over whole columns at once rather than row
+by row:
+
+    history = rates.load_csv('sia-metrics.csv', ['contract_upload_spending'],
+                             node_id='renter-1')
+    window_starts, spending_per_second = rates.window_rates(
+        history, 'contract_upload_spending', 60 * 60, counter=True)
+
+Hastings fields are held as exact limbs (see hastings_limbs), so that the
+difference between two large amounts keeps every digit. Results are converted
+to float64 only after deltas have been summed.
+
+Two kinds of irregularity in the history are handled:
+    Gaps: An interval between samples longer than max_gap_seconds (e.g.
+        while the collector was stopped) has no rate, rather than spreading
+        the change across the gap. Intervals where either sample lacks the
+        field, or where time doesn't advance, have no rate either.
+    Counter resets: For counters, fields that only go up until they reset to
+        zero (e.g. spending, which restarts with each renter period), a
+        decrease means the counter reset between samples, so the interval's
+        delta is the new value rather than a negative change.
+
+Requires NumPy.
+"""
+
+import collections
+
+import numpy
+
+from sia_metrics_collector import binary_serialize
+from sia_metrics_collector import csv_index
+from sia_metrics_collector import hastings_limbs
+from sia_metrics_collector import sqlite_serialize
+from sia_metrics_collector import state
+
+_NUMERIC_KINDS = (state.FLOAT, state.INTEGER, state.HASTINGS)
+_MICROSECONDS_PER_SECOND = 1e6
+_TIMESTAMP_TYPE = 'datetime64[us]'
+"""Samples of a single field.
+
+Fields:
+    values: For float and integer fields, a float64 array with one value per
+        sample. For hastings fields, hastings_limbs limbs with one row per
+        sample.
+    present: A bool array, False for samples that lack the field, whose
+        values are meaningless.
+"""
+Column = collections.namedtuple('Column', ['values', 'present'])
+"""Samples of a node's metrics, in time order.
+
+Fields:
+    timestamps: A datetime64[us] array of each sample's timestamp.
+    columns: A dict mapping each loaded field name to its Column.
+"""
+History = collections.namedtuple('History', ['timestamps', 'columns'])
+"""Changes in a field between consecutive samples.
+
+Fields:
+    end_times: A datetime64[us] array of the later sample of each interval.
+    seconds: A float64 array of the length of each interval.
+    values: A float64 array of the change in the field over each interval,
+        NaN for intervals without a valid change.
+"""
+Deltas = collections.namedtuple('Deltas', ['end_times', 'seconds', 'values'])
+
+
+class Error(Exception):
+    pass
+
+
+class UnsupportedFieldError(Error):
+    pass
+
+
+def load_csv(csv_path, fields, node_id=None, start=None, end=None):
+    """Loads a History from a CSV file written by the collector.
+
+    Reads through the file's csv_index, updating it first, so that only rows
+    near the time range are read.
+
+    Args:
+        csv_path: Path to the CSV file.
+        fields: A list of names of numeric fields to load.
+        node_id: If specified, only samples for the node with this ID are
+            loaded. Required if the file holds samples for multiple nodes.
+        start: If specified, only samples with this timestamp or later are
+            loaded. An ISO 8601 timestamp, or prefix of one (e.g.
+            '2018-02-11' or '2018-02-11T16:05').
+        end: If specified, only samples with a timestamp before this are
+            loaded. In the same format as start.
+
+    Returns:
+        The History of the samples.
+
+    Raises:
+        UnsupportedFieldError: One of the fields is not a numeric field.
+        csv_index.UnknownFieldError: One of the fields is not in the file.
+    """
+    _check_fields(fields)
+    index = csv_index.CsvIndex(csv_path)
+    index.update()
+    _, rows = index.read_rows(
+        fields=['timestamp'] + list(fields),
+        start=start,
+        end=end,
+        node_id=node_id)
+    table = numpy.array(
+        list(rows), dtype=numpy.bytes_).reshape(-1,
+                                                len(fields) + 1)
+    columns = {}
+    for i, field in enumerate(fields):
+        text = table[:, i + 1]
+        columns[field] = _parse_text_column(field, text, text != b'')
+    return History(table[:, 0].astype(_TIMESTAMP_TYPE), columns)
+
+
+def load_binary(binary_path, fields, node_id=None, start=None, end=None):
+    """Loads a History from a binary file written by the collector.
+
+    Reads the file through binary_serialize.load_records, so values are
+    converted without parsing individual records.
+
+    Args:
+        binary_path: Path to the binary metrics file.
+        fields: A list of names of numeric fields to load.
+        node_id: If specified, only samples for the node with this ID are
+            loaded. Required if the file holds samples for multiple nodes.
+        start: If specified, only samples with this timestamp or later are
+            loaded. In the same format as for load_csv.
+        end: If specified, only samples with a timestamp before this are
+            loaded. In the same format as start.
+
+    Returns:
+        The History of the samples.
+
+    Raises:
+        UnsupportedFieldError: One of the fields is not a numeric field, or
+            is not in the file.
+    """
+    _check_fields(fields)
+    records = binary_serialize.load_records(binary_path)
+    record_fields = records.dtype.names[1:]
+    for field in fields:
+        if field not in record_fields:
+            raise UnsupportedFieldError('Field not in file: %s' % field)
+    timestamps = records['timestamp']
+    selected = ~numpy.isnat(timestamps)
+    if node_id is not None:
+        selected &= records['node_id'] == node_id.encode('utf-8')
+    if start:
+        selected &= timestamps >= numpy.datetime64(start)
+    if end:
+        selected &= timestamps < numpy.datetime64(end)
+    records = records[selected]
+    columns = {}
+    for field in fields:
+        bit = record_fields.index(field)
+        null_bits = (records['null_mask'][:, bit // 64] >> numpy.uint64(
+            bit % 64)) & numpy.uint64(1)
+        present = null_bits == 0
+        if state.FIELD_KINDS[field] == state.HASTINGS:
+            values = hastings_limbs.from_lo_hi(records[field]['lo'],
+                                               records[field]['hi'])
+        else:
+            values = records[field].astype(numpy.float64)
+        columns[field] = Column(values, present)
+    return History(records['timestamp'].astype(_TIMESTAMP_TYPE), columns)
+
+
+def load_sqlite(connection, fields, node_id=None, start=None, end=None):
+    """Loads a History from a SQLite database written by the collector.
+
+    Args:
+        connection: sqlite3.Connection to the database.
+        fields: A list of names of numeric fields to load.
+        node_id: If specified, only samples for the node with this ID are
+            loaded. Required if the database holds samples for multiple
+            nodes.
+        start: If specified, only samples with this timestamp or later are
+            loaded. In the same format as for load_csv.
+        end: If specified, only samples with a timestamp before this are
+            loaded. In the same format as start.
+
+    Returns:
+        The History of the samples.
+
+    Raises:
+        UnsupportedFieldError: One of the fields is not a numeric field.
+    """
+    _check_fields(fields)
+    rows = list(
+        sqlite_serialize.query_rows(
+            connection,
+            fields=['timestamp'] + list(fields),
+            start=start,
+            end=end,
+            node_id=node_id))
+    table = numpy.array(rows, dtype=object).reshape(-1, len(fields) + 1)
+    columns = {}
+    for i, field in enumerate(fields):
+        values = table[:, i + 1]
+        present = numpy.not_equal(values, None)
+        if state.FIELD_KINDS[field] == state.HASTINGS:
+            columns[field] = _parse_text_column(field, values, present)
+        else:
+            columns[field] = Column(
+                numpy.where(present, values, numpy.nan).astype(numpy.float64),
+                present)
+    return History(table[:, 0].astype(_TIMESTAMP_TYPE), columns)
+
+
+def deltas(history, field, counter=False, max_gap_seconds=None):
+    """Computes the change in a field between each pair of consecutive samples.
+
+    Args:
+        history: History with the field loaded.
+        field: Name of the field.
+        counter: Whether the field is a counter, whose decreases are resets.
+        max_gap_seconds: If specified, intervals longer than this have no
+            delta.
+
+    Returns:
+        Deltas with one entry per interval between samples.
+    """
+    seconds, valid, values = _exact_deltas(history, field, counter,
+                                           max_gap_seconds)
+    if state.FIELD_KINDS[field] == state.HASTINGS:
+        values = hastings_limbs.to_float(values)
+    return Deltas(
+        end_times=history.timestamps[1:],
+        seconds=seconds,
+        values=numpy.where(valid, values, numpy.nan))
+
+
+def rates(history, field, counter=False, max_gap_seconds=None):
+    """Computes the per-second rate of change of a field between samples.
+
+    Args:
+        history: History with the field loaded.
+        field: Name of the field.
+        counter: Whether the field is a counter, whose decreases are resets.
+        max_gap_seconds: If specified, intervals longer than this have no
+            rate.
+
+    Returns:
+        A tuple of (end_times, rates), where end_times is a datetime64[us]
+        array of the later sample of each interval, and rates is a float64
+        array of the field's change per second over each interval, NaN for
+        intervals without a valid change.
+    """
+    field_deltas = deltas(history, field, counter, max_gap_seconds)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        rates = field_deltas.values / field_deltas.seconds
+    return field_deltas.end_times, rates
+
+
+def window_rates(history,
+                 field,
+                 window_seconds,
+                 counter=False,
+                 max_gap_seconds=None):
+    """Computes the average per-second rate of change of a field per window.
+
+    Windows are aligned to the Unix epoch (e.g. hourly windows start on the
+    hour, UTC), and each interval between samples counts towards the window
+    of its later sample. A window's rate is the total change over its valid
+    intervals, divided by their total length, so gaps lower neither the
+    change nor the time.
+
+    Args:
+        history: History with the field loaded.
+        field: Name of the field.
+        window_seconds: Length of each window, in seconds.
+        counter: Whether the field is a counter, whose decreases are resets.
+        max_gap_seconds: If specified, intervals longer than this are left
+            out.
+
+    Returns:
+        A tuple of (window_starts, rates), where window_starts is a
+        datetime64[us] array of the start of each window that contains an
+        interval, in time order, and rates is a float64 array of the field's
+        average change per second in each window, NaN for windows without
+        valid intervals.
+    """
+    seconds, valid, values = _exact_deltas(history, field, counter,
+                                           max_gap_seconds)
+    if len(seconds) == 0:
+        return numpy.zeros(0, dtype=_TIMESTAMP_TYPE), numpy.zeros(0)
+    window_length = int(window_seconds * _MICROSECONDS_PER_SECOND)
+    window_ids = history.timestamps[1:].astype(numpy.int64) // window_length
+    # Sorting is a no-op for histories in time order, but keeps each window's
+    # intervals together if the clock was set back.
+    order = numpy.argsort(window_ids, kind='mergesort')
+    window_ids = window_ids[order]
+    valid = valid[order]
+    is_group_start = numpy.ones(len(window_ids), dtype=bool)
+    is_group_start[1:] = window_ids[1:] != window_ids[:-1]
+    group_starts = numpy.flatnonzero(is_group_start)
+    covered_seconds = numpy.add.reduceat(
+        numpy.where(valid, seconds[order], 0.0), group_starts)
+    if state.FIELD_KINDS[field] == state.HASTINGS:
+        valid_limbs = numpy.where(valid[:, numpy.newaxis], values[order], 0)
+        changes = hastings_limbs.to_float(
+            hastings_limbs.sum_groups(valid_limbs, group_starts))
+    else:
+        changes = numpy.add.reduceat(
+            numpy.where(valid, values[order], 0.0), group_starts)
+    window_starts = (
+        window_ids[group_starts] * window_length).astype(_TIMESTAMP_TYPE)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return window_starts, numpy.where(covered_seconds > 0,
+                                          changes / covered_seconds, numpy.nan)
+
+
+def _check_fields(fields):
+    for field in fields:
+        if state.FIELD_KINDS.get(field) not in _NUMERIC_KINDS:
+            raise UnsupportedFieldError('Not a numeric field: %s' % field)
+
+
+def _parse_text_column(field, text, present):
+    if state.FIELD_KINDS[field] == state.HASTINGS:
+        return Column(
+            hastings_limbs.from_decimal_strings(
+                numpy.where(present, text, b'0')), present)
+    return Column(
+        numpy.where(present, text, b'nan').astype(numpy.float64), present)
+
+
+def _exact_deltas(history, field, counter, max_gap_seconds):
+    """Computes deltas, keeping hastings deltas as limbs.
+
+    Returns:
+        A tuple of (seconds, valid, values), where seconds is the length of
+        each interval, valid is a bool array, True for intervals with a valid
+        change, and values is the change over each interval, as a float64
+        array or, for hastings fields, as limbs.
+    """
+    column = history.columns[field]
+    seconds = numpy.diff(history.timestamps.astype(
+        numpy.int64)) / _MICROSECONDS_PER_SECOND
+    valid = column.present[1:] & column.present[:-1] & (seconds > 0)
+    if max_gap_seconds is not None:
+        valid &= seconds <= max_gap_seconds
+    if state.FIELD_KINDS[field] == state.HASTINGS:
+        values = hastings_limbs.subtract(column.values[1:], column.values[:-1])
+        if counter:
+            is_reset = hastings_limbs.is_negative(values)
+            values[is_reset] = column.values[1:][is_reset]
+    else:
+        values = numpy.diff(column.values)
+        if counter:
+            values = numpy.where(values < 0, column.values[1:], values)
+    return seconds, valid, values
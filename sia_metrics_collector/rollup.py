@@ -0,0 +1,223 @@
+"""Downsamples SiaState into fixed-length time buckets as samples arrive.
+
+Each bucket covers one resolution-length span of time (aligned to the Unix
+epoch, in UTC) for a single node, and holds the min, max, mean, and last
+value of every numeric SiaState field over the samples in that span. Adding
+a sample updates its bucket in constant time, without keeping the samples.
+"""
+
+import calendar
+import csv
+import datetime
+
+from sia_metrics_collector import buffered_writer
+from sia_metrics_collector import serialize
+from sia_metrics_collector import state
+
+# Maps the name of each supported resolution to its length in seconds.
+RESOLUTION_SECONDS = {
+    '1m': 60,
+    '1h': 60 * 60,
+    '1d': 24 * 60 * 60,
+}
+
+_NUMERIC_KINDS = (state.FLOAT, state.INTEGER, state.HASTINGS)
+
+# Numeric SiaState fields, in SiaState order.
+NUMERIC_FIELDS = tuple(
+    f for f in state.SiaState._fields if state.FIELD_KINDS[f] in _NUMERIC_KINDS)
+
+_AGGREGATES = ('min', 'max', 'mean', 'last')
+
+FIELDNAMES = ['bucket_start', 'node_id', 'sample_count'] + [
+    '%s_%s' % (field, aggregate)
+    for field in NUMERIC_FIELDS
+    for aggregate in _AGGREGATES
+]
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+class _FieldAggregate(object):
+    """Running aggregates of one field's values within a bucket."""
+
+    __slots__ = ('minimum', 'maximum', 'total', 'count', 'last')
+
+    def __init__(self, value):
+        self.minimum = value
+        self.maximum = value
+        self.total = value
+        self.count = 1
+        self.last = value
+
+    def add(self, value):
+        if value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+        self.total += value
+        self.count += 1
+        self.last = value
+
+
+class _Bucket(object):
+
+    def __init__(self, node_id, start):
+        self.node_id = node_id
+        self.start = start
+        self.sample_count = 0
+        # Maps each numeric field name to its _FieldAggregate. Fields with no
+        # values in the bucket have no entry.
+        self.aggregates = {}
+
+    def add(self, sia_state):
+        self.sample_count += 1
+        for field in NUMERIC_FIELDS:
+            value = getattr(sia_state, field)
+            if value is None:
+                continue
+            if state.FIELD_KINDS[field] == state.HASTINGS:
+                # Sia reports some amounts as strings of decimal digits, which
+                # must be compared and added as numbers.
+                value = int(value)
+            aggregate = self.aggregates.get(field)
+            if aggregate is None:
+                self.aggregates[field] = _FieldAggregate(value)
+            else:
+                aggregate.add(value)
+
+    def to_row(self):
+        row = {
+            'bucket_start': self.start.strftime('%Y-%m-%dT%H:%M:%S'),
+            'node_id': self.node_id,
+            'sample_count': self.sample_count,
+        }
+        for field, aggregate in self.aggregates.items():
+            row[field + '_min'] = aggregate.minimum
+            row[field + '_max'] = aggregate.maximum
+            row[field + '_mean'] = _mean(field, aggregate)
+            row[field + '_last'] = aggregate.last
+        return row
+
+
+class Rollup(object):
+    """Aggregates samples into buckets of a single resolution."""
+
+    def __init__(self, resolution_seconds):
+        """Creates a new Rollup.
+
+        Args:
+            resolution_seconds: Length of each bucket, in seconds.
+        """
+        self._resolution_seconds = resolution_seconds
+        # Maps each node ID to its open bucket.
+        self._buckets = {}
+
+    def add(self, sia_state):
+        """Adds a sample to its node's bucket.
+
+        Samples must arrive in time order for each node. A sample that is
+        earlier than its node's open bucket is added to the open bucket.
+
+        Args:
+            sia_state: SiaState sample to add.
+
+        Returns:
+            A list of rows (dicts keyed by FIELDNAMES) for buckets that this
+            sample closed, as it falls in a later bucket.
+        """
+        start = self._bucket_start(sia_state.timestamp)
+        bucket = self._buckets.get(sia_state.node_id)
+        closed_rows = []
+        if bucket is None or start > bucket.start:
+            if bucket is not None:
+                closed_rows.append(bucket.to_row())
+            bucket = _Bucket(sia_state.node_id, start)
+            self._buckets[sia_state.node_id] = bucket
+        bucket.add(sia_state)
+        return closed_rows
+
+    def close(self):
+        """Closes every open bucket.
+
+        Returns:
+            A list of rows for the open buckets, which may be partial.
+        """
+        rows = [bucket.to_row() for bucket in self._buckets.values()]
+        self._buckets = {}
+        return rows
+
+    def _bucket_start(self, timestamp):
+        seconds = calendar.timegm(timestamp.timetuple())
+        return _EPOCH + datetime.timedelta(
+            seconds=seconds - seconds % self._resolution_seconds)
+
+
+class RollupSerializer(object):
+    """Rolls up SiaState and writes the closed buckets to a CSV file."""
+
+    def __init__(self,
+                 csv_file,
+                 resolution_seconds,
+                 flush_policy=buffered_writer.DEFAULT_FLUSH_POLICY):
+        """Creates a new RollupSerializer.
+
+        Args:
+            csv_file: Output file to write buckets to, opened in either 'w' or
+                'r+' mode. If file is empty, writes a header row. Otherwise,
+                its header must match FIELDNAMES.
+            resolution_seconds: Length of each bucket, in seconds.
+            flush_policy: buffered_writer.FlushPolicy for when to flush rows
+                to the file.
+
+        Raises:
+            serialize.HeaderMismatchError: The existing file's header doesn't
+                match FIELDNAMES.
+        """
+        self._csv_file = csv_file
+        self._rollup = Rollup(resolution_seconds)
+        is_empty_file = serialize.seek_to_append(csv_file, FIELDNAMES)
+        self._writer = buffered_writer.GroupCommitWriter(csv_file, flush_policy)
+        self._csv_writer = csv.DictWriter(
+            self._writer, fieldnames=FIELDNAMES, lineterminator='\n')
+        if is_empty_file:
+            self._csv_writer.writeheader()
+            self._writer.flush()
+
+    def write_state(self, sia_state):
+        self._write_rows(self._rollup.add(sia_state))
+
+    def flush(self):
+        """Writes any buffered rows to the file."""
+        self._writer.flush()
+
+    def flush_if_due(self):
+        """Writes buffered rows to the file if the flush policy says to."""
+        self._writer.flush_if_due()
+
+    def writer_stats(self):
+        """Returns buffered_writer.WriterStats for the output file."""
+        return self._writer.stats()
+
+    def close(self):
+        """Writes the open, possibly partial, buckets and closes the file.
+
+        After a restart, the collector starts a new bucket for the same span,
+        so a span may appear in more than one row. Readers can merge these
+        rows using sample_count to weight the means.
+        """
+        self._write_rows(self._rollup.close())
+        self._writer.flush()
+        self._csv_file.close()
+
+    def _write_rows(self, rows):
+        for row in rows:
+            self._csv_writer.writerow(row)
+            self._writer.end_row()
+
+
+def _mean(field, aggregate):
+    if state.FIELD_KINDS[field] == state.HASTINGS:
+        # Keep hastings exact, rounding the mean down to a whole hasting.
+        return aggregate.total // aggregate.count
+    return float(aggregate.total) / aggregate.count
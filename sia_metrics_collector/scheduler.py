@@ -0,0 +1,123 @@
+"""Schedules polls at a fixed rate, without drift, on a monotonic clock."""
+
+import collections
+import time
+
+import monotonic
+
+# Policies for ticks whose scheduled time passed while the previous tick was
+# still being processed.
+#
+# SKIP: Drop the missed ticks, however many there were, and wait for the next
+#   tick that is still in the future.
+# CATCH_UP: Run every missed tick, back to back, until back on schedule.
+# COALESCE: Run a single tick immediately in place of all the missed ones,
+#   then continue on schedule.
+SKIP = 'skip'
+CATCH_UP = 'catch_up'
+COALESCE = 'coalesce'
+MISSED_TICK_POLICIES = (SKIP, CATCH_UP, COALESCE)
+"""A single scheduled tick.
+
+Fields:
+    index: Zero-based index of the tick's slot in the schedule. Slot i is
+        scheduled for i periods after the schedule started, so indexes stay
+        aligned with time even when ticks are skipped or coalesced.
+    lateness: Time (in seconds) between the tick's scheduled time and the
+        time it was actually delivered.
+    missed_count: Number of scheduled ticks dropped immediately before this
+        one because of the missed tick policy.
+"""
+Tick = collections.namedtuple('Tick', ['index', 'lateness', 'missed_count'])
+
+
+class Scheduler(object):
+    """Generates ticks at a fixed period.
+
+    Tick times are computed from the schedule's start time, rather than from
+    the previous tick, so that time spent processing a tick never causes the
+    schedule to drift.
+    """
+
+    def __init__(self,
+                 period,
+                 missed_tick_policy=SKIP,
+                 clock=monotonic.monotonic,
+                 sleep_fn=time.sleep):
+        """Creates a new Scheduler.
+
+        Args:
+            period: Time (in seconds) between ticks. May be fractional.
+            missed_tick_policy: One of MISSED_TICK_POLICIES.
+            clock: A function that returns the current time (in seconds) on a
+                clock that never goes backwards.
+            sleep_fn: A function that sleeps for a given number of seconds.
+        """
+        if period <= 0:
+            raise ValueError('Period must be positive: %s' % period)
+        if missed_tick_policy not in MISSED_TICK_POLICIES:
+            raise ValueError(
+                'Unknown missed tick policy: %s' % missed_tick_policy)
+        self._period = float(period)
+        self._missed_tick_policy = missed_tick_policy
+        self._clock = clock
+        self._sleep_fn = sleep_fn
+
+    def ticks(self):
+        """Yields ticks forever, sleeping until each one is due.
+
+        The first tick is due immediately.
+
+        Yields:
+            A Tick for each scheduled tick that the missed tick policy allows.
+        """
+        start_time = self._clock()
+        next_index = 0
+        while True:
+            next_index, scheduled_time, missed_count = self.next_slot(
+                start_time, next_index)
+            self._sleep_until(scheduled_time)
+            yield Tick(
+                index=next_index,
+                lateness=self._clock() - scheduled_time,
+                missed_count=missed_count)
+            next_index += 1
+
+    def next_slot(self, start_time, next_index):
+        """Picks the slot of the next tick, as the missed tick policy allows.
+
+        Unlike ticks(), this doesn't sleep, so that callers with their own
+        timers (like an asyncio event loop) can wait for the slot themselves.
+
+        Args:
+            start_time: Time on the scheduler's clock at which the schedule
+                started.
+            next_index: Index of the earliest slot that hasn't ticked yet.
+
+        Returns:
+            A tuple of the slot's index, its scheduled time on the
+            scheduler's clock, and the number of slots dropped before it.
+        """
+        missed_count = 0
+        latest_passed_index = int((self._clock() - start_time) / self._period)
+        if self._missed_tick_policy == SKIP:
+            # Every slot that passed while the previous tick was being
+            # processed is dropped, even if it was only one. The first slot
+            # has no previous tick, so always runs.
+            if 0 < next_index <= latest_passed_index:
+                missed_count = latest_passed_index - next_index + 1
+                next_index = latest_passed_index + 1
+        elif (self._missed_tick_policy == COALESCE and
+              latest_passed_index > next_index):
+            missed_count = latest_passed_index - next_index
+            next_index = latest_passed_index
+        return next_index, start_time + next_index * self._period, missed_count
+
+    def _sleep_until(self, deadline):
+        # Sleep can return early (e.g. when interrupted by a signal), so keep
+        # sleeping until the deadline has actually passed.
+        while True:
+            remaining = deadline - self._clock()
+            if remaining <= 0:
+                return
+            self._sleep_fn(remaining)
@@ -1,72 +1,166 @@
 import csv
 
+from sia_metrics_collector import buffered_writer
+
 # Constant for Python's file seek() function.
 _FROM_FILE_END = 2
 
+# Columns of the CSV file, in order.
+FIELDNAMES = [
+    'timestamp',
+    'api_latency',
+    'file_count',
+    'file_total_bytes',
+    'file_uploads_in_progress_count',
+    'file_uploaded_bytes',
+    'contract_count_active',
+    'contract_count_inactive',
+    'contract_total_size',
+    'contract_total_spending',
+    'contract_fee_spending',
+    'contract_storage_spending',
+    'contract_upload_spending',
+    'contract_download_spending',
+    'contract_remaining_funds',
+    'wallet_siacoin_balance',
+    'wallet_outgoing_siacoins',
+    'wallet_incoming_siacoins',
+    'renter_allowance',
+    'renter_contract_fees',
+    'renter_total_allocated',
+    'renter_contract_spending',
+    'renter_download_spending',
+    'renter_storage_spending',
+    'renter_upload_spending',
+    'renter_unspent',
+    'contract_query_start_time',
+    'contract_query_latency',
+    'contract_response_bytes',
+    'file_query_start_time',
+    'file_query_latency',
+    'file_response_bytes',
+    'wallet_query_start_time',
+    'wallet_query_latency',
+    'wallet_response_bytes',
+    'renter_query_start_time',
+    'renter_query_latency',
+    'renter_response_bytes',
+    'node_id',
+    'contract_metrics_age',
+    'file_metrics_age',
+    'wallet_metrics_age',
+    'renter_metrics_age',
+    'poll_lateness',
+    'contract_status',
+    'file_status',
+    'wallet_status',
+    'renter_status',
+]
+
+_QUERY_START_TIME_FIELDS = (
+    'contract_query_start_time',
+    'file_query_start_time',
+    'wallet_query_start_time',
+    'renter_query_start_time',
+)
+
+
+class Error(Exception):
+    pass
+
+
+class HeaderMismatchError(Error):
+    pass
+
 
 class CsvSerializer(object):
     """Serializes SiaState to a CSV file."""
 
-    def __init__(self, csv_file):
+    def __init__(self,
+                 csv_file,
+                 flush_policy=buffered_writer.DEFAULT_FLUSH_POLICY):
         """Creates a serializer, wriiting to the given file.
 
         Args:
             csv_file: Output file to write CSV to. If file is empty,
-                CsvSerializer will write a header row. Caller must open the file
-                in either 'w' or 'r+' mode, as 'a' will not let us detect
-                whether to write a header on Windows.
+                CsvSerializer will write a header row. Otherwise, its header
+                must match FIELDNAMES. Caller must open the file in either 'w'
+                or 'r+' mode, as 'a' will not let us detect whether to write a
+                header on Windows.
+            flush_policy: buffered_writer.FlushPolicy for when to flush rows
+                to the file.
+
+        Raises:
+            HeaderMismatchError: The existing file's header doesn't match
+                FIELDNAMES (e.g. because an older version of the collector
+                wrote it).
         """
-        _seek_to_end_of_file(csv_file)
-        is_empty_file = _is_empty_file(csv_file)
-        self._csv_file = csv_file
+        is_empty_file = seek_to_append(csv_file, FIELDNAMES)
+        self._writer = buffered_writer.GroupCommitWriter(csv_file, flush_policy)
         self._csv_writer = csv.DictWriter(
-            csv_file,
-            fieldnames=[
-                'timestamp',
-                'api_latency',
-                'file_count',
-                'file_total_bytes',
-                'file_uploads_in_progress_count',
-                'file_uploaded_bytes',
-                'contract_count_active',
-                'contract_count_inactive',
-                'contract_total_size',
-                'contract_total_spending',
-                'contract_fee_spending',
-                'contract_storage_spending',
-                'contract_upload_spending',
-                'contract_download_spending',
-                'contract_remaining_funds',
-                'wallet_siacoin_balance',
-                'wallet_outgoing_siacoins',
-                'wallet_incoming_siacoins',
-                'renter_allowance',
-                'renter_contract_fees',
-                'renter_total_allocated',
-                'renter_contract_spending',
-                'renter_download_spending',
-                'renter_storage_spending',
-                'renter_upload_spending',
-                'renter_unspent',
-            ],
-            lineterminator='\n')
+            self._writer, fieldnames=FIELDNAMES, lineterminator='\n')
         if is_empty_file:
             self._csv_writer.writeheader()
+            self._writer.flush()
 
     def write_state(self, state):
         self._csv_writer.writerow(_state_to_dict(state))
-        self._csv_file.flush()
+        self._writer.end_row()
 
+    def flush(self):
+        """Writes any buffered rows to the file."""
+        self._writer.flush()
 
-def _seek_to_end_of_file(file_handle):
-    file_handle.seek(0, _FROM_FILE_END)
+    def flush_if_due(self):
+        """Writes buffered rows to the file if the flush policy says to."""
+        self._writer.flush_if_due()
 
+    def writer_stats(self):
+        """Returns buffered_writer.WriterStats for the output file."""
+        return self._writer.stats()
 
-def _is_empty_file(file_handle):
-    return file_handle.tell() == 0
+
+def seek_to_append(csv_file, fieldnames):
+    """Seeks to the end of a CSV file, to append rows with the given columns.
+
+    Appending rows to a file whose header has different columns would put
+    values under the wrong column names, so the file's header must match.
+
+    Args:
+        csv_file: CSV file opened in either 'w' or 'r+' mode.
+        fieldnames: A list of the names of the columns to append.
+
+    Returns:
+        True if the file is empty, and so needs a header row.
+
+    Raises:
+        HeaderMismatchError: The file's header doesn't match fieldnames.
+    """
+    csv_file.seek(0, _FROM_FILE_END)
+    if csv_file.tell() == 0:
+        return True
+    csv_file.seek(0)
+    header = next(csv.reader([csv_file.readline()]), [])
+    if header != list(fieldnames):
+        raise HeaderMismatchError(
+            'Existing file\'s header (%d columns) does not match the %d '
+            'columns to write, so it was probably written by a different '
+            'version of the collector. Move it aside to start a new file.' %
+            (len(header), len(fieldnames)))
+    csv_file.seek(0, _FROM_FILE_END)
+    return False
 
 
 def _state_to_dict(state):
     d = state.as_dict()
     d['timestamp'] = state.timestamp.strftime('%Y-%m-%dT%H:%M:%S')
+    for field in _QUERY_START_TIME_FIELDS:
+        if d[field] is not None:
+            d[field] = _format_precise_timestamp(d[field])
     return d
+
+
+def _format_precise_timestamp(timestamp):
+    # Query start times are only meaningful at sub-second precision, so keep
+    # milliseconds.
+    return timestamp.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]
@@ -0,0 +1,592 @@
+#!/usr/bin/python2
+"""Serves synthetic Sia API responses, standing in for siad in load tests.
+
+A Simulator answers GET /renter/contracts, /renter/files, /wallet and /renter
+like a renter node would, with as many contracts and files as configured. Its
+state changes slowly over time: every change interval, spending grows, renter
+funds and the wallet balance shrink, and uploads progress. Between changes,
+responses are byte-for-byte identical, as they are from a real idle node.
+
+Each request can be delayed by a random latency and can fail with a random
+HTTP 500, to mimic slow or flaky nodes. Like siad, requests without the
+'Sia-Agent' user agent are rejected, and large responses are sent with
+chunked transfer encoding.
+
+Run as a script, it starts a fleet of simulators and prints node specs for
+the collector's --node flag (or writes them to a --nodes_file):
+
+    python -m sia_metrics_collector.siad_simulator --nodes 50 \\
+        --contracts 1000 --files 10000 --latency lognormal:30,0.5
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import itertools
+import json
+import logging
+import math
+import random
+import threading
+import time
+
+try:
+    import BaseHTTPServer
+    import SocketServer
+except ImportError:
+    # Python 3 renamed them.
+    from http import server as BaseHTTPServer
+    import socketserver as SocketServer
+
+logger = logging.getLogger(__name__)
+
+_USER_AGENT = 'Sia-Agent'
+_JSON_CONTENT_TYPE = 'application/json'
+
+# siad writes its JSON responses through Go's net/http without setting their
+# length, so net/http sends bodies up to this size with a Content-Length, and
+# larger ones with chunked transfer encoding, in chunks of up to
+# _CHUNK_BYTES.
+_MAX_UNCHUNKED_BODY_BYTES = 2048
+_CHUNK_BYTES = 4096
+
+# Hastings in one siacoin.
+_HASTINGS_PER_SIACOIN = 10**24
+
+# Fraction of files that are still uploading when the simulator starts.
+_UPLOADING_FILE_FRACTION = 0.1
+# Percentage points of upload progress that uploading files make per change.
+_UPLOAD_PROGRESS_PER_CHANGE = 5.0
+
+_CONSTANT = 'constant'
+_UNIFORM = 'uniform'
+_EXPONENTIAL = 'exponential'
+_LOGNORMAL = 'lognormal'
+# Number of parameters each latency distribution takes.
+_LATENCY_DISTRIBUTIONS = {
+    _CONSTANT: 1,
+    _UNIFORM: 2,
+    _EXPONENTIAL: 1,
+    _LOGNORMAL: 2,
+}
+"""How a Simulator behaves.
+
+Fields:
+    contract_count: Number of contracts the renter has. A quarter of them are
+        inactive.
+    file_count: Number of files the renter has.
+    latency_fn: Function that takes a random.Random and returns the seconds
+        to delay a response by (see parse_latency_spec).
+    error_rate: Fraction of requests, from 0 to 1, to fail with HTTP 500.
+    change_interval: Seconds between changes to the renter's state.
+    seed: Seed for the simulator's random numbers, so that simulators with the
+        same seed serve the same contracts and files.
+"""
+SimulatorOptions = collections.namedtuple('SimulatorOptions', [
+    'contract_count', 'file_count', 'latency_fn', 'error_rate',
+    'change_interval', 'seed'
+])
+
+DEFAULT_SIMULATOR_OPTIONS = SimulatorOptions(
+    contract_count=50,
+    file_count=100,
+    latency_fn=lambda rng: 0.0,
+    error_rate=0.0,
+    change_interval=60.0,
+    seed=0)
+
+
+class Error(Exception):
+    pass
+
+
+class InvalidLatencySpecError(Error):
+    pass
+
+
+def parse_latency_spec(spec):
+    """Parses a response latency distribution.
+
+    Args:
+        spec: A string of one of the forms:
+            'MS': Always MS milliseconds.
+            'uniform:LOW_MS,HIGH_MS': Uniformly between LOW_MS and HIGH_MS.
+            'exponential:MEAN_MS': Exponentially distributed with mean
+                MEAN_MS.
+            'lognormal:MEDIAN_MS,SIGMA': Log-normally distributed with median
+                MEDIAN_MS, and SIGMA the standard deviation of the latency's
+                natural logarithm. Like real network latencies, mostly near
+                the median with a long tail.
+
+    Returns:
+        A function that takes a random.Random and returns a latency in
+        seconds.
+
+    Raises:
+        InvalidLatencySpecError: The spec is not a valid latency
+            distribution.
+    """
+    if ':' in spec:
+        distribution, parameters = spec.split(':', 1)
+    else:
+        distribution, parameters = _CONSTANT, spec
+    distribution = distribution.strip()
+    if distribution not in _LATENCY_DISTRIBUTIONS:
+        raise InvalidLatencySpecError(
+            'Unknown latency distribution: %s' % distribution)
+    try:
+        parameters = [float(p) for p in parameters.split(',')]
+    except ValueError:
+        raise InvalidLatencySpecError('Invalid latency parameters: %s' % spec)
+    if (len(parameters) != _LATENCY_DISTRIBUTIONS[distribution] or
+            any(p < 0 for p in parameters)):
+        raise InvalidLatencySpecError('Invalid latency parameters: %s' % spec)
+    if distribution == _CONSTANT:
+        seconds = parameters[0] / 1000.0
+        return lambda rng: seconds
+    if distribution == _UNIFORM:
+        low, high = sorted(parameters)
+        return lambda rng: rng.uniform(low, high) / 1000.0
+    if distribution == _EXPONENTIAL:
+        mean = parameters[0]
+        if not mean:
+            return lambda rng: 0.0
+        return lambda rng: rng.expovariate(1.0 / mean) / 1000.0
+    median, sigma = parameters
+    if not median:
+        return lambda rng: 0.0
+    mu = math.log(median)
+    return lambda rng: rng.lognormvariate(mu, sigma) / 1000.0
+
+
+class Simulator(object):
+    """Serves synthetic Sia API responses over HTTP."""
+
+    def __init__(self,
+                 host='127.0.0.1',
+                 port=0,
+                 options=DEFAULT_SIMULATOR_OPTIONS,
+                 time_fn=time.time):
+        """Creates a new Simulator and starts serving on a background thread.
+
+        Args:
+            host: Address to listen on.
+            port: Port to listen on, or 0 to pick a free port.
+            options: SimulatorOptions for how the simulator behaves.
+            time_fn: Function that returns the current time, in seconds.
+        """
+        self._options = options
+        self._time_fn = time_fn
+        self._start_time = time_fn()
+        # Each request is handled on its own thread, and Random objects are
+        # not safe to share across threads without a lock.
+        self._rng_lock = threading.Lock()
+        self._rng = random.Random(options.seed)
+        self._renter = _Renter(options.contract_count, options.file_count,
+                               random.Random(options.seed))
+        self._bodies_lock = threading.Lock()
+        # Maps each path to a (change number, response body) pair.
+        self._bodies = {}
+        self._server = _ThreadingHTTPServer((host, port), _SiadHandler)
+        self._server.simulator = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name='siad-simulator')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        """Stops serving and closes the listening socket."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def change_number(self):
+        """Returns how many times the renter's state has changed so far."""
+        if not self._options.change_interval:
+            return 0
+        return int((
+            self._time_fn() - self._start_time) / self._options.change_interval)
+
+    def response_body(self, path):
+        """Returns the body of a successful response, or None if unknown.
+
+        Bodies are JSON encoded as bytes, and rendered once per change to the
+        renter's state.
+
+        Args:
+            path: Path of the Sia API endpoint (e.g. '/wallet').
+        """
+        render_fn = {
+            '/renter/contracts': self._renter.contracts,
+            '/renter/files': self._renter.files,
+            '/wallet': self._renter.wallet,
+            '/renter': self._renter.renter,
+        }.get(path)
+        if not render_fn:
+            return None
+        change_number = self.change_number()
+        with self._bodies_lock:
+            cached = self._bodies.get(path)
+            if cached and cached[0] == change_number:
+                return cached[1]
+            body = json.dumps(render_fn(change_number)).encode('ascii')
+            self._bodies[path] = (change_number, body)
+            return body
+
+    def sample_response_delay(self):
+        """Returns seconds to delay a response by, and whether it fails."""
+        with self._rng_lock:
+            return (self._options.latency_fn(self._rng),
+                    self._rng.random() < self._options.error_rate)
+
+
+class _Renter(object):
+    """Computes a renter's responses as its state changes over time."""
+
+    def __init__(self, contract_count, file_count, rng):
+        self._contracts = [{
+            u'id':
+            u'%064x' % rng.getrandbits(256),
+            u'size':
+            rng.randint(0, 2**36),
+            u'totalcost':
+            rng.randint(100, 5000) * _HASTINGS_PER_SIACOIN,
+            u'fees':
+            rng.randint(1, 50) * _HASTINGS_PER_SIACOIN,
+            u'StorageSpending':
+            rng.randint(0, 100) * _HASTINGS_PER_SIACOIN,
+            u'uploadspending':
+            rng.randint(0, 100) * _HASTINGS_PER_SIACOIN,
+            u'downloadspending':
+            rng.randint(0, 10) * _HASTINGS_PER_SIACOIN,
+            u'endheight':
+            rng.randint(150000, 200000),
+        } for _ in range(contract_count)]
+        for contract in self._contracts:
+            contract[u'renterfunds'] = (
+                contract[u'totalcost'] - contract[u'fees'] -
+                contract[u'StorageSpending'] - contract[u'uploadspending'] -
+                contract[u'downloadspending'])
+        self._inactive_count = contract_count // 4
+        self._files = [{
+            u'siapath':
+            u'simulated/file-%d' % i,
+            u'filesize':
+            rng.randint(1, 2**32),
+            u'uploadprogress': (rng.uniform(0, 100)
+                                if rng.random() < _UPLOADING_FILE_FRACTION else
+                                100.0),
+        } for i in range(file_count)]
+        self._wallet_balance = rng.randint(10**4, 10**6) * _HASTINGS_PER_SIACOIN
+        self._allowance = sum(
+            c[u'totalcost']
+            for c in self._contracts) + 1000 * _HASTINGS_PER_SIACOIN
+
+    def contracts(self, change_number):
+        """Returns the /renter/contracts response after some changes.
+
+        Each active contract spends a hundredth of a siacoin on uploads and
+        storage per change, until it runs out of funds.
+        """
+        contracts = []
+        for i, contract in enumerate(self._contracts):
+            spent = 0
+            if i >= self._inactive_count:
+                spent = min(contract[u'renterfunds'],
+                            change_number * _HASTINGS_PER_SIACOIN // 100) // 2
+            contracts.append({
+                u'id':
+                contract[u'id'],
+                u'size':
+                contract[u'size'],
+                u'endheight':
+                contract[u'endheight'],
+                u'totalcost':
+                str(contract[u'totalcost']),
+                u'fees':
+                str(contract[u'fees']),
+                u'StorageSpending':
+                str(contract[u'StorageSpending'] + spent),
+                u'uploadspending':
+                str(contract[u'uploadspending'] + spent),
+                u'downloadspending':
+                str(contract[u'downloadspending']),
+                u'renterfunds':
+                str(contract[u'renterfunds'] - 2 * spent),
+            })
+        return {
+            u'activecontracts': contracts[self._inactive_count:],
+            u'inactivecontracts': contracts[:self._inactive_count],
+        }
+
+    def files(self, change_number):
+        """Returns the /renter/files response after some changes."""
+        files = []
+        for f in self._files:
+            progress = min(100.0, f[u'uploadprogress'] +
+                           change_number * _UPLOAD_PROGRESS_PER_CHANGE)
+            files.append({
+                u'siapath':
+                f[u'siapath'],
+                u'filesize':
+                f[u'filesize'],
+                u'uploadprogress':
+                progress,
+                u'uploadedbytes':
+                int(f[u'filesize'] * progress / 100.0),
+                u'available':
+                progress >= 100.0,
+                u'redundancy':
+                3.0 if progress >= 100.0 else 0.0,
+            })
+        return {u'files': files}
+
+    def wallet(self, change_number):
+        """Returns the /wallet response after some changes.
+
+        The wallet funds one siacoin of outgoing transactions per change,
+        which are unconfirmed until the next change.
+        """
+        outgoing = _HASTINGS_PER_SIACOIN if change_number else 0
+        balance = max(
+            0, self._wallet_balance - change_number * _HASTINGS_PER_SIACOIN)
+        return {
+            u'encrypted': True,
+            u'unlocked': True,
+            u'confirmedsiacoinbalance': str(balance),
+            u'unconfirmedoutgoingsiacoins': str(outgoing),
+            u'unconfirmedincomingsiacoins': '0',
+        }
+
+    def renter(self, change_number):
+        """Returns the /renter response, consistent with the contracts."""
+        contracts = self.contracts(change_number)
+        totals = collections.Counter()
+        for contract in itertools.chain(contracts[u'activecontracts'],
+                                        contracts[u'inactivecontracts']):
+            for field in (u'totalcost', u'fees', u'StorageSpending',
+                          u'uploadspending', u'downloadspending',
+                          u'renterfunds'):
+                totals[field] += int(contract[field])
+        return {
+            u'settings': {
+                u'allowance': {
+                    u'funds': str(self._allowance),
+                    u'hosts': 50,
+                    u'period': 12960,
+                    u'renewwindow': 4320,
+                },
+            },
+            u'financialmetrics': {
+                u'contractfees':
+                str(totals[u'fees']),
+                u'totalallocated':
+                str(totals[u'totalcost']),
+                u'contractspending':
+                str(totals[u'totalcost']),
+                u'downloadspending':
+                str(totals[u'downloadspending']),
+                u'storagespending':
+                str(totals[u'StorageSpending']),
+                u'uploadspending':
+                str(totals[u'uploadspending']),
+                u'unspent':
+                str(self._allowance - totals[u'totalcost'] +
+                    totals[u'renterfunds']),
+            },
+        }
+
+
+class _ThreadingHTTPServer(SocketServer.ThreadingMixIn,
+                           BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    # A fleet of simulators may be started and stopped in quick succession.
+    allow_reuse_address = True
+
+
+class _SiadHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # Keep connections alive between requests, as siad does.
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes, so with Nagle's algorithm,
+    # the body would wait on the client's delayed ACK of the headers, adding
+    # up to 40ms to every response.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        simulator = self.server.simulator
+        path = self.path.split('?', 1)[0]
+        if self.headers.get('User-Agent') != _USER_AGENT:
+            self._send_json(
+                400, {
+                    u'message': (u'Browser access disabled due to security '
+                                 u'vulnerability. Use Sia-UI or siac.')
+                })
+            return
+        delay, fails = simulator.sample_response_delay()
+        if delay:
+            time.sleep(delay)
+        if fails:
+            self._send_json(500, {u'message': u'simulated siad error'})
+            return
+        body = simulator.response_body(path)
+        if body is None:
+            self._send_json(404, {u'message': u'404 - Refer to API.md'})
+            return
+        self._send_body(200, body)
+
+    def _send_json(self, status, response):
+        self._send_body(status, json.dumps(response).encode('ascii'))
+
+    def _send_body(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', _JSON_CONTENT_TYPE)
+        if len(body) <= _MAX_UNCHUNKED_BODY_BYTES:
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        chunks = []
+        for start in range(0, len(body), _CHUNK_BYTES):
+            chunk = body[start:start + _CHUNK_BYTES]
+            chunks.append(
+                ('%x\r\n' % len(chunk)).encode('ascii') + chunk + b'\r\n')
+        chunks.append(b'0\r\n\r\n')
+        self.wfile.write(b''.join(chunks))
+
+    def log_message(self, format, *args):
+        # Load tests send many requests, so don't log each one.
+        logger.debug(format, *args)
+
+
+def start_fleet(count, options, host='127.0.0.1', base_port=0):
+    """Starts a number of simulators, each with its own contracts and files.
+
+    Args:
+        count: Number of simulators to start.
+        options: SimulatorOptions for every simulator. Each simulator's seed
+            is offset by its position in the fleet.
+        host: Address for the simulators to listen on.
+        base_port: Port of the first simulator, with the others on the ports
+            after it, or 0 to pick free ports.
+
+    Returns:
+        A list of the running Simulators.
+    """
+    simulators = []
+    try:
+        for i in range(count):
+            simulators.append(
+                Simulator(
+                    host,
+                    base_port + i if base_port else 0,
+                    options._replace(seed=options.seed + i)))
+    except Exception:
+        for simulator in simulators:
+            simulator.close()
+        raise
+    return simulators
+
+
+def make_node_specs(simulators, host='127.0.0.1'):
+    """Returns collector node specs (see nodes.py) for a fleet of simulators.
+
+    Each node's ID is 'sim-N', for the Nth simulator.
+    """
+    return [
+        'sim-%d=http://%s:%d' % (i, host, simulator.port)
+        for i, simulator in enumerate(simulators)
+    ]
+
+
+def _main(args):
+    logging.basicConfig(level=logging.INFO)
+    options = SimulatorOptions(
+        contract_count=args.contracts,
+        file_count=args.files,
+        latency_fn=parse_latency_spec(args.latency),
+        error_rate=args.error_rate,
+        change_interval=args.change_interval,
+        seed=args.seed)
+    simulators = start_fleet(args.nodes, options, args.host, args.base_port)
+    try:
+        node_specs = make_node_specs(simulators, args.host)
+        if args.nodes_file:
+            with open(args.nodes_file, 'w') as nodes_file:
+                nodes_file.write(''.join(spec + '\n' for spec in node_specs))
+            logger.info('Wrote %d node specs to %s', len(node_specs),
+                        args.nodes_file)
+        else:
+            for spec in node_specs:
+                print(spec)
+        logger.info('Serving %d simulated Sia nodes. Press Ctrl+C to stop.',
+                    len(simulators))
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for simulator in simulators:
+            simulator.close()
+
+
+def add_simulator_arguments(parser):
+    """Adds flags for SimulatorOptions to an argparse.ArgumentParser."""
+    parser.add_argument(
+        '--nodes',
+        type=int,
+        default=1,
+        help='Number of simulated Sia nodes to serve')
+    parser.add_argument(
+        '--contracts',
+        type=int,
+        default=DEFAULT_SIMULATOR_OPTIONS.contract_count,
+        help='Number of contracts each node has')
+    parser.add_argument(
+        '--files',
+        type=int,
+        default=DEFAULT_SIMULATOR_OPTIONS.file_count,
+        help='Number of files each node has')
+    parser.add_argument(
+        '--latency',
+        default='0',
+        help=('Distribution of response latencies, in milliseconds: MS, '
+              'uniform:LOW,HIGH, exponential:MEAN, or lognormal:MEDIAN,SIGMA'))
+    parser.add_argument(
+        '--error_rate',
+        type=float,
+        default=DEFAULT_SIMULATOR_OPTIONS.error_rate,
+        help='Fraction of requests to fail with HTTP 500')
+    parser.add_argument(
+        '--change_interval',
+        type=float,
+        default=DEFAULT_SIMULATOR_OPTIONS.change_interval,
+        help=('Seconds between changes to each node\'s spending, balances, '
+              'and upload progress (0 to never change)'))
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=DEFAULT_SIMULATOR_OPTIONS.seed,
+        help='Seed for the first node\'s random contracts, files and latencies')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='Sia Node Simulator',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    add_simulator_arguments(parser)
+    parser.add_argument(
+        '--host', default='127.0.0.1', help='Address to serve nodes on')
+    parser.add_argument(
+        '--base_port',
+        type=int,
+        default=0,
+        help=('Port of the first node, with the others on consecutive ports '
+              'after it. If 0, picks free ports'))
+    parser.add_argument(
+        '--nodes_file',
+        help=('Path to write node specs to, for the collector\'s '
+              '--nodes_file. If unset, prints them'))
+    _main(parser.parse_args())
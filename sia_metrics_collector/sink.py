@@ -0,0 +1,126 @@
+"""Hands items off to background threads through bounded queues."""
+
+import collections
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Policies for items put onto a sink's queue while it is full.
+#
+# BLOCK: Wait until the sink's worker takes an item off the queue.
+# DROP_OLDEST: Discard the oldest item on the queue to make room.
+# DROP_NEWEST: Discard the new item.
+BLOCK = 'block'
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+BACKPRESSURE_POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST)
+
+# Maximum time (in seconds) to block at once while waiting for room on a full
+# queue. Python 2 can't deliver signals to a thread blocked in an untimed wait,
+# so waiting in short slices keeps the process responsive to SIGTERM.
+_BLOCK_SLICE_SECONDS = 0.5
+"""Counts of a sink's queue usage.
+
+Fields:
+    depth: Number of items currently waiting on the queue.
+    max_depth: Largest number of items that have waited on the queue at once.
+    capacity: Maximum number of items the queue holds.
+    put_count: Number of items put onto the queue, including dropped items.
+    dropped_count: Number of items discarded because the queue was full.
+"""
+QueueStats = collections.namedtuple(
+    'QueueStats',
+    ['depth', 'max_depth', 'capacity', 'put_count', 'dropped_count'])
+
+
+class Sink(object):
+    """Passes items to a function on a background thread, through a queue.
+
+    The thread calling put() never waits for the function, only (under the
+    BLOCK policy) for room on the queue, so a slow function delays the caller
+    only once the queue fills up.
+    """
+
+    def __init__(self, name, handle_fn, capacity, backpressure_policy=BLOCK):
+        """Creates a new Sink and starts its worker thread.
+
+        Args:
+            name: Name of the sink, for logs and stats.
+            handle_fn: Function the worker thread calls with each item, in the
+                order the items were put. Exceptions it raises are logged and
+                otherwise ignored.
+            capacity: Maximum number of items waiting on the queue.
+            backpressure_policy: One of BACKPRESSURE_POLICIES.
+        """
+        if capacity <= 0:
+            raise ValueError('Capacity must be positive: %s' % capacity)
+        if backpressure_policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(
+                'Unknown backpressure policy: %s' % backpressure_policy)
+        self.name = name
+        self._handle_fn = handle_fn
+        self._capacity = capacity
+        self._backpressure_policy = backpressure_policy
+        self._items = collections.deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._max_depth = 0
+        self._put_count = 0
+        self._dropped_count = 0
+        self._thread = threading.Thread(target=self._run, name='sink-%s' % name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, item):
+        """Queues an item for the worker thread.
+
+        If the queue is full, applies the backpressure policy.
+        """
+        with self._condition:
+            self._put_count += 1
+            if len(self._items) >= self._capacity:
+                if self._backpressure_policy == DROP_NEWEST:
+                    self._dropped_count += 1
+                    return
+                if self._backpressure_policy == DROP_OLDEST:
+                    self._items.popleft()
+                    self._dropped_count += 1
+                else:
+                    while len(self._items) >= self._capacity:
+                        self._condition.wait(_BLOCK_SLICE_SECONDS)
+            self._items.append(item)
+            self._max_depth = max(self._max_depth, len(self._items))
+            self._condition.notify_all()
+
+    def close(self):
+        """Stops the worker thread once it has handled every queued item."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        while self._thread.is_alive():
+            self._thread.join(_BLOCK_SLICE_SECONDS)
+
+    def stats(self):
+        """Returns QueueStats counting queue usage so far."""
+        with self._condition:
+            return QueueStats(
+                depth=len(self._items),
+                max_depth=self._max_depth,
+                capacity=self._capacity,
+                put_count=self._put_count,
+                dropped_count=self._dropped_count)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._items and not self._closed:
+                    self._condition.wait()
+                if not self._items:
+                    return
+                item = self._items.popleft()
+                self._condition.notify_all()
+            try:
+                self._handle_fn(item)
+            except Exception:
+                logger.exception('Sink %s failed to handle item', self.name)
@@ -0,0 +1,213 @@
+"""Serializes SiaState to a SQLite database.
+
+Each SiaState is a row of the metrics table, which has a column for each
+SiaState field and is indexed on (timestamp, node_id), so that queries for a
+time range read only the matching rows.
+
+Columns are typed by the kind of value in the field (see state.FIELD_KINDS):
+    timestamp: TEXT in ISO 8601 format (e.g. '2018-02-11T16:05:02.000000'),
+        which sorts chronologically.
+    float: REAL.
+    integer: INTEGER.
+    hastings: TEXT of the decimal value, as hastings overflow SQLite's 64-bit
+        INTEGER.
+    string: TEXT.
+"""
+
+import sqlite3
+
+import monotonic
+
+from sia_metrics_collector import state
+
+TABLE_NAME = 'metrics'
+_INDEX_NAME = 'metrics_timestamp_node_id'
+
+_TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+_COLUMN_TYPES = {
+    state.TIMESTAMP: 'TEXT',
+    state.FLOAT: 'REAL',
+    state.INTEGER: 'INTEGER',
+    state.HASTINGS: 'TEXT',
+    state.STRING: 'TEXT',
+}
+
+
+class Error(Exception):
+    pass
+
+
+class UnknownFieldError(Error):
+    pass
+
+
+def connect(db_path):
+    """Opens a SQLite database for SqliteSerializer to write to.
+
+    The database runs in write-ahead log (WAL) mode, so that other processes
+    can read it while the collector writes to it, without either blocking the
+    other.
+
+    The connection may be used from any thread, as the collector opens it on
+    the main thread but writes to it from the output's sink thread. Callers
+    must still use it from only one thread at a time.
+
+    Args:
+        db_path: Path to the SQLite database file to open or create.
+
+    Returns:
+        An open sqlite3.Connection.
+    """
+    connection = sqlite3.connect(db_path, check_same_thread=False)
+    connection.execute('PRAGMA journal_mode=WAL')
+    # In WAL mode, NORMAL still guarantees the database survives a crash, but
+    # only syncs to disk at checkpoints rather than at every commit.
+    connection.execute('PRAGMA synchronous=NORMAL')
+    return connection
+
+
+class SqliteSerializer(object):
+    """Serializes SiaState to a table in a SQLite database.
+
+    To avoid the cost of a transaction per row, rows are inserted in batches:
+    the serializer commits once batch_size rows are pending, or once the
+    oldest pending row is batch_seconds old. Pending rows are not visible to
+    readers, and are lost if the collector crashes before committing them.
+    """
+
+    def __init__(self,
+                 connection,
+                 batch_size=1,
+                 batch_seconds=None,
+                 clock=monotonic.monotonic):
+        """Creates a serializer, writing to the given database.
+
+        If the metrics table does not exist, creates it. If it exists but
+        lacks columns for some SiaState fields (e.g. because it was created
+        by an older version of the collector), adds them.
+
+        Args:
+            connection: sqlite3.Connection to the database to write to.
+            batch_size: Number of rows to insert in each transaction.
+            batch_seconds: Maximum number of seconds a row may wait for its
+                batch to fill before being committed, or None to only commit
+                full batches. As the serializer only checks when writing a
+                row, or on flush_if_due(), a partial batch is committed on the
+                next check after this time passes, or on flush().
+            clock: Function that returns the current time in seconds, for
+                measuring batch_seconds.
+        """
+        self._connection = connection
+        self._batch_size = batch_size
+        self._batch_seconds = batch_seconds
+        self._clock = clock
+        self._pending_count = 0
+        self._batch_start_time = None
+        self._fields = state.SiaState._fields
+        _create_table(connection, self._fields)
+        self._insert_sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+            TABLE_NAME, ', '.join(self._fields), ', '.join(
+                '?' for _ in self._fields))
+
+    def write_state(self, sia_state):
+        self._connection.execute(self._insert_sql, [
+            _to_column_value(field, getattr(sia_state, field))
+            for field in self._fields
+        ])
+        if self._pending_count == 0:
+            self._batch_start_time = self._clock()
+        self._pending_count += 1
+        if self._is_batch_due():
+            self.flush()
+
+    def flush(self):
+        """Commits any pending rows."""
+        self._connection.commit()
+        self._pending_count = 0
+        self._batch_start_time = None
+
+    def flush_if_due(self):
+        """Commits pending rows if the batch is full or old enough."""
+        if self._pending_count and self._is_batch_due():
+            self.flush()
+
+    def _is_batch_due(self):
+        if self._pending_count >= self._batch_size:
+            return True
+        return self._batch_seconds is not None and (
+            self._clock() - self._batch_start_time >= self._batch_seconds)
+
+
+def query_rows(connection, fields=None, start=None, end=None, node_id=None):
+    """Queries rows of the metrics table, in timestamp order.
+
+    Args:
+        connection: sqlite3.Connection to the database to query.
+        fields: A list of names of fields to select, or None for all fields.
+        start: If specified, only rows with this timestamp or later are
+            selected. An ISO 8601 timestamp, or prefix of one (e.g.
+            '2018-02-11' or '2018-02-11T16:05').
+        end: If specified, only rows with a timestamp before this are
+            selected. In the same format as start.
+        node_id: If specified, only rows for the node with this ID are
+            selected.
+
+    Returns:
+        An iterator of rows, each a tuple of the values of the selected
+        fields, as stored in the database.
+
+    Raises:
+        UnknownFieldError: One of the fields is not a SiaState field.
+    """
+    fields = fields or list(state.SiaState._fields)
+    for field in fields:
+        if field not in state.FIELD_KINDS:
+            raise UnknownFieldError('Unknown field: %s' % field)
+    conditions = []
+    parameters = []
+    if start:
+        conditions.append('timestamp >= ?')
+        parameters.append(start)
+    if end:
+        conditions.append('timestamp < ?')
+        parameters.append(end)
+    if node_id is not None:
+        conditions.append('node_id = ?')
+        parameters.append(node_id)
+    sql = 'SELECT %s FROM %s' % (', '.join(fields), TABLE_NAME)
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY timestamp'
+    return connection.execute(sql, parameters)
+
+
+def _create_table(connection, fields):
+    connection.execute('CREATE TABLE IF NOT EXISTS %s (%s)' %
+                       (TABLE_NAME, ', '.join(
+                           _column_definition(f) for f in fields)))
+    existing_columns = set(
+        row[1]
+        for row in connection.execute('PRAGMA table_info(%s)' % TABLE_NAME))
+    for field in fields:
+        if field not in existing_columns:
+            connection.execute('ALTER TABLE %s ADD COLUMN %s' %
+                               (TABLE_NAME, _column_definition(field)))
+    connection.execute('CREATE INDEX IF NOT EXISTS %s ON %s (timestamp, '
+                       'node_id)' % (_INDEX_NAME, TABLE_NAME))
+    connection.commit()
+
+
+def _column_definition(field):
+    return '%s %s' % (field, _COLUMN_TYPES[state.FIELD_KINDS[field]])
+
+
+def _to_column_value(field, value):
+    if value is None:
+        return None
+    kind = state.FIELD_KINDS[field]
+    if kind == state.TIMESTAMP:
+        return value.strftime(_TIMESTAMP_FORMAT)
+    if kind == state.HASTINGS:
+        return str(value)
+    return value
@@ -0,0 +1,126 @@
+"""Client for querying the Sia API that needs only the standard library.
+
+api.Client builds on pysia and requests, which together take longer to import
+than a poll of a local Sia node takes. A collector that polls once and exits
+(main.py's --once) uses this client instead, so that most of its run isn't
+spent importing HTTP machinery it has no use for.
+
+Settings shared by every client live here too, so that reading them doesn't
+import api.py's dependencies.
+"""
+
+import collections
+import json
+import time
+
+try:
+    import httplib
+except ImportError:
+    # Python 3 renamed it.
+    from http import client as httplib
+try:
+    import urlparse
+except ImportError:
+    # Python 3 moved it.
+    from urllib import parse as urlparse
+
+_HEADERS = {'User-agent': 'Sia-Agent'}
+
+# Python 2's standard library has no monotonic clock, but the wall clock is
+# good enough to time parsing a response.
+_clock = getattr(time, 'monotonic', time.time)
+"""Settings for a client's HTTP connections to Sia.
+
+Fields:
+    pool_size: Maximum number of keep-alive connections to hold open to Sia.
+    connect_timeout: Seconds to wait for a connection to Sia to open, or None
+        to wait forever.
+    read_timeout: Seconds to wait between bytes of Sia's response, or None to
+        wait forever.
+"""
+ConnectionOptions = collections.namedtuple(
+    'ConnectionOptions', ['pool_size', 'connect_timeout', 'read_timeout'])
+
+DEFAULT_CONNECTION_OPTIONS = ConnectionOptions(
+    pool_size=4, connect_timeout=10.0, read_timeout=None)
+
+
+class Client(object):
+    """Queries the Sia API on the standard library's HTTP client.
+
+    Has the query methods of api.Client that state.Builder calls, except for
+    iter_renter_files(). Each query opens its own connection, so the client is
+    safe to share between threads, but is only worth using for a handful of
+    queries.
+
+    Attributes:
+        response_sizes: Like api.Client.response_sizes.
+        decode_seconds: Like api.Client.decode_seconds.
+    """
+
+    def __init__(self,
+                 host,
+                 port,
+                 connection_options=DEFAULT_CONNECTION_OPTIONS):
+        """Creates a new Client.
+
+        Args:
+            host: Hostname of the Sia node, including URL scheme.
+            port: Siad API port of the Sia node.
+            connection_options: ConnectionOptions for the connections. The
+                client never keeps connections open, so ignores pool_size.
+        """
+        url = urlparse.urlsplit(host)
+        if url.scheme == 'https':
+            self._connection_class = httplib.HTTPSConnection
+        else:
+            self._connection_class = httplib.HTTPConnection
+        self._hostname = url.hostname
+        self._port = port
+        self._connect_timeout = connection_options.connect_timeout
+        self._read_timeout = connection_options.read_timeout
+        self.response_sizes = {}
+        self.decode_seconds = {}
+
+    def get_renter_contracts(self):
+        return self._get('/renter/contracts')
+
+    def get_renter_files(self):
+        return self._get('/renter/files')
+
+    def get_wallet(self):
+        return self._get('/wallet')
+
+    def get_renter(self):
+        return self._get('/renter')
+
+    def _get(self, path):
+        """Sends a GET request to the Sia API.
+
+        Args:
+            path: Path of the Sia API endpoint (e.g. '/wallet').
+
+        Returns:
+            The parsed JSON response, or if the response is not JSON, whether
+            the HTTP status was a success (as api.Client does).
+        """
+        self.response_sizes.pop(path, None)
+        self.decode_seconds.pop(path, None)
+        connection = self._connection_class(
+            self._hostname, self._port, timeout=self._connect_timeout)
+        try:
+            connection.connect()
+            connection.sock.settimeout(self._read_timeout)
+            connection.request('GET', path, headers=_HEADERS)
+            response = connection.getresponse()
+            body = response.read()
+        finally:
+            connection.close()
+        self.response_sizes[path] = len(body)
+        decode_start_time = _clock()
+        try:
+            return json.loads(body.decode('utf-8'))
+        except ValueError:
+            return response.status < 400
+        finally:
+            self.decode_seconds[path] = _clock() - decode_start_time
@@ -0,0 +1,238 @@
+"""Measures where the collector's own time and memory go, poll by poll.
+
+A Recorder adds up the time that each stage of the collector's work takes, on
+whichever thread it runs, and on every poll, takes a Sample of those totals
+since the previous sample, along with the process's CPU time, memory use and
+garbage collection pauses. A CsvWriter writes the samples to a file of their
+own, apart from the Sia metrics.
+
+Nothing is measured unless a Recorder is in use, so the collector only pays
+for telemetry when it's turned on.
+"""
+
+import collections
+import csv
+import datetime
+import functools
+import gc
+import threading
+
+import monotonic
+
+from sia_metrics_collector import buffered_writer
+from sia_metrics_collector import process_stats
+from sia_metrics_collector import serialize
+
+# Stages of the collector's work that a Recorder times:
+#
+# *_populate: Querying a Sia API endpoint and computing its metrics (the
+#   Builder's population function for the group), including JSON decoding.
+# json_decode: Parsing Sia API responses from JSON, as timed by the Sia API
+#   client.
+# serialize: Writing SiaStates to the outputs, including rollups.
+# console_render: Printing polls to the console.
+STAGES = ('contract_populate', 'file_populate', 'wallet_populate',
+          'renter_populate', 'json_decode', 'serialize', 'console_render')
+"""The collector's resource use over the interval since the previous sample.
+
+Fields:
+    timestamp: Time at which the sample was taken.
+    poll_index: Index of the poll the sample was taken at.
+    interval_seconds: Time (in seconds) since the previous sample, or since
+        the Recorder was created.
+    cpu_time_ms: CPU time (in milliseconds, user plus system) the process used
+        over the interval.
+    rss_bytes: The process's resident set size, or None if the platform does
+        not report it.
+    gc_collections: Number of garbage collections over the interval, or None
+        if Python can't report them (Python 2).
+    gc_pause_ms: Time (in milliseconds) spent in garbage collections over the
+        interval, or None if Python can't report it (Python 2).
+    *_ms: Time (in milliseconds) spent in each of STAGES over the interval,
+        summed over every thread and node.
+"""
+Sample = collections.namedtuple('Sample', [
+    'timestamp', 'poll_index', 'interval_seconds', 'cpu_time_ms', 'rss_bytes',
+    'gc_collections', 'gc_pause_ms'
+] + [stage + '_ms' for stage in STAGES])
+
+
+class Recorder(object):
+    """Adds up the time spent in each stage, from any thread, between samples.
+
+    Attributes:
+        clock: The function the Recorder times stages with, for callers that
+            time stages themselves and add() the result.
+    """
+
+    def __init__(self,
+                 clock=monotonic.monotonic,
+                 time_fn=datetime.datetime.utcnow,
+                 cpu_seconds_fn=process_stats.cpu_seconds,
+                 rss_bytes_fn=process_stats.rss_bytes):
+        """Creates a new Recorder, which times garbage collections until closed.
+
+        Args:
+            clock: Function that returns the current time in seconds, on a
+                clock that never goes backwards.
+            time_fn: A function that returns the current time, for sample
+                timestamps.
+            cpu_seconds_fn: Function that returns the CPU time the process
+                has used so far.
+            rss_bytes_fn: Function that returns the process's current resident
+                set size, or None.
+        """
+        self.clock = clock
+        self._time_fn = time_fn
+        self._cpu_seconds_fn = cpu_seconds_fn
+        self._rss_bytes_fn = rss_bytes_fn
+        # Reentrant, as a garbage collection can start on a thread that holds
+        # the lock, and its callback takes the lock too.
+        self._lock = threading.RLock()
+        self._stage_seconds = dict.fromkeys(STAGES, 0.0)
+        self._last_sample_time = clock()
+        self._last_cpu_seconds = cpu_seconds_fn()
+        # Python 2 has no hook to time garbage collections with.
+        self._gc_callbacks = getattr(gc, 'callbacks', None)
+        self._gc_collections = 0
+        self._gc_pause_seconds = 0.0
+        self._gc_start_time = None
+        if self._gc_callbacks is not None:
+            self._gc_callbacks.append(self._on_gc)
+
+    def add(self, stage, seconds):
+        """Adds time spent in a stage.
+
+        Args:
+            stage: One of STAGES.
+            seconds: Time (in seconds) spent in the stage.
+        """
+        with self._lock:
+            self._stage_seconds[stage] += seconds
+
+    def timed(self, stage, fn):
+        """Wraps a function so that the time each call takes adds to a stage.
+
+        Args:
+            stage: One of STAGES.
+            fn: Function to time.
+
+        Returns:
+            A function that takes the same arguments and returns the same
+            value as fn.
+        """
+
+        @functools.wraps(fn)
+        def timed_fn(*args, **kwargs):
+            start_time = self.clock()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(stage, self.clock() - start_time)
+
+        return timed_fn
+
+    def sample(self, poll_index):
+        """Takes a Sample of the interval since the previous one.
+
+        Args:
+            poll_index: Index of the poll to tag the sample with.
+
+        Returns:
+            A Sample, after which the totals start again from zero.
+        """
+        now = self.clock()
+        cpu_seconds = self._cpu_seconds_fn()
+        with self._lock:
+            stage_seconds = self._stage_seconds
+            self._stage_seconds = dict.fromkeys(STAGES, 0.0)
+            gc_collections = self._gc_collections
+            gc_pause_seconds = self._gc_pause_seconds
+            self._gc_collections = 0
+            self._gc_pause_seconds = 0.0
+        interval_seconds = now - self._last_sample_time
+        cpu_time_ms = (cpu_seconds - self._last_cpu_seconds) * 1000.0
+        self._last_sample_time = now
+        self._last_cpu_seconds = cpu_seconds
+        if self._gc_callbacks is None:
+            gc_collections = None
+            gc_pause_ms = None
+        else:
+            gc_pause_ms = gc_pause_seconds * 1000.0
+        stage_ms = {
+            stage + '_ms': seconds * 1000.0
+            for stage, seconds in stage_seconds.items()
+        }
+        return Sample(
+            timestamp=self._time_fn(),
+            poll_index=poll_index,
+            interval_seconds=interval_seconds,
+            cpu_time_ms=cpu_time_ms,
+            rss_bytes=self._rss_bytes_fn(),
+            gc_collections=gc_collections,
+            gc_pause_ms=gc_pause_ms,
+            **stage_ms)
+
+    def close(self):
+        """Stops timing garbage collections."""
+        if self._gc_callbacks and self._on_gc in self._gc_callbacks:
+            self._gc_callbacks.remove(self._on_gc)
+
+    def _on_gc(self, phase, info):
+        # Python runs one collection at a time, so a stop always follows the
+        # start before it.
+        if phase == 'start':
+            self._gc_start_time = self.clock()
+        elif phase == 'stop' and self._gc_start_time is not None:
+            with self._lock:
+                self._gc_collections += 1
+                self._gc_pause_seconds += self.clock() - self._gc_start_time
+            self._gc_start_time = None
+
+
+class CsvWriter(object):
+    """Writes Samples to a CSV file."""
+
+    def __init__(self,
+                 csv_file,
+                 flush_policy=buffered_writer.DEFAULT_FLUSH_POLICY):
+        """Creates a new CsvWriter.
+
+        Args:
+            csv_file: Output file to write samples to, opened in either 'w' or
+                'r+' mode. If file is empty, writes a header row. Otherwise,
+                its header must match Sample's fields.
+            flush_policy: buffered_writer.FlushPolicy for when to flush rows
+                to the file.
+
+        Raises:
+            serialize.HeaderMismatchError: The existing file's header doesn't
+                match Sample's fields.
+        """
+        self._csv_file = csv_file
+        is_empty_file = serialize.seek_to_append(csv_file, Sample._fields)
+        self._writer = buffered_writer.GroupCommitWriter(csv_file, flush_policy)
+        self._csv_writer = csv.DictWriter(
+            self._writer, fieldnames=Sample._fields, lineterminator='\n')
+        if is_empty_file:
+            self._csv_writer.writeheader()
+            self._writer.flush()
+
+    def write_sample(self, sample):
+        row = sample._asdict()
+        row['timestamp'] = sample.timestamp.strftime('%Y-%m-%dT%H:%M:%S')
+        self._csv_writer.writerow(row)
+        self._writer.end_row()
+
+    def flush(self):
+        """Writes any buffered rows to the file."""
+        self._writer.flush()
+
+    def flush_if_due(self):
+        """Writes buffered rows to the file if the flush policy says to."""
+        self._writer.flush_if_due()
+
+    def close(self):
+        """Writes any buffered rows and closes the file."""
+        self._writer.flush()
+        self._csv_file.close()
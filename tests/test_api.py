@@ -0,0 +1,159 @@
+import io
+import threading
+import unittest
+
+try:
+    import BaseHTTPServer
+except ImportError:
+    # Python 3 renamed it.
+    from http import server as BaseHTTPServer
+
+import mock
+
+from sia_metrics_collector import api
+
+
+class ClientTest(unittest.TestCase):
+
+    def setUp(self):
+        requests_get_patch = mock.patch.object(api.requests.Session, 'get')
+        self.addCleanup(requests_get_patch.stop)
+        self.mock_requests_get = requests_get_patch.start()
+        self.client = api.Client('http://localhost', 9980)
+
+    def make_response(self, body, status_code=200):
+        response = mock.Mock()
+        response.content = body
+        response.raw = io.BytesIO(body)
+        response.status_code = status_code
+        response.json.side_effect = ValueError('dummy JSON decode error')
+        return response
+
+    def test_records_response_size(self):
+        response = self.make_response(b'{"confirmedsiacoinbalance": "5"}')
+        response.json.side_effect = None
+        response.json.return_value = {u'confirmedsiacoinbalance': u'5'}
+        self.mock_requests_get.return_value = response
+
+        self.assertEqual({
+            u'confirmedsiacoinbalance': u'5'
+        }, self.client.get_wallet())
+        self.assertEqual({'/wallet': 32}, self.client.response_sizes)
+        self.assertEqual(['/wallet'], list(self.client.decode_seconds))
+
+    def test_reuses_parsed_response_when_body_is_unchanged(self):
+        first_response = self.make_response(b'{"confirmedsiacoinbalance": "5"}')
+        first_response.json.side_effect = None
+        first_response.json.return_value = {u'confirmedsiacoinbalance': u'5'}
+        second_response = self.make_response(
+            b'{"confirmedsiacoinbalance": "5"}')
+        self.mock_requests_get.side_effect = [first_response, second_response]
+
+        first_wallet = self.client.get_wallet()
+        second_wallet = self.client.get_wallet()
+
+        self.assertIs(first_wallet, second_wallet)
+        self.assertFalse(second_response.json.called)
+
+    def test_parses_response_when_body_changes(self):
+        first_response = self.make_response(b'{"confirmedsiacoinbalance": "5"}')
+        first_response.json.side_effect = None
+        first_response.json.return_value = {u'confirmedsiacoinbalance': u'5'}
+        second_response = self.make_response(
+            b'{"confirmedsiacoinbalance": "6"}')
+        second_response.json.side_effect = None
+        second_response.json.return_value = {u'confirmedsiacoinbalance': u'6'}
+        self.mock_requests_get.side_effect = [first_response, second_response]
+
+        self.client.get_wallet()
+
+        self.assertEqual({
+            u'confirmedsiacoinbalance': u'6'
+        }, self.client.get_wallet())
+
+    def test_streams_renter_files(self):
+        body = (b'{"files": ['
+                b'{"filesize": 900, "uploadedbytes": 50, '
+                b'"uploadprogress": 90.5},'
+                b'{"filesize": 800, "uploadedbytes": 100, '
+                b'"uploadprogress": 100}'
+                b']}')
+        self.mock_requests_get.return_value = self.make_response(body)
+
+        files = list(self.client.iter_renter_files())
+
+        self.assertEqual([
+            {
+                u'filesize': 900,
+                u'uploadedbytes': 50,
+                u'uploadprogress': 90.5
+            },
+            {
+                u'filesize': 800,
+                u'uploadedbytes': 100,
+                u'uploadprogress': 100
+            },
+        ], files)
+        self.assertIsInstance(files[0][u'uploadprogress'], float)
+        self.assertEqual({
+            '/renter/files': len(body)
+        }, self.client.response_sizes)
+        self.assertTrue(self.mock_requests_get.call_args[1]['stream'])
+
+    def test_streams_no_files_when_files_is_null(self):
+        self.mock_requests_get.return_value = self.make_response(
+            b'{"files": null}')
+
+        self.assertEqual([], list(self.client.iter_renter_files()))
+
+    def test_raises_when_streamed_response_has_no_files(self):
+        self.mock_requests_get.return_value = self.make_response(
+            b'{"message": "dummy error"}', status_code=500)
+
+        with self.assertRaises(api.ResponseError):
+            list(self.client.iter_renter_files())
+        self.assertEqual({}, self.client.response_sizes)
+
+
+class _KeepAliveHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'{"confirmedsiacoinbalance": "5"}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ClientConnectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0),
+                                                _KeepAliveHandler)
+        server_thread = threading.Thread(target=self.server.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+        self.client = api.Client('http://127.0.0.1',
+                                 self.server.server_address[1])
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_reuses_connection_across_requests(self):
+        for _ in range(3):
+            self.assertEqual({
+                u'confirmedsiacoinbalance': u'5'
+            }, self.client.get_wallet())
+
+        self.assertEqual(
+            api.ConnectionStats(
+                request_count=3,
+                new_connection_count=1,
+                reused_connection_count=2), self.client.connection_stats())
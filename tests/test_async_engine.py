@@ -0,0 +1,573 @@
+import json
+import socket
+import sys
+import threading
+import unittest
+
+from sia_metrics_collector import api
+from sia_metrics_collector import cadence
+from sia_metrics_collector import nodes
+from sia_metrics_collector import scheduler
+from sia_metrics_collector import siad_simulator
+from sia_metrics_collector import sink
+from sia_metrics_collector import state
+
+if sys.version_info[0] >= 3:
+    import asyncio
+    from sia_metrics_collector import async_engine
+
+_requires_python3 = unittest.skipIf(sys.version_info[0] < 3,
+                                    'asyncio engine requires Python 3')
+
+
+class LoopTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        # Cleanups run last to first, so the loop closes after everything
+        # that runs on it.
+        self.addCleanup(self.loop.close)
+        self.now = 1000.0
+
+    def start_simulator(self, **kwargs):
+        simulator = siad_simulator.Simulator(
+            options=siad_simulator.DEFAULT_SIMULATOR_OPTIONS._replace(**kwargs),
+            time_fn=lambda: self.now)
+        self.addCleanup(simulator.close)
+        return simulator
+
+    def run_loop_for(self, seconds):
+        self.loop.run_until_complete(asyncio.sleep(seconds))
+
+
+@_requires_python3
+class ResponseParserTest(unittest.TestCase):
+
+    def test_parses_body_of_known_length(self):
+        parser = async_engine._ResponseParser()
+
+        self.assertIsNone(parser.feed(b'HTTP/1.1 200 OK\r\nContent-Le'))
+        self.assertIsNone(parser.feed(b'ngth: 7\r\n\r\n{"a":'))
+        self.assertEqual(
+            async_engine._Response(200, b'{"a":1}'), parser.feed(b'1}'))
+        self.assertTrue(parser.keep_alive)
+
+    def test_parses_chunked_body_fed_byte_by_byte(self):
+        parser = async_engine._ResponseParser()
+        data = (b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+                b'4\r\n{"a"\r\nA;ext=1\r\n:123456789\r\n1\r\n}\r\n0\r\n\r\n')
+
+        responses = [parser.feed(data[i:i + 1]) for i in range(len(data))]
+
+        self.assertEqual([None] * (len(data) - 1), responses[:-1])
+        self.assertEqual(
+            async_engine._Response(200, b'{"a":123456789}'), responses[-1])
+
+    def test_parses_bodiless_status(self):
+        parser = async_engine._ResponseParser()
+
+        self.assertEqual(
+            async_engine._Response(304, b''),
+            parser.feed(b'HTTP/1.1 304 Not Modified\r\n\r\n'))
+
+    def test_connection_close_header_ends_keep_alive(self):
+        parser = async_engine._ResponseParser()
+
+        parser.feed(b'HTTP/1.1 200 OK\r\nConnection: close\r\n'
+                    b'Content-Length: 0\r\n\r\n')
+
+        self.assertFalse(parser.keep_alive)
+
+    def test_rejects_invalid_responses(self):
+        for data in (
+                b'HTTP/1.1 OK\r\n\r\n',
+                b'HTTP/1.1 200 OK\r\nContent-Length: lots\r\n\r\n',
+                b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+                b'zz\r\n',
+                b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+                b'1\r\n{}\r\n',
+        ):
+            with self.assertRaises(async_engine.ProtocolError):
+                async_engine._ResponseParser().feed(data)
+
+    def test_rejects_responses_siad_never_sends(self):
+        for data in (
+                b'HTTP/1.0 200 OK\r\nContent-Length: 2\r\n\r\n{}',
+                b'HTTP/1.1 100 Continue\r\n\r\n',
+                # A body that runs until the connection closes.
+                b'HTTP/1.1 200 OK\r\n\r\n{}',
+                b'HTTP/1.1 200 OK\r\nTransfer-Encoding: gzip, chunked\r\n'
+                b'\r\n',
+                b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+                b'0\r\nX-Trailer: 1\r\n\r\n',
+        ):
+            with self.assertRaises(async_engine.ProtocolError):
+                async_engine._ResponseParser().feed(data)
+
+
+@_requires_python3
+class AsyncClientTest(LoopTestCase):
+
+    def make_client(self, simulator, **connection_options):
+        client = async_engine.AsyncClient(
+            self.loop, 'http://127.0.0.1', simulator.port,
+            api.DEFAULT_CONNECTION_OPTIONS._replace(**connection_options))
+        self.addCleanup(self.run_loop_for, 0)
+        self.addCleanup(client.close)
+        return client
+
+    def get(self, client, path):
+        return self.loop.run_until_complete(client.get(path))
+
+    def test_returns_parsed_responses_and_their_sizes(self):
+        simulator = self.start_simulator(contract_count=8)
+        client = self.make_client(simulator)
+
+        response = self.get(client, '/renter/contracts')
+
+        self.assertEqual(6, len(response[u'activecontracts']))
+        self.assertEqual(
+            len(simulator.response_body('/renter/contracts')),
+            client.response_sizes['/renter/contracts'])
+        self.assertIn('/renter/contracts', client.decode_seconds)
+
+    def test_reads_chunked_responses_over_one_connection(self):
+        simulator = self.start_simulator(contract_count=20, file_count=100)
+        client = self.make_client(simulator)
+
+        for path in ('/renter/files', '/wallet', '/renter/contracts'):
+            self.assertEqual(
+                json.loads(simulator.response_body(path).decode('utf-8')),
+                self.get(client, path))
+            self.assertEqual(
+                len(simulator.response_body(path)), client.response_sizes[path])
+        self.assertEqual(1, client.connection_stats().new_connection_count)
+
+    def test_parses_responses_off_the_loop(self):
+        simulator = self.start_simulator()
+        client = self.make_client(simulator)
+        parse_threads = []
+        parse_body = client._parse_body
+
+        def record_thread(*args):
+            parse_threads.append(threading.current_thread())
+            return parse_body(*args)
+
+        client._parse_body = record_thread
+
+        self.get(client, '/wallet')
+
+        self.assertEqual(1, len(parse_threads))
+        self.assertIsNot(threading.current_thread(), parse_threads[0])
+
+    def test_returns_same_object_for_unchanged_response(self):
+        simulator = self.start_simulator()
+        client = self.make_client(simulator)
+
+        first = self.get(client, '/wallet')
+        second = self.get(client, '/wallet')
+        self.now += 3600
+        third = self.get(client, '/wallet')
+
+        self.assertIs(first, second)
+        self.assertIsNot(first, third)
+        self.assertEqual(
+            api.ConnectionStats(
+                request_count=3,
+                new_connection_count=1,
+                reused_connection_count=2), client.connection_stats())
+
+    def test_limits_open_connections_to_pool_size(self):
+        simulator = self.start_simulator(latency_fn=lambda rng: 0.01)
+        client = self.make_client(simulator, pool_size=2)
+
+        responses = self.loop.run_until_complete(
+            asyncio.gather(*[client.get('/renter') for _ in range(6)]))
+
+        self.assertEqual(6, len(responses))
+        self.assertEqual(
+            api.ConnectionStats(
+                request_count=6,
+                new_connection_count=2,
+                reused_connection_count=4), client.connection_stats())
+
+    def test_fails_when_read_times_out(self):
+        simulator = self.start_simulator(latency_fn=lambda rng: 0.5)
+        client = self.make_client(simulator, read_timeout=0.05)
+
+        with self.assertRaises(async_engine.ReadTimeoutError):
+            self.get(client, '/wallet')
+        self.assertNotIn('/wallet', client.response_sizes)
+        self.assertNotIn('/wallet', client.decode_seconds)
+
+    def test_fails_when_connection_is_refused(self):
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        port = listener.getsockname()[1]
+        listener.close()
+        client = async_engine.AsyncClient(self.loop, 'http://127.0.0.1', port)
+
+        with self.assertRaises(OSError):
+            self.get(client, '/wallet')
+
+    def test_sends_host_header_with_brackets_to_ipv6_host(self):
+        requests = []
+
+        class Server(asyncio.Protocol):
+
+            def connection_made(self, transport):
+                self.transport = transport
+
+            def data_received(self, data):
+                requests.append(data)
+                self.transport.write(b'HTTP/1.1 200 OK\r\n'
+                                     b'Content-Length: 2\r\n\r\n{}')
+
+        try:
+            server = self.loop.run_until_complete(
+                self.loop.create_server(Server, '::1', 0))
+        except OSError:
+            self.skipTest('IPv6 is not available')
+        self.addCleanup(server.close)
+        port = server.sockets[0].getsockname()[1]
+        client = async_engine.AsyncClient(self.loop, 'http://[::1]', port)
+        self.addCleanup(self.run_loop_for, 0)
+        self.addCleanup(client.close)
+
+        self.assertEqual({}, self.get(client, '/wallet'))
+        self.assertIn(('\r\nHost: [::1]:%d\r\n' % port).encode('ascii'),
+                      requests[0])
+
+    def test_fails_if_connection_closes_partway_through_body(self):
+
+        class Server(asyncio.Protocol):
+
+            def connection_made(self, transport):
+                self.transport = transport
+
+            def data_received(self, data):
+                self.transport.write(b'HTTP/1.1 200 OK\r\n'
+                                     b'Content-Length: 10\r\n\r\n{}')
+                self.transport.close()
+
+        server = self.loop.run_until_complete(
+            self.loop.create_server(Server, '127.0.0.1', 0))
+        self.addCleanup(server.close)
+        client = async_engine.AsyncClient(self.loop, 'http://127.0.0.1',
+                                          server.sockets[0].getsockname()[1])
+        self.addCleanup(self.run_loop_for, 0)
+        self.addCleanup(client.close)
+
+        with self.assertRaises(async_engine.ConnectionClosedError):
+            self.get(client, '/wallet')
+
+    def test_cancelling_request_closes_its_connection(self):
+        simulator = self.start_simulator(latency_fn=lambda rng: 0.1)
+        client = self.make_client(simulator, pool_size=1)
+
+        request = client.get('/wallet')
+        self.run_loop_for(0.02)
+        request.cancel()
+        response = self.get(client, '/wallet')
+
+        self.assertIn(u'confirmedsiacoinbalance', response)
+        self.assertEqual(2, client.connection_stats().new_connection_count)
+
+
+@_requires_python3
+class EngineTest(LoopTestCase):
+
+    def make_engine(self, simulators, **kwargs):
+        engine = async_engine.Engine(
+            self.loop, [
+                nodes.make_node('http://127.0.0.1',
+                                simulator.port)._replace(node_id='node-%d' % i)
+                for i, simulator in enumerate(simulators)
+            ],
+            **kwargs)
+        self.addCleanup(engine.close)
+        return engine
+
+    def poll(self, engine, query_groups=None):
+        return self.loop.run_until_complete(engine.poll(query_groups))
+
+    def test_polls_every_node(self):
+        engine = self.make_engine([
+            self.start_simulator(contract_count=4, file_count=10),
+            self.start_simulator(contract_count=8, file_count=20),
+        ])
+
+        states = self.poll(engine)
+
+        self.assertEqual(['node-0', 'node-1'], [s.node_id for s in states])
+        self.assertEqual([3, 6], [s.contract_count_active for s in states])
+        self.assertEqual([10, 20], [s.file_count for s in states])
+        for s in states:
+            self.assertGreater(s.wallet_siacoin_balance, 0)
+            self.assertIsNotNone(s.renter_allowance)
+            self.assertGreater(s.contract_response_bytes, 0)
+            self.assertGreaterEqual(s.api_latency, s.renter_query_latency)
+            self.assertLessEqual(s.file_query_start_time, s.timestamp)
+
+    def test_carries_forward_groups_that_are_not_due(self):
+        engine = self.make_engine([self.start_simulator(file_count=10)])
+        self.poll(engine)
+
+        sia_state = self.poll(engine, query_groups=['wallet'])[0]
+
+        self.assertEqual(10, sia_state.file_count)
+        self.assertIsNone(sia_state.file_query_latency)
+        self.assertIsNotNone(sia_state.wallet_query_latency)
+        self.assertGreater(sia_state.file_metrics_age, 0)
+
+    def test_leaves_metrics_of_failed_queries_unset(self):
+        engine = self.make_engine([self.start_simulator(error_rate=1.0)])
+
+        sia_state = self.poll(engine)[0]
+
+        self.assertIsNone(sia_state.contract_count_active)
+        self.assertIsNone(sia_state.wallet_siacoin_balance)
+        self.assertIsNotNone(sia_state.wallet_query_latency)
+
+    def test_builds_states_off_the_loop(self):
+        engine = self.make_engine([self.start_simulator()])
+        build_threads = []
+        build = engine.builders[0].build
+
+        def record_thread(*args, **kwargs):
+            build_threads.append(threading.current_thread())
+            return build(*args, **kwargs)
+
+        engine.builders[0].build = record_thread
+
+        self.poll(engine)
+
+        self.assertEqual(1, len(build_threads))
+        self.assertIsNot(threading.current_thread(), build_threads[0])
+
+    def test_hung_node_times_out_without_stalling_other_nodes(self):
+        engine = self.make_engine(
+            [
+                self.start_simulator(latency_fn=lambda rng: 1.0),
+                self.start_simulator(),
+            ],
+            query_timeout=0.1)
+
+        start_time = self.loop.time()
+        states = self.poll(engine)
+
+        self.assertLess(self.loop.time() - start_time, 0.5)
+        self.assertEqual(state.STATUS_LATE, states[0].wallet_status)
+        self.assertIsNone(states[0].wallet_siacoin_balance)
+        self.assertEqual(state.STATUS_OK, states[1].wallet_status)
+        self.assertGreater(states[1].wallet_siacoin_balance, 0)
+
+    def test_deadline_overrides_query_timeout(self):
+        engine = self.make_engine(
+            [self.start_simulator(latency_fn=lambda rng: 0.3)],
+            deadlines=state.DeadlineOptions(
+                query_deadlines={'wallet': 0.05},
+                sample_deadline=None,
+                late_policy=state.LATE_EMPTY),
+            query_timeout=5.0)
+
+        sia_state = self.poll(engine)[0]
+
+        self.assertEqual(state.STATUS_LATE, sia_state.wallet_status)
+        self.assertEqual(state.STATUS_OK, sia_state.renter_status)
+
+    def test_carries_forward_timed_out_group_if_policy_says_to(self):
+        latency = [0.0]
+        engine = self.make_engine(
+            [self.start_simulator(latency_fn=lambda rng: latency[0])],
+            deadlines=state.DeadlineOptions(
+                query_deadlines={},
+                sample_deadline=0.2,
+                late_policy=state.LATE_CARRY_FORWARD))
+        first_state = self.poll(engine)[0]
+        latency[0] = 1.0
+
+        sia_state = self.poll(engine)[0]
+
+        self.assertEqual(state.STATUS_LATE, sia_state.wallet_status)
+        self.assertEqual(first_state.wallet_siacoin_balance,
+                         sia_state.wallet_siacoin_balance)
+        self.assertIsNotNone(sia_state.wallet_metrics_age)
+
+    def test_close_cancels_queries_in_flight(self):
+        engine = self.make_engine(
+            [self.start_simulator(latency_fn=lambda rng: 0.5)])
+
+        polled = engine.poll()
+        self.run_loop_for(0.02)
+        engine.close()
+        sia_state = self.loop.run_until_complete(polled)[0]
+
+        self.assertIsNone(sia_state.wallet_siacoin_balance)
+
+
+@_requires_python3
+class AsyncSinkTest(LoopTestCase):
+
+    def setUp(self):
+        super(AsyncSinkTest, self).setUp()
+        self.handled = []
+        # Set to let the sink handle items.
+        self.unblocked = threading.Event()
+
+    def tearDown(self):
+        self.unblocked.set()
+
+    def handle(self, item):
+        self.unblocked.wait()
+        self.handled.append(item)
+
+    def make_sink(self, capacity, backpressure_policy=sink.BLOCK):
+        return async_engine.AsyncSink(self.loop, 'test', self.handle, capacity,
+                                      backpressure_policy)
+
+    def test_close_handles_items_in_order(self):
+        self.unblocked.set()
+        s = self.make_sink(capacity=2)
+
+        for item in range(10):
+            s.put(item)
+        s.close()
+
+        self.assertEqual(list(range(10)), self.handled)
+        self.assertEqual(10, s.stats().put_count)
+
+    def test_drop_newest_policy_drops_new_items(self):
+        s = self.make_sink(capacity=2, backpressure_policy=sink.DROP_NEWEST)
+
+        # The first item is taken off the queue to be handled.
+        for item in range(5):
+            s.put(item)
+        self.unblocked.set()
+        s.close()
+
+        self.assertEqual([0, 1, 2], self.handled)
+        self.assertEqual(2, s.stats().dropped_count)
+
+    def test_drop_oldest_policy_drops_old_items(self):
+        s = self.make_sink(capacity=2, backpressure_policy=sink.DROP_OLDEST)
+
+        for item in range(5):
+            s.put(item)
+        self.unblocked.set()
+        s.close()
+
+        self.assertEqual([0, 3, 4], self.handled)
+        self.assertEqual(2, s.stats().dropped_count)
+
+    def test_block_policy_has_room_once_an_item_is_handled(self):
+        s = self.make_sink(capacity=1)
+        for item in range(3):
+            s.put(item)
+
+        room = s.room()
+        self.run_loop_for(0.02)
+        self.assertFalse(room.done())
+        self.assertEqual(2, s.stats().depth)
+        self.unblocked.set()
+        self.loop.run_until_complete(room)
+        s.close()
+
+        self.assertEqual([0, 1, 2], self.handled)
+        self.assertEqual(0, s.stats().dropped_count)
+
+    def test_handles_items_on_one_thread_of_its_own(self):
+        self.unblocked.set()
+        thread_names = []
+        s = async_engine.AsyncSink(
+            self.loop, 'test',
+            lambda item: thread_names.append(threading.current_thread().name),
+            10)
+
+        for item in range(3):
+            s.put(item)
+        s.close()
+
+        self.assertEqual(3, len(thread_names))
+        self.assertEqual(1, len(set(thread_names)))
+        self.assertTrue(thread_names[0].startswith('sink-test'))
+        self.assertNotIn(thread_names[0],
+                         [thread.name for thread in threading.enumerate()])
+
+    def test_slow_sink_does_not_hold_up_other_sinks(self):
+        blocked_sink = self.make_sink(capacity=10)
+        other_handled = []
+        other_sink = async_engine.AsyncSink(self.loop, 'other',
+                                            other_handled.append, 10)
+
+        blocked_sink.put(0)
+        for item in range(3):
+            other_sink.put(item)
+        other_sink.close()
+        self.unblocked.set()
+        blocked_sink.close()
+
+        self.assertEqual([0, 1, 2], other_handled)
+        self.assertEqual([0], self.handled)
+
+    def test_logs_and_ignores_handler_errors(self):
+        s = async_engine.AsyncSink(self.loop, 'test', lambda item: 1 / item, 10)
+
+        with self.assertLogs('sia_metrics_collector.async_engine'):
+            s.put(0)
+            s.close()
+        s.put(1)
+        s.close()
+
+        self.assertEqual(0, s.stats().depth)
+
+
+@_requires_python3
+class PollForeverTest(LoopTestCase):
+
+    def start_polling(self, handle_poll_fn, sinks=()):
+        engine = async_engine.Engine(
+            self.loop,
+            [nodes.make_node('http://127.0.0.1',
+                             self.start_simulator().port)])
+        self.addCleanup(engine.close)
+        return async_engine.poll_forever(self.loop, engine,
+                                         scheduler.Scheduler(
+                                             0.05,
+                                             scheduler.CATCH_UP,
+                                             clock=self.loop.time),
+                                         cadence.Cadences({
+                                             'file': 0.1
+                                         }, 0.05), handle_poll_fn, list(sinks))
+
+    def test_polls_on_schedule_until_cancelled(self):
+        polls = []
+
+        def handle_poll(poll_index, tick, states):
+            polls.append((poll_index, tick.index, len(states),
+                          states[0].file_query_latency is not None))
+            if len(polls) == 4:
+                polling.cancel()
+
+        polling = self.start_polling(handle_poll)
+        with self.assertRaises(asyncio.CancelledError):
+            self.loop.run_until_complete(polling)
+
+        self.assertEqual([
+            (0, 0, 1, True),
+            (1, 1, 1, False),
+            (2, 2, 1, True),
+            (3, 3, 1, False),
+        ], polls)
+
+    def test_fails_if_handling_a_poll_fails(self):
+
+        def handle_poll(poll_index, tick, states):
+            raise ValueError('dummy handling error')
+
+        with self.assertRaises(ValueError):
+            self.loop.run_until_complete(self.start_polling(handle_poll))
+
+
+if __name__ == '__main__':
+    unittest.main()
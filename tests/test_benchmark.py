@@ -0,0 +1,180 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from sia_metrics_collector import benchmark
+from sia_metrics_collector import state
+
+
+def _result(seconds, peak_memory_bytes=0):
+    return {
+        'seconds': seconds,
+        'peak_memory_bytes': peak_memory_bytes,
+        'operations_per_second': 1.0 / seconds,
+    }
+
+
+class PayloadTest(unittest.TestCase):
+
+    def test_contracts_response_aggregates_like_a_real_one(self):
+        response = benchmark.make_contracts_response(100)
+        builder = state.Builder(
+            benchmark._FakeSiaApi(contracts_response=response), time_fn=None)
+        sia_state = state.SiaState()
+
+        self.assertTrue(builder._populate_contract_metrics(sia_state))
+        self.assertEqual(75, sia_state.contract_count_active)
+        self.assertEqual(25, sia_state.contract_count_inactive)
+        self.assertEqual(
+            sum(
+                int(c[u'totalcost']) for c in
+                response[u'activecontracts'] + response[u'inactivecontracts']),
+            sia_state.contract_total_spending)
+
+    def test_files_response_has_uploads_in_progress(self):
+        response = benchmark.make_files_response(1000)
+        builder = state.Builder(
+            benchmark._FakeSiaApi(files_response=response), time_fn=None)
+        sia_state = state.SiaState()
+
+        self.assertTrue(builder._populate_file_metrics(sia_state))
+        self.assertEqual(1000, sia_state.file_count)
+        self.assertGreater(sia_state.file_uploads_in_progress_count, 0)
+        self.assertLess(sia_state.file_uploads_in_progress_count, 1000)
+
+    def test_full_state_sets_every_field(self):
+        sia_state = benchmark.make_full_state()
+
+        for field in state.SiaState._fields:
+            self.assertIsNotNone(getattr(sia_state, field), field)
+
+
+class FindRegressionsTest(unittest.TestCase):
+
+    def test_allows_changes_within_tolerance(self):
+        self.assertEqual([],
+                         benchmark.find_regressions(
+                             {
+                                 'a/10': _result(1.2, 10 * 1024 * 1024),
+                                 'b': _result(0.5),
+                             }, {
+                                 'a/10': _result(1.0, 9 * 1024 * 1024),
+                                 'b': _result(1.0),
+                             },
+                             time_tolerance=0.25,
+                             memory_tolerance=0.25))
+
+    def test_reports_slower_cases(self):
+        self.assertEqual(['a/10: 1.300s per operation, baseline 1.000s'],
+                         benchmark.find_regressions(
+                             {
+                                 'a/10': _result(1.3)
+                             }, {'a/10': _result(1.0)},
+                             time_tolerance=0.25))
+
+    def test_reports_memory_growth_above_noise(self):
+        self.assertEqual([],
+                         benchmark.find_regressions(
+                             {
+                                 'a': _result(1.0, 1000 * 1000)
+                             }, {
+                                 'a': _result(1.0, 0)
+                             }))
+        self.assertEqual(['a: 4194304 bytes peak memory, baseline 2097152'],
+                         benchmark.find_regressions(
+                             {
+                                 'a': _result(1.0, 4 * 1024 * 1024)
+                             }, {'a': _result(1.0, 2 * 1024 * 1024)},
+                             memory_tolerance=0.5))
+
+    def test_skips_cases_missing_from_either_run(self):
+        self.assertEqual([],
+                         benchmark.find_regressions({
+                             'a': _result(9.0)
+                         }, {
+                             'b': _result(1.0)
+                         }))
+
+
+class FindOverBudgetTest(unittest.TestCase):
+
+    def test_allows_once_run_within_budget(self):
+        self.assertEqual([],
+                         benchmark.find_over_budget(
+                             {
+                                 'once_run': _result(0.5),
+                                 'b': _result(9.0),
+                             },
+                             once_budget=1.0))
+
+    def test_reports_once_run_over_budget(self):
+        self.assertEqual(['once_run: 1.500s per operation, budget 1.000s'],
+                         benchmark.find_over_budget(
+                             {
+                                 'once_run': _result(1.5)
+                             }, once_budget=1.0))
+
+    def test_skips_once_run_when_not_run(self):
+        self.assertEqual([], benchmark.find_over_budget({'b': _result(9.0)}))
+
+
+class FindBatchSumCrossoverTest(unittest.TestCase):
+
+    def make_results(self, batched_seconds, loop_seconds):
+        results = {}
+        for size, batched, loop in zip(benchmark.BATCH_SUM_SIZES,
+                                       batched_seconds, loop_seconds):
+            results['contract_sum_batched/%d' % size] = _result(batched)
+            results['contract_sum_loop/%d' % size] = _result(loop)
+        return results
+
+    def test_finds_size_from_which_batched_sums_stay_faster(self):
+        # Sizes are 1024, 2048, 4096, 8192, 16384, 32768.
+        self.assertEqual(
+            4096,
+            benchmark.find_batch_sum_crossover(
+                self.make_results([1.0, 2.0, 3.0, 4.0, 5.0, 6.0],
+                                  [2.0, 1.5, 4.0, 8.0, 16.0, 32.0])))
+
+    def test_returns_none_if_batched_sums_are_slower_at_largest_size(self):
+        self.assertIsNone(
+            benchmark.find_batch_sum_crossover(
+                self.make_results([1.0] * 6, [2.0] * 5 + [0.5])))
+
+    def test_returns_none_if_cases_were_not_run(self):
+        self.assertIsNone(
+            benchmark.find_batch_sum_crossover({
+                'once_run': _result(1.0)
+            }))
+
+
+class LoadBaselineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.baseline_path = os.path.join(self.temp_dir, 'baseline.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_reads_results(self):
+        with open(self.baseline_path, 'w') as baseline_file:
+            json.dump({
+                'python': '2.7.18',
+                'results': {
+                    'b': _result(1.0)
+                }
+            }, baseline_file)
+
+        self.assertEqual({
+            'b': _result(1.0)
+        }, benchmark.load_baseline(self.baseline_path))
+
+    def test_rejects_invalid_files(self):
+        for contents in ('not json', '[]', '{"python": "2.7.18"}'):
+            with open(self.baseline_path, 'w') as baseline_file:
+                baseline_file.write(contents)
+            with self.assertRaises(benchmark.InvalidBaselineError):
+                benchmark.load_baseline(self.baseline_path)
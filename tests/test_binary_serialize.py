@@ -0,0 +1,208 @@
+import datetime
+import io
+import math
+import os
+import shutil
+import tempfile
+import unittest
+
+from sia_metrics_collector import binary_serialize
+from sia_metrics_collector import state
+
+
+def _make_full_state():
+    return state.SiaState(
+        timestamp=datetime.datetime(2018, 2, 11, 16, 5, 2, 123456),
+        api_latency=5.0,
+        file_count=3,
+        file_total_bytes=4444.5,
+        file_uploads_in_progress_count=2,
+        file_uploaded_bytes=900,
+        contract_count_active=3,
+        contract_count_inactive=2,
+        contract_total_size=9,
+        contract_total_spending=65,
+        contract_fee_spending=25,
+        contract_storage_spending=2,
+        contract_upload_spending=35,
+        contract_download_spending=0,
+        contract_remaining_funds=500,
+        wallet_siacoin_balance=(1 << 100) + 7,
+        wallet_outgoing_siacoins=3,
+        wallet_incoming_siacoins=4,
+        renter_allowance=5000000000000000000000000000,
+        renter_contract_fees=10,
+        renter_total_allocated=11,
+        renter_contract_spending=12,
+        renter_download_spending=13,
+        renter_storage_spending=14,
+        renter_upload_spending=15,
+        renter_unspent=16,
+        contract_query_start_time=datetime.datetime(2018, 2, 11, 16, 5, 0),
+        contract_query_latency=1.5,
+        contract_response_bytes=100,
+        file_query_start_time=datetime.datetime(2018, 2, 11, 16, 5, 0, 500),
+        file_query_latency=2.5,
+        file_response_bytes=200,
+        wallet_query_start_time=datetime.datetime(2018, 2, 11, 16, 5, 1),
+        wallet_query_latency=3.5,
+        wallet_response_bytes=300,
+        renter_query_start_time=datetime.datetime(2018, 2, 11, 16, 5, 1, 9),
+        renter_query_latency=4.5,
+        renter_response_bytes=400,
+        node_id=u'node-a',
+        contract_metrics_age=0.0,
+        file_metrics_age=60.0,
+        wallet_metrics_age=0.0,
+        renter_metrics_age=0.0,
+        poll_lateness=0.25)
+
+
+class BinarySerializerTest(unittest.TestCase):
+
+    def test_writes_header_to_empty_file(self):
+        mock_file = io.BytesIO()
+
+        binary_serialize.BinarySerializer(mock_file)
+
+        header = mock_file.getvalue()
+        self.assertEqual(b'SIAMETRC', header[:8])
+        self.assertEqual(0, len(header) % 64)
+        self.assertEqual(binary_serialize.current_schema(),
+                         binary_serialize.read_schema(mock_file))
+
+    def test_record_size_is_fixed(self):
+        mock_file = io.BytesIO()
+        serializer = binary_serialize.BinarySerializer(mock_file)
+        schema = binary_serialize.current_schema()
+
+        serializer.write_state(_make_full_state())
+        serializer.write_state(state.SiaState())
+
+        self.assertEqual(schema.header_size + 2 * schema.record_size,
+                         len(mock_file.getvalue()))
+
+    def test_round_trips_state(self):
+        mock_file = io.BytesIO()
+        serializer = binary_serialize.BinarySerializer(mock_file)
+        original = _make_full_state()
+
+        serializer.write_state(original)
+
+        states = list(binary_serialize.read_states(mock_file))
+        self.assertEqual(1, len(states))
+        self.assertEqual(original.as_dict(), states[0].as_dict())
+
+    def test_round_trips_missing_fields_as_none(self):
+        mock_file = io.BytesIO()
+        serializer = binary_serialize.BinarySerializer(mock_file)
+
+        serializer.write_state(
+            state.SiaState(
+                timestamp=datetime.datetime(2018, 2, 11, 16, 5, 2),
+                api_latency=5.0))
+
+        states = list(binary_serialize.read_states(mock_file))
+        self.assertEqual(
+            state.SiaState(
+                timestamp=datetime.datetime(2018, 2, 11, 16, 5, 2),
+                api_latency=5.0).as_dict(), states[0].as_dict())
+
+    def test_rejects_hastings_too_large_for_128_bits(self):
+        serializer = binary_serialize.BinarySerializer(io.BytesIO())
+
+        with self.assertRaises(ValueError):
+            serializer.write_state(
+                state.SiaState(wallet_siacoin_balance=1 << 128))
+
+    def test_appends_to_existing_file(self):
+        mock_file = io.BytesIO()
+        binary_serialize.BinarySerializer(mock_file).write_state(
+            _make_full_state())
+
+        binary_serialize.BinarySerializer(mock_file).write_state(
+            state.SiaState(api_latency=6.0))
+
+        states = list(binary_serialize.read_states(mock_file))
+        self.assertEqual(2, len(states))
+        self.assertEqual(5.0, states[0].api_latency)
+        self.assertEqual(6.0, states[1].api_latency)
+
+    def test_truncates_partial_record_in_existing_file(self):
+        mock_file = io.BytesIO()
+        binary_serialize.BinarySerializer(mock_file).write_state(
+            _make_full_state())
+        mock_file.write(b'\x01\x02\x03')
+
+        binary_serialize.BinarySerializer(mock_file).write_state(
+            state.SiaState(api_latency=6.0))
+
+        states = list(binary_serialize.read_states(mock_file))
+        self.assertEqual([5.0, 6.0], [s.api_latency for s in states])
+
+    def test_rejects_existing_file_that_is_not_binary_metrics(self):
+        mock_file = io.BytesIO(b'timestamp,api_latency\n')
+
+        with self.assertRaises(binary_serialize.InvalidFileError):
+            binary_serialize.BinarySerializer(mock_file)
+
+    def test_rejects_existing_file_with_different_fields(self):
+        schema = binary_serialize.Schema([
+            binary_serialize.FieldDescriptor(
+                name='timestamp', kind=state.TIMESTAMP, width=8)
+        ])
+        mock_file = io.BytesIO(schema.encode_header())
+
+        with self.assertRaises(binary_serialize.SchemaMismatchError):
+            binary_serialize.BinarySerializer(mock_file)
+
+
+class LoadRecordsTest(unittest.TestCase):
+
+    def setUp(self):
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest('NumPy is not installed')
+        self.numpy = numpy
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'metrics.bin')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _write_states(self, states):
+        with open(self.path, 'w+b') as binary_file:
+            serializer = binary_serialize.BinarySerializer(binary_file)
+            for s in states:
+                serializer.write_state(s)
+
+    def test_maps_records_as_structured_array(self):
+        self._write_states([_make_full_state(), state.SiaState()])
+
+        records = binary_serialize.load_records(self.path)
+
+        self.assertEqual(2, len(records))
+        self.assertEqual(
+            self.numpy.datetime64('2018-02-11T16:05:02.123456'),
+            records['timestamp'][0])
+        self.assertEqual(5.0, records['api_latency'][0])
+        self.assertEqual(3, records['file_count'][0])
+        self.assertEqual(b'node-a', records['node_id'][0])
+        self.assertEqual((1 << 100) + 7,
+                         binary_serialize.hastings_to_long(
+                             records['wallet_siacoin_balance'][0]))
+        self.assertTrue(self.numpy.isnat(records['timestamp'][1]))
+        self.assertTrue(math.isnan(records['api_latency'][1]))
+
+    def test_ignores_partial_record(self):
+        self._write_states([_make_full_state()])
+        with open(self.path, 'ab') as binary_file:
+            binary_file.write(b'\x01\x02\x03')
+
+        self.assertEqual(1, len(binary_serialize.load_records(self.path)))
+
+    def test_maps_empty_file(self):
+        self._write_states([])
+
+        self.assertEqual(0, len(binary_serialize.load_records(self.path)))
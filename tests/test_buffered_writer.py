@@ -0,0 +1,202 @@
+import io
+import threading
+import time
+import unittest
+
+import mock
+
+from sia_metrics_collector import buffered_writer
+
+# In-memory file of native strings, like a file opened in text mode.
+_TextIO = io.BytesIO if str is bytes else io.StringIO
+
+
+class GroupCommitWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_file = mock.Mock(spec=io.BytesIO)
+        self.mock_file.fileno.return_value = 42
+        self.mock_clock = mock.Mock(return_value=0.0)
+        fsync_patch = mock.patch('os.fsync')
+        self.addCleanup(fsync_patch.stop)
+        self.mock_fsync = fsync_patch.start()
+
+    def make_writer(self,
+                    flush_rows=None,
+                    flush_seconds=None,
+                    fsync_seconds=None):
+        return buffered_writer.GroupCommitWriter(
+            self.mock_file,
+            buffered_writer.FlushPolicy(
+                flush_rows=flush_rows,
+                flush_seconds=flush_seconds,
+                fsync_seconds=fsync_seconds),
+            clock=self.mock_clock)
+
+    def test_default_policy_flushes_every_row(self):
+        writer = buffered_writer.GroupCommitWriter(self.mock_file)
+
+        writer.write('a,')
+        writer.write('b\n')
+        writer.end_row()
+
+        self.mock_file.write.assert_called_once_with('a,b\n')
+        self.mock_file.flush.assert_called_once()
+        self.mock_fsync.assert_not_called()
+
+    def test_flushes_once_row_count_is_reached(self):
+        writer = self.make_writer(flush_rows=3)
+
+        for row in ('a\n', 'b\n'):
+            writer.write(row)
+            writer.end_row()
+        self.mock_file.write.assert_not_called()
+
+        writer.write('c\n')
+        writer.end_row()
+        self.mock_file.write.assert_called_once_with('a\nb\nc\n')
+        self.mock_file.flush.assert_called_once()
+
+    def test_flushes_once_oldest_row_is_old_enough(self):
+        writer = self.make_writer(flush_seconds=10.0)
+
+        self.mock_clock.return_value = 100.0
+        writer.write('a\n')
+        writer.end_row()
+        self.mock_clock.return_value = 109.0
+        writer.write('b\n')
+        writer.end_row()
+        self.mock_file.write.assert_not_called()
+
+        self.mock_clock.return_value = 110.0
+        writer.write('c\n')
+        writer.end_row()
+        self.mock_file.write.assert_called_once_with('a\nb\nc\n')
+
+    def test_flush_if_due_flushes_once_oldest_row_is_old_enough(self):
+        writer = self.make_writer(flush_seconds=10.0)
+        writer.flush_if_due()
+        self.mock_clock.return_value = 100.0
+        writer.write('a\n')
+        writer.end_row()
+
+        self.mock_clock.return_value = 109.0
+        writer.flush_if_due()
+        self.mock_file.flush.assert_not_called()
+
+        self.mock_clock.return_value = 110.0
+        writer.flush_if_due()
+        self.mock_file.write.assert_called_once_with('a\n')
+        self.assertEqual(1, writer.stats().flush_count)
+
+    def test_flush_writes_buffered_rows(self):
+        writer = self.make_writer(flush_rows=100)
+        writer.write('a\n')
+        writer.end_row()
+
+        writer.flush()
+
+        self.mock_file.write.assert_called_once_with('a\n')
+        self.mock_file.flush.assert_called_once()
+
+    def test_fsyncs_every_flush_when_fsync_seconds_is_zero(self):
+        writer = self.make_writer(flush_rows=1, fsync_seconds=0)
+
+        writer.write('a\n')
+        writer.end_row()
+        writer.write('b\n')
+        writer.end_row()
+
+        self.mock_fsync.assert_has_calls([mock.call(42), mock.call(42)])
+
+    def test_fsyncs_at_most_once_per_fsync_interval(self):
+        writer = self.make_writer(flush_rows=1, fsync_seconds=30.0)
+
+        for now in (0.0, 29.0, 30.0, 31.0):
+            self.mock_clock.return_value = now
+            writer.write('a\n')
+            writer.end_row()
+
+        self.assertEqual(2, self.mock_fsync.call_count)
+        self.assertEqual(4, writer.stats().flush_count)
+        self.assertEqual(2, writer.stats().fsync_count)
+
+    def test_stats_count_buffered_data_and_flush_latency(self):
+        writer = self.make_writer(flush_rows=100)
+        writer.write('abc\n')
+        writer.end_row()
+        writer.write('de\n')
+        writer.end_row()
+
+        self.assertEqual(
+            buffered_writer.WriterStats(
+                bytes_buffered=7,
+                rows_buffered=2,
+                flush_count=0,
+                fsync_count=0,
+                total_flush_latency=0.0,
+                max_flush_latency=0.0), writer.stats())
+
+        self.mock_clock.side_effect = [10.0, 10.5, 20.0, 20.25]
+        writer.flush()
+        writer.flush()
+
+        self.assertEqual(
+            buffered_writer.WriterStats(
+                bytes_buffered=0,
+                rows_buffered=0,
+                flush_count=2,
+                fsync_count=0,
+                total_flush_latency=0.75,
+                max_flush_latency=0.5), writer.stats())
+
+
+class _FakeOutput(object):
+
+    def __init__(self):
+        self.flush_checks = 0
+        self.checked = threading.Event()
+
+    def flush_if_due(self):
+        self.flush_checks += 1
+        self.checked.set()
+
+
+class FlushTimerTest(unittest.TestCase):
+
+    def test_checks_every_output_until_closed(self):
+        outputs = [_FakeOutput(), _FakeOutput()]
+        timer = buffered_writer.FlushTimer(outputs, interval=0.01)
+
+        for output in outputs:
+            self.assertTrue(output.checked.wait(5))
+        timer.close()
+        flush_checks = [output.flush_checks for output in outputs]
+        time.sleep(0.05)
+
+        self.assertEqual(flush_checks,
+                         [output.flush_checks for output in outputs])
+
+    def test_logs_and_ignores_failed_checks(self):
+        failing_output = mock.Mock()
+        failing_output.flush_if_due.side_effect = IOError('dummy error')
+        output = _FakeOutput()
+        with mock.patch.object(buffered_writer.logger, 'exception'):
+            timer = buffered_writer.FlushTimer(
+                [failing_output, output], interval=0.01)
+            self.addCleanup(timer.close)
+
+            self.assertTrue(output.checked.wait(5))
+
+    def test_locked_function_excludes_checks(self):
+        output = _FakeOutput()
+        timer = buffered_writer.FlushTimer([output], interval=0.01)
+        self.addCleanup(timer.close)
+
+        def check_count_while_locked():
+            flush_checks = output.flush_checks
+            output.checked.wait(0.1)
+            return output.flush_checks - flush_checks
+
+        output.checked.clear()
+        self.assertEqual(0, timer.locked(output, check_count_while_locked)())
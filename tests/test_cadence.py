@@ -0,0 +1,57 @@
+import unittest
+
+from sia_metrics_collector import cadence
+
+
+class CadencesTest(unittest.TestCase):
+
+    def test_refreshes_every_group_on_every_poll_by_default(self):
+        cadences = cadence.Cadences({}, poll_frequency=10)
+
+        for poll_index in range(3):
+            self.assertEqual(['contract', 'file', 'wallet', 'renter'],
+                             cadences.due_groups(poll_index))
+
+    def test_refreshes_groups_at_their_own_cadence(self):
+        cadences = cadence.Cadences(
+            {
+                'contract': 60,
+                'file': 300,
+                'wallet': 10
+            }, poll_frequency=10)
+
+        self.assertEqual(['contract', 'file', 'wallet', 'renter'],
+                         cadences.due_groups(0))
+        self.assertEqual(['wallet', 'renter'], cadences.due_groups(1))
+        self.assertEqual(['contract', 'wallet', 'renter'],
+                         cadences.due_groups(6))
+        self.assertEqual(['contract', 'file', 'wallet', 'renter'],
+                         cadences.due_groups(30))
+
+    def test_refreshes_group_on_next_poll_after_its_slot_is_missed(self):
+        cadences = cadence.Cadences({'file': 60}, poll_frequency=10)
+
+        self.assertIn('file', cadences.due_groups(0))
+        self.assertNotIn('file', cadences.due_groups(5))
+        # Poll 6 was missed.
+        self.assertIn('file', cadences.due_groups(7))
+        self.assertNotIn('file', cadences.due_groups(12))
+        self.assertIn('file', cadences.due_groups(13))
+
+    def test_refreshes_group_whose_slots_are_always_missed(self):
+        cadences = cadence.Cadences({'file': 20}, poll_frequency=10)
+
+        # Only odd slots are polled, so the file group's slots, on multiples
+        # of two polls, are never polled.
+        due_polls = [
+            poll_index for poll_index in range(1, 10, 2)
+            if 'file' in cadences.due_groups(poll_index)
+        ]
+
+        self.assertEqual([1, 3, 5, 7, 9], due_polls)
+
+    def test_refreshes_at_least_once_per_poll(self):
+        cadences = cadence.Cadences({'wallet': 1}, poll_frequency=10)
+
+        for poll_index in range(3):
+            self.assertIn('wallet', cadences.due_groups(poll_index))
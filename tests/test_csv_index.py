@@ -0,0 +1,170 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from sia_metrics_collector import csv_index
+from sia_metrics_collector import serialize
+from sia_metrics_collector import state
+
+
+def _make_state(minute, node_id='renter-1'):
+    return state.SiaState(
+        timestamp=datetime.datetime(2018, 2, 11, 16, minute, 0),
+        api_latency=float(minute),
+        node_id=node_id)
+
+
+class CsvIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.temp_dir, 'metrics.csv')
+        self.index_path = self.csv_path + '.idx'
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write_states(self, states, mode='w'):
+        with open(self.csv_path, mode) as csv_file:
+            serializer = serialize.CsvSerializer(csv_file)
+            for sia_state in states:
+                serializer.write_state(sia_state)
+
+    def read_index_entries(self):
+        with open(self.index_path) as index_file:
+            return [line.split(' ')[0] for line in index_file.readlines()[2:]]
+
+    def test_indexes_every_interval_rows(self):
+        self.write_states([_make_state(minute) for minute in range(5)])
+
+        csv_index.CsvIndex(self.csv_path, interval=2).update()
+
+        self.assertEqual([
+            '2018-02-11T16:00:00', '2018-02-11T16:02:00', '2018-02-11T16:04:00'
+        ], self.read_index_entries())
+
+    def test_appends_entries_for_new_rows(self):
+        self.write_states([_make_state(minute) for minute in range(3)])
+        csv_index.CsvIndex(self.csv_path, interval=2).update()
+
+        self.write_states(
+            [_make_state(minute) for minute in range(3, 7)], mode='r+')
+        csv_index.CsvIndex(self.csv_path, interval=2).update()
+
+        self.assertEqual([
+            '2018-02-11T16:00:00', '2018-02-11T16:02:00', '2018-02-11T16:04:00',
+            '2018-02-11T16:06:00'
+        ], self.read_index_entries())
+
+    def test_rebuilds_index_for_replaced_file(self):
+        self.write_states([_make_state(minute) for minute in range(3)])
+        csv_index.CsvIndex(self.csv_path, interval=2).update()
+
+        self.write_states([_make_state(minute) for minute in range(10, 13)])
+        csv_index.CsvIndex(self.csv_path, interval=2).update()
+
+        self.assertEqual(['2018-02-11T16:10:00', '2018-02-11T16:12:00'],
+                         self.read_index_entries())
+
+    def test_rebuilds_damaged_index(self):
+        self.write_states([_make_state(minute) for minute in range(3)])
+        csv_index.CsvIndex(self.csv_path, interval=2).update()
+        with open(self.index_path, 'a') as index_file:
+            index_file.write('2018-02-11T16:0')
+
+        csv_index.CsvIndex(self.csv_path, interval=2).update()
+
+        self.assertEqual(['2018-02-11T16:00:00', '2018-02-11T16:02:00'],
+                         self.read_index_entries())
+
+    def test_ignores_partially_written_row(self):
+        self.write_states([_make_state(minute) for minute in range(2)])
+        with open(self.csv_path, 'a') as csv_file:
+            csv_file.write('2018-02-11T16:02:00,2.0')
+
+        index = csv_index.CsvIndex(self.csv_path, interval=1)
+        index.update()
+        _, rows = index.read_rows(fields=['timestamp'])
+
+        self.assertEqual(['2018-02-11T16:00:00', '2018-02-11T16:01:00'],
+                         self.read_index_entries())
+        self.assertEqual([['2018-02-11T16:00:00'], ['2018-02-11T16:01:00']],
+                         list(rows))
+
+    def test_reads_time_range(self):
+        self.write_states([_make_state(minute) for minute in range(10)])
+        index = csv_index.CsvIndex(self.csv_path, interval=3)
+        index.update()
+
+        fieldnames, rows = index.read_rows(
+            fields=['timestamp', 'api_latency'],
+            start='2018-02-11T16:04',
+            end='2018-02-11T16:07')
+
+        self.assertEqual(['timestamp', 'api_latency'], fieldnames)
+        self.assertEqual([
+            ['2018-02-11T16:04:00', '4.0'],
+            ['2018-02-11T16:05:00', '5.0'],
+            ['2018-02-11T16:06:00', '6.0'],
+        ], list(rows))
+
+    def test_reads_rows_written_after_update(self):
+        self.write_states([_make_state(minute) for minute in range(2)])
+        index = csv_index.CsvIndex(self.csv_path, interval=1)
+        index.update()
+        self.write_states(
+            [_make_state(minute) for minute in range(2, 4)], mode='r+')
+
+        _, rows = index.read_rows(fields=['api_latency'], start='2018-02-11')
+
+        self.assertEqual([['0.0'], ['1.0'], ['2.0'], ['3.0']], list(rows))
+
+    def test_reads_all_fields_by_default(self):
+        self.write_states([_make_state(0)])
+        index = csv_index.CsvIndex(self.csv_path)
+
+        fieldnames, rows = index.read_rows()
+        rows = list(rows)
+
+        self.assertEqual('timestamp', fieldnames[0])
+        self.assertEqual(1, len(rows))
+        self.assertEqual(len(fieldnames), len(rows[0]))
+        self.assertEqual('renter-1', rows[0][fieldnames.index('node_id')])
+
+    def test_filters_by_node_id(self):
+        self.write_states([
+            _make_state(0, node_id='renter-1'),
+            _make_state(0, node_id='renter-2'),
+            _make_state(1, node_id='renter-1'),
+        ])
+        index = csv_index.CsvIndex(self.csv_path)
+
+        _, rows = index.read_rows(
+            fields=['timestamp', 'node_id'], node_id='renter-1')
+
+        self.assertEqual([['2018-02-11T16:00:00', 'renter-1'],
+                          ['2018-02-11T16:01:00', 'renter-1']], list(rows))
+
+    def test_reads_quoted_values(self):
+        self.write_states([_make_state(0, node_id='renter,1')])
+        index = csv_index.CsvIndex(self.csv_path)
+
+        _, rows = index.read_rows(fields=['node_id'], node_id='renter,1')
+
+        self.assertEqual([['renter,1']], list(rows))
+
+    def test_rejects_unknown_field(self):
+        self.write_states([_make_state(0)])
+        index = csv_index.CsvIndex(self.csv_path)
+
+        with self.assertRaises(csv_index.UnknownFieldError):
+            index.read_rows(fields=['timestamp', 'dummy_field'])
+
+    def test_rejects_file_without_leading_timestamp_column(self):
+        with open(self.csv_path, 'w') as csv_file:
+            csv_file.write('node_id,timestamp\n')
+
+        with self.assertRaises(csv_index.InvalidFileError):
+            csv_index.CsvIndex(self.csv_path).update()
@@ -0,0 +1,17 @@
+import unittest
+
+from sia_metrics_collector import group_spec
+
+
+class ParseGroupSpecTest(unittest.TestCase):
+
+    def test_parses_valid_specs(self):
+        self.assertEqual(('file', 300.0),
+                         group_spec.parse_group_spec('file=300'))
+        self.assertEqual(('wallet', 2.5),
+                         group_spec.parse_group_spec(' wallet = 2.5 '))
+
+    def test_rejects_invalid_specs(self):
+        for spec in ('file', 'blocks=10', 'file=soon', 'file=0', 'file=-1'):
+            with self.assertRaises(group_spec.InvalidGroupSpecError):
+                group_spec.parse_group_spec(spec)
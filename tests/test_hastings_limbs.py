@@ -0,0 +1,109 @@
+import unittest
+
+import mock
+import numpy
+
+from sia_metrics_collector import hastings_limbs
+
+
+class HastingsLimbsTest(unittest.TestCase):
+
+    def test_parses_decimal_strings(self):
+        values = [0, 1, 2**32, 10**30 + 7, 2**128 - 1]
+
+        limbs = hastings_limbs.from_decimal_strings([str(v) for v in values])
+
+        self.assertEqual((5, hastings_limbs.LIMB_COUNT), limbs.shape)
+        self.assertEqual(values, hastings_limbs.to_longs(limbs))
+
+    def test_parses_unicode_strings(self):
+        limbs = hastings_limbs.from_decimal_strings([u'123', u'45'])
+
+        self.assertEqual([123, 45], hastings_limbs.to_longs(limbs))
+
+    def test_parses_empty_sequence(self):
+        self.assertEqual((0, hastings_limbs.LIMB_COUNT),
+                         hastings_limbs.from_decimal_strings([]).shape)
+
+    def test_rejects_invalid_strings(self):
+        for invalid in ['', '12a', '-5', str(2**128), '1' * 41]:
+            with self.assertRaises(ValueError):
+                hastings_limbs.from_decimal_strings(['1', invalid])
+
+    def test_sums_decimal_strings_exactly(self):
+        values = [0, 7, 10**24 + 3, 2**200, 999, 10**50 - 1]
+
+        self.assertEqual(
+            sum(values),
+            hastings_limbs.sum_decimal_strings([str(v) for v in values]))
+
+    def test_sums_bytes_unicode_and_arrays_alike(self):
+        values = [0, 7, 10**24 + 3, 2**200, 999, 10**50 - 1]
+        strings = [u'%d' % v for v in values]
+
+        for sequence in (strings, [s.encode('ascii') for s in strings],
+                         numpy.array(strings),
+                         numpy.array(strings, dtype=numpy.bytes_)):
+            self.assertEqual(
+                sum(values), hastings_limbs.sum_decimal_strings(sequence))
+
+    def test_sums_decimal_strings_across_blocks(self):
+        values = [10**(i % 30) + i for i in range(1000)]
+
+        with mock.patch.object(hastings_limbs, '_SUM_BLOCK_SIZE', 7):
+            total = hastings_limbs.sum_decimal_strings(
+                [u'%d' % v for v in values])
+
+        self.assertEqual(sum(values), total)
+
+    def test_sums_integers(self):
+        self.assertEqual(10**30 + 22,
+                         hastings_limbs.sum_decimal_strings([22,
+                                                             str(10**30)]))
+
+    def test_sums_empty_sequence(self):
+        self.assertEqual(0, hastings_limbs.sum_decimal_strings([]))
+
+    def test_sum_rejects_invalid_strings(self):
+        for invalid in [
+                '', ' 1', '12a', '-5', '+5', '1.5', '1\x002', u'1\u0663', None,
+                True
+        ]:
+            with self.assertRaises(ValueError):
+                hastings_limbs.sum_decimal_strings(['1', invalid])
+
+    def test_converts_lo_hi_halves(self):
+        limbs = hastings_limbs.from_lo_hi(
+            numpy.array([5, 2**64 - 1], dtype=numpy.uint64),
+            numpy.array([7, 2**64 - 1], dtype=numpy.uint64))
+
+        self.assertEqual([(7 << 64) + 5, 2**128 - 1],
+                         hastings_limbs.to_longs(limbs))
+
+    def test_subtracts_exactly(self):
+        a = hastings_limbs.from_longs([10**30 + 1, 2**96, 5])
+        b = hastings_limbs.from_longs([10**30, 1, 2**100])
+
+        difference = hastings_limbs.subtract(a, b)
+
+        self.assertEqual([1, 2**96 - 1, 5 - 2**100],
+                         hastings_limbs.to_longs(difference))
+        self.assertEqual([False, False, True],
+                         list(hastings_limbs.is_negative(difference)))
+
+    def test_sums_groups_exactly(self):
+        limbs = hastings_limbs.from_longs(
+            [10**30, 1, 2**128 - 1, 2**128 - 1, 3])
+
+        sums = hastings_limbs.sum_groups(limbs, numpy.array([0, 2, 4]))
+
+        self.assertEqual([10**30 + 1, 2**129 - 2, 3],
+                         hastings_limbs.to_longs(sums))
+
+    def test_converts_to_float(self):
+        limbs = hastings_limbs.subtract(
+            hastings_limbs.from_longs([0, 10**30, 3]),
+            hastings_limbs.from_longs([1, 0, 0]))
+
+        self.assertEqual([-1.0, 1e30, 3.0], list(
+            hastings_limbs.to_float(limbs)))
@@ -0,0 +1,148 @@
+import datetime
+import unittest
+
+import numpy
+
+from sia_metrics_collector import hastings_limbs
+from sia_metrics_collector import history_buffer
+from sia_metrics_collector import rates
+from sia_metrics_collector import state
+
+
+def _make_state(seconds, **kwargs):
+    return state.SiaState(
+        timestamp=datetime.datetime(2018, 2, 11, 16, 0, 0) +
+        datetime.timedelta(seconds=seconds),
+        node_id='renter-1',
+        **kwargs)
+
+
+def _timestamp(seconds):
+    return numpy.datetime64('2018-02-11T16:00:00', 'us') + numpy.timedelta64(
+        seconds, 's')
+
+
+class HistoryBufferTest(unittest.TestCase):
+
+    def test_bytes_per_sample(self):
+        self.assertEqual(488, history_buffer.bytes_per_sample())
+        self.assertEqual(
+            8 + 8 + 8 + 16,
+            history_buffer.bytes_per_sample(
+                ['timestamp', 'api_latency', 'wallet_siacoin_balance']))
+
+    def test_allocates_memory_up_front(self):
+        buf = history_buffer.HistoryBuffer(
+            100, fields=['timestamp', 'api_latency'], slack=0.5)
+
+        self.assertEqual(150 * (8 + 8 + 8), buf.nbytes())
+
+    def test_stores_values_of_each_kind(self):
+        buf = history_buffer.HistoryBuffer(10)
+        buf.append(
+            _make_state(
+                0,
+                api_latency=5.5,
+                file_count=3,
+                wallet_siacoin_balance=2**100 + 7,
+                renter_allowance='1000',
+                contract_query_start_time=datetime.datetime(
+                    2018, 2, 11, 15, 59, 59, 123000)))
+
+        window = buf.last(1)
+
+        self.assertEqual([_timestamp(0)], list(window.timestamps))
+        self.assertEqual([5.5], list(window.values('api_latency')))
+        self.assertEqual([3], list(window.values('file_count')))
+        self.assertEqual([2**100 + 7, 1000],
+                         [(int(v['hi']) << 64) | int(v['lo'])
+                          for v in (window.values('wallet_siacoin_balance')[0],
+                                    window.values('renter_allowance')[0])])
+        self.assertEqual([numpy.datetime64('2018-02-11T15:59:59.123000')],
+                         list(window.values('contract_query_start_time')))
+
+    def test_tracks_missing_values(self):
+        buf = history_buffer.HistoryBuffer(10)
+        buf.append(_make_state(0, api_latency=1.0, file_count=0))
+        buf.append(_make_state(1))
+
+        window = buf.last(2)
+
+        self.assertEqual([True, False], list(window.present('api_latency')))
+        self.assertEqual([True, False], list(window.present('file_count')))
+        self.assertEqual([False, False],
+                         list(window.present('wallet_siacoin_balance')))
+        self.assertTrue(numpy.isnan(window.values('api_latency')[1]))
+        self.assertTrue(
+            numpy.isnat(window.values('contract_query_start_time')[0]))
+
+    def test_discards_oldest_samples_once_full(self):
+        buf = history_buffer.HistoryBuffer(
+            3, fields=['timestamp', 'file_count'], slack=0)
+
+        for i in range(10):
+            buf.append(_make_state(i, file_count=i))
+
+        self.assertEqual(3, len(buf))
+        self.assertEqual([7, 8, 9], list(buf.last(5).values('file_count')))
+        self.assertEqual([8, 9], list(buf.last(2).values('file_count')))
+
+    def test_returns_views_without_copying(self):
+        buf = history_buffer.HistoryBuffer(
+            4, fields=['timestamp', 'file_count'])
+        for i in range(3):
+            buf.append(_make_state(i, file_count=i))
+
+        first = buf.last(3).values('file_count')
+        second = buf.last(2).values('file_count')
+
+        self.assertTrue(numpy.shares_memory(first, second))
+        self.assertFalse(first.flags.owndata)
+
+    def test_slices_by_time(self):
+        buf = history_buffer.HistoryBuffer(
+            100, fields=['timestamp', 'file_count'], slack=0.1)
+        for i in range(250):
+            buf.append(_make_state(i, file_count=i))
+
+        window = buf.between(
+            datetime.datetime(2018, 2, 11, 16, 3, 0),
+            datetime.datetime(2018, 2, 11, 16, 3, 5))
+
+        self.assertEqual([180, 181, 182, 183, 184],
+                         list(window.values('file_count')))
+        self.assertEqual(0,
+                         len(
+                             buf.between(
+                                 datetime.datetime(2018, 2, 11, 16, 0, 0),
+                                 datetime.datetime(2018, 2, 11, 16, 2, 0))))
+
+    def test_rejects_out_of_order_samples(self):
+        buf = history_buffer.HistoryBuffer(10)
+        buf.append(_make_state(5))
+
+        with self.assertRaises(ValueError):
+            buf.append(_make_state(4))
+        with self.assertRaises(ValueError):
+            buf.append(state.SiaState())
+
+    def test_rejects_invalid_fields(self):
+        with self.assertRaises(ValueError):
+            history_buffer.HistoryBuffer(10, fields=['api_latency'])
+        with self.assertRaises(ValueError):
+            history_buffer.HistoryBuffer(10, fields=['timestamp', 'node_id'])
+
+    def test_converts_to_history_for_rates(self):
+        buf = history_buffer.HistoryBuffer(10)
+        buf.append(_make_state(0, wallet_siacoin_balance=10**30))
+        buf.append(_make_state(10, wallet_siacoin_balance=10**30 + 50))
+
+        history = buf.last(2).to_history(['wallet_siacoin_balance'])
+        _, balance_rates = rates.rates(history, 'wallet_siacoin_balance')
+
+        self.assertEqual([10**30, 10**30 + 50],
+                         hastings_limbs.to_longs(
+                             history.columns['wallet_siacoin_balance'].values))
+        self.assertEqual([5.0], list(balance_rates))
+        with self.assertRaises(rates.UnsupportedFieldError):
+            buf.last(2).to_history(['timestamp'])
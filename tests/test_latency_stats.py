@@ -0,0 +1,50 @@
+import unittest
+
+from sia_metrics_collector import latency_stats
+from sia_metrics_collector import state
+
+
+class LatencyTrackerTest(unittest.TestCase):
+
+    def test_summarizes_nothing_before_any_samples(self):
+        tracker = latency_stats.LatencyTracker()
+
+        self.assertEqual([], tracker.summarize())
+
+    def test_summarizes_percentiles_of_each_query(self):
+        tracker = latency_stats.LatencyTracker()
+        for i in range(1, 101):
+            tracker.record(
+                state.SiaState(
+                    api_latency=float(i * 10), file_query_latency=float(i)))
+
+        self.assertEqual([
+            latency_stats.LatencySummary(
+                name='all', sample_count=100, p50=500.0, p95=950.0, p99=990.0),
+            latency_stats.LatencySummary(
+                name='/renter/files',
+                sample_count=100,
+                p50=50.0,
+                p95=95.0,
+                p99=99.0),
+        ], tracker.summarize())
+
+    def test_only_summarizes_samples_in_window(self):
+        tracker = latency_stats.LatencyTracker(window_size=2)
+        for latency in (900.0, 5.0, 7.0):
+            tracker.record(state.SiaState(api_latency=latency))
+
+        self.assertEqual([
+            latency_stats.LatencySummary(
+                name='all', sample_count=2, p50=5.0, p95=7.0, p99=7.0),
+        ], tracker.summarize())
+
+
+class SummarizeLatenciesTest(unittest.TestCase):
+
+    def test_summarizes_unsorted_latencies(self):
+        self.assertEqual(
+            latency_stats.LatencySummary(
+                name='poll lateness', sample_count=3, p50=2.0, p95=9.0,
+                p99=9.0),
+            latency_stats.summarize_latencies('poll lateness', [9.0, 1.0, 2.0]))
@@ -0,0 +1,49 @@
+import datetime
+import unittest
+
+from sia_metrics_collector import api
+from sia_metrics_collector import load_test
+from sia_metrics_collector import siad_simulator
+
+
+class LoadTestTest(unittest.TestCase):
+
+    def test_measures_collector_polling_simulated_nodes(self):
+        report = load_test.run_load_test(
+            2,
+            siad_simulator.DEFAULT_SIMULATOR_OPTIONS._replace(
+                contract_count=10, file_count=10),
+            load_test.CollectorOptions(
+                poll_frequency=0.5,
+                max_parallel_nodes=2,
+                concurrent_queries=False,
+                stream_files=False,
+                connection_options=api.DEFAULT_CONNECTION_OPTIONS,
+                engine='threads'),
+            duration=1.2)
+
+        self.assertEqual(6, report.expected_sample_count)
+        self.assertGreaterEqual(report.sample_count, 4)
+        self.assertEqual(0, report.incomplete_sample_count)
+        self.assertEqual('all', report.latency_summaries[0].name)
+        self.assertEqual(report.sample_count,
+                         report.latency_summaries[0].sample_count)
+        self.assertEqual(report.sample_count,
+                         report.lateness_summary.sample_count)
+        self.assertIsNotNone(report.interval_error_summary)
+        self.assertGreater(report.cpu_seconds, 0)
+        self.assertGreater(report.peak_rss_bytes, 0)
+
+    def test_measures_interval_errors_of_each_node(self):
+        start = datetime.datetime(2018, 2, 11, 16, 0, 0)
+        errors = load_test._interval_errors(
+            {
+                'a': [
+                    start, start + datetime.timedelta(seconds=5.25),
+                    start + datetime.timedelta(seconds=10)
+                ],
+                'b': [start],
+            },
+            5.0)
+
+        self.assertEqual([250.0, 250.0], errors)
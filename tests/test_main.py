@@ -0,0 +1,300 @@
+import argparse
+import functools
+import os
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import mock
+
+from sia_metrics_collector import buffered_writer
+from sia_metrics_collector import cadence
+from sia_metrics_collector import main
+from sia_metrics_collector import nodes
+from sia_metrics_collector import scheduler
+from sia_metrics_collector import siad_simulator
+from sia_metrics_collector import sink
+from sia_metrics_collector import sqlite_serialize
+from sia_metrics_collector import state
+from sia_metrics_collector import stdlib_api
+
+_POLL_COUNT = 3
+
+# Directory that holds the sia_metrics_collector package, to run it from.
+_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_RUN_MAIN_ARGS = ['-m', 'sia_metrics_collector.main']
+
+# Runs the collector with a slow cleanup, which it announces on stderr, so that
+# a test can signal the collector while it cleans up.
+_SLOW_CLEANUP_SCRIPT = """
+import runpy
+import sys
+import time
+
+from sia_metrics_collector import sink
+
+close = sink.Sink.close
+
+
+def slow_close(self):
+    sys.stderr.write('Closing sink\\n')
+    sys.stderr.flush()
+    time.sleep(0.5)
+    close(self)
+
+
+sink.Sink.close = slow_close
+runpy.run_module('sia_metrics_collector.main', run_name='__main__')
+"""
+_RUN_MAIN_WITH_SLOW_CLEANUP_ARGS = ['-c', _SLOW_CLEANUP_SCRIPT]
+
+
+class PollForeverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.simulator = siad_simulator.Simulator()
+        self.addCleanup(self.simulator.close)
+        self.node = nodes.parse_node_spec(
+            siad_simulator.make_node_specs([self.simulator])[0])
+        # Polling stops after a few ticks, rather than running forever.
+        mock_scheduler = mock.patch.object(scheduler, 'Scheduler')
+        mock_scheduler.start().return_value.ticks.return_value = [
+            scheduler.Tick(index=i, lateness=0.0, missed_count=0)
+            for i in range(_POLL_COUNT)
+        ]
+        self.addCleanup(mock_scheduler.stop)
+        print_states = mock.patch.object(main, '_print_states')
+        print_states.start()
+        self.addCleanup(print_states.stop)
+        # The standard library client closes its connection after each query,
+        # so no simulator thread outlives the test waiting on a keep-alive
+        # connection.
+        make_builders = mock.patch.object(main, '_make_builders',
+                                          functools.partial(
+                                              main._make_builders,
+                                              client_class=stdlib_api.Client))
+        make_builders.start()
+        self.addCleanup(make_builders.stop)
+
+    def poll_forever(self, output_path, serializer, flush_check_seconds=None):
+        main._poll_forever(
+            [self.node], {self.node.node_id: [output_path]},
+            {output_path: serializer},
+            exporter=None,
+            frequency=1,
+            missed_poll_policy=scheduler.SKIP,
+            cadences=cadence.Cadences({}, 1),
+            connection_options=stdlib_api.DEFAULT_CONNECTION_OPTIONS,
+            concurrent_queries=False,
+            stream_files=False,
+            max_parallel_nodes=1,
+            latency_summary_interval=0,
+            sink_queue_size=10,
+            backpressure_policy=sink.BLOCK,
+            flush_check_seconds=flush_check_seconds)
+
+    def test_writes_every_poll_to_sqlite_output(self):
+        db_path = os.path.join(self.temp_dir, 'metrics.db')
+        connection = sqlite_serialize.connect(db_path)
+        self.addCleanup(connection.close)
+
+        self.poll_forever(db_path,
+                          sqlite_serialize.SqliteSerializer(
+                              connection, batch_size=100))
+
+        reader = sqlite3.connect(db_path)
+        self.addCleanup(reader.close)
+        self.assertEqual([(_POLL_COUNT,)],
+                         reader.execute('SELECT COUNT(*) FROM metrics WHERE '
+                                        'wallet_status = "ok"').fetchall())
+
+    def test_writes_every_poll_to_csv_output(self):
+        csv_path = os.path.join(self.temp_dir, 'metrics.csv')
+        with open(csv_path, 'w') as csv_file:
+            self.poll_forever(csv_path,
+                              main.serialize.CsvSerializer(
+                                  csv_file,
+                                  buffered_writer.FlushPolicy(
+                                      flush_rows=100,
+                                      flush_seconds=None,
+                                      fsync_seconds=None)))
+
+        with open(csv_path) as csv_file:
+            self.assertEqual(1 + _POLL_COUNT, len(csv_file.readlines()))
+
+    def test_writes_buffered_rows_between_polls_once_due(self):
+        csv_path = os.path.join(self.temp_dir, 'metrics.csv')
+        line_counts = []
+
+        def read_line_count():
+            with open(csv_path) as csv_file:
+                return len(csv_file.readlines())
+
+        def ticks():
+            yield scheduler.Tick(index=0, lateness=0.0, missed_count=0)
+            # Waits for the first poll's row, as polls are far enough apart
+            # for it to come due.
+            for _ in range(500):
+                if read_line_count() > 1:
+                    break
+                time.sleep(0.01)
+            line_counts.append(read_line_count())
+            yield scheduler.Tick(index=1, lateness=0.0, missed_count=0)
+
+        scheduler.Scheduler.return_value.ticks.side_effect = ticks
+        with open(csv_path, 'w') as csv_file:
+            self.poll_forever(
+                csv_path,
+                main.serialize.CsvSerializer(csv_file,
+                                             buffered_writer.FlushPolicy(
+                                                 flush_rows=100,
+                                                 flush_seconds=0.05,
+                                                 fsync_seconds=None)),
+                flush_check_seconds=0.05)
+
+        self.assertEqual([2], line_counts)
+        self.assertEqual(3, read_line_count())
+
+
+class GetFlushCheckSecondsTest(unittest.TestCase):
+
+    def get_flush_check_seconds(self, output_format, flush_seconds):
+        return main._get_flush_check_seconds(
+            argparse.Namespace(
+                output_format=output_format,
+                flush_seconds=flush_seconds,
+                sqlite_batch_seconds=300.0))
+
+    def test_checks_every_flush_interval(self):
+        self.assertEqual(10.0, self.get_flush_check_seconds('csv', 10.0))
+
+    def test_does_not_check_without_a_time_limit(self):
+        self.assertIsNone(self.get_flush_check_seconds('binary', None))
+
+    def test_checks_every_sqlite_batch_interval_or_sooner(self):
+        self.assertEqual(300.0, self.get_flush_check_seconds('sqlite', None))
+        self.assertEqual(10.0, self.get_flush_check_seconds('sqlite', 10.0))
+
+
+class MakeBuildersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.nodes = [
+            nodes.make_node('http://127.0.0.1', 9980 + i) for i in range(3)
+        ]
+        make_builder = mock.patch.object(state, 'make_builder')
+        self.mock_make_builder = make_builder.start()
+        self.addCleanup(make_builder.stop)
+
+    def make_builders(self, concurrent_queries, deadlines):
+        main._make_builders(
+            self.nodes,
+            stdlib_api.DEFAULT_CONNECTION_OPTIONS,
+            concurrent_queries,
+            stream_files=False,
+            max_parallel_nodes=1,
+            deadlines=deadlines)
+        return [
+            call[1]['thread_pool']
+            for call in self.mock_make_builder.call_args_list
+        ]
+
+    def test_concurrent_queries_share_a_query_pool(self):
+        query_pools = self.make_builders(
+            concurrent_queries=True, deadlines=None)
+
+        self.assertIsNotNone(query_pools[0])
+        self.assertEqual([query_pools[0]] * 3, query_pools)
+
+    def test_deadlines_give_each_node_its_own_query_pool(self):
+        query_pools = self.make_builders(
+            concurrent_queries=True,
+            deadlines=state.DeadlineOptions(
+                query_deadlines={},
+                sample_deadline=1.0,
+                late_policy=state.LATE_EMPTY))
+
+        self.assertEqual(3, len(set(query_pools)))
+        self.assertNotIn(None, query_pools)
+
+    def test_queries_run_on_polling_thread_by_default(self):
+        self.assertEqual([None] * 3,
+                         self.make_builders(
+                             concurrent_queries=False, deadlines=None))
+
+
+class MainProcessTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.simulator = siad_simulator.Simulator()
+        self.addCleanup(self.simulator.close)
+        self.output_path = os.path.join(self.temp_dir, 'metrics.csv')
+
+    def start_collector(self, run_args, *args):
+        return subprocess.Popen(
+            [sys.executable, '-u'] + run_args + [
+                '--node',
+                siad_simulator.make_node_specs([self.simulator])[0],
+                '--output_file', self.output_path
+            ] + list(args),
+            cwd=_ROOT_DIR,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+
+    def read_output_lines(self):
+        with open(self.output_path) as output_file:
+            return output_file.readlines()
+
+    def test_once_appends_a_row_per_run_after_one_header(self):
+        for _ in range(3):
+            collector = self.start_collector(_RUN_MAIN_ARGS, '--once')
+            collector.communicate()
+            self.assertEqual(0, collector.returncode)
+
+        output_lines = self.read_output_lines()
+        self.assertEqual(4, len(output_lines))
+        self.assertTrue(output_lines[0].startswith('timestamp,'))
+        self.assertFalse(
+            any(line.startswith('timestamp,') for line in output_lines[1:]))
+
+    def test_once_rejects_flags_for_collectors_that_keep_running(self):
+        for args, error in [
+            (['--cadence', 'file=300'], '--once does not support --cadence'),
+            (['--rollup', '1h'], '--once does not support --rollup'),
+            (['--metrics_port', '9100'],
+             '--once does not support --metrics_port'),
+        ]:
+            collector = self.start_collector(_RUN_MAIN_ARGS, '--once', *args)
+            _, stderr = collector.communicate()
+
+            self.assertEqual(2, collector.returncode)
+            self.assertIn(error, stderr.decode('utf-8'))
+            self.assertFalse(os.path.exists(self.output_path))
+
+    def test_flushes_buffered_rows_when_sigterm_is_sent_again_in_cleanup(self):
+        collector = self.start_collector(_RUN_MAIN_WITH_SLOW_CLEANUP_ARGS,
+                                         '--poll_frequency', '0.1',
+                                         '--flush_rows', '100')
+        # Each poll prints a line to the console, after the header's two.
+        printed_lines = [collector.stdout.readline() for _ in range(6)]
+        collector.send_signal(signal.SIGTERM)
+        for line in iter(collector.stderr.readline, b''):
+            if b'Closing sink' in line:
+                break
+        collector.send_signal(signal.SIGTERM)
+        collector.communicate()
+
+        self.assertEqual(0, collector.returncode)
+        self.assertTrue(all(printed_lines))
+        # The header, and at least every poll that was printed.
+        self.assertGreaterEqual(len(self.read_output_lines()), 5)
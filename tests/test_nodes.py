@@ -0,0 +1,82 @@
+import io
+import unittest
+
+from sia_metrics_collector import nodes
+
+# In-memory file of native strings, like a file opened in text mode.
+_TextIO = io.BytesIO if str is bytes else io.StringIO
+
+
+class ParseNodeSpecTest(unittest.TestCase):
+
+    def test_parses_full_spec(self):
+        self.assertEqual(
+            nodes.Node(
+                node_id='renter-1', hostname='https://10.0.0.5', port=8000),
+            nodes.parse_node_spec('renter-1=https://10.0.0.5:8000'))
+
+    def test_uses_defaults_for_missing_parts(self):
+        self.assertEqual(
+            nodes.Node(
+                node_id='10.0.0.5:9980', hostname='http://10.0.0.5', port=9980),
+            nodes.parse_node_spec('10.0.0.5'))
+
+    def test_derives_node_id_from_host_and_port(self):
+        self.assertEqual(
+            nodes.Node(
+                node_id='localhost:9980',
+                hostname='http://localhost',
+                port=9980), nodes.make_node('http://localhost', 9980))
+
+    def test_keeps_brackets_of_ipv6_host(self):
+        self.assertEqual(
+            nodes.Node(
+                node_id='[::1]:9980', hostname='http://[::1]', port=9980),
+            nodes.parse_node_spec('http://[::1]:9980'))
+        self.assertEqual(
+            nodes.Node(
+                node_id='[fd00::5]:9980',
+                hostname='http://[fd00::5]',
+                port=9980), nodes.parse_node_spec('[fd00::5]'))
+        self.assertEqual(
+            nodes.Node(
+                node_id='[::1]:8000', hostname='http://[::1]', port=8000),
+            nodes.make_node('http://[::1]', 8000))
+
+    def test_rejects_invalid_specs(self):
+        for spec in ('=localhost', 'localhost:notaport', 'localhost/renter',
+                     'http://'):
+            with self.assertRaises(nodes.InvalidNodeSpecError):
+                nodes.parse_node_spec(spec)
+
+
+class ReadNodesFileTest(unittest.TestCase):
+
+    def test_reads_one_node_per_line_skipping_comments(self):
+        nodes_file = _TextIO('# Renters in rack 1\n'
+                             'renter-1=10.0.0.5\n'
+                             '\n'
+                             'renter-2=10.0.0.6:9000\n')
+
+        self.assertEqual([
+            nodes.Node(
+                node_id='renter-1', hostname='http://10.0.0.5', port=9980),
+            nodes.Node(
+                node_id='renter-2', hostname='http://10.0.0.6', port=9000),
+        ], nodes.read_nodes_file(nodes_file))
+
+
+class CheckUniqueIdsTest(unittest.TestCase):
+
+    def test_accepts_unique_ids(self):
+        nodes.check_unique_ids([
+            nodes.Node(node_id='a', hostname='http://a', port=9980),
+            nodes.Node(node_id='b', hostname='http://a', port=9981),
+        ])
+
+    def test_rejects_duplicate_ids(self):
+        with self.assertRaises(nodes.DuplicateNodeIdError):
+            nodes.check_unique_ids([
+                nodes.Node(node_id='a', hostname='http://a', port=9980),
+                nodes.Node(node_id='a', hostname='http://b', port=9980),
+            ])
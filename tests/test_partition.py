@@ -0,0 +1,234 @@
+import datetime
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from sia_metrics_collector import partition
+from sia_metrics_collector import serialize
+from sia_metrics_collector import state
+
+_NOW = datetime.datetime(2018, 2, 11, 18, 30, 0)
+
+
+def _open_csv(path):
+    if os.path.exists(path):
+        return open(path, 'r+')
+    return open(path, 'w')
+
+
+class PartitionedSerializerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.base_path = os.path.join(self.temp_dir, 'metrics.csv')
+        self.manifest_path = os.path.join(self.temp_dir,
+                                          'metrics.manifest.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def make_serializer(self, period=partition.HOUR,
+                        compression=partition.GZIP):
+        return partition.PartitionedSerializer(
+            self.base_path,
+            period,
+            compression,
+            _open_csv,
+            serialize.CsvSerializer,
+            time_fn=lambda: _NOW)
+
+    def write_states(self, serializer, timestamps):
+        for timestamp in timestamps:
+            serializer.write_state(
+                state.SiaState(timestamp=timestamp, api_latency=1.0))
+
+    def read_segment(self, name):
+        path = os.path.join(self.temp_dir, name)
+        if path.endswith('.gz'):
+            with gzip.open(path) as segment_file:
+                return segment_file.read().splitlines()
+        with open(path) as segment_file:
+            return segment_file.read().splitlines()
+
+    def test_writes_each_hour_to_its_own_segment(self):
+        serializer = self.make_serializer(compression=partition.NO_COMPRESSION)
+
+        self.write_states(serializer, [
+            datetime.datetime(2018, 2, 11, 16, 5, 0),
+            datetime.datetime(2018, 2, 11, 16, 59, 59),
+            datetime.datetime(2018, 2, 11, 17, 0, 0),
+        ])
+        serializer.close()
+
+        first_segment = self.read_segment('metrics.2018-02-11T16.csv')
+        self.assertEqual(3, len(first_segment))
+        self.assertTrue(first_segment[0].startswith('timestamp,'))
+        self.assertTrue(first_segment[1].startswith('2018-02-11T16:05:00,'))
+        self.assertTrue(first_segment[2].startswith('2018-02-11T16:59:59,'))
+        second_segment = self.read_segment('metrics.2018-02-11T17.csv')
+        self.assertEqual(2, len(second_segment))
+        self.assertTrue(second_segment[1].startswith('2018-02-11T17:00:00,'))
+
+    def test_compresses_and_lists_closed_segments(self):
+        serializer = self.make_serializer()
+
+        self.write_states(serializer, [
+            datetime.datetime(2018, 2, 11, 16, 5, 0),
+            datetime.datetime(2018, 2, 11, 17, 5, 0),
+            datetime.datetime(2018, 2, 11, 18, 5, 0),
+        ])
+        serializer.close()
+
+        self.assertEqual([
+            {
+                'path': 'metrics.2018-02-11T16.csv.gz',
+                'start': '2018-02-11T16:00:00',
+                'end': '2018-02-11T17:00:00',
+            },
+            {
+                'path': 'metrics.2018-02-11T17.csv.gz',
+                'start': '2018-02-11T17:00:00',
+                'end': '2018-02-11T18:00:00',
+            },
+        ], partition.read_manifest(self.manifest_path))
+        self.assertEqual(2,
+                         len(self.read_segment('metrics.2018-02-11T16.csv.gz')))
+        self.assertFalse(
+            os.path.exists(
+                os.path.join(self.temp_dir, 'metrics.2018-02-11T16.csv')))
+        # The open segment is left uncompressed and unlisted.
+        self.assertEqual(2, len(self.read_segment('metrics.2018-02-11T18.csv')))
+
+    def test_partitions_by_day(self):
+        serializer = self.make_serializer(period=partition.DAY)
+
+        self.write_states(serializer, [
+            datetime.datetime(2018, 2, 10, 23, 59, 0),
+            datetime.datetime(2018, 2, 11, 0, 1, 0),
+        ])
+        serializer.close()
+
+        self.assertEqual([{
+            'path': 'metrics.2018-02-10.csv.gz',
+            'start': '2018-02-10T00:00:00',
+            'end': '2018-02-11T00:00:00',
+        }], partition.read_manifest(self.manifest_path))
+        self.assertEqual(2, len(self.read_segment('metrics.2018-02-11.csv')))
+
+    def test_writes_past_states_to_current_segment(self):
+        serializer = self.make_serializer(compression=partition.NO_COMPRESSION)
+
+        self.write_states(serializer, [
+            datetime.datetime(2018, 2, 11, 17, 5, 0),
+            datetime.datetime(2018, 2, 11, 16, 55, 0),
+        ])
+        serializer.close()
+
+        self.assertEqual(3, len(self.read_segment('metrics.2018-02-11T17.csv')))
+        self.assertEqual([], partition.read_manifest(self.manifest_path))
+
+    def test_appends_to_current_segment_after_restart(self):
+        serializer = self.make_serializer()
+        self.write_states(serializer,
+                          [datetime.datetime(2018, 2, 11, 18, 5, 0)])
+        serializer.close()
+
+        serializer = self.make_serializer()
+        self.write_states(serializer,
+                          [datetime.datetime(2018, 2, 11, 18, 10, 0)])
+        serializer.close()
+
+        self.assertEqual(3, len(self.read_segment('metrics.2018-02-11T18.csv')))
+        self.assertEqual([], partition.read_manifest(self.manifest_path))
+
+    def test_closes_segments_left_open_by_earlier_run(self):
+        serializer = self.make_serializer()
+        self.write_states(serializer,
+                          [datetime.datetime(2018, 2, 11, 15, 5, 0)])
+        # Simulate a crash by never closing the serializer.
+        serializer.flush()
+
+        self.make_serializer().close()
+
+        self.assertEqual([{
+            'path': 'metrics.2018-02-11T15.csv.gz',
+            'start': '2018-02-11T15:00:00',
+            'end': '2018-02-11T16:00:00',
+        }], partition.read_manifest(self.manifest_path))
+        self.assertEqual(2,
+                         len(self.read_segment('metrics.2018-02-11T15.csv.gz')))
+
+    def test_lists_segment_before_removing_its_source(self):
+        serializer = self.make_serializer()
+        self.write_states(serializer,
+                          [datetime.datetime(2018, 2, 11, 15, 5, 0)])
+        serializer.flush()
+
+        # Simulate a crash between compressing the segment and removing its
+        # source.
+        with mock.patch.object(partition.os, 'remove', side_effect=OSError):
+            self.make_serializer().close()
+
+        self.assertEqual([{
+            'path': 'metrics.2018-02-11T15.csv.gz',
+            'start': '2018-02-11T15:00:00',
+            'end': '2018-02-11T16:00:00',
+        }], partition.read_manifest(self.manifest_path))
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(self.temp_dir, 'metrics.2018-02-11T15.csv')))
+
+        # The leftover source is removed on the next restart.
+        self.make_serializer().close()
+
+        self.assertFalse(
+            os.path.exists(
+                os.path.join(self.temp_dir, 'metrics.2018-02-11T15.csv')))
+        self.assertEqual(1, len(partition.read_manifest(self.manifest_path)))
+        self.assertEqual(2,
+                         len(self.read_segment('metrics.2018-02-11T15.csv.gz')))
+
+    def test_lists_compressed_segments_left_unlisted_by_earlier_run(self):
+        with gzip.open(
+                os.path.join(self.temp_dir, 'metrics.2018-02-11T14.csv.gz'),
+                'wb') as segment_file:
+            segment_file.write(b'timestamp\n')
+
+        self.make_serializer().close()
+
+        self.assertEqual([{
+            'path': 'metrics.2018-02-11T14.csv.gz',
+            'start': '2018-02-11T14:00:00',
+            'end': '2018-02-11T15:00:00',
+        }], partition.read_manifest(self.manifest_path))
+
+    def test_recompresses_segment_left_partly_compressed(self):
+        serializer = self.make_serializer()
+        self.write_states(serializer,
+                          [datetime.datetime(2018, 2, 11, 15, 5, 0)])
+        serializer.flush()
+        with open(
+                os.path.join(self.temp_dir, 'metrics.2018-02-11T15.csv.gz'),
+                'wb') as segment_file:
+            segment_file.write(b'partial')
+
+        self.make_serializer().close()
+
+        self.assertEqual(1, len(partition.read_manifest(self.manifest_path)))
+        self.assertEqual(2,
+                         len(self.read_segment('metrics.2018-02-11T15.csv.gz')))
+
+    def test_rejects_zstd_if_zstandard_is_not_installed(self):
+        try:
+            import zstandard
+        except ImportError:
+            zstandard = None
+        if zstandard:
+            self.skipTest('zstandard is installed')
+
+        with self.assertRaises(partition.CompressionUnavailableError):
+            self.make_serializer(compression=partition.ZSTD)
@@ -0,0 +1,23 @@
+import sys
+import unittest
+
+from sia_metrics_collector import process_stats
+
+
+class ProcessStatsTest(unittest.TestCase):
+
+    def test_cpu_seconds_grow_with_work(self):
+        before = process_stats.cpu_seconds()
+        sum(i * i for i in range(200000))
+
+        self.assertGreater(process_stats.cpu_seconds(), before)
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'requires Linux')
+    def test_peak_rss_is_at_least_current_rss(self):
+        process_stats.reset_peak_rss()
+        # Reading the current RSS first, as the peak can't fall below it
+        # afterwards, but the RSS can grow after reading the peak.
+        rss_bytes = process_stats.rss_bytes()
+
+        self.assertGreater(rss_bytes, 0)
+        self.assertGreaterEqual(process_stats.peak_rss_bytes(), rss_bytes)
@@ -0,0 +1,117 @@
+import datetime
+import unittest
+
+try:
+    import urllib2
+except ImportError:
+    # Python 3 renamed it.
+    from urllib import request as urllib2
+
+from sia_metrics_collector import api
+from sia_metrics_collector import buffered_writer
+from sia_metrics_collector import prometheus_exporter
+from sia_metrics_collector import sink
+from sia_metrics_collector import state
+
+_EMPTY_STATS = prometheus_exporter.CollectorStats(
+    node_connection_stats=[], output_writer_stats=[], sink_queue_stats=[])
+
+
+class ExporterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.exporter = prometheus_exporter.Exporter('127.0.0.1', 0)
+
+    def tearDown(self):
+        self.exporter.close()
+
+    def scrape(self, path='/metrics'):
+        response = urllib2.urlopen('http://127.0.0.1:%d%s' %
+                                   (self.exporter.port, path))
+        self.assertEqual('text/plain; version=0.0.4; charset=utf-8',
+                         response.info()['Content-Type'])
+        return response.read().decode('utf-8')
+
+    def test_serves_empty_response_before_first_update(self):
+        self.assertEqual('', self.scrape())
+
+    def test_serves_latest_state_of_each_node(self):
+        self.exporter.update([
+            state.SiaState(
+                timestamp=datetime.datetime(2018, 2, 11, 16, 5, 2),
+                node_id='renter-1',
+                api_latency=5.0,
+                file_count=3,
+                wallet_siacoin_balance=10**30 + 1),
+            state.SiaState(node_id='renter-2', file_count=7),
+        ], _EMPTY_STATS)
+        self.exporter.update([state.SiaState(node_id='renter-2', file_count=8)],
+                             _EMPTY_STATS)
+
+        lines = self.scrape().splitlines()
+
+        self.assertIn('# TYPE sia_file_count gauge', lines)
+        self.assertIn('sia_file_count{node_id="renter-1"} 3', lines)
+        self.assertIn('sia_file_count{node_id="renter-2"} 8', lines)
+        self.assertIn('sia_api_latency{node_id="renter-1"} 5.0', lines)
+        self.assertIn('sia_wallet_siacoin_balance{node_id="renter-1"} '
+                      '1000000000000000000000000000001', lines)
+        self.assertIn('sia_timestamp{node_id="renter-1"} 1518365102.0', lines)
+        self.assertNotIn('sia_api_latency{node_id="renter-2"}', ' '.join(lines))
+        self.assertNotIn('sia_node_id', ' '.join(lines))
+        self.assertIn('sia_collector_polls_total 2', lines)
+        self.assertIn('sia_collector_query_latency_milliseconds'
+                      '{quantile="0.5",query="all"} 5.0', lines)
+
+    def test_serves_collector_stats(self):
+        self.exporter.update(
+            [],
+            prometheus_exporter.CollectorStats(
+                node_connection_stats=[('renter-1',
+                                        api.ConnectionStats(
+                                            request_count=4,
+                                            new_connection_count=1,
+                                            reused_connection_count=3)),
+                                       ('renter-2', None)],
+                output_writer_stats=[('metrics.csv',
+                                      buffered_writer.WriterStats(
+                                          bytes_buffered=100,
+                                          rows_buffered=2,
+                                          flush_count=5,
+                                          fsync_count=1,
+                                          total_flush_latency=0.25,
+                                          max_flush_latency=0.125))],
+                sink_queue_stats=[('console',
+                                   sink.QueueStats(
+                                       depth=1,
+                                       max_depth=3,
+                                       capacity=10,
+                                       put_count=20,
+                                       dropped_count=2))]))
+
+        lines = self.scrape().splitlines()
+
+        self.assertIn('# TYPE sia_collector_requests_total counter', lines)
+        self.assertIn('sia_collector_requests_total{node_id="renter-1"} 4',
+                      lines)
+        self.assertNotIn('renter-2', ' '.join(lines))
+        self.assertIn(
+            'sia_collector_output_flushes_total{output="metrics.csv"} 5', lines)
+        self.assertIn(
+            'sia_collector_output_flush_seconds_max{output="metrics.csv"} '
+            '0.125', lines)
+        self.assertIn('sia_collector_sink_dropped_total{sink="console"} 2',
+                      lines)
+        self.assertIn('sia_collector_sink_queue_depth{sink="console"} 1', lines)
+
+    def test_escapes_label_values(self):
+        self.exporter.update(
+            [state.SiaState(node_id=u'a"b\\c\nd', file_count=1)], _EMPTY_STATS)
+
+        self.assertIn('sia_file_count{node_id="a\\"b\\\\c\\nd"} 1',
+                      self.scrape().splitlines())
+
+    def test_returns_not_found_for_other_paths(self):
+        with self.assertRaises(urllib2.HTTPError) as context:
+            self.scrape('/')
+        self.assertEqual(404, context.exception.code)
@@ -0,0 +1,200 @@
+import datetime
+import math
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from sia_metrics_collector import binary_serialize
+from sia_metrics_collector import hastings_limbs
+from sia_metrics_collector import rates
+from sia_metrics_collector import serialize
+from sia_metrics_collector import sqlite_serialize
+from sia_metrics_collector import state
+
+
+def _make_state(seconds, node_id='renter-1', **kwargs):
+    return state.SiaState(
+        timestamp=datetime.datetime(2018, 2, 11, 16, 0, 0) +
+        datetime.timedelta(seconds=seconds),
+        node_id=node_id,
+        **kwargs)
+
+
+def _make_history(seconds, field, values):
+    present = numpy.array([v is not None for v in values], dtype=bool)
+    if state.FIELD_KINDS[field] == state.HASTINGS:
+        column_values = hastings_limbs.from_longs([v or 0 for v in values])
+    else:
+        column_values = numpy.array(
+            [numpy.nan if v is None else v for v in values], dtype=float)
+    timestamps = (numpy.datetime64('2018-02-11T16:00:00', 'us') +
+                  (numpy.array(seconds) * 1000000).astype('timedelta64[us]'))
+    return rates.History(timestamps, {
+        field: rates.Column(column_values, present)
+    })
+
+
+def _to_list(values):
+    return [None if math.isnan(v) else v for v in values]
+
+
+class RatesTest(unittest.TestCase):
+
+    def test_computes_rates_between_samples(self):
+        history = _make_history([0, 10, 30], 'file_uploaded_bytes',
+                                [100, 200, 600])
+
+        end_times, field_rates = rates.rates(history, 'file_uploaded_bytes')
+
+        self.assertEqual([
+            numpy.datetime64('2018-02-11T16:00:10'),
+            numpy.datetime64('2018-02-11T16:00:30')
+        ], list(end_times))
+        self.assertEqual([10.0, 20.0], list(field_rates))
+
+    def test_skips_gaps_and_missing_values(self):
+        history = _make_history([0, 10, 20, 1000, 1010], 'file_uploaded_bytes',
+                                [100, None, 300, 400, 500])
+
+        field_deltas = rates.deltas(
+            history, 'file_uploaded_bytes', max_gap_seconds=60)
+
+        self.assertEqual([10.0, 10.0, 980.0, 10.0], list(field_deltas.seconds))
+        self.assertEqual([None, None, None, 100.0], _to_list(
+            field_deltas.values))
+
+    def test_skips_intervals_where_time_does_not_advance(self):
+        history = _make_history([0, 10, 10], 'api_latency', [1.0, 2.0, 3.0])
+
+        _, field_rates = rates.rates(history, 'api_latency')
+
+        self.assertEqual([0.1, None], _to_list(field_rates))
+
+    def test_treats_counter_decreases_as_resets(self):
+        history = _make_history([0, 10, 20], 'contract_upload_spending',
+                                [10**30, 10**30 + 50, 20])
+
+        counter_deltas = rates.deltas(
+            history, 'contract_upload_spending', counter=True)
+        gauge_deltas = rates.deltas(history, 'contract_upload_spending')
+
+        self.assertEqual([50.0, 20.0], list(counter_deltas.values))
+        self.assertEqual([50.0, 20.0 - 10**30 - 50], list(gauge_deltas.values))
+
+    def test_keeps_small_changes_in_large_hastings_values(self):
+        history = _make_history([0, 1], 'wallet_siacoin_balance',
+                                [10**30 + 1, 10**30 + 4])
+
+        _, field_rates = rates.rates(history, 'wallet_siacoin_balance')
+
+        self.assertEqual([3.0], list(field_rates))
+
+    def test_computes_window_rates(self):
+        history = _make_history(
+            [0, 1800, 3600, 5400, 7200, 12600], 'contract_upload_spending',
+            [0, 3600 * 10**24, 7200 * 10**24, 0, 1800 * 10**24, 1800 * 10**24])
+
+        window_starts, window_rates = rates.window_rates(
+            history,
+            'contract_upload_spending',
+            3600,
+            counter=True,
+            max_gap_seconds=3600)
+
+        self.assertEqual([
+            numpy.datetime64('2018-02-11T16:00:00'),
+            numpy.datetime64('2018-02-11T17:00:00'),
+            numpy.datetime64('2018-02-11T18:00:00'),
+            numpy.datetime64('2018-02-11T19:00:00')
+        ], list(window_starts))
+        # The reset at 17:30 counts as growth from zero, and the interval
+        # ending at 19:30 is a gap.
+        self.assertEqual([2e24, 1e24, 1e24, None], _to_list(window_rates))
+
+    def test_handles_empty_history(self):
+        history = _make_history([], 'api_latency', [])
+
+        window_starts, window_rates = rates.window_rates(
+            history, 'api_latency', 60)
+
+        self.assertEqual(0, len(window_starts))
+        self.assertEqual(0, len(window_rates))
+        self.assertEqual(0, len(rates.rates(history, 'api_latency')[1]))
+
+    def test_rejects_non_numeric_fields(self):
+        with self.assertRaises(rates.UnsupportedFieldError):
+            rates.load_csv('dummy.csv', ['node_id'])
+
+
+class LoadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.states = [
+            _make_state(
+                0, api_latency=1.5, wallet_siacoin_balance=10**30,
+                file_count=3),
+            _make_state(0, node_id='renter-2', api_latency=9.0),
+            _make_state(
+                60,
+                api_latency=2.5,
+                wallet_siacoin_balance=10**30 + 1,
+                file_count=None),
+            _make_state(120, api_latency=3.5),
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def assertHistoryLoaded(self, history):
+        self.assertEqual([
+            numpy.datetime64('2018-02-11T16:01:00'),
+            numpy.datetime64('2018-02-11T16:02:00')
+        ], list(history.timestamps))
+        self.assertEqual([2.5, 3.5],
+                         list(history.columns['api_latency'].values))
+        self.assertEqual([True, True],
+                         list(history.columns['api_latency'].present))
+        balance = history.columns['wallet_siacoin_balance']
+        self.assertEqual([10**30 + 1, 0], hastings_limbs.to_longs(
+            balance.values))
+        self.assertEqual([True, False], list(balance.present))
+        self.assertEqual([False, False],
+                         list(history.columns['file_count'].present))
+
+    def load(self, load_fn, source):
+        return load_fn(
+            source, ['api_latency', 'wallet_siacoin_balance', 'file_count'],
+            node_id='renter-1',
+            start='2018-02-11T16:01')
+
+    def test_loads_csv(self):
+        csv_path = os.path.join(self.temp_dir, 'metrics.csv')
+        with open(csv_path, 'w') as csv_file:
+            serializer = serialize.CsvSerializer(csv_file)
+            for sia_state in self.states:
+                serializer.write_state(sia_state)
+
+        self.assertHistoryLoaded(self.load(rates.load_csv, csv_path))
+
+    def test_loads_binary(self):
+        binary_path = os.path.join(self.temp_dir, 'metrics.bin')
+        with open(binary_path, 'w+b') as binary_file:
+            serializer = binary_serialize.BinarySerializer(binary_file)
+            for sia_state in self.states:
+                serializer.write_state(sia_state)
+
+        self.assertHistoryLoaded(self.load(rates.load_binary, binary_path))
+
+    def test_loads_sqlite(self):
+        connection = sqlite_serialize.connect(
+            os.path.join(self.temp_dir, 'metrics.db'))
+        serializer = sqlite_serialize.SqliteSerializer(connection)
+        for sia_state in self.states:
+            serializer.write_state(sia_state)
+
+        self.assertHistoryLoaded(self.load(rates.load_sqlite, connection))
+        connection.close()
@@ -0,0 +1,199 @@
+import csv
+import datetime
+import io
+import unittest
+
+from sia_metrics_collector import rollup
+from sia_metrics_collector import serialize
+from sia_metrics_collector import state
+
+# In-memory file of native strings, like a file opened in text mode.
+_TextIO = io.BytesIO if str is bytes else io.StringIO
+
+
+def _make_state(timestamp, node_id='renter-1', **kwargs):
+    return state.SiaState(timestamp=timestamp, node_id=node_id, **kwargs)
+
+
+class RollupTest(unittest.TestCase):
+
+    def test_numeric_fields_exclude_timestamps_and_strings(self):
+        self.assertIn('api_latency', rollup.NUMERIC_FIELDS)
+        self.assertIn('file_count', rollup.NUMERIC_FIELDS)
+        self.assertIn('wallet_siacoin_balance', rollup.NUMERIC_FIELDS)
+        self.assertNotIn('timestamp', rollup.NUMERIC_FIELDS)
+        self.assertNotIn('contract_query_start_time', rollup.NUMERIC_FIELDS)
+        self.assertNotIn('node_id', rollup.NUMERIC_FIELDS)
+
+    def test_aggregates_samples_in_bucket(self):
+        r = rollup.Rollup(60)
+
+        self.assertEqual([],
+                         r.add(
+                             _make_state(
+                                 datetime.datetime(2018, 2, 11, 16, 5, 0),
+                                 api_latency=5.0,
+                                 file_count=3)))
+        self.assertEqual([],
+                         r.add(
+                             _make_state(
+                                 datetime.datetime(2018, 2, 11, 16, 5, 30),
+                                 api_latency=9.0,
+                                 file_count=2)))
+        self.assertEqual([],
+                         r.add(
+                             _make_state(
+                                 datetime.datetime(2018, 2, 11, 16, 5, 59),
+                                 api_latency=7.0,
+                                 file_count=None)))
+        rows = r.add(
+            _make_state(
+                datetime.datetime(2018, 2, 11, 16, 6, 0), api_latency=1.0))
+
+        self.assertEqual(1, len(rows))
+        row = rows[0]
+        self.assertEqual('2018-02-11T16:05:00', row['bucket_start'])
+        self.assertEqual('renter-1', row['node_id'])
+        self.assertEqual(3, row['sample_count'])
+        self.assertEqual(5.0, row['api_latency_min'])
+        self.assertEqual(9.0, row['api_latency_max'])
+        self.assertEqual(7.0, row['api_latency_mean'])
+        self.assertEqual(7.0, row['api_latency_last'])
+        # Samples missing a field don't count towards its aggregates.
+        self.assertEqual(2, row['file_count_min'])
+        self.assertEqual(3, row['file_count_max'])
+        self.assertEqual(2.5, row['file_count_mean'])
+        self.assertEqual(2, row['file_count_last'])
+        self.assertNotIn('renter_allowance_min', row)
+
+    def test_keeps_hastings_exact(self):
+        r = rollup.Rollup(3600)
+        r.add(
+            _make_state(
+                datetime.datetime(2018, 2, 11, 16, 5, 0),
+                wallet_siacoin_balance=10**30 + 1))
+        r.add(
+            _make_state(
+                datetime.datetime(2018, 2, 11, 16, 6, 0),
+                wallet_siacoin_balance=10**30 + 4))
+
+        row = r.close()[0]
+
+        self.assertEqual(10**30 + 1, row['wallet_siacoin_balance_min'])
+        self.assertEqual(10**30 + 4, row['wallet_siacoin_balance_max'])
+        self.assertEqual(10**30 + 2, row['wallet_siacoin_balance_mean'])
+
+    def test_aggregates_hastings_strings_as_numbers(self):
+        r = rollup.Rollup(3600)
+        r.add(
+            _make_state(
+                datetime.datetime(2018, 2, 11, 16, 5, 0),
+                renter_allowance=u'900'))
+        r.add(
+            _make_state(
+                datetime.datetime(2018, 2, 11, 16, 6, 0),
+                renter_allowance=u'10000000000000000000000000001'))
+
+        row = r.close()[0]
+
+        self.assertEqual(900, row['renter_allowance_min'])
+        self.assertEqual(10**28 + 1, row['renter_allowance_max'])
+        self.assertEqual((10**28 + 901) // 2, row['renter_allowance_mean'])
+        self.assertEqual(10**28 + 1, row['renter_allowance_last'])
+
+    def test_aligns_buckets_to_resolution(self):
+        r = rollup.Rollup(24 * 60 * 60)
+        r.add(_make_state(datetime.datetime(2018, 2, 11, 16, 5, 0)))
+
+        rows = r.add(_make_state(datetime.datetime(2018, 2, 12, 0, 0, 1)))
+
+        self.assertEqual('2018-02-11T00:00:00', rows[0]['bucket_start'])
+
+    def test_keeps_separate_buckets_for_each_node(self):
+        r = rollup.Rollup(60)
+        r.add(
+            _make_state(
+                datetime.datetime(2018, 2, 11, 16, 5, 0),
+                node_id='renter-1',
+                api_latency=1.0))
+        r.add(
+            _make_state(
+                datetime.datetime(2018, 2, 11, 16, 5, 0),
+                node_id='renter-2',
+                api_latency=3.0))
+
+        rows = r.add(
+            _make_state(
+                datetime.datetime(2018, 2, 11, 16, 6, 0), node_id='renter-1'))
+
+        self.assertEqual(1, len(rows))
+        self.assertEqual('renter-1', rows[0]['node_id'])
+        self.assertEqual(1.0, rows[0]['api_latency_mean'])
+        self.assertEqual(
+            [('renter-1', 1), ('renter-2', 1)],
+            sorted((row['node_id'], row['sample_count']) for row in r.close()))
+
+    def test_adds_late_samples_to_open_bucket(self):
+        r = rollup.Rollup(60)
+        r.add(_make_state(datetime.datetime(2018, 2, 11, 16, 6, 0)))
+
+        self.assertEqual([],
+                         r.add(
+                             _make_state(
+                                 datetime.datetime(2018, 2, 11, 16, 5, 0))))
+        self.assertEqual(2, r.close()[0]['sample_count'])
+
+
+class RollupSerializerTest(unittest.TestCase):
+
+    def test_writes_closed_buckets_and_open_buckets_on_close(self):
+        mock_file = _TextIO()
+        serializer = rollup.RollupSerializer(mock_file, 60)
+        mock_file.close = lambda: None
+
+        for second in (0, 30, 60):
+            serializer.write_state(
+                _make_state(
+                    datetime.datetime(2018, 2, 11, 16, 5, 0) +
+                    datetime.timedelta(seconds=second),
+                    api_latency=float(second)))
+        rows = list(csv.DictReader(_TextIO(mock_file.getvalue())))
+        self.assertEqual(1, len(rows))
+
+        serializer.close()
+
+        reader = csv.DictReader(_TextIO(mock_file.getvalue()))
+        rows = list(reader)
+        self.assertEqual(rollup.FIELDNAMES, reader.fieldnames)
+        self.assertEqual(['2018-02-11T16:05:00', '2018-02-11T16:06:00'],
+                         [row['bucket_start'] for row in rows])
+        self.assertEqual(['15.0', '60.0'],
+                         [row['api_latency_mean'] for row in rows])
+        self.assertEqual(['2', '1'], [row['sample_count'] for row in rows])
+        self.assertEqual(['', ''], [row['file_count_min'] for row in rows])
+
+    def test_appends_to_file_with_same_header(self):
+        existing = (
+            ','.join(rollup.FIELDNAMES) + '\n' + '2018-02-11T16:04:00' + ',' *
+            (len(rollup.FIELDNAMES) - 1) + '\n')
+        mock_file = _TextIO(existing)
+        serializer = rollup.RollupSerializer(mock_file, 60)
+        mock_file.close = lambda: None
+
+        serializer.write_state(
+            _make_state(datetime.datetime(2018, 2, 11, 16, 5, 0)))
+        serializer.close()
+
+        rows = list(csv.DictReader(_TextIO(mock_file.getvalue())))
+        self.assertEqual(['2018-02-11T16:04:00', '2018-02-11T16:05:00'],
+                         [row['bucket_start'] for row in rows])
+
+    def test_rejects_file_with_different_header(self):
+        existing = (','.join(rollup.FIELDNAMES[:-1]) + '\n' +
+                    '2018-02-11T16:04:00' + ',' *
+                    (len(rollup.FIELDNAMES) - 2) + '\n')
+        mock_file = _TextIO(existing)
+
+        with self.assertRaises(serialize.HeaderMismatchError):
+            rollup.RollupSerializer(mock_file, 60)
+        self.assertEqual(existing, mock_file.getvalue())
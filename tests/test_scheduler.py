@@ -0,0 +1,122 @@
+import unittest
+
+from sia_metrics_collector import scheduler
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.sleeps = []
+        # Number of upcoming sleeps that will wake up halfway through.
+        self.early_wakeups = 0
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        if self.early_wakeups:
+            self.early_wakeups -= 1
+            seconds /= 2.0
+        self.now += seconds
+
+    def make_scheduler(self, period, missed_tick_policy=scheduler.SKIP):
+        return scheduler.Scheduler(
+            period,
+            missed_tick_policy=missed_tick_policy,
+            clock=self.clock,
+            sleep_fn=self.sleep)
+
+    def test_sleeps_exactly_until_each_tick_without_drifting(self):
+        ticks = self.make_scheduler(0.25).ticks()
+
+        self.assertEqual(
+            scheduler.Tick(index=0, lateness=0.0, missed_count=0), next(ticks))
+        self.now += 0.1
+        self.assertEqual(
+            scheduler.Tick(index=1, lateness=0.0, missed_count=0), next(ticks))
+        self.now += 0.2
+        self.assertEqual(
+            scheduler.Tick(index=2, lateness=0.0, missed_count=0), next(ticks))
+        self.assertEqual([0.15, 0.05], [round(s, 6) for s in self.sleeps])
+        self.assertEqual(1000.5, self.now)
+
+    def test_keeps_sleeping_when_sleep_returns_early(self):
+        ticks = self.make_scheduler(10).ticks()
+        next(ticks)
+        self.early_wakeups = 1
+
+        self.assertEqual(
+            scheduler.Tick(index=1, lateness=0.0, missed_count=0), next(ticks))
+        self.assertEqual([10.0, 5.0], self.sleeps)
+        self.assertEqual(1010.0, self.now)
+
+    def test_reports_lateness_of_slightly_late_tick(self):
+        ticks = self.make_scheduler(10, scheduler.CATCH_UP).ticks()
+        next(ticks)
+        self.now += 12.5
+
+        self.assertEqual(
+            scheduler.Tick(index=1, lateness=2.5, missed_count=0), next(ticks))
+
+    def test_skip_policy_drops_missed_ticks(self):
+        ticks = self.make_scheduler(10, scheduler.SKIP).ticks()
+        next(ticks)
+        self.now += 35
+
+        self.assertEqual(
+            scheduler.Tick(index=4, lateness=0.0, missed_count=3), next(ticks))
+        self.assertEqual(1040.0, self.now)
+
+    def test_skip_policy_drops_single_missed_tick(self):
+        ticks = self.make_scheduler(10, scheduler.SKIP).ticks()
+        next(ticks)
+        self.now += 12.5
+
+        self.assertEqual(
+            scheduler.Tick(index=2, lateness=0.0, missed_count=1), next(ticks))
+        self.assertEqual(1020.0, self.now)
+
+    def test_skip_policy_runs_first_tick_even_if_clock_moved(self):
+        s = self.make_scheduler(10, scheduler.SKIP)
+
+        self.now += 0.5
+
+        self.assertEqual((0, 1000.0, 0), s.next_slot(1000.0, 0))
+
+    def test_catch_up_policy_runs_every_missed_tick(self):
+        ticks = self.make_scheduler(10, scheduler.CATCH_UP).ticks()
+        next(ticks)
+        self.now += 35
+
+        self.assertEqual([
+            scheduler.Tick(index=1, lateness=25.0, missed_count=0),
+            scheduler.Tick(index=2, lateness=15.0, missed_count=0),
+            scheduler.Tick(index=3, lateness=5.0, missed_count=0),
+            scheduler.Tick(index=4, lateness=0.0, missed_count=0),
+        ], [next(ticks) for _ in range(4)])
+
+    def test_coalesce_policy_runs_one_tick_for_all_missed_ticks(self):
+        ticks = self.make_scheduler(10, scheduler.COALESCE).ticks()
+        next(ticks)
+        self.now += 35
+
+        self.assertEqual([
+            scheduler.Tick(index=3, lateness=5.0, missed_count=2),
+            scheduler.Tick(index=4, lateness=0.0, missed_count=0),
+        ], [next(ticks) for _ in range(2)])
+
+    def test_next_slot_applies_policy_without_sleeping(self):
+        s = self.make_scheduler(10, scheduler.SKIP)
+
+        self.assertEqual((0, 1000.0, 0), s.next_slot(1000.0, 0))
+        self.now += 35
+        self.assertEqual((4, 1040.0, 3), s.next_slot(1000.0, 1))
+        self.assertEqual([], self.sleeps)
+
+    def test_rejects_invalid_settings(self):
+        with self.assertRaises(ValueError):
+            scheduler.Scheduler(0)
+        with self.assertRaises(ValueError):
+            scheduler.Scheduler(10, missed_tick_policy='panic')
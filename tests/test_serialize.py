@@ -2,47 +2,78 @@ import datetime
 import io
 import unittest
 
+from sia_metrics_collector import buffered_writer
 from sia_metrics_collector import serialize
 from sia_metrics_collector import state
 
+# In-memory file of native strings, like a file opened in text mode.
+_TextIO = io.BytesIO if str is bytes else io.StringIO
+
+
+def _header_before(field):
+    """Returns the header that files had before the field's column was added."""
+    return ','.join(
+        serialize.FIELDNAMES[:serialize.FIELDNAMES.index(field)]) + '\n'
+
 
 class CsvSerializerTest(unittest.TestCase):
 
     def test_writes_header_to_empty_file(self):
-        mock_file = io.BytesIO()
+        mock_file = _TextIO()
 
         serialize.CsvSerializer(mock_file)
 
-        self.assertEqual((
-            'timestamp,'
-            'api_latency,'
-            'file_count,'
-            'file_total_bytes,'
-            'file_uploads_in_progress_count,'
-            'file_uploaded_bytes,'
-            'contract_count_active,'
-            'contract_count_inactive,'
-            'contract_total_size,'
-            'contract_total_spending,'
-            'contract_fee_spending,'
-            'contract_storage_spending,'
-            'contract_upload_spending,'
-            'contract_download_spending,'
-            'contract_remaining_funds,'
-            'wallet_siacoin_balance,'
-            'wallet_outgoing_siacoins,'
-            'wallet_incoming_siacoins,'
-            'renter_allowance,'
-            'renter_contract_fees,'
-            'renter_total_allocated,'
-            'renter_contract_spending,'
-            'renter_download_spending,'
-            'renter_storage_spending,'
-            'renter_upload_spending,'
-            'renter_unspent\n'), mock_file.getvalue())
+        self.assertEqual(('timestamp,'
+                          'api_latency,'
+                          'file_count,'
+                          'file_total_bytes,'
+                          'file_uploads_in_progress_count,'
+                          'file_uploaded_bytes,'
+                          'contract_count_active,'
+                          'contract_count_inactive,'
+                          'contract_total_size,'
+                          'contract_total_spending,'
+                          'contract_fee_spending,'
+                          'contract_storage_spending,'
+                          'contract_upload_spending,'
+                          'contract_download_spending,'
+                          'contract_remaining_funds,'
+                          'wallet_siacoin_balance,'
+                          'wallet_outgoing_siacoins,'
+                          'wallet_incoming_siacoins,'
+                          'renter_allowance,'
+                          'renter_contract_fees,'
+                          'renter_total_allocated,'
+                          'renter_contract_spending,'
+                          'renter_download_spending,'
+                          'renter_storage_spending,'
+                          'renter_upload_spending,'
+                          'renter_unspent,'
+                          'contract_query_start_time,'
+                          'contract_query_latency,'
+                          'contract_response_bytes,'
+                          'file_query_start_time,'
+                          'file_query_latency,'
+                          'file_response_bytes,'
+                          'wallet_query_start_time,'
+                          'wallet_query_latency,'
+                          'wallet_response_bytes,'
+                          'renter_query_start_time,'
+                          'renter_query_latency,'
+                          'renter_response_bytes,'
+                          'node_id,'
+                          'contract_metrics_age,'
+                          'file_metrics_age,'
+                          'wallet_metrics_age,'
+                          'renter_metrics_age,'
+                          'poll_lateness,'
+                          'contract_status,'
+                          'file_status,'
+                          'wallet_status,'
+                          'renter_status\n'), mock_file.getvalue())
 
     def test_writes_state_to_file(self):
-        mock_file = io.BytesIO()
+        mock_file = _TextIO()
 
         serializer = serialize.CsvSerializer(mock_file)
         serializer.write_state(
@@ -72,7 +103,33 @@ class CsvSerializerTest(unittest.TestCase):
                 renter_download_spending=0,
                 renter_storage_spending=200,
                 renter_upload_spending=66,
-                renter_unspent=111))
+                renter_unspent=111,
+                contract_query_start_time=datetime.datetime(
+                    2018, 2, 11, 16, 5, 1, 995000),
+                contract_query_latency=1.5,
+                contract_response_bytes=2048,
+                file_query_start_time=datetime.datetime(2018, 2, 11, 16, 5, 1,
+                                                        996500),
+                file_query_latency=2.0,
+                file_response_bytes=4096,
+                wallet_query_start_time=datetime.datetime(
+                    2018, 2, 11, 16, 5, 1, 998500),
+                wallet_query_latency=0.5,
+                wallet_response_bytes=128,
+                renter_query_start_time=datetime.datetime(
+                    2018, 2, 11, 16, 5, 1, 999000),
+                renter_query_latency=1.0,
+                renter_response_bytes=512,
+                node_id='renter-1',
+                contract_metrics_age=0.005,
+                file_metrics_age=299.0,
+                wallet_metrics_age=0.001,
+                renter_metrics_age=0.001,
+                poll_lateness=0.25,
+                contract_status=state.STATUS_OK,
+                file_status=state.STATUS_SKIPPED,
+                wallet_status=state.STATUS_LATE,
+                renter_status=state.STATUS_FAILED))
 
         self.assertEqual((
             'timestamp,'
@@ -100,100 +157,125 @@ class CsvSerializerTest(unittest.TestCase):
             'renter_download_spending,'
             'renter_storage_spending,'
             'renter_upload_spending,'
-            'renter_unspent\n'
-            '2018-02-11T16:05:02,5.0,3,4444,2,900,3,2,9,65,25,2,35,0,100,75,26,83,500,233,443,123,0,200,66,111\n'
-        ), mock_file.getvalue())
+            'renter_unspent,'
+            'contract_query_start_time,'
+            'contract_query_latency,'
+            'contract_response_bytes,'
+            'file_query_start_time,'
+            'file_query_latency,'
+            'file_response_bytes,'
+            'wallet_query_start_time,'
+            'wallet_query_latency,'
+            'wallet_response_bytes,'
+            'renter_query_start_time,'
+            'renter_query_latency,'
+            'renter_response_bytes,'
+            'node_id,'
+            'contract_metrics_age,'
+            'file_metrics_age,'
+            'wallet_metrics_age,'
+            'renter_metrics_age,'
+            'poll_lateness,'
+            'contract_status,'
+            'file_status,'
+            'wallet_status,'
+            'renter_status\n'
+            '2018-02-11T16:05:02,5.0,3,4444,2,900,3,2,9,65,25,2,35,0,100,75,26,83,500,233,443,123,0,200,66,111,'
+            '2018-02-11T16:05:01.995,1.5,2048,'
+            '2018-02-11T16:05:01.996,2.0,4096,'
+            '2018-02-11T16:05:01.998,0.5,128,'
+            '2018-02-11T16:05:01.999,1.0,512,'
+            'renter-1,0.005,299.0,0.001,0.001,0.25,'
+            'ok,skipped,late,failed\n'), mock_file.getvalue())
 
     def test_appends_to_existing_file(self):
-        if True:
-            return
-        mock_file = io.BytesIO((
-            'timestamp,'
-            'api_latency,'
-            'file_count,'
-            'file_total_bytes,'
-            'file_uploads_in_progress_count,'
-            'file_uploaded_bytes,'
-            'contract_count_active,'
-            'contract_count_inactive,'
-            'contract_total_size,'
-            'contract_total_spending,'
-            'contract_fee_spending,'
-            'contract_storage_spending,'
-            'contract_upload_spending,'
-            'contract_download_spending,'
-            'contract_remaining_funds,'
-            'wallet_siacoin_balance,'
-            'wallet_outgoing_siacoins,'
-            'wallet_incoming_siacoins,'
-            'renter_allowance,'
-            'renter_contract_fees,'
-            'renter_total_allocated,'
-            'renter_contract_spending,'
-            'renter_download_spending,'
-            'renter_storage_spending,'
-            'renter_upload_spending,'
-            'renter_unspent\n'
-            '2018-02-11T16:05:02,5.0,3,4444,2,900,3,2,8,65,25,2,35,0,100,75,26,83,500,233,443,123,0,200,66,111\n'
-        ))
+        existing_rows = (','.join(serialize.FIELDNAMES) + '\n' +
+                         '2018-02-11T16:05:02' + ',' * 47 + '\n')
+        mock_file = _TextIO(existing_rows)
 
         serializer = serialize.CsvSerializer(mock_file)
         serializer.write_state(
-            state.SiaState(
-                timestamp=datetime.datetime(2018, 2, 11, 16, 5, 7),
-                api_latency=6.0,
-                file_count=4,
-                file_total_bytes=5555,
-                file_uploads_in_progress_count=3,
-                file_uploaded_bytes=901,
-                contract_count_active=4,
-                contract_count_inactive=2,
-                contract_total_size=10,
-                contract_total_spending=75,
-                contract_fee_spending=26,
-                contract_storage_spending=3,
-                contract_upload_spending=36,
-                contract_download_spending=1,
-                contract_remaining_funds=101,
-                wallet_siacoin_balance=76,
-                wallet_outgoing_siacoins=27,
-                wallet_incoming_siacoins=84,
-                renter_allowance=501,
-                renter_contract_fees=234,
-                renter_total_allocated=444,
-                renter_contract_spending=124,
-                renter_download_spending=1,
-                renter_storage_spending=201,
-                renter_upload_spending=67,
-                renter_unspent=110))
+            state.SiaState(timestamp=datetime.datetime(2018, 2, 11, 16, 5, 7)))
 
-        self.assertEqual((
-            'timestamp,'
-            'api_latency,'
-            'file_count,'
-            'file_total_bytes,'
-            'file_uploads_in_progress_count,'
-            'file_uploaded_bytes,'
-            'contract_count_active,'
-            'contract_count_inactive,'
-            'contract_total_size,'
-            'contract_total_spending,'
-            'contract_fee_spending,'
-            'contract_storage_spending,'
-            'contract_upload_spending,'
-            'contract_download_spending,'
-            'contract_remaining_funds,'
-            'wallet_siacoin_balance,'
-            'wallet_outgoing_siacoins,'
-            'wallet_incoming_siacoins,'
-            'renter_allowance,'
-            'renter_contract_fees,'
-            'renter_total_allocated,'
-            'renter_contract_spending,'
-            'renter_download_spending,'
-            'renter_storage_spending,'
-            'renter_upload_spending,'
-            'renter_unspent\n'
-            '2018-02-11T16:05:02,5.0,3,4444,2,900,3,2,8,65,25,2,35,0,100,75,26,83,500,233,443,123,0,200,66,111\n'
-            '2018-02-11T16:05:07,6.0,4,5555,3,901,4,2,10,75,26,3,36,1,101,76,27,84,501,234,444,124,1,201,67,110\n'
-        ), mock_file.getvalue())
+        self.assertEqual(
+            existing_rows + '2018-02-11T16:05:07' + ',' * 47 + '\n',
+            mock_file.getvalue())
+
+    def assert_rejects_existing_header(self, existing_rows):
+        mock_file = _TextIO(existing_rows)
+
+        with self.assertRaises(serialize.HeaderMismatchError):
+            serialize.CsvSerializer(mock_file)
+        self.assertEqual(existing_rows, mock_file.getvalue())
+
+    def test_rejects_file_with_header_of_first_version(self):
+        self.assert_rejects_existing_header(
+            ('timestamp,'
+             'api_latency,'
+             'file_count,'
+             'file_total_bytes,'
+             'file_uploads_in_progress_count,'
+             'file_uploaded_bytes,'
+             'contract_count_active,'
+             'contract_count_inactive,'
+             'contract_total_size,'
+             'contract_total_spending,'
+             'contract_fee_spending,'
+             'contract_storage_spending,'
+             'contract_upload_spending,'
+             'contract_download_spending,'
+             'contract_remaining_funds,'
+             'wallet_siacoin_balance,'
+             'wallet_outgoing_siacoins,'
+             'wallet_incoming_siacoins,'
+             'renter_allowance,'
+             'renter_contract_fees,'
+             'renter_total_allocated,'
+             'renter_contract_spending,'
+             'renter_download_spending,'
+             'renter_storage_spending,'
+             'renter_upload_spending,'
+             'renter_unspent\n'
+             '2018-02-11T16:05:02,5.0,3,4444,2,900,3,2,8,65,25,2,35,0,100,75,'
+             '26,83,500,233,443,123,0,200,66,111\n'))
+
+    def test_rejects_file_with_header_without_query_timing(self):
+        self.assert_rejects_existing_header(
+            _header_before('contract_query_start_time'))
+
+    def test_rejects_file_with_header_without_node_id(self):
+        self.assert_rejects_existing_header(
+            _header_before('node_id') + '2018-02-11T16:05:02' + ',' * 37 + '\n')
+
+    def test_rejects_file_with_header_without_metrics_ages(self):
+        self.assert_rejects_existing_header(
+            _header_before('contract_metrics_age') + '2018-02-11T16:05:02' +
+            ',' * 38 + '\n')
+
+    def test_rejects_file_with_header_without_poll_lateness(self):
+        self.assert_rejects_existing_header(
+            _header_before('poll_lateness') + '2018-02-11T16:05:02' + ',' * 42 +
+            '\n')
+
+    def test_rejects_file_with_header_without_statuses(self):
+        self.assert_rejects_existing_header(
+            _header_before('contract_status') + '2018-02-11T16:05:02' +
+            ',' * 43 + '\n')
+
+    def test_buffers_rows_until_flush_policy_is_met(self):
+        mock_file = _TextIO()
+        serializer = serialize.CsvSerializer(mock_file,
+                                             buffered_writer.FlushPolicy(
+                                                 flush_rows=2,
+                                                 flush_seconds=None,
+                                                 fsync_seconds=None))
+        header = mock_file.getvalue()
+
+        serializer.write_state(
+            state.SiaState(timestamp=datetime.datetime(2018, 2, 11, 16, 5, 2)))
+        self.assertEqual(header, mock_file.getvalue())
+        self.assertEqual(1, serializer.writer_stats().rows_buffered)
+
+        serializer.flush()
+        self.assertEqual(header + '2018-02-11T16:05:02' + ',' * 47 + '\n',
+                         mock_file.getvalue())
@@ -0,0 +1,161 @@
+import random
+import unittest
+
+try:
+    import urllib2
+except ImportError:
+    # Python 3 renamed it.
+    from urllib import request as urllib2
+
+from sia_metrics_collector import api
+from sia_metrics_collector import siad_simulator
+from sia_metrics_collector import state
+
+
+class ParseLatencySpecTest(unittest.TestCase):
+
+    def test_parses_constant_latency(self):
+        latency_fn = siad_simulator.parse_latency_spec('25')
+
+        self.assertEqual(0.025, latency_fn(random.Random(0)))
+
+    def test_parses_distributions(self):
+        rng = random.Random(0)
+        uniform = siad_simulator.parse_latency_spec('uniform:10,20')
+        lognormal = siad_simulator.parse_latency_spec('lognormal:30,0.5')
+        exponential = siad_simulator.parse_latency_spec('exponential:5')
+
+        for _ in range(100):
+            self.assertTrue(0.010 <= uniform(rng) <= 0.020)
+        lognormal_latencies = sorted(lognormal(rng) for _ in range(1001))
+        self.assertAlmostEqual(0.030, lognormal_latencies[500], delta=0.005)
+        exponential_latencies = [exponential(rng) for _ in range(1000)]
+        self.assertAlmostEqual(
+            0.005, sum(exponential_latencies) / 1000, delta=0.001)
+
+    def test_rejects_invalid_specs(self):
+        for spec in ('', 'fast', 'normal:5,1', 'uniform:5', 'lognormal:a,b',
+                     '-5'):
+            with self.assertRaises(siad_simulator.InvalidLatencySpecError):
+                siad_simulator.parse_latency_spec(spec)
+
+
+class SimulatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.simulators = []
+
+    def tearDown(self):
+        for simulator in self.simulators:
+            simulator.close()
+
+    def start_simulator(self, **kwargs):
+        simulator = siad_simulator.Simulator(
+            options=siad_simulator.DEFAULT_SIMULATOR_OPTIONS._replace(**kwargs),
+            time_fn=lambda: self.now)
+        self.simulators.append(simulator)
+        return simulator
+
+    def make_client(self, simulator):
+        return api.Client('http://127.0.0.1', simulator.port)
+
+    def test_serves_responses_the_builder_can_parse(self):
+        simulator = self.start_simulator(contract_count=8, file_count=20)
+        builder = state.Builder(
+            self.make_client(simulator), time_fn=lambda: None)
+        sia_state = state.SiaState()
+
+        self.assertTrue(builder._populate_contract_metrics(sia_state))
+        self.assertTrue(builder._populate_file_metrics(sia_state))
+        self.assertTrue(builder._populate_wallet_metrics(sia_state))
+        self.assertTrue(builder._populate_renter_metrics(sia_state))
+        self.assertEqual(6, sia_state.contract_count_active)
+        self.assertEqual(2, sia_state.contract_count_inactive)
+        self.assertEqual(20, sia_state.file_count)
+        self.assertGreater(sia_state.wallet_siacoin_balance, 0)
+        self.assertEqual(sia_state.contract_total_spending,
+                         int(sia_state.renter_total_allocated))
+
+    def test_state_changes_slowly_over_time(self):
+        simulator = self.start_simulator(change_interval=60.0)
+        client = self.make_client(simulator)
+
+        first_wallet = client.get_wallet()
+        self.now += 59.0
+        self.assertIs(first_wallet, client.get_wallet())
+        self.now += 1.0
+        second_wallet = client.get_wallet()
+
+        self.assertEqual(10**24,
+                         int(first_wallet[u'confirmedsiacoinbalance']) -
+                         int(second_wallet[u'confirmedsiacoinbalance']))
+
+    def test_spending_grows_as_uploads_progress(self):
+        simulator = self.start_simulator(change_interval=1.0)
+        client = self.make_client(simulator)
+
+        def totals():
+            contracts = client.get_renter_contracts()[u'activecontracts']
+            files = client.get_renter_files()[u'files']
+            return (sum(int(c[u'uploadspending']) for c in contracts),
+                    sum(int(c[u'renterfunds']) for c in contracts),
+                    sum(f[u'uploadedbytes'] for f in files))
+
+        before = totals()
+        self.now += 3.0
+        after = totals()
+
+        self.assertGreater(after[0], before[0])
+        self.assertLess(after[1], before[1])
+        self.assertGreater(after[2], before[2])
+
+    def test_fails_requests_at_error_rate(self):
+        simulator = self.start_simulator(error_rate=1.0)
+
+        self.assertEqual({
+            u'message': u'simulated siad error'
+        },
+                         self.make_client(simulator).get_wallet())
+
+    def test_sends_large_responses_in_chunks_like_siad(self):
+        simulator = self.start_simulator(contract_count=2, file_count=100)
+
+        def get(path):
+            return urllib2.urlopen(
+                urllib2.Request(
+                    'http://127.0.0.1:%d%s' % (simulator.port, path),
+                    headers={
+                        'User-Agent': 'Sia-Agent'
+                    }))
+
+        small = get('/wallet')
+        large = get('/renter/files')
+
+        self.assertEqual(
+            str(len(simulator.response_body('/wallet'))),
+            small.headers.get('Content-Length'))
+        self.assertEqual('chunked', large.headers.get('Transfer-Encoding'))
+        self.assertIsNone(large.headers.get('Content-Length'))
+        self.assertEqual(simulator.response_body('/renter/files'), large.read())
+
+    def test_rejects_requests_without_sia_user_agent(self):
+        simulator = self.start_simulator()
+
+        with self.assertRaises(urllib2.HTTPError) as context:
+            urllib2.urlopen('http://127.0.0.1:%d/wallet' % simulator.port)
+        self.assertEqual(400, context.exception.code)
+
+    def test_starts_fleet_of_distinct_nodes(self):
+        self.simulators = siad_simulator.start_fleet(
+            3, siad_simulator.DEFAULT_SIMULATOR_OPTIONS)
+
+        node_specs = siad_simulator.make_node_specs(self.simulators)
+        balances = set(
+            self.make_client(s).get_wallet()[u'confirmedsiacoinbalance']
+            for s in self.simulators)
+
+        self.assertEqual('sim-0=http://127.0.0.1:%d' % self.simulators[0].port,
+                         node_specs[0])
+        self.assertEqual(3, len(set(node_specs)))
+        self.assertEqual(3, len(balances))
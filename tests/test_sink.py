@@ -0,0 +1,120 @@
+import threading
+import unittest
+
+from sia_metrics_collector import sink
+
+
+class SinkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.handled = []
+        # Set to let the sink's worker handle items.
+        self.unblocked = threading.Event()
+        self.sinks = []
+
+    def tearDown(self):
+        self.unblocked.set()
+        for s in self.sinks:
+            s.close()
+
+    def handle(self, item):
+        self.unblocked.wait()
+        self.handled.append(item)
+
+    def make_sink(self, capacity, backpressure_policy=sink.BLOCK):
+        s = sink.Sink('test', self.handle, capacity, backpressure_policy)
+        self.sinks.append(s)
+        return s
+
+    def fill_sink(self, s, items):
+        # The worker takes the first item off the queue and waits in handle(),
+        # so the rest stay queued.
+        s.put(items[0])
+        while s.stats().depth:
+            pass
+        for item in items[1:]:
+            s.put(item)
+
+    def test_handles_items_in_order(self):
+        self.unblocked.set()
+        s = self.make_sink(capacity=2)
+
+        for item in range(10):
+            s.put(item)
+        s.close()
+
+        self.assertEqual(list(range(10)), self.handled)
+
+    def test_close_handles_queued_items(self):
+        s = self.make_sink(capacity=10)
+        self.fill_sink(s, [1, 2, 3])
+
+        self.unblocked.set()
+        s.close()
+
+        self.assertEqual([1, 2, 3], self.handled)
+
+    def test_put_does_not_wait_for_handler(self):
+        s = self.make_sink(capacity=10)
+
+        self.fill_sink(s, [1, 2, 3])
+
+        self.assertEqual([], self.handled)
+        self.assertEqual(2, s.stats().depth)
+
+    def test_drop_newest_discards_new_items_when_full(self):
+        s = self.make_sink(capacity=2, backpressure_policy=sink.DROP_NEWEST)
+        self.fill_sink(s, [1, 2, 3, 4, 5])
+
+        self.unblocked.set()
+        s.close()
+
+        self.assertEqual([1, 2, 3], self.handled)
+        self.assertEqual(
+            sink.QueueStats(
+                depth=0, max_depth=2, capacity=2, put_count=5, dropped_count=2),
+            s.stats())
+
+    def test_drop_oldest_discards_queued_items_when_full(self):
+        s = self.make_sink(capacity=2, backpressure_policy=sink.DROP_OLDEST)
+        self.fill_sink(s, [1, 2, 3, 4, 5])
+
+        self.unblocked.set()
+        s.close()
+
+        self.assertEqual([1, 4, 5], self.handled)
+        self.assertEqual(2, s.stats().dropped_count)
+
+    def test_block_waits_for_room_when_full(self):
+        s = self.make_sink(capacity=1)
+        self.fill_sink(s, [1, 2])
+        put_thread = threading.Thread(target=s.put, args=(3,))
+        put_thread.start()
+
+        put_thread.join(0.1)
+        self.assertTrue(put_thread.is_alive())
+
+        self.unblocked.set()
+        put_thread.join()
+        s.close()
+        self.assertEqual([1, 2, 3], self.handled)
+        self.assertEqual(0, s.stats().dropped_count)
+
+    def test_keeps_handling_items_after_handler_fails(self):
+        self.unblocked.set()
+
+        def handle(item):
+            if item == 1:
+                raise ValueError('dummy error')
+            self.handled.append(item)
+
+        s = sink.Sink('test', handle, capacity=10)
+        s.put(1)
+        s.put(2)
+        s.close()
+
+        self.assertEqual([2], self.handled)
+
+    def test_rejects_unknown_backpressure_policy(self):
+        with self.assertRaises(ValueError):
+            sink.Sink('test', self.handle, 10, 'dummy-policy')
@@ -0,0 +1,200 @@
+import datetime
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import mock
+
+from sia_metrics_collector import sqlite_serialize
+from sia_metrics_collector import state
+
+
+def _make_state(timestamp, node_id='renter-1', **kwargs):
+    return state.SiaState(timestamp=timestamp, node_id=node_id, **kwargs)
+
+
+class SqliteSerializerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'metrics.db')
+        self.connection = sqlite_serialize.connect(self.db_path)
+        self.mock_clock = mock.Mock(return_value=0.0)
+
+    def tearDown(self):
+        self.connection.close()
+        shutil.rmtree(self.temp_dir)
+
+    def _count_committed_rows(self):
+        # A separate connection only sees committed rows.
+        reader = sqlite3.connect(self.db_path)
+        try:
+            return reader.execute('SELECT COUNT(*) FROM metrics').fetchone()[0]
+        finally:
+            reader.close()
+
+    def test_opens_database_in_wal_mode(self):
+        self.assertEqual(
+            'wal',
+            self.connection.execute('PRAGMA journal_mode').fetchone()[0])
+
+    def test_creates_table_with_column_for_each_field(self):
+        sqlite_serialize.SqliteSerializer(self.connection)
+
+        columns = [
+            row[1]
+            for row in self.connection.execute('PRAGMA table_info(metrics)')
+        ]
+        self.assertEqual(list(state.SiaState._fields), columns)
+
+    def test_indexes_timestamp_and_node_id(self):
+        sqlite_serialize.SqliteSerializer(self.connection)
+
+        plan = self.connection.execute(
+            'EXPLAIN QUERY PLAN SELECT * FROM metrics WHERE timestamp >= ? '
+            'AND timestamp < ?', ('2018-02-11', '2018-02-12')).fetchall()
+        self.assertIn('metrics_timestamp_node_id', str(plan))
+
+    def test_writes_state(self):
+        serializer = sqlite_serialize.SqliteSerializer(self.connection)
+
+        serializer.write_state(
+            _make_state(
+                datetime.datetime(2018, 2, 11, 16, 5, 2),
+                api_latency=5.0,
+                file_count=3,
+                wallet_siacoin_balance=(1 << 100) + 7))
+
+        row = self.connection.execute(
+            'SELECT timestamp, api_latency, file_count, '
+            'wallet_siacoin_balance, node_id, renter_allowance '
+            'FROM metrics').fetchone()
+        self.assertEqual((u'2018-02-11T16:05:02.000000', 5.0, 3, u'%d' %
+                          ((1 << 100) + 7), u'renter-1', None), row)
+
+    def test_commits_when_batch_is_full(self):
+        serializer = sqlite_serialize.SqliteSerializer(
+            self.connection, batch_size=3, clock=self.mock_clock)
+
+        serializer.write_state(_make_state(datetime.datetime(2018, 2, 11)))
+        serializer.write_state(_make_state(datetime.datetime(2018, 2, 12)))
+        self.assertEqual(0, self._count_committed_rows())
+
+        serializer.write_state(_make_state(datetime.datetime(2018, 2, 13)))
+        self.assertEqual(3, self._count_committed_rows())
+
+    def test_commits_partial_batch_when_batch_window_passes(self):
+        serializer = sqlite_serialize.SqliteSerializer(
+            self.connection,
+            batch_size=100,
+            batch_seconds=60.0,
+            clock=self.mock_clock)
+
+        self.mock_clock.return_value = 10.0
+        serializer.write_state(_make_state(datetime.datetime(2018, 2, 11)))
+        self.mock_clock.return_value = 69.0
+        serializer.write_state(_make_state(datetime.datetime(2018, 2, 12)))
+        self.assertEqual(0, self._count_committed_rows())
+
+        self.mock_clock.return_value = 70.0
+        serializer.write_state(_make_state(datetime.datetime(2018, 2, 13)))
+        self.assertEqual(3, self._count_committed_rows())
+
+    def test_flush_if_due_commits_partial_batch_once_window_passes(self):
+        serializer = sqlite_serialize.SqliteSerializer(
+            self.connection,
+            batch_size=100,
+            batch_seconds=60.0,
+            clock=self.mock_clock)
+        serializer.flush_if_due()
+
+        self.mock_clock.return_value = 10.0
+        serializer.write_state(_make_state(datetime.datetime(2018, 2, 11)))
+        self.mock_clock.return_value = 69.0
+        serializer.flush_if_due()
+        self.assertEqual(0, self._count_committed_rows())
+
+        self.mock_clock.return_value = 70.0
+        serializer.flush_if_due()
+        self.assertEqual(1, self._count_committed_rows())
+
+    def test_flush_commits_pending_rows(self):
+        serializer = sqlite_serialize.SqliteSerializer(
+            self.connection, batch_size=100, clock=self.mock_clock)
+        serializer.write_state(_make_state(datetime.datetime(2018, 2, 11)))
+
+        serializer.flush()
+
+        self.assertEqual(1, self._count_committed_rows())
+
+    def test_adds_missing_columns_to_existing_table(self):
+        self.connection.execute(
+            'CREATE TABLE metrics (timestamp TEXT, api_latency REAL)')
+        self.connection.execute(
+            'INSERT INTO metrics VALUES (\'2018-02-10T00:00:00.000000\', 1.0)')
+        self.connection.commit()
+
+        serializer = sqlite_serialize.SqliteSerializer(self.connection)
+        serializer.write_state(
+            _make_state(datetime.datetime(2018, 2, 11), api_latency=2.0))
+
+        self.assertEqual([(1.0, None), (2.0, u'renter-1')],
+                         list(
+                             sqlite_serialize.query_rows(
+                                 self.connection,
+                                 fields=['api_latency', 'node_id'])))
+
+
+class QueryRowsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = sqlite3.connect(':memory:')
+        serializer = sqlite_serialize.SqliteSerializer(self.connection)
+        for day, node_id in ((13, 'renter-1'), (11, 'renter-1'),
+                             (12, 'renter-2'), (12, 'renter-1')):
+            serializer.write_state(
+                _make_state(
+                    datetime.datetime(2018, 2, day, 16, 5, 2),
+                    node_id=node_id,
+                    file_count=day))
+
+    def tearDown(self):
+        self.connection.close()
+
+    def test_queries_all_rows_in_timestamp_order(self):
+        rows = sqlite_serialize.query_rows(
+            self.connection, fields=['file_count'])
+
+        self.assertEqual([(11,), (12,), (12,), (13,)], list(rows))
+
+    def test_queries_all_fields_by_default(self):
+        rows = list(sqlite_serialize.query_rows(self.connection))
+
+        self.assertEqual(len(state.SiaState._fields), len(rows[0]))
+
+    def test_queries_time_range(self):
+        rows = sqlite_serialize.query_rows(
+            self.connection,
+            fields=['timestamp', 'node_id'],
+            start='2018-02-12',
+            end='2018-02-13')
+
+        self.assertEqual([(u'2018-02-12T16:05:02.000000', u'renter-2'),
+                          (u'2018-02-12T16:05:02.000000', u'renter-1')],
+                         sorted(rows, reverse=True))
+
+    def test_queries_node(self):
+        rows = sqlite_serialize.query_rows(
+            self.connection,
+            fields=['file_count'],
+            start='2018-02-12',
+            node_id='renter-1')
+
+        self.assertEqual([(12,), (13,)], list(rows))
+
+    def test_rejects_unknown_field(self):
+        with self.assertRaises(sqlite_serialize.UnknownFieldError):
+            sqlite_serialize.query_rows(
+                self.connection, fields=['file_count; DROP TABLE metrics'])
@@ -1,19 +1,45 @@
 import datetime
+import itertools
+from multiprocessing import pool
+import threading
 import unittest
 
 import mock
 
 from sia_metrics_collector import state
+from sia_metrics_collector import telemetry
 
 _DUMMY_START_TIMESTAMP = datetime.datetime(2018, 2, 12, 18, 5, 55, 0)
 _DUMMY_END_TIMESTAMP = datetime.datetime(2018, 2, 12, 18, 5, 55, 207000)
 
+# The dummy clock stops at the end timestamp after the first reading, so every
+# query appears to start at the end timestamp and take no time.
+_DUMMY_QUERY_FIELDS = {
+    'contract_query_start_time': _DUMMY_END_TIMESTAMP,
+    'contract_query_latency': 0.0,
+    'file_query_start_time': _DUMMY_END_TIMESTAMP,
+    'file_query_latency': 0.0,
+    'wallet_query_start_time': _DUMMY_END_TIMESTAMP,
+    'wallet_query_latency': 0.0,
+    'renter_query_start_time': _DUMMY_END_TIMESTAMP,
+    'renter_query_latency': 0.0,
+}
+
+
+class SiaStateTest(unittest.TestCase):
+
+    def test_every_field_has_a_kind(self):
+        self.assertEqual(
+            sorted(state.SiaState().as_dict().keys()),
+            sorted(state.FIELD_KINDS.keys()))
+
 
 class StateBuilderTest(unittest.TestCase):
 
     def setUp(self):
         self.maxDiff = None
         self.mock_sia_api = mock.Mock()
+        self.mock_sia_api.response_sizes = {}
         self.times = [_DUMMY_START_TIMESTAMP, _DUMMY_END_TIMESTAMP]
 
         def mock_time_fn():
@@ -37,8 +63,14 @@ class StateBuilderTest(unittest.TestCase):
             'dummy get_wallet exception')
 
         self.assertSiaStateEqual(
-            state.SiaState(timestamp=_DUMMY_END_TIMESTAMP, api_latency=207.0),
-            self.builder.build())
+            state.SiaState(
+                timestamp=_DUMMY_END_TIMESTAMP,
+                api_latency=207.0,
+                contract_status=state.STATUS_FAILED,
+                file_status=state.STATUS_FAILED,
+                wallet_status=state.STATUS_FAILED,
+                renter_status=state.STATUS_FAILED,
+                **_DUMMY_QUERY_FIELDS), self.builder.build())
 
     def test_builds_empty_state_when_all_api_calls_return_errors(self):
         self.mock_sia_api.get_renter_contracts.return_value = {
@@ -52,8 +84,14 @@ class StateBuilderTest(unittest.TestCase):
         }
 
         self.assertSiaStateEqual(
-            state.SiaState(timestamp=_DUMMY_END_TIMESTAMP, api_latency=207.0),
-            self.builder.build())
+            state.SiaState(
+                timestamp=_DUMMY_END_TIMESTAMP,
+                api_latency=207.0,
+                contract_status=state.STATUS_FAILED,
+                file_status=state.STATUS_FAILED,
+                wallet_status=state.STATUS_FAILED,
+                renter_status=state.STATUS_FAILED,
+                **_DUMMY_QUERY_FIELDS), self.builder.build())
 
     def test_builds_zero_metrics_when_files_is_None(self):
         self.mock_sia_api.get_renter_contracts.return_value = {
@@ -90,7 +128,13 @@ class StateBuilderTest(unittest.TestCase):
                 renter_download_spending=None,
                 renter_storage_spending=None,
                 renter_upload_spending=None,
-                renter_unspent=None), self.builder.build())
+                renter_unspent=None,
+                file_metrics_age=0.0,
+                contract_status=state.STATUS_FAILED,
+                file_status=state.STATUS_OK,
+                wallet_status=state.STATUS_FAILED,
+                renter_status=state.STATUS_FAILED,
+                **_DUMMY_QUERY_FIELDS), self.builder.build())
 
     def test_builds_full_state_when_all_api_calls_return_successfully(self):
         self.mock_sia_api.get_renter_contracts.return_value = {
@@ -170,16 +214,16 @@ class StateBuilderTest(unittest.TestCase):
                 file_uploaded_bytes=155,
                 contract_count_active=2,
                 contract_count_inactive=2,
-                contract_total_size=143L,
-                contract_total_spending=1050000L,
-                contract_fee_spending=120000L,
-                contract_storage_spending=10500L,
-                contract_upload_spending=1350L,
-                contract_download_spending=105L,
-                contract_remaining_funds=9L,
-                wallet_siacoin_balance=900L,
-                wallet_outgoing_siacoins=35L,
-                wallet_incoming_siacoins=92L,
+                contract_total_size=143,
+                contract_total_spending=1050000,
+                contract_fee_spending=120000,
+                contract_storage_spending=10500,
+                contract_upload_spending=1350,
+                contract_download_spending=105,
+                contract_remaining_funds=9,
+                wallet_siacoin_balance=900,
+                wallet_outgoing_siacoins=35,
+                wallet_incoming_siacoins=92,
                 renter_allowance=None,
                 renter_contract_fees=None,
                 renter_total_allocated=None,
@@ -187,7 +231,15 @@ class StateBuilderTest(unittest.TestCase):
                 renter_download_spending=None,
                 renter_storage_spending=None,
                 renter_upload_spending=None,
-                renter_unspent=None), self.builder.build())
+                renter_unspent=None,
+                contract_metrics_age=0.0,
+                file_metrics_age=0.0,
+                wallet_metrics_age=0.0,
+                contract_status=state.STATUS_OK,
+                file_status=state.STATUS_OK,
+                wallet_status=state.STATUS_OK,
+                renter_status=state.STATUS_FAILED,
+                **_DUMMY_QUERY_FIELDS), self.builder.build())
 
     def test_builds_partial_state_when_one_api_call_fails(self):
         self.mock_sia_api.get_renter_contracts.return_value = {
@@ -251,16 +303,16 @@ class StateBuilderTest(unittest.TestCase):
                 file_uploaded_bytes=None,
                 contract_count_active=2,
                 contract_count_inactive=2,
-                contract_total_size=143L,
-                contract_total_spending=1050000L,
-                contract_fee_spending=120000L,
-                contract_storage_spending=10500L,
-                contract_upload_spending=1350L,
-                contract_download_spending=105L,
-                contract_remaining_funds=9L,
-                wallet_siacoin_balance=900L,
-                wallet_outgoing_siacoins=35L,
-                wallet_incoming_siacoins=92L,
+                contract_total_size=143,
+                contract_total_spending=1050000,
+                contract_fee_spending=120000,
+                contract_storage_spending=10500,
+                contract_upload_spending=1350,
+                contract_download_spending=105,
+                contract_remaining_funds=9,
+                wallet_siacoin_balance=900,
+                wallet_outgoing_siacoins=35,
+                wallet_incoming_siacoins=92,
                 renter_allowance=None,
                 renter_contract_fees=None,
                 renter_total_allocated=None,
@@ -268,4 +320,528 @@ class StateBuilderTest(unittest.TestCase):
                 renter_download_spending=None,
                 renter_storage_spending=None,
                 renter_upload_spending=None,
-                renter_unspent=None), self.builder.build())
+                renter_unspent=None,
+                contract_metrics_age=0.0,
+                wallet_metrics_age=0.0,
+                contract_status=state.STATUS_OK,
+                file_status=state.STATUS_FAILED,
+                wallet_status=state.STATUS_OK,
+                renter_status=state.STATUS_FAILED,
+                **_DUMMY_QUERY_FIELDS), self.builder.build())
+
+    def test_reuses_metrics_when_response_is_unchanged(self):
+        contracts_response = {
+            u'activecontracts': [{
+                u'totalcost': u'200000',
+                u'fees': u'10000',
+                u'StorageSpending': u'2000',
+                u'uploadspending': u'800',
+                u'downloadspending': u'60',
+                u'renterfunds': u'3',
+                u'size': 22,
+            }],
+            u'inactivecontracts': [],
+        }
+        self.mock_sia_api.get_renter_contracts.return_value = (
+            contracts_response)
+        self.builder.build()
+        # The API returns the identical object when the response body is
+        # unchanged. The builder should trust that and skip recomputing, which
+        # we detect by modifying the object behind its back.
+        contracts_response[u'activecontracts'][0][u'totalcost'] = u'999'
+
+        built = self.builder.build()
+
+        self.assertEqual(1, built.contract_count_active)
+        self.assertEqual(200000, built.contract_total_spending)
+
+    def test_recomputes_metrics_when_response_changes(self):
+        self.mock_sia_api.get_wallet.return_value = {
+            u'confirmedsiacoinbalance': u'900',
+            u'unconfirmedoutgoingsiacoins': u'35',
+            u'unconfirmedincomingsiacoins': u'92',
+        }
+        self.builder.build()
+        self.mock_sia_api.get_wallet.return_value = {
+            u'confirmedsiacoinbalance': u'800',
+            u'unconfirmedoutgoingsiacoins': u'35',
+            u'unconfirmedincomingsiacoins': u'92',
+        }
+
+        self.assertEqual(800, self.builder.build().wallet_siacoin_balance)
+
+    def test_sums_many_contracts_exactly(self):
+        contracts = [{
+            u'totalcost': u'%d' % (10**30 + i),
+            u'fees': u'%d' % (i * 7),
+            u'StorageSpending': u'%d' % (2**100 - i),
+            u'uploadspending': u'800',
+            u'downloadspending': u'0',
+            u'renterfunds': u'%d' % 10**(i % 28),
+            u'size': i,
+        } for i in range(1000)]
+        self.mock_sia_api.get_renter_contracts.return_value = {
+            u'activecontracts': contracts[:600],
+            u'inactivecontracts': contracts[600:],
+        }
+
+        built = state.SiaState()
+        with mock.patch.object(state, '_BATCH_SUM_MIN_CONTRACTS', 0):
+            with mock.patch.object(state, '_BATCH_SUM_SIZE', 128):
+                self.assertTrue(self.builder._populate_contract_metrics(built))
+
+        self.assertEqual(600, built.contract_count_active)
+        self.assertEqual(400, built.contract_count_inactive)
+        self.assertEqual(sum(range(1000)), built.contract_total_size)
+        self.assertEqual(1000 * 10**30 + sum(range(1000)),
+                         built.contract_total_spending)
+        self.assertEqual(7 * sum(range(1000)), built.contract_fee_spending)
+        self.assertEqual(1000 * 2**100 - sum(range(1000)),
+                         built.contract_storage_spending)
+        self.assertEqual(800000, built.contract_upload_spending)
+        self.assertEqual(0, built.contract_download_spending)
+        self.assertEqual(
+            sum(10**(i % 28) for i in range(1000)),
+            built.contract_remaining_funds)
+
+    def test_invalid_contract_field_fails_as_when_summing_each_contract(self):
+        contracts = [{
+            u'totalcost': u'200000',
+            u'fees': u'10000',
+            u'StorageSpending': u'2000',
+            u'uploadspending': u'800',
+            u'downloadspending': u'60',
+            u'renterfunds': u'3',
+            u'size': 22,
+        } for _ in range(1000)]
+        contracts[700] = dict(contracts[700], fees=u'1e5')
+        del contracts[900][u'renterfunds']
+        for invalid_contracts, error in ((contracts[:800], ValueError),
+                                         (contracts[800:] * 6, KeyError)):
+            self.mock_sia_api.get_renter_contracts.return_value = {
+                u'activecontracts': invalid_contracts,
+                u'inactivecontracts': [],
+            }
+            batched = state.SiaState()
+            with mock.patch.object(state, '_BATCH_SUM_MIN_CONTRACTS', 0):
+                with self.assertRaises(error):
+                    self.builder._populate_contract_metrics(batched)
+            one_at_a_time = state.SiaState()
+            with mock.patch.object(state, '_BATCH_SUM_MIN_CONTRACTS', 10**9):
+                with self.assertRaises(error):
+                    self.builder._populate_contract_metrics(one_at_a_time)
+
+            self.assertEqual(one_at_a_time.as_dict(), batched.as_dict())
+
+    def test_carries_forward_metrics_of_groups_not_queried(self):
+        now = [_DUMMY_START_TIMESTAMP]
+        self.builder = state.Builder(self.mock_sia_api, lambda: now[0])
+        self.mock_sia_api.get_renter_contracts.return_value = {
+            u'activecontracts': [{
+                u'totalcost': u'200000',
+                u'fees': u'10000',
+                u'StorageSpending': u'2000',
+                u'uploadspending': u'800',
+                u'downloadspending': u'60',
+                u'renterfunds': u'3',
+                u'size': 22,
+            }],
+            u'inactivecontracts': [],
+        }
+        self.mock_sia_api.get_wallet.return_value = {
+            u'confirmedsiacoinbalance': u'900',
+            u'unconfirmedoutgoingsiacoins': u'35',
+            u'unconfirmedincomingsiacoins': u'92',
+        }
+        self.builder.build()
+        now[0] = _DUMMY_START_TIMESTAMP + datetime.timedelta(seconds=30)
+        self.mock_sia_api.get_wallet.return_value = {
+            u'confirmedsiacoinbalance': u'800',
+            u'unconfirmedoutgoingsiacoins': u'35',
+            u'unconfirmedincomingsiacoins': u'92',
+        }
+
+        built = self.builder.build(query_groups=['wallet'])
+
+        self.assertEqual(1, self.mock_sia_api.get_renter_contracts.call_count)
+        self.assertEqual(1, built.contract_count_active)
+        self.assertEqual(200000, built.contract_total_spending)
+        self.assertEqual(30.0, built.contract_metrics_age)
+        self.assertIsNone(built.contract_query_start_time)
+        self.assertIsNone(built.contract_query_latency)
+        self.assertEqual(800, built.wallet_siacoin_balance)
+        self.assertEqual(0.0, built.wallet_metrics_age)
+        # Groups that have never been queried successfully have no metrics to
+        # carry forward.
+        self.assertIsNone(built.renter_allowance)
+        self.assertIsNone(built.renter_metrics_age)
+
+    def test_streams_file_metrics(self):
+        self.builder = state.Builder(
+            self.mock_sia_api, self.mock_time_fn, stream_files=True)
+        self.mock_sia_api.iter_renter_files.return_value = iter([
+            {
+                u'filesize': 900,
+                u'uploadedbytes': 50,
+                u'uploadprogress': 90,
+            },
+            {
+                u'filesize': 800,
+                u'uploadedbytes': 100,
+                u'uploadprogress': 100,
+            },
+        ])
+
+        built = self.builder.build()
+
+        self.assertEqual(2, built.file_count)
+        self.assertEqual((900 * .9) + (800 * 1.0), built.file_total_bytes)
+        self.assertEqual(1, built.file_uploads_in_progress_count)
+        self.assertEqual(150, built.file_uploaded_bytes)
+        self.assertFalse(self.mock_sia_api.get_renter_files.called)
+
+    def test_leaves_file_metrics_unset_when_stream_fails_partway(self):
+        self.builder = state.Builder(
+            self.mock_sia_api, self.mock_time_fn, stream_files=True)
+
+        def files_then_error():
+            yield {
+                u'filesize': 900,
+                u'uploadedbytes': 50,
+                u'uploadprogress': 90,
+            }
+            raise ValueError('dummy stream parse error')
+
+        self.mock_sia_api.iter_renter_files.return_value = files_then_error()
+
+        built = self.builder.build()
+
+        self.assertIsNone(built.file_count)
+        self.assertIsNone(built.file_total_bytes)
+        self.assertIsNone(built.file_uploads_in_progress_count)
+        self.assertIsNone(built.file_uploaded_bytes)
+
+    def test_tags_state_with_node_id(self):
+        self.builder = state.Builder(
+            self.mock_sia_api, self.mock_time_fn, node_id='renter-1')
+
+        self.assertEqual('renter-1', self.builder.build().node_id)
+
+    def test_records_timing_and_response_size_of_each_query(self):
+        self.times = [
+            datetime.datetime(2018, 2, 12, 18, 5, 55, 0),
+            datetime.datetime(2018, 2, 12, 18, 5, 55, 1000),
+            datetime.datetime(2018, 2, 12, 18, 5, 55, 5000),
+            datetime.datetime(2018, 2, 12, 18, 5, 55, 6000),
+            datetime.datetime(2018, 2, 12, 18, 5, 55, 9000),
+            datetime.datetime(2018, 2, 12, 18, 5, 55, 9000),
+            datetime.datetime(2018, 2, 12, 18, 5, 55, 12000),
+            datetime.datetime(2018, 2, 12, 18, 5, 55, 12000),
+            datetime.datetime(2018, 2, 12, 18, 5, 55, 14000),
+            datetime.datetime(2018, 2, 12, 18, 5, 55, 15000),
+        ]
+        self.mock_sia_api.get_renter_files.side_effect = ValueError(
+            'dummy get_renter_files exception')
+        self.mock_sia_api.response_sizes = {
+            '/renter/contracts': 250,
+            '/wallet': 90,
+            '/renter': 400,
+        }
+
+        built = self.builder.build()
+
+        self.assertEqual(
+            datetime.datetime(2018, 2, 12, 18, 5, 55, 1000),
+            built.contract_query_start_time)
+        self.assertEqual(4.0, built.contract_query_latency)
+        self.assertEqual(250, built.contract_response_bytes)
+        self.assertEqual(
+            datetime.datetime(2018, 2, 12, 18, 5, 55, 6000),
+            built.file_query_start_time)
+        self.assertEqual(3.0, built.file_query_latency)
+        self.assertIsNone(built.file_response_bytes)
+        self.assertEqual(
+            datetime.datetime(2018, 2, 12, 18, 5, 55, 9000),
+            built.wallet_query_start_time)
+        self.assertEqual(3.0, built.wallet_query_latency)
+        self.assertEqual(90, built.wallet_response_bytes)
+        self.assertEqual(
+            datetime.datetime(2018, 2, 12, 18, 5, 55, 12000),
+            built.renter_query_start_time)
+        self.assertEqual(2.0, built.renter_query_latency)
+        self.assertEqual(400, built.renter_response_bytes)
+        self.assertEqual(15.0, built.api_latency)
+
+    def test_records_timing_of_responses_fetched_ahead_of_time(self):
+        start = datetime.datetime(2018, 2, 12, 18, 5, 55, 0)
+        self.times = [datetime.datetime(2018, 2, 12, 18, 5, 56, 0)]
+        self.mock_sia_api.response_sizes = {'/wallet': 90}
+
+        built = self.builder.build(
+            query_groups=['contract', 'wallet'],
+            query_timings={
+                'contract':
+                state.QueryTiming(
+                    start_time=start,
+                    end_time=start + datetime.timedelta(milliseconds=40)),
+                'wallet':
+                state.QueryTiming(
+                    start_time=start + datetime.timedelta(milliseconds=10),
+                    end_time=start + datetime.timedelta(milliseconds=25)),
+            })
+
+        self.assertEqual(start, built.contract_query_start_time)
+        self.assertEqual(40.0, built.contract_query_latency)
+        self.assertEqual(
+            start + datetime.timedelta(milliseconds=10),
+            built.wallet_query_start_time)
+        self.assertEqual(15.0, built.wallet_query_latency)
+        self.assertEqual(90, built.wallet_response_bytes)
+        self.assertIsNone(built.file_query_latency)
+        self.assertEqual(1000.0, built.api_latency)
+
+    def test_marks_groups_fetched_late_as_late(self):
+        self.mock_sia_api.get_wallet.return_value = {
+            u'confirmedsiacoinbalance': u'900',
+            u'unconfirmedoutgoingsiacoins': u'35',
+            u'unconfirmedincomingsiacoins': u'92',
+        }
+        self.builder.build(query_groups=['wallet'])
+
+        built = self.builder.build(
+            query_groups=['wallet', 'renter'], late_groups=['wallet'])
+
+        self.assertEqual(1, self.mock_sia_api.get_wallet.call_count)
+        self.assertEqual(state.STATUS_LATE, built.wallet_status)
+        self.assertIsNone(built.wallet_siacoin_balance)
+        self.assertIsNone(built.wallet_query_latency)
+        self.assertIsNone(built.wallet_metrics_age)
+        self.assertEqual(state.STATUS_FAILED, built.renter_status)
+        self.assertEqual(state.STATUS_SKIPPED, built.contract_status)
+
+    def test_carries_forward_groups_fetched_late_if_policy_says_to(self):
+        self.mock_sia_api.get_wallet.return_value = {
+            u'confirmedsiacoinbalance': u'900',
+            u'unconfirmedoutgoingsiacoins': u'35',
+            u'unconfirmedincomingsiacoins': u'92',
+        }
+        self.builder.build(query_groups=['wallet'])
+
+        built = self.builder.build(
+            query_groups=['wallet'],
+            late_groups=['wallet'],
+            late_policy=state.LATE_CARRY_FORWARD)
+
+        self.assertEqual(state.STATUS_LATE, built.wallet_status)
+        self.assertEqual(900, built.wallet_siacoin_balance)
+        self.assertIsNotNone(built.wallet_metrics_age)
+
+
+class ConcurrentStateBuilderTest(StateBuilderTest):
+    """Runs all of StateBuilderTest's tests against a concurrent Builder."""
+
+    def setUp(self):
+        super(ConcurrentStateBuilderTest, self).setUp()
+        self.thread_pool = pool.ThreadPool(4)
+        self.builder = state.Builder(
+            self.mock_sia_api, self.mock_time_fn, thread_pool=self.thread_pool)
+
+    def tearDown(self):
+        self.thread_pool.terminate()
+
+    def test_records_timing_and_response_size_of_each_query(self):
+        self.mock_sia_api.response_sizes = {
+            '/renter/contracts': 250,
+            '/renter/files': 1000,
+            '/wallet': 90,
+            '/renter': 400,
+        }
+
+        built = self.builder.build()
+
+        # The order in which concurrent queries read the clock varies, so only
+        # check the values that don't depend on it.
+        self.assertEqual(250, built.contract_response_bytes)
+        self.assertEqual(1000, built.file_response_bytes)
+        self.assertEqual(90, built.wallet_response_bytes)
+        self.assertEqual(400, built.renter_response_bytes)
+        for field_prefix in ('contract', 'file', 'wallet', 'renter'):
+            self.assertIsNotNone(
+                getattr(built, field_prefix + '_query_start_time'))
+            self.assertIsNotNone(
+                getattr(built, field_prefix + '_query_latency'))
+
+    def test_queries_all_endpoints_at_once(self):
+        lock = threading.Lock()
+        all_queries_started = threading.Event()
+        queries_in_flight = []
+
+        def wait_for_all_queries():
+            with lock:
+                queries_in_flight.append(None)
+                if len(queries_in_flight) == 4:
+                    all_queries_started.set()
+            # If the Builder queried the endpoints one by one, the first query
+            # would never see the others start.
+            if not all_queries_started.wait(5.0):
+                raise ValueError('dummy timeout waiting for other queries')
+            return {u'message': u'dummy error'}
+
+        self.mock_sia_api.get_renter_contracts.side_effect = (
+            wait_for_all_queries)
+        self.mock_sia_api.get_renter_files.side_effect = wait_for_all_queries
+        self.mock_sia_api.get_wallet.side_effect = wait_for_all_queries
+        self.mock_sia_api.get_renter.side_effect = wait_for_all_queries
+
+        self.builder.build()
+
+        self.assertTrue(all_queries_started.is_set())
+
+
+class DeadlineStateBuilderTest(ConcurrentStateBuilderTest):
+    """Runs all of StateBuilderTest's tests against a Builder with deadlines.
+
+    The deadlines are long enough that no query misses them.
+    """
+
+    def setUp(self):
+        super(DeadlineStateBuilderTest, self).setUp()
+        self.builder = state.Builder(
+            self.mock_sia_api,
+            self.mock_time_fn,
+            thread_pool=self.thread_pool,
+            deadlines=state.DeadlineOptions(
+                query_deadlines={'file': 60.0},
+                sample_deadline=60.0,
+                late_policy=state.LATE_EMPTY))
+
+
+class TelemetryStateBuilderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_sia_api = mock.Mock()
+        self.mock_sia_api.response_sizes = {}
+        self.mock_sia_api.decode_seconds = {'/wallet': 0.25, '/renter': 0.5}
+        self.mock_sia_api.get_wallet.return_value = {
+            u'confirmedsiacoinbalance': u'5',
+            u'unconfirmedoutgoingsiacoins': u'0',
+            u'unconfirmedincomingsiacoins': u'0',
+        }
+        # Every reading of the clock is a second after the last, so each
+        # population function takes a second.
+        ticks = itertools.count()
+        self.recorder = telemetry.Recorder(
+            clock=lambda: float(next(ticks)),
+            cpu_seconds_fn=lambda: 0.0,
+            rss_bytes_fn=lambda: None)
+        self.addCleanup(self.recorder.close)
+        self.builder = state.Builder(
+            self.mock_sia_api,
+            datetime.datetime.utcnow,
+            telemetry=self.recorder)
+
+    def test_records_time_of_population_functions_and_json_decoding(self):
+        built = self.builder.build(query_groups=['wallet', 'renter'])
+
+        sample = self.recorder.sample(0)
+        self.assertEqual(5, built.wallet_siacoin_balance)
+        self.assertEqual(0.0, sample.contract_populate_ms)
+        self.assertEqual(0.0, sample.file_populate_ms)
+        self.assertEqual(1000.0, sample.wallet_populate_ms)
+        self.assertEqual(1000.0, sample.renter_populate_ms)
+        self.assertEqual(750.0, sample.json_decode_ms)
+
+
+class MissedDeadlineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_sia_api = mock.Mock()
+        self.mock_sia_api.response_sizes = {}
+        self.mock_sia_api.get_wallet.return_value = {
+            u'confirmedsiacoinbalance': u'900',
+            u'unconfirmedoutgoingsiacoins': u'35',
+            u'unconfirmedincomingsiacoins': u'92',
+        }
+        self.thread_pool = pool.ThreadPool(4)
+        self.addCleanup(self.thread_pool.terminate)
+        self.wallet_released = threading.Event()
+        # Unblocks any query still waiting, so the pool can shut down.
+        self.addCleanup(self.wallet_released.set)
+
+    def make_builder(self,
+                     query_deadlines=None,
+                     sample_deadline=None,
+                     late_policy=state.LATE_EMPTY):
+        return state.Builder(
+            self.mock_sia_api,
+            datetime.datetime.utcnow,
+            thread_pool=self.thread_pool,
+            deadlines=state.DeadlineOptions(
+                query_deadlines=query_deadlines or {},
+                sample_deadline=sample_deadline,
+                late_policy=late_policy))
+
+    def hang_wallet_queries(self):
+        response = self.mock_sia_api.get_wallet.return_value
+
+        def wait_for_release():
+            self.wallet_released.wait(5.0)
+            return response
+
+        self.mock_sia_api.get_wallet.side_effect = wait_for_release
+
+    def test_requires_thread_pool(self):
+        with self.assertRaises(ValueError):
+            state.Builder(
+                self.mock_sia_api,
+                datetime.datetime.utcnow,
+                deadlines=state.DeadlineOptions(
+                    query_deadlines={},
+                    sample_deadline=1.0,
+                    late_policy=state.LATE_EMPTY))
+
+    def test_builds_state_without_late_group_by_its_deadline(self):
+        self.hang_wallet_queries()
+        builder = self.make_builder(query_deadlines={'wallet': 0.05})
+
+        built = builder.build()
+
+        self.assertFalse(self.wallet_released.is_set())
+        self.assertEqual(state.STATUS_LATE, built.wallet_status)
+        self.assertIsNone(built.wallet_siacoin_balance)
+        self.assertIsNone(built.wallet_query_latency)
+        self.assertIsNone(built.wallet_metrics_age)
+        self.assertEqual(state.STATUS_FAILED, built.renter_status)
+
+    def test_sample_deadline_applies_to_every_group(self):
+        self.hang_wallet_queries()
+        builder = self.make_builder(
+            query_deadlines={'wallet': 60.0}, sample_deadline=0.05)
+
+        self.assertEqual(state.STATUS_LATE, builder.build().wallet_status)
+
+    def test_carries_forward_late_group_if_policy_says_to(self):
+        builder = self.make_builder(
+            query_deadlines={'wallet': 0.05},
+            late_policy=state.LATE_CARRY_FORWARD)
+        builder.build()
+        self.hang_wallet_queries()
+
+        built = builder.build()
+
+        self.assertEqual(state.STATUS_LATE, built.wallet_status)
+        self.assertEqual(900, built.wallet_siacoin_balance)
+        self.assertIsNotNone(built.wallet_metrics_age)
+
+    def test_uses_late_response_on_next_build_instead_of_querying_again(self):
+        self.hang_wallet_queries()
+        builder = self.make_builder(query_deadlines={'wallet': 0.05})
+        builder.build()
+        self.wallet_released.set()
+
+        built = builder.build(query_groups=['wallet'])
+
+        self.assertEqual(state.STATUS_OK, built.wallet_status)
+        self.assertEqual(900, built.wallet_siacoin_balance)
+        self.assertEqual(1, self.mock_sia_api.get_wallet.call_count)
+        self.assertEqual(state.STATUS_SKIPPED, built.contract_status)
@@ -0,0 +1,75 @@
+import socket
+import threading
+import unittest
+
+try:
+    import BaseHTTPServer
+except ImportError:
+    # Python 3 renamed it.
+    from http import server as BaseHTTPServer
+
+from sia_metrics_collector import stdlib_api
+
+
+class _SiadHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get('User-Agent')))
+        if self.path == '/wallet':
+            self._send_body(200, b'{"confirmedsiacoinbalance": "5"}')
+        elif self.path == '/renter':
+            self._send_body(200, b'not json')
+        else:
+            self._send_body(404, b'404 page not found')
+
+    def _send_body(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), _SiadHandler)
+        self.server.requests = []
+        server_thread = threading.Thread(target=self.server.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+        self.client = stdlib_api.Client('http://127.0.0.1',
+                                        self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_parses_json_response_and_records_its_size(self):
+        self.assertEqual({
+            u'confirmedsiacoinbalance': u'5'
+        }, self.client.get_wallet())
+        self.assertEqual({'/wallet': 32}, self.client.response_sizes)
+        self.assertEqual(['/wallet'], list(self.client.decode_seconds))
+        self.assertEqual([('/wallet', 'Sia-Agent')], self.server.requests)
+
+    def test_returns_whether_request_succeeded_when_response_is_not_json(self):
+        self.assertTrue(self.client.get_renter())
+        self.assertFalse(self.client.get_renter_contracts())
+        self.assertEqual({
+            '/renter': 8,
+            '/renter/contracts': 18
+        }, self.client.response_sizes)
+
+    def test_raises_and_forgets_response_size_when_node_is_down(self):
+        self.client.get_wallet()
+        self.server.shutdown()
+        self.server.server_close()
+
+        with self.assertRaises(socket.error):
+            self.client.get_wallet()
+        self.assertEqual({}, self.client.response_sizes)
+        self.assertEqual({}, self.client.decode_seconds)
@@ -0,0 +1,144 @@
+import csv
+import datetime
+import gc
+import io
+import unittest
+
+from sia_metrics_collector import serialize
+from sia_metrics_collector import telemetry
+
+# In-memory file of native strings, like a file opened in text mode.
+_TextIO = io.BytesIO if str is bytes else io.StringIO
+
+_DUMMY_TIMESTAMP = datetime.datetime(2018, 2, 11, 16, 5, 0)
+
+
+class RecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 100.0
+        self.cpu_seconds = 3.0
+        self.rss_bytes = 1 << 20
+        self.recorder = telemetry.Recorder(
+            clock=lambda: self.now,
+            time_fn=lambda: _DUMMY_TIMESTAMP,
+            cpu_seconds_fn=lambda: self.cpu_seconds,
+            rss_bytes_fn=lambda: self.rss_bytes)
+        self.addCleanup(self.recorder.close)
+
+    def test_adds_up_time_spent_in_each_stage(self):
+        self.recorder.add('serialize', 0.25)
+        self.recorder.add('serialize', 0.5)
+        self.recorder.add('json_decode', 0.125)
+
+        sample = self.recorder.sample(7)
+
+        self.assertEqual(_DUMMY_TIMESTAMP, sample.timestamp)
+        self.assertEqual(7, sample.poll_index)
+        self.assertEqual(750.0, sample.serialize_ms)
+        self.assertEqual(125.0, sample.json_decode_ms)
+        self.assertEqual(0.0, sample.console_render_ms)
+
+    def test_times_calls_to_wrapped_function(self):
+
+        def render(value):
+            self.now += 2.0
+            return value * 2
+
+        timed_render = self.recorder.timed('console_render', render)
+
+        self.assertEqual(6, timed_render(3))
+        self.assertEqual('render', timed_render.__name__)
+        self.assertEqual(2000.0, self.recorder.sample(0).console_render_ms)
+
+    def test_times_calls_that_raise(self):
+
+        def fail():
+            self.now += 1.0
+            raise ValueError('dummy render failure')
+
+        with self.assertRaises(ValueError):
+            self.recorder.timed('console_render', fail)()
+        self.assertEqual(1000.0, self.recorder.sample(0).console_render_ms)
+
+    def test_samples_cpu_time_and_rss_over_interval_since_last_sample(self):
+        self.now += 2.0
+        self.cpu_seconds += 0.5
+        self.recorder.add('serialize', 1.0)
+        first = self.recorder.sample(0)
+        self.now += 1.0
+        self.cpu_seconds += 0.25
+        self.rss_bytes = 2 << 20
+        second = self.recorder.sample(1)
+
+        self.assertEqual(2.0, first.interval_seconds)
+        self.assertEqual(500.0, first.cpu_time_ms)
+        self.assertEqual(1 << 20, first.rss_bytes)
+        self.assertEqual(1000.0, first.serialize_ms)
+        self.assertEqual(1.0, second.interval_seconds)
+        self.assertEqual(250.0, second.cpu_time_ms)
+        self.assertEqual(2 << 20, second.rss_bytes)
+        self.assertEqual(0.0, second.serialize_ms)
+
+    @unittest.skipUnless(hasattr(gc, 'callbacks'), 'requires Python 3')
+    def test_counts_garbage_collections_until_closed(self):
+        gc.collect()
+        gc.collect()
+        sample = self.recorder.sample(0)
+        self.recorder.close()
+        gc.collect()
+
+        self.assertGreaterEqual(sample.gc_collections, 2)
+        self.assertGreaterEqual(sample.gc_pause_ms, 0.0)
+        self.assertEqual(0, self.recorder.sample(1).gc_collections)
+
+    @unittest.skipIf(hasattr(gc, 'callbacks'), 'requires Python 2')
+    def test_leaves_garbage_collections_unset_without_gc_callbacks(self):
+        gc.collect()
+
+        sample = self.recorder.sample(0)
+
+        self.assertIsNone(sample.gc_collections)
+        self.assertIsNone(sample.gc_pause_ms)
+
+
+class CsvWriterTest(unittest.TestCase):
+
+    def test_writes_header_then_samples(self):
+        recorder = telemetry.Recorder(
+            clock=lambda: 0.0,
+            time_fn=lambda: _DUMMY_TIMESTAMP,
+            cpu_seconds_fn=lambda: 0.0,
+            rss_bytes_fn=lambda: None)
+        self.addCleanup(recorder.close)
+        mock_file = _TextIO()
+        writer = telemetry.CsvWriter(mock_file)
+        recorder.add('file_populate', 0.5)
+
+        writer.write_sample(recorder.sample(4))
+
+        reader = csv.DictReader(_TextIO(mock_file.getvalue()))
+        rows = list(reader)
+        self.assertEqual(list(telemetry.Sample._fields), reader.fieldnames)
+        self.assertEqual(1, len(rows))
+        self.assertEqual('2018-02-11T16:05:00', rows[0]['timestamp'])
+        self.assertEqual('4', rows[0]['poll_index'])
+        self.assertEqual('500.0', rows[0]['file_populate_ms'])
+        self.assertEqual('', rows[0]['rss_bytes'])
+
+    def test_appends_to_existing_file_without_repeating_header(self):
+        header = ','.join(telemetry.Sample._fields) + '\n'
+        mock_file = _TextIO()
+        mock_file.write(header)
+
+        telemetry.CsvWriter(mock_file)
+
+        self.assertEqual(header, mock_file.getvalue())
+
+    def test_rejects_existing_file_with_different_header(self):
+        mock_file = _TextIO()
+        mock_file.write('timestamp,poll_index\n')
+
+        with self.assertRaises(serialize.HeaderMismatchError):
+            telemetry.CsvWriter(mock_file)
+        self.assertEqual('timestamp,poll_index\n', mock_file.getvalue())